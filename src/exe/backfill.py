@@ -0,0 +1,83 @@
+# encoding = utf-8
+
+""" Backfills Station with historical GuardDuty findings:  JSON lines or
+JSON files, gzipped or not, in local files, directories or S3
+("s3://bucket/prefix").  Uses the same environment variables as the
+Lambda (ENCLAVE_ID, USER_API_KEY, USER_API_SECRET, ...).  Re-run with the
+same --checkpoint to resume an interrupted backfill. """
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from trustar_guardduty_lambda_handler import HandlerConfig, \
+    TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler.backfill_runner import BackfillRunner
+from trustar_guardduty_lambda_handler.helpers.aws.finding_source import \
+    FindingSource
+from trustar_guardduty_lambda_handler.helpers.common.backfill_checkpoint \
+    import BackfillCheckpoint
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from argparse import Namespace
+    from typing import List, Optional
+
+
+def parse_args(argv=None):       # type: (Optional[List[str]]) -> Namespace
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('locations', nargs='+',
+                        help="files, directories or s3://bucket/prefix URLs")
+    parser.add_argument('--checkpoint', default='backfill_checkpoint.json',
+                        help="where progress is saved.  Default "
+                             "%(default)s.")
+    parser.add_argument('--failed', default=None,
+                        help="JSON lines file the failed findings are "
+                             "appended to")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="findings upserted together.  Default "
+                             "%(default)s.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="concurrent upserts.  Default UPSERT_WORKERS.")
+    parser.add_argument('--checkpoint-every', type=float, default=30.0,
+                        help="seconds between checkpoints.  Default "
+                             "%(default)s.")
+    parser.add_argument('--log-every', type=float, default=10.0,
+                        help="seconds between progress lines.  Default "
+                             "%(default)s.")
+    parser.add_argument('--s3-endpoint-url', default=None,
+                        help="an S3-compatible store to read from instead "
+                             "of AWS")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):                     # type: (Optional[List[str]]) -> int
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    environ = dict(os.environ)
+    if args.workers is not None:
+        environ['UPSERT_WORKERS'] = str(args.workers)
+    handler = TruStarGuardDutyLambdaHandler(
+        HandlerConfig.from_env_vars(environ))
+    source = FindingSource(args.locations, endpoint_url=args.s3_endpoint_url)
+    failed_file = open(args.failed, 'a') if args.failed else None
+    try:
+        result = BackfillRunner(handler, source,
+                                checkpoint=BackfillCheckpoint(args.checkpoint),
+                                batch_size=args.batch_size,
+                                checkpoint_every=args.checkpoint_every,
+                                failed_file=failed_file,
+                                log_every=args.log_every).run()
+    finally:
+        handler.close()
+        if failed_file is not None:
+            failed_file.close()
+    print(json.dumps(result, indent=4))
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,18 +4,66 @@
 enclave as a Report. """
 
 # noinspection PyUnresolvedReferences
-from trustar_guardduty_lambda_handler import TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler import AsyncHandlerCache, HandlerCache
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import Dict
+    from typing import Any, Dict, List, Union
 
 
-# noinspection PyUnusedLocal
-def lambda_handler(event, context):             # type: (Dict, Dict) -> Dict
+# built during the Lambda init phase and re-used by every warm invocation
+# of this container.
+HANDLER_CACHE = HandlerCache()
+HANDLER_CACHE.warm()
+
+# only built if the async entry point is used.
+ASYNC_HANDLER_CACHE = None
+
+
+def lambda_handler(event, context):              # type: (Dict, Any) -> Dict
     """ Sends Finding to Station.
     :param event: the GD event dictionary.
-    :param context:  not used.  """
-    handler = TruStarGuardDutyLambdaHandler()
-    report = handler.handle(event)                                # type: Dict
+    :param context:  the Lambda context, used to respect its deadline.  """
+    report = HANDLER_CACHE.handle(event, context)                 # type: Dict
     return report
+
+
+def batch_lambda_handler(event, context
+                         ):          # type: (Union[Dict, List], Any) -> Dict
+    """ Sends a batch of Findings to Station.
+    :param event: an SQS batch of GD events, or a list of GD events.
+    :param context:  the Lambda context, used to respect its deadline.
+    :return: the "batchItemFailures" of the findings that failed, so only
+    those are redelivered.  """
+    return HANDLER_CACHE.handle_batch(event, context)
+
+
+def verify_lambda_handler(event, context):       # type: (Dict, Any) -> Dict
+    """ Checks the reports whose saved report check was deferred
+    (SAVED_REPORT_CHECK=deferred) against Station, ex:  on a schedule.
+    Only this container's queue is checked.
+    :param event: ignored.
+    :param context:  the Lambda context, used to respect its deadline.
+    :return: how many reports were checked.  """
+    return HANDLER_CACHE.verify(context)
+
+
+def drain_lambda_handler(event, context):        # type: (Dict, Any) -> Dict
+    """ Upserts the reports spooled when Station was struggling
+    (UPSERT_SPOOL), ex:  on a schedule.  Drains the spool this container
+    sees:  its own "file" spool, or the shared "s3" one.
+    :param event: ignored.
+    :param context:  the Lambda context, used to respect its deadline.
+    :return: how many reports were drained, failed again and are left.  """
+    return HANDLER_CACHE.drain(context)
+
+
+def async_batch_lambda_handler(event, context
+                               ):    # type: (Union[Dict, List], Any) -> Dict
+    """ Same as batch_lambda_handler, but keeps the batch's upserts in
+    flight on one asyncio event loop instead of a pool of threads.
+    Requires the 'aiohttp' library. """
+    global ASYNC_HANDLER_CACHE
+    if ASYNC_HANDLER_CACHE is None:
+        ASYNC_HANDLER_CACHE = AsyncHandlerCache()
+    return ASYNC_HANDLER_CACHE.handle_batch(event, context)
@@ -5,3 +5,13 @@ events/findings to TruSTAR as reports. """
 
 # noinspection PyUnresolvedReferences
 from .ts_gd_lambda_handler import TruStarGuardDutyLambdaHandler
+# noinspection PyUnresolvedReferences
+from .handler_cache import HandlerCache
+# noinspection PyUnresolvedReferences
+from .handler_config import HandlerConfig
+# noinspection PyUnresolvedReferences
+from .async_handler_cache import AsyncHandlerCache
+# noinspection PyUnresolvedReferences
+from .async_ts_gd_lambda_handler import AsyncTruStarGuardDutyLambdaHandler
+# noinspection PyUnresolvedReferences
+from .backfill_runner import BackfillRunner
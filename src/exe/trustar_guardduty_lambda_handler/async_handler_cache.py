@@ -0,0 +1,90 @@
+# encoding = utf-8
+
+""" AsyncHandlerCache class definition. """
+
+import asyncio
+from logging import getLogger
+import time
+
+from .async_ts_gd_lambda_handler import AsyncTruStarGuardDutyLambdaHandler
+from .base_handler_cache import BaseHandlerCache
+from .handler_config import HandlerConfig
+from .helpers.aws.batch_event_parser import BatchEventParser
+from .helpers.aws.batch_summary import BatchSummary
+from .helpers.ts.station_error_classifier import StationErrorClassifier
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Union
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class AsyncHandlerCache(BaseHandlerCache):
+    """ The asyncio counterpart of the HandlerCache.  Owns the event loop
+    that the cached handler, and its pooled HTTP session, are bound to, so
+    that warm invocations re-use both, and the MetricsRecorder. """
+
+    def __init__(self, handler_cls=AsyncTruStarGuardDutyLambdaHandler):
+        super().__init__(handler_cls)
+        self.loop = asyncio.new_event_loop()
+
+    def handle_batch(self, event,                  # type: Union[Dict, List]
+                     context=None                                  # type: Any
+                     ):                                 # type: (...) -> Dict
+        """ Processes a batch of findings and returns the
+        "batchItemFailures" response. """
+        return self.loop.run_until_complete(
+            self._handle_batch(event, context))
+
+    async def _handle_batch(self, event, context):
+        items = BatchEventParser.parse(event)
+        start = time.perf_counter()
+        handler = await self.get()
+        with self.metrics.invocation() as metrics:
+            await handler.process_batch(items, context)
+
+            auth_failed = [i for i in items if i.failed and
+                           StationErrorClassifier.is_auth_error(i.error)]
+            if auth_failed:
+                logger.warning("'{}' batch item(s) failed with an auth "
+                               "error.  Rebuilding async lambda handler and "
+                               "retrying them once.".format(len(auth_failed)))
+                await self.invalidate()
+                await (await self.get()).process_batch(auth_failed, context)
+
+            summary = BatchSummary(items, time.perf_counter() - start)
+            summary.log()
+            summary.record(metrics)
+        return summary.response()
+
+    async def get(self):   # type: () -> AsyncTruStarGuardDutyLambdaHandler
+        """ Returns the cached handler, building a new one if there isn't
+        one yet or if the configs changed since it was built.  The configs
+        are only parsed again if the env vars changed. """
+        env_vars = HandlerConfig.env_vars_of()
+        handler = self.handler_if_current(env_vars)
+        if handler is not None:
+            return handler
+        config = HandlerConfig.from_env_vars()
+        self._env_vars = env_vars
+        if self._handler is not None:
+            if self._fingerprint == config.fingerprint:
+                return self._handler
+            logger.info("Lambda handler configs changed.  Rebuilding async "
+                        "lambda handler.")
+            await self.invalidate()
+
+        kwargs = self.handler_kwargs(config)
+        with self.metrics.span('HandlerBuild'):
+            self._handler = await self.handler_cls.create(config, **kwargs)
+        self._fingerprint = config.fingerprint
+        return self._handler
+
+    async def invalidate(self):                             # type: () -> None
+        """ Closes and drops the cached handler. """
+        if self._handler is not None:
+            await self._handler.close()
+        self._handler = None
+        self._fingerprint = None
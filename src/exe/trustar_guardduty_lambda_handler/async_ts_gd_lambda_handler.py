@@ -0,0 +1,279 @@
+# encoding = utf-8
+
+""" TruSTAR's asyncio Guard Duty Finding Lambda Handler. """
+
+import asyncio
+from collections import OrderedDict
+from logging import getLogger
+import time
+
+from .base_handler import BaseHandler
+from .helpers.aws.batch_event_parser import BatchEventParser
+from .helpers.aws.batch_summary import BatchSummary
+from .helpers.ts.async_report_details_fetcher import AsyncReportDetailsFetcher
+from .helpers.ts.async_report_upserter import AsyncReportUpserter
+from .helpers.ts.async_saved_report_verifier import \
+    AsyncSavedReportVerifier
+from .helpers.ts.async_station_client import AsyncStationClient
+from .helpers.ts.enclave_permissions_checker import EnclavePermissionsChecker
+from .helpers.ts.report_comparer import ReportComparer
+from .helpers.ts.routing_upserter import RoutingUpserter
+from .helpers.ts.verification_queue import VerificationQueue
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Tuple, Union
+    from logging import Logger
+    from trustar import Report
+    from .handler_config import HandlerConfig
+    from .helpers.aws.batch_item import BatchItem
+    from .helpers.aws.idempotency_store import IdempotencyStore
+    from .helpers.aws.upsert_spool import UpsertSpool
+    from .helpers.common.metrics_recorder import MetricsRecorder
+    from .helpers.gd.finding_aggregator import RollupGroup
+    from .helpers.ts.enclave_permissions_cache import EnclavePermissionsCache
+    from .helpers.ts.report_index import ReportIndex
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class AsyncTruStarGuardDutyLambdaHandler(BaseHandler):
+    """ The asyncio counterpart of the TruStarGuardDutyLambdaHandler's
+    batch mode.  Builds reports with the same GuardDutyReportBuilder, then
+    keeps up to 'async_max_in_flight' upserts in flight on one pooled
+    HTTP session.  Build instances with 'create'. """
+
+    def __init__(self, config,                         # type: HandlerConfig
+                 permissions_cache=None,       # type: EnclavePermissionsCache
+                 report_index=None,             # type: Optional[ReportIndex]
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 idempotency_store=None,   # type: Optional[IdempotencyStore]
+                 upsert_spool=None              # type: Optional[UpsertSpool]
+                 ):
+        super().__init__(config, permissions_cache, report_index, metrics,
+                         idempotency_store, upsert_spool)
+        self.ts = AsyncStationClient(
+            config.client_params, self.CLIENT_METATAG,
+            max_connections=config.async_max_in_flight,
+            limiter=self.limiter,
+            token_provider=config.build_token_provider(self.metrics))
+        self.upserter = RoutingUpserter.for_enclaves(
+            self.router.enclave_ids, lambda enclave_id: AsyncReportUpserter(
+                self.ts, enclave_id,
+                on_forbidden=lambda: self.permissions_cache.invalidate(
+                    self.perms_key),
+                retry_policy=config.retry_policy(config.lookup_max_attempts),
+                index=self.report_index,
+                digester=self.digester,
+                metrics=self.metrics,
+                breaker=self.breaker,
+                limiter=self.limiter))
+        self.details_fetcher = AsyncReportDetailsFetcher(
+            self.ts, config.retry_policy(config.saved_report_max_attempts),
+            metrics=self.metrics)
+        self.verifier = None     # type: Optional[AsyncSavedReportVerifier]
+        if config.defers_saved_report_check:
+            self.verifier = AsyncSavedReportVerifier(
+                self.ts, self.router.enclave_ids, self.VARS_TO_SKIP,
+                queue=VerificationQueue(config.verification_queue_max_entries),
+                digester=config.build_report_digester(),
+                delay=config.saved_report_verify_delay,
+                metrics=self.metrics)
+
+    @classmethod
+    async def create(cls, config,                      # type: HandlerConfig
+                     permissions_cache=None,   # type: EnclavePermissionsCache
+                     report_index=None,         # type: Optional[ReportIndex]
+                     metrics=None,            # type: Optional[MetricsRecorder]
+                     idempotency_store=None,
+                     upsert_spool=None
+                     ):     # type: (...) -> AsyncTruStarGuardDutyLambdaHandler
+        """ Builds the handler and verifies its enclave permissions.  Closes
+        the handler's HTTP session if they can't be verified. """
+        logger.info("Initializing async lambda handler.")
+        handler = cls(config, permissions_cache, report_index, metrics,
+                      idempotency_store, upsert_spool)
+        try:
+            with handler.metrics.span('PermissionCheck'):
+                await handler.check_permissions()
+        except Exception:
+            await handler.close()
+            raise
+        return handler
+
+    async def check_permissions(self):                      # type: () -> None
+        """ Raises exception if the creds can't write to every enclave
+        findings are routed to. """
+        enclaves = self.permissions_cache.peek(self.perms_key)
+        if enclaves is None:
+            enclaves = await self.ts.get_user_enclaves()
+            self.permissions_cache.put(self.perms_key, enclaves)
+        checker = EnclavePermissionsChecker.from_enclaves(enclaves)
+        forbidden = [e for e in self.router.enclave_ids
+                     if not checker.can_create(e)]
+        if forbidden:
+            self.permissions_cache.invalidate(self.perms_key)
+            raise Exception("TruSTAR API creds do not have permissions to "
+                            "write to enclave(s) '{}'."
+                            .format("', '".join(forbidden)))
+
+    async def handle_batch(self, event,            # type: Union[Dict, List]
+                           context=None                            # type: Any
+                           ):                           # type: (...) -> Dict
+        """ Processes an SQS batch or a list of Guard-duty events.  Returns
+        the "batchItemFailures" of the findings that failed. """
+        items = BatchEventParser.parse(event)          # type: List[BatchItem]
+        start = time.perf_counter()
+        await self.process_batch(items, context)
+        summary = BatchSummary(items, time.perf_counter() - start)
+        summary.log()
+        return summary.response()
+
+    async def process_batch(self, items,               # type: List[BatchItem]
+                            context=None                           # type: Any
+                            ):                          # type: (...) -> None
+        """ Builds a report for the newest version of each finding, in each
+        enclave it is routed to, and upserts them with up to
+        'async_max_in_flight' upserts in flight.  Reports that share an
+        external ID are upserted in order, one after the other.  Records
+        each item's result or error on the item instead of raising.  Items
+        whose events were already delivered, and findings the filter drops,
+        are acknowledged without calling Station.  A rollup report is
+        upserted once per batch, with every member the batch added. """
+        self.limiter.context = context
+        claimed = self.drop_duplicates(items)          # type: List[BatchItem]
+        coalesced = self.coalesce(claimed)
+        # external ID -> (items, report) tuples to upsert in order.
+        groups = OrderedDict()             # type: Dict[str, List[Tuple]]
+        routed = OrderedDict()        # type: Dict[BatchItem, List[Dict]]
+        item_reports = {}              # type: Dict[BatchItem, List[Report]]
+        for item in [c.item for c in coalesced]:
+            # noinspection PyBroadException
+            try:
+                item.result = self.filtered_result(item.finding)
+                if item.result is not None:
+                    continue
+                with self.metrics.span('BuildReport'):
+                    reports = await self.build_routed(item.finding)
+                item.error = None
+            except Exception as e:
+                logger.exception("Failed to build report for batch item "
+                                 "'{}'.".format(item.item_id))
+                item.error = e
+                continue
+            routed[item] = []
+            item_reports[item] = reports
+            for report in reports:
+                group = groups.setdefault(report.external_id, [])
+                if group and self.is_rollup(report):
+                    # the newer report of the rollup has every member.
+                    group[0] = (group[0][0] + [item], report)
+                else:
+                    group.append(([item], report))
+
+        semaphore = asyncio.Semaphore(self.config.async_max_in_flight)
+        await asyncio.gather(*[self._process_in_order(group, semaphore,
+                                                      context, routed)
+                               for group in groups.values()])
+        self.supersede_spooled(
+            [report.external_id for group in groups.values()
+             for items, report in group
+             if not any(item.failed for item in items)])
+        for item, results in routed.items():
+            if not item.failed:
+                item.result = self.routed_result(results, item.finding)
+                continue
+            spooled = self.spooled_result(item.finding, item_reports[item],
+                                          item.error)
+            if spooled is not None:
+                item.error, item.result = None, spooled
+        for c in coalesced:
+            c.share_outcome()
+        self.settle_claims(claimed)
+        self.record_spool_gauges()
+        await self.verify_due(context)
+
+    async def build_routed(self, finding):       # type: (Dict) -> List[Report]
+        """ Builds the finding's report for each enclave it is routed to,
+        or, if findings are rolled up, the reports of its groups. """
+        enclave_ids = self.router.route(finding)
+        if self.aggregator is None or not self.aggregator.aggregates(finding):
+            return self.builder.build_for_enclaves(finding, enclave_ids)
+        reports = []                                      # type: List[Report]
+        for enclave_id in enclave_ids:
+            group = self.aggregator.group_for(finding, enclave_id)
+            if not group.loaded:
+                await self.load_rollup(group)
+            self.aggregator.add(finding, group)
+            reports.append(self.aggregator.report_for(group))
+        return reports
+
+    async def load_rollup(self, group):          # type: (RollupGroup) -> None
+        """ Reads a group's members back from its report in Station. """
+        upserter = self.upserter.upserters[group.enclave_id]
+        with self.metrics.span('LoadRollup'):
+            existing = await upserter.fetch_existing_report(group.external_id)
+        group.restore(existing.body if existing else None)
+        if existing:
+            upserter.index_upserted(existing)
+
+    async def _process_in_order(self, group,
+                                semaphore,         # type: asyncio.Semaphore
+                                context,                           # type: Any
+                                routed        # type: Dict[BatchItem, List]
+                                ):                      # type: (...) -> None
+        """ Processes one external ID's reports in order.  'group' is a
+        list of (BatchItem list, Report) tuples.  The results are added to
+        the items' lists in 'routed'. """
+        for items, report in group:
+            start = time.perf_counter()
+            async with semaphore:
+                # noinspection PyBroadException
+                try:
+                    with self.metrics.span('Upsert'):
+                        upserted = await self.upserter.upsert(report)
+                    result = await self.result_for(upserted, context)
+                    for item in items:
+                        routed[item].append(result)
+                except Exception as e:
+                    for item in items:
+                        logger.error("Failed to process batch item '{}':  {}"
+                                     .format(item.item_id, e))
+                        item.error = e
+            for item in items:
+                item.seconds += time.perf_counter() - start
+
+    async def result_for(self, upserted,                        # type: Report
+                         context=None                              # type: Any
+                         ):                             # type: (...) -> Dict
+        """ Returns the upserted report, or the report saved in Station if
+        the user wants the saved report checked. """
+        if not self.config.return_saved_report:
+            return upserted.to_dict()
+        if self.verifier is not None:
+            self.verifier.defer(upserted)
+            return upserted.to_dict()
+
+        saved = await self.details_fetcher.fetch_for(
+            upserted.external_id, context)             # type: Optional[Report]
+        if not saved:
+            logger.error("Failed to fetch saved report from Station. "
+                         "Returning the upserted report.")
+            return upserted.to_dict()
+
+        with self.metrics.span('CompareReport'):
+            _ = ReportComparer.compare(upserted, saved, self.VARS_TO_SKIP)
+        return saved.to_dict()
+
+    async def verify_due(self, context=None,                       # type: Any
+                         everything=False                         # type: bool
+                         ):                              # type: (...) -> int
+        """ Runs a verification pass over the deferred saved report checks
+        that are due, if checks are deferred. """
+        if self.verifier is None:
+            return 0
+        return await self.verifier.verify_due(context, everything)
+
+    async def close(self):                                  # type: () -> None
+        """ Closes the pooled HTTP session. """
+        await self.ts.close()
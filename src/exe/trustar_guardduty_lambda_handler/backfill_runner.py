@@ -0,0 +1,120 @@
+# encoding = utf-8
+
+""" BackfillRunner class definition. """
+
+import itertools
+import json
+from logging import getLogger
+import time
+
+from .helpers.aws.batch_item import BatchItem
+from .helpers.aws.finding_source import FindingSource
+from .helpers.common.backfill_checkpoint import BackfillCheckpoint
+from .helpers.common.backfill_progress import BackfillProgress
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Iterator, List, Optional, TextIO
+    from logging import Logger
+    from .ts_gd_lambda_handler import TruStarGuardDutyLambdaHandler
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BackfillRunner:
+    """ Upserts historical findings (ex:  a GuardDuty export) to Station
+    through a lambda handler, a chunk at a time.
+
+    Findings are streamed from the FindingSource in chunks of
+    'batch_size';  the handler builds each chunk's reports and upserts
+    them concurrently (UPSERT_WORKERS), exactly as it does an SQS batch.
+    Only one chunk is held in memory at a time.
+
+    The checkpoint records every chunk once it's upserted and is saved
+    every 'checkpoint_every' seconds, after each file and when the run
+    stops, even on an error or an interrupt.  A resumed run skips the
+    files it finished and the findings it already processed in the file
+    it was on;  at most the chunks since the last save are upserted
+    again, which upserting makes harmless.  Findings that fail are
+    appended to 'failed_file' as JSON lines, so they can be backfilled
+    again on their own. """
+
+    def __init__(self, handler,         # type: TruStarGuardDutyLambdaHandler
+                 source,                                 # type: FindingSource
+                 checkpoint=None,          # type: Optional[BackfillCheckpoint]
+                 batch_size=100,                                   # type: int
+                 checkpoint_every=30.0,                          # type: float
+                 failed_file=None,                    # type: Optional[TextIO]
+                 log_every=10.0                                  # type: float
+                 ):
+        self.handler = handler          # type: TruStarGuardDutyLambdaHandler
+        self.source = source                             # type: FindingSource
+        self.checkpoint = checkpoint or BackfillCheckpoint()
+        self.batch_size = batch_size                               # type: int
+        self.checkpoint_every = checkpoint_every                 # type: float
+        self.failed_file = failed_file                # type: Optional[TextIO]
+        self.log_every = log_every                               # type: float
+        self.progress = None            # type: Optional[BackfillProgress]
+
+    def run(self):                                          # type: () -> Dict
+        """ Backfills every finding not yet checkpointed.  Returns the
+        run's totals and those of the checkpoint. """
+        pending = [(location, size) for location, size
+                   in self.source.objects()
+                   if not self.checkpoint.is_complete(location)]
+        self.progress = BackfillProgress(sum(s for _, s in pending),
+                                         log_every=self.log_every)
+        logger.info("Backfilling '{}' file(s).".format(len(pending)))
+        saved_at = time.monotonic()
+        try:
+            for location, _ in pending:
+                for items in self.chunks(location):
+                    self.process(location, items)
+                    if time.monotonic() - saved_at >= self.checkpoint_every:
+                        self.save()
+                        saved_at = time.monotonic()
+                self.checkpoint.complete(location)
+                self.save()
+                saved_at = time.monotonic()
+        finally:
+            self.save()
+            logger.info("Backfill stopped.  " + self.progress.line())
+        return {'findings': self.progress.findings,
+                'failed': self.progress.failed,
+                'seconds': round(self.progress.elapsed, 3),
+                'findings_per_second': round(self.progress.rate, 1),
+                'totals': dict(self.checkpoint.totals)}
+
+    def save(self):                                         # type: () -> None
+        """ Saves the checkpoint, after the failed findings it counts. """
+        if self.failed_file is not None:
+            self.failed_file.flush()
+        self.checkpoint.save()
+
+    def chunks(self, location):      # type: (str) -> Iterator[List[BatchItem]]
+        """ The location's findings not processed yet, in chunks. """
+        skip = self.checkpoint.done(location)
+        if skip:
+            logger.info("Skipping the '{}' finding(s) of '{}' already "
+                        "processed.".format(skip, location))
+        findings = enumerate(self.source.findings(location))
+        findings = itertools.islice(findings, skip, None)
+        while True:
+            chunk = [BatchItem("{}#{}".format(location, i), finding=f)
+                     for i, f in itertools.islice(findings, self.batch_size)]
+            if not chunk:
+                return
+            yield chunk
+
+    def process(self, location,                                    # type: str
+                items                                  # type: List[BatchItem]
+                ):                                      # type: (...) -> None
+        self.handler.process_batch(items)
+        failed = [i for i in items if i.failed]
+        for item in failed:
+            logger.warning("Could not backfill finding '{}':  {}"
+                           .format(item.item_id, item.error))
+            if self.failed_file is not None:
+                self.failed_file.write(json.dumps(item.finding) + '\n')
+        self.checkpoint.advance(location, len(items), len(failed))
+        self.progress.update(len(items), len(failed), self.source.bytes_read)
@@ -0,0 +1,195 @@
+# encoding = utf-8
+
+""" BaseHandler class definition. """
+
+from logging import getLogger
+
+from .handler_config import HandlerConfig
+from .helpers.common.metrics_recorder import MetricsRecorder
+from .helpers.gd.finding_aggregator import FindingAggregator
+from .helpers.gd.finding_coalescer import FindingCoalescer
+from .helpers.gd.report_builder import GuardDutyReportBuilder
+from .helpers.ts.enclave_permissions_cache import EnclavePermissionsCache
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+    from logging import Logger
+    from trustar import Report
+    from .helpers.aws.batch_item import BatchItem
+    from .helpers.aws.idempotency_store import IdempotencyStore
+    from .helpers.aws.upsert_spool import UpsertSpool
+    from .helpers.gd.finding_coalescer import CoalescedFinding
+    from .helpers.ts.report_index import ReportIndex
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BaseHandler:
+    """ What the TruStarGuardDutyLambdaHandler and its asyncio counterpart
+    share:  the components built from the config, and the steps around
+    the upserts that don't call Station (deduplication, filtering,
+    coalescing, spooling).  The idempotency store's and the spool's calls
+    block in both handlers;  they're quick next to Station's. """
+
+    CLIENT_METATAG = "AWS_GUARD_DUTY"
+    VARS_TO_SKIP = ("created", "updated", "id")
+
+    def __init__(self, config=None,                    # type: HandlerConfig
+                 permissions_cache=None,       # type: EnclavePermissionsCache
+                 report_index=None,             # type: Optional[ReportIndex]
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 idempotency_store=None,   # type: Optional[IdempotencyStore]
+                 upsert_spool=None              # type: Optional[UpsertSpool]
+                 ):
+        if config is None:
+            config = HandlerConfig.from_env_vars()
+        if permissions_cache is None:
+            permissions_cache = EnclavePermissionsCache(
+                ttl_seconds=config.permissions_cache_ttl,
+                file_path=config.permissions_cache_path)
+        if report_index is None:
+            report_index = config.build_report_index()
+        if idempotency_store is None:
+            idempotency_store = config.build_idempotency_store()
+        # the handler caches flush the recorder once per invocation.
+        self.metrics = metrics or MetricsRecorder()    # type: MetricsRecorder
+        if upsert_spool is None:
+            upsert_spool = config.build_upsert_spool(self.metrics)
+        self.config = config                             # type: HandlerConfig
+        self.permissions_cache = \
+            permissions_cache                  # type: EnclavePermissionsCache
+        self.perms_key = config.credentials_fingerprint            # type: str
+        self.report_index = report_index        # type: Optional[ReportIndex]
+        self.idempotency_store = \
+            idempotency_store             # type: Optional[IdempotencyStore]
+        self.upsert_spool = upsert_spool        # type: Optional[UpsertSpool]
+        self.finding_filter = config.build_finding_filter(self.metrics)
+        self.router = config.build_finding_router(self.metrics)
+        self.aggregator = config.build_aggregator(
+            self.metrics)                  # type: Optional[FindingAggregator]
+        self.limiter = config.build_rate_limiter(self.metrics)
+        self.builder = GuardDutyReportBuilder(
+            config.enclave_id, config.report_body_format,
+            shaper=config.build_body_shaper(self.metrics))
+        # the enclaves' upserters share the index, the digester and the
+        # breaker:  they all talk to the same Station.
+        self.digester = config.build_report_digester()
+        self.breaker = config.build_circuit_breaker(self.metrics)
+
+    def is_duplicate(self, event):                       # type: (Dict) -> bool
+        """ Claims the event's idempotency key.  True if another delivery
+        of the same event already claimed it. """
+        store = self.idempotency_store
+        if store is None or store.claim_event(event):
+            return False
+        logger.info("Dropping duplicate delivery of event '{}'."
+                    .format(event.get('id')))
+        self.metrics.increment('DuplicatesDropped')
+        return True
+
+    def duplicate_result(self, event):                   # type: (Dict) -> Dict
+        """ What a dropped duplicate is acknowledged with. """
+        return {'duplicate': True,
+                'externalTrackingId': self.builder.external_id_for(event)}
+
+    def drop_duplicates(self, items    # type: List[BatchItem]
+                        ):                     # type: (...) -> List[BatchItem]
+        """ Acknowledges the items whose events were already delivered and
+        returns the others. """
+        fresh = []                                     # type: List[BatchItem]
+        for item in items:
+            if (not isinstance(item.finding, dict)
+                    or not self.is_duplicate(item.finding)):
+                fresh.append(item)
+            else:
+                item.result = self.duplicate_result(item.finding)
+        return fresh
+
+    def settle_claims(self, items):          # type: (List[BatchItem]) -> None
+        """ Completes the idempotency keys of the items that were processed
+        and gives up those of the items that failed, so that their
+        redeliveries are processed. """
+        for item in items:
+            if isinstance(item.finding, dict):
+                self.settle_claim(item.finding, item.failed)
+
+    def settle_claim(self, event,                                 # type: Dict
+                     failed                                       # type: bool
+                     ):                                 # type: (...) -> None
+        store = self.idempotency_store
+        if store is None:
+            return
+        if failed:
+            store.release_event(event)
+        else:
+            store.complete_event(event)
+
+    def filtered_result(self, finding):        # type: (Dict) -> Optional[Dict]
+        """ What a finding the filter drops is acknowledged with, or None
+        if it passes. """
+        rule = self.finding_filter.rejecting_rule(finding)
+        if rule is None:
+            return None
+        logger.info("Finding '{}' dropped by filter rule '{}'."
+                    .format((finding.get('detail') or {}).get('id'), rule))
+        return {'filtered': True, 'rule': rule,
+                'findingId': (finding.get('detail') or {}).get('id')}
+
+    @staticmethod
+    def routed_result(results,                              # type: List[Dict]
+                      finding                                     # type: Dict
+                      ):                                # type: (...) -> Dict
+        """ What a finding is acknowledged with:  its report, its reports
+        if it was routed to several enclaves, or, if it was routed nowhere,
+        its ID. """
+        if len(results) == 1:
+            return results[0]
+        if results:
+            return {'reports': results}
+        return {'routed': False,
+                'findingId': (finding.get('detail') or {}).get('id')}
+
+    def coalesce(self, items    # type: List[BatchItem]
+                 ):                   # type: (...) -> List[CoalescedFinding]
+        """ Keeps only the newest version of each finding in the batch,
+        unless the user turned coalescing off. """
+        return FindingCoalescer.coalesce_batch(
+            items,
+            self.builder.external_id_for if self.config.coalesce_findings
+            else None,
+            max_buffered=self.config.coalesce_max_buffered,
+            metrics=self.metrics)
+
+    def is_rollup(self, report):                      # type: (Report) -> bool
+        return (self.aggregator is not None
+                and FindingAggregator.is_rollup(report.external_id))
+
+    def spooled_result(self, finding,                              # type: Dict
+                       reports,                           # type: List[Report]
+                       error                                 # type: Exception
+                       ):                       # type: (...) -> Optional[Dict]
+        """ Spools the finding's reports, for 'drain_spool' to upsert again,
+        if their upserts failed because Station was struggling.  What the
+        finding is acknowledged with, or None if it wasn't spooled. """
+        spool = self.upsert_spool
+        if spool is None or not reports or not spool.is_spoolable(error):
+            return None
+        finding_id = (finding.get('detail') or {}).get('id')
+        if not spool.spool(finding, reports, error):
+            return None
+        logger.warning("Failed to upsert the report(s) of finding '{}':  {}  "
+                       "Spooled them for a later drain."
+                       .format(finding_id, error))
+        return {'spooled': True, 'findingId': finding_id,
+                'externalTrackingIds': [r.external_id for r in reports]}
+
+    def supersede_spooled(self, external_ids):  # type: (List[str]) -> None
+        """ Drops spooled reports that were just upserted again, so the
+        drain doesn't overwrite them with older versions. """
+        if self.upsert_spool is not None:
+            self.upsert_spool.ack(external_ids, 'SpoolSuperseded')
+
+    def record_spool_gauges(self):                          # type: () -> None
+        if self.upsert_spool is not None:
+            self.upsert_spool.record_gauges()
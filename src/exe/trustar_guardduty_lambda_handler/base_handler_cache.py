@@ -0,0 +1,110 @@
+# encoding = utf-8
+
+""" BaseHandlerCache class definition. """
+
+from .helpers.common.metrics_recorder import MetricsRecorder
+from .helpers.ts.enclave_permissions_cache import EnclavePermissionsCache
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, Optional, Tuple
+    from .handler_config import HandlerConfig
+    from .helpers.aws.idempotency_store import IdempotencyStore
+    from .helpers.aws.upsert_spool import UpsertSpool
+    from .helpers.ts.report_index import ReportIndex
+
+
+class BaseHandlerCache:
+    """ What the HandlerCache and the AsyncHandlerCache share:  the
+    resources that outlive the handlers they are handed to (the enclave
+    permissions cache, the report index, the idempotency store, the upsert
+    spool and the MetricsRecorder), each rebuilt only when its own settings
+    change. """
+
+    def __init__(self, handler_cls):
+        self.handler_cls = handler_cls
+        self._handler = None
+        self._fingerprint = None                         # type: Optional[str]
+        # the raw env var values the cached handler's configs were read from.
+        self._env_vars = None                          # type: Optional[Tuple]
+        self._perms_cache = None   # type: Optional[EnclavePermissionsCache]
+        self._report_index = None           # type: Optional[ReportIndex]
+        self._report_index_settings = None             # type: Optional[Tuple]
+        self._idempotency_store = None   # type: Optional[IdempotencyStore]
+        self._idempotency_settings = None              # type: Optional[Tuple]
+        self._upsert_spool = None             # type: Optional[UpsertSpool]
+        self._upsert_spool_settings = None             # type: Optional[Tuple]
+        self.metrics = MetricsRecorder()               # type: MetricsRecorder
+        self._metrics_settings = None                  # type: Optional[Tuple]
+
+    def handler_if_current(self, env_vars):              # type: (Tuple) -> Any
+        """ The cached handler, if the env vars didn't change since its
+        configs were read from them. """
+        if self._handler is not None and env_vars == self._env_vars:
+            return self._handler
+        return None
+
+    def handler_kwargs(self, config               # type: HandlerConfig
+                       ):                       # type: (...) -> Dict[str, Any]
+        """ The resources to build a handler for 'config' with. """
+        metrics = self.metrics_for(config)
+        return {'permissions_cache': self.permissions_cache_for(config),
+                'report_index': self.report_index_for(config),
+                'metrics': metrics,
+                'idempotency_store': self.idempotency_store_for(config),
+                'upsert_spool': self.upsert_spool_for(config, metrics)}
+
+    def permissions_cache_for(self, config               # type: HandlerConfig
+                              ):     # type: (...) -> EnclavePermissionsCache
+        """ Returns the enclave permissions cache, which outlives the
+        handlers it is handed to unless its own settings change. """
+        c = self._perms_cache
+        if (c is None
+                or c.ttl_seconds != config.permissions_cache_ttl
+                or c.file_path != config.permissions_cache_path):
+            c = EnclavePermissionsCache(
+                ttl_seconds=config.permissions_cache_ttl,
+                file_path=config.permissions_cache_path)
+            self._perms_cache = c
+        return c
+
+    def report_index_for(self, config                    # type: HandlerConfig
+                         ):              # type: (...) -> Optional[ReportIndex]
+        """ Returns the report index, which outlives the handlers it is
+        handed to unless its own settings change. """
+        if self._report_index_settings != config.report_index_settings:
+            self._report_index = config.build_report_index()
+            self._report_index_settings = config.report_index_settings
+        return self._report_index
+
+    def idempotency_store_for(self, config               # type: HandlerConfig
+                              ):    # type: (...) -> Optional[IdempotencyStore]
+        """ Returns the idempotency store, which outlives the handlers it
+        is handed to unless its own settings change. """
+        if self._idempotency_settings != config.idempotency_settings:
+            self._idempotency_store = config.build_idempotency_store()
+            self._idempotency_settings = config.idempotency_settings
+        return self._idempotency_store
+
+    def upsert_spool_for(self, config,                   # type: HandlerConfig
+                         metrics                       # type: MetricsRecorder
+                         ):              # type: (...) -> Optional[UpsertSpool]
+        """ Returns the upsert spool, which outlives the handlers it is
+        handed to unless its own settings, or the metrics recorder,
+        change. """
+        if (self._upsert_spool_settings != config.upsert_spool_settings
+                or (self._upsert_spool is not None
+                    and self._upsert_spool.metrics is not metrics)):
+            self._upsert_spool = config.build_upsert_spool(metrics)
+            self._upsert_spool_settings = config.upsert_spool_settings
+        return self._upsert_spool
+
+    def metrics_for(self, config                         # type: HandlerConfig
+                    ):                         # type: (...) -> MetricsRecorder
+        """ Returns the metrics recorder, which outlives the handlers it is
+        handed to unless its own settings change. """
+        if self._metrics_settings != config.metrics_settings:
+            self.metrics.flush()
+            self.metrics = config.build_metrics_recorder()
+            self._metrics_settings = config.metrics_settings
+        return self.metrics
@@ -0,0 +1,148 @@
+# encoding = utf-8
+
+""" HandlerCache class definition. """
+
+from logging import getLogger
+import threading
+import time
+
+from .base_handler_cache import BaseHandlerCache
+from .handler_config import HandlerConfig
+from .helpers.aws.batch_event_parser import BatchEventParser
+from .helpers.aws.batch_summary import BatchSummary
+from .helpers.ts.station_error_classifier import StationErrorClassifier
+from .ts_gd_lambda_handler import TruStarGuardDutyLambdaHandler
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Union
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class HandlerCache(BaseHandlerCache):
+    """ Holds one TruStarGuardDutyLambdaHandler for the life of a Lambda
+    container so that warm invocations skip building the TruStar client,
+    authenticating and checking enclave permissions.
+
+    The handler is rebuilt when the configs (env vars) change or when a
+    call to Station fails with an auth error.  The cache also owns the
+    MetricsRecorder and emits its metrics once per invocation. """
+
+    def __init__(self, handler_cls=TruStarGuardDutyLambdaHandler):
+        super().__init__(handler_cls)
+        self._lock = threading.Lock()
+
+    def warm(self):                                         # type: () -> None
+        """ Builds the handler during the Lambda init phase.  Failures are
+        logged, not raised, so the invocation that follows can retry the
+        build and surface the error to the caller. """
+        # noinspection PyBroadException
+        try:
+            self.get()
+        except Exception:
+            logger.warning("Failed to build lambda handler during init. "
+                           "Will try again on first invocation.",
+                           exc_info=True)
+
+    def get(self):               # type: () -> TruStarGuardDutyLambdaHandler
+        """ Returns the cached handler, building a new one if there isn't
+        one yet or if the configs changed since it was built.  The configs
+        are only parsed again if the env vars changed. """
+        env_vars = HandlerConfig.env_vars_of()
+        with self._lock:
+            handler = self.handler_if_current(env_vars)
+            if handler is not None:
+                logger.info("Re-using cached lambda handler.")
+                return handler
+            config = HandlerConfig.from_env_vars()
+            self._env_vars = env_vars
+            if self._handler is None:
+                logger.info("No cached lambda handler.  Building one.")
+            elif self._fingerprint != config.fingerprint:
+                logger.info("Lambda handler configs changed.  Rebuilding "
+                            "lambda handler.")
+            else:
+                logger.info("Re-using cached lambda handler.")
+                return self._handler
+
+            self._close_handler()
+            kwargs = self.handler_kwargs(config)
+            with self.metrics.span('HandlerBuild'):
+                self._handler = self.handler_cls(config, **kwargs)
+            self._fingerprint = config.fingerprint
+            return self._handler
+
+    def invalidate(self):                                   # type: () -> None
+        """ Drops the cached handler so that the next call to 'get'
+        builds a new one. """
+        with self._lock:
+            logger.info("Invalidating cached lambda handler.")
+            self._close_handler()
+            self._fingerprint = None
+
+    def _close_handler(self):                               # type: () -> None
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+    def handle(self, event,                                       # type: Dict
+               context=None                                        # type: Any
+               ):                                       # type: (...) -> Dict
+        """ Processes the event with the cached handler.  If Station
+        rejects the handler's credentials, rebuilds the handler once and
+        tries again. """
+        handler = self.get()
+        with self.metrics.invocation():
+            try:
+                return handler.handle(event, context)
+            except Exception as e:
+                if not StationErrorClassifier.is_auth_error(e):
+                    raise
+                logger.warning("Station call failed with an auth error.  "
+                               "Rebuilding lambda handler and retrying "
+                               "once.")
+                self.invalidate()
+                return self.get().handle(event, context)
+
+    def handle_batch(self, event,                  # type: Union[Dict, List]
+                     context=None                                  # type: Any
+                     ):                                 # type: (...) -> Dict
+        """ Processes a batch of findings with the cached handler and
+        returns the "batchItemFailures" response.  Items that failed with
+        an auth error are retried once with a rebuilt handler. """
+        items = BatchEventParser.parse(event)
+        start = time.perf_counter()
+        handler = self.get()
+        with self.metrics.invocation() as metrics:
+            handler.process_batch(items, context)
+
+            auth_failed = [i for i in items if i.failed and
+                           StationErrorClassifier.is_auth_error(i.error)]
+            if auth_failed:
+                logger.warning("'{}' batch item(s) failed with an auth "
+                               "error.  Rebuilding lambda handler and "
+                               "retrying them once.".format(len(auth_failed)))
+                self.invalidate()
+                self.get().process_batch(auth_failed, context)
+
+            summary = BatchSummary(items, time.perf_counter() - start)
+            summary.log()
+            summary.record(metrics)
+        return summary.response()
+
+    def verify(self, context=None):                       # type: (Any) -> Dict
+        """ Verifies every deferred saved report check this container has
+        queued, due or not.  Returns how many reports were checked. """
+        handler = self.get()
+        with self.metrics.invocation():
+            checked = handler.verify_due(context, everything=True)
+        return {'checked': checked}
+
+    def drain(self, context=None):                        # type: (Any) -> Dict
+        """ Upserts the spooled reports that are due.  Returns how many
+        were drained, failed again and are left. """
+        handler = self.get()
+        with self.metrics.invocation():
+            return handler.drain_spool(context)
@@ -0,0 +1,481 @@
+# encoding = utf-8
+
+""" HandlerConfig class definition. """
+
+import hashlib
+import json
+from logging import getLogger
+import os
+
+from .helpers.aws.dynamodb_idempotency_store import \
+    DynamoDbIdempotencyStore
+from .helpers.aws.file_idempotency_store import FileIdempotencyStore
+from .helpers.aws.file_upsert_spool import FileUpsertSpool
+from .helpers.aws.memory_idempotency_store import MemoryIdempotencyStore
+from .helpers.aws.s3_upsert_spool import S3UpsertSpool
+from .helpers.common.circuit_breaker import CircuitBreaker
+from .helpers.common.emf_metrics_sink import EmfMetricsSink
+from .helpers.common.metrics_recorder import MetricsRecorder
+from .helpers.common.retry_policy import RetryPolicy
+from .helpers.gd.body_shaper import BodyShaper
+from .helpers.gd.finding_aggregator import FindingAggregator
+from .helpers.gd.finding_filter import FindingFilter
+from .helpers.gd.finding_router import FindingRouter
+from .helpers.gd.report_builder import GuardDutyReportBuilder
+from .helpers.ts.client_builder import ClientBuilder
+from .helpers.ts.dynamodb_report_index import DynamoDbReportIndex
+from .helpers.ts.file_report_index import FileReportIndex
+from .helpers.ts.memory_report_index import MemoryReportIndex
+from .helpers.ts.report_digester import ReportDigester
+from .helpers.ts.station_error_classifier import StationErrorClassifier
+from .helpers.ts.station_rate_limiter import StationRateLimiter
+from .helpers.ts.token_provider import TokenProvider
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Tuple
+    from logging import Logger
+    from .helpers.aws.idempotency_store import IdempotencyStore
+    from .helpers.aws.upsert_spool import UpsertSpool
+    from .helpers.ts.report_index import ReportIndex
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class HandlerConfig:
+    """ A validated snapshot of the environment variables the Lambda
+    handler is configured with. """
+
+    REQUIRED_CLIENT_PARAMS = ('user_api_key', 'user_api_secret')
+
+    # optional settings:  (attribute, env var, type, default).
+    # "path" settings may be set to an empty string to disable them.
+    SETTINGS = (
+        ('enclave_routes', 'ENCLAVE_ROUTES', str, None),
+        ('finding_filter', 'FINDING_FILTER', str, None),
+        ('return_saved_report', 'RETURN_SAVED_REPORT', bool, False),
+        ('saved_report_check', 'SAVED_REPORT_CHECK', str, 'inline'),
+        ('saved_report_verify_delay', 'SAVED_REPORT_VERIFY_DELAY_SECONDS',
+         float, 30.0),
+        ('verification_queue_max_entries', 'VERIFICATION_QUEUE_MAX_ENTRIES',
+         int, 10000),
+        ('permissions_cache_ttl', 'PERMISSIONS_CACHE_TTL_SECONDS', float,
+         900.0),
+        ('permissions_cache_path', 'PERMISSIONS_CACHE_PATH', str,
+         '/tmp/trustar_enclave_permissions.json'),
+        ('token_cache_path', 'TOKEN_CACHE_PATH', str,
+         '/tmp/trustar_token.json'),
+        ('token_refresh_margin', 'TOKEN_REFRESH_MARGIN_SECONDS', float,
+         TokenProvider.DEFAULT_REFRESH_MARGIN),
+        ('upsert_workers', 'UPSERT_WORKERS', int, 8),
+        ('async_max_in_flight', 'ASYNC_MAX_IN_FLIGHT', int, 100),
+        ('lookup_max_attempts', 'LOOKUP_MAX_ATTEMPTS', int, 1),
+        ('saved_report_max_attempts', 'SAVED_REPORT_MAX_ATTEMPTS', int, 6),
+        ('retry_base_delay', 'RETRY_BASE_DELAY_SECONDS', float, 0.5),
+        ('retry_max_delay', 'RETRY_MAX_DELAY_SECONDS', float, 4.0),
+        ('circuit_breaker_threshold', 'CIRCUIT_BREAKER_THRESHOLD', int, 5),
+        ('circuit_breaker_reset', 'CIRCUIT_BREAKER_RESET_SECONDS', float,
+         30.0),
+        ('station_reads_per_second', 'STATION_READS_PER_SECOND', float,
+         None),
+        ('station_writes_per_second', 'STATION_WRITES_PER_SECOND', float,
+         None),
+        ('station_rate_burst', 'STATION_RATE_BURST', float, None),
+        ('station_max_throttled_attempts', 'STATION_MAX_THROTTLED_ATTEMPTS',
+         int, 5),
+        ('report_index', 'REPORT_INDEX', str, 'memory'),
+        ('report_index_max_entries', 'REPORT_INDEX_MAX_ENTRIES', int, 10000),
+        ('report_index_path', 'REPORT_INDEX_PATH', str,
+         '/tmp/trustar_report_index.json'),
+        ('report_index_table', 'REPORT_INDEX_TABLE', str, None),
+        ('report_index_endpoint_url', 'REPORT_INDEX_ENDPOINT_URL', str, None),
+        ('idempotency_store', 'IDEMPOTENCY_STORE', str, 'memory'),
+        ('idempotency_ttl', 'IDEMPOTENCY_TTL_SECONDS', float, 3600.0),
+        ('idempotency_lease', 'IDEMPOTENCY_LEASE_SECONDS', float, 900.0),
+        ('idempotency_max_entries', 'IDEMPOTENCY_MAX_ENTRIES', int, 10000),
+        ('idempotency_path', 'IDEMPOTENCY_PATH', str,
+         '/tmp/trustar_idempotency.json'),
+        ('idempotency_table', 'IDEMPOTENCY_TABLE', str, None),
+        ('idempotency_endpoint_url', 'IDEMPOTENCY_ENDPOINT_URL', str, None),
+        ('skip_unchanged_reports', 'SKIP_UNCHANGED_REPORTS', bool, True),
+        ('volatile_report_fields', 'VOLATILE_REPORT_FIELDS', str, None),
+        ('report_body_format', 'REPORT_BODY_FORMAT', str,
+         GuardDutyReportBuilder.PRETTY),
+        ('report_body_max_list_items', 'REPORT_BODY_MAX_LIST_ITEMS', int,
+         100),
+        ('report_body_max_string_chars', 'REPORT_BODY_MAX_STRING_CHARS', int,
+         4096),
+        ('report_body_max_bytes', 'REPORT_BODY_MAX_BYTES', int, 1000000),
+        ('coalesce_findings', 'COALESCE_FINDINGS', bool, True),
+        ('coalesce_max_buffered', 'COALESCE_MAX_BUFFERED', int, 1000),
+        ('rollup_keys', 'ROLLUP_KEYS', str, None),
+        ('rollup_types', 'ROLLUP_TYPES', str, None),
+        ('rollup_bucket_seconds', 'ROLLUP_BUCKET_SECONDS', float, 3600.0),
+        ('rollup_max_members', 'ROLLUP_MAX_MEMBERS', int, 1000),
+        ('rollup_max_groups', 'ROLLUP_MAX_GROUPS', int, 1000),
+        ('upsert_spool', 'UPSERT_SPOOL', str, None),
+        ('upsert_spool_path', 'UPSERT_SPOOL_PATH', str,
+         '/tmp/trustar_upsert_spool'),
+        ('upsert_spool_bucket', 'UPSERT_SPOOL_BUCKET', str, None),
+        ('upsert_spool_prefix', 'UPSERT_SPOOL_PREFIX', str, None),
+        ('upsert_spool_endpoint_url', 'UPSERT_SPOOL_ENDPOINT_URL', str, None),
+        ('upsert_spool_max_bytes', 'UPSERT_SPOOL_MAX_BYTES', int, 50000000),
+        ('upsert_spool_backoff', 'UPSERT_SPOOL_BACKOFF_SECONDS', float, 30.0),
+        ('upsert_spool_drain_batch', 'UPSERT_SPOOL_DRAIN_BATCH', int, 100),
+        ('metrics', 'METRICS', str, 'emf'),
+        ('metrics_namespace', 'METRICS_NAMESPACE', str,
+         MetricsRecorder.DEFAULT_NAMESPACE),
+        ('function_name', 'AWS_LAMBDA_FUNCTION_NAME', str, None),
+    )
+
+    REPORT_INDEX_BACKENDS = ('memory', 'file', 'dynamodb')
+    IDEMPOTENCY_BACKENDS = ('memory', 'file', 'dynamodb')
+    UPSERT_SPOOL_BACKENDS = ('file', 's3')
+    SAVED_REPORT_CHECKS = ('inline', 'deferred')
+
+    def __init__(self, enclave_id,                                 # type: str
+                 client_params,                       # type: Dict[str, str]
+                 **settings
+                 ):
+        self.enclave_id = enclave_id                               # type: str
+        self.client_params = client_params            # type: Dict[str, str]
+        for attr, _, _, default in self.SETTINGS:
+            setattr(self, attr, settings.pop(attr, default))
+        if settings:
+            raise Exception("Unknown lambda handler setting(s) '{}'."
+                            .format("', '".join(settings)))
+        self.validate()
+
+    @classmethod
+    def from_env_vars(cls, environ=None
+                      ):                        # type: (Dict) -> HandlerConfig
+        """ Reads the handler's configs from the Lambda's environment
+        variables. """
+        environ = os.environ if environ is None else environ
+        client_params = {param: environ.get(param.upper()) for param in
+                         ClientBuilder.TRUSTAR_CLIENT_PARAMS}
+        settings = {}
+        for attr, env_var, type_, default in cls.SETTINGS:
+            if env_var in environ:
+                settings[attr] = cls.parse(environ[env_var], type_)
+        return cls(enclave_id=environ.get('ENCLAVE_ID'),
+                   client_params=client_params,
+                   **settings)
+
+    @classmethod
+    def env_vars_of(cls, environ=None):                 # type: (Dict) -> Tuple
+        """ The raw values of the environment variables the configs are
+        read from:  if they didn't change, neither did the configs, and
+        they needn't be parsed and validated again. """
+        environ = os.environ if environ is None else environ
+        return ((environ.get('ENCLAVE_ID'),)
+                + tuple(environ.get(param.upper()) for param in
+                        ClientBuilder.TRUSTAR_CLIENT_PARAMS)
+                + tuple(environ.get(env_var)
+                        for _, env_var, _, _ in cls.SETTINGS))
+
+    def validate(self):                                     # type: () -> None
+        """ Raises exception if a required config is missing. """
+        missing = [p.upper() for p in self.REQUIRED_CLIENT_PARAMS
+                   if not self.client_params.get(p)]
+        if not self.enclave_id:
+            missing.insert(0, 'ENCLAVE_ID')
+        if self.report_index == 'dynamodb' and not self.report_index_table:
+            missing.append('REPORT_INDEX_TABLE')
+        if (self.idempotency_store == 'dynamodb'
+                and not self.idempotency_table):
+            missing.append('IDEMPOTENCY_TABLE')
+        if self.upsert_spool == 's3' and not self.upsert_spool_bucket:
+            missing.append('UPSERT_SPOOL_BUCKET')
+        if missing:
+            msg = ("Lambda handler is missing required environment "
+                   "variable(s) '{}'.".format("', '".join(missing)))
+            logger.error(msg)
+            raise Exception(msg)
+        if self.metrics not in (None, 'emf'):
+            msg = ("Unknown METRICS '{}'.  Use 'emf', or an empty string to "
+                   "disable metrics.".format(self.metrics))
+            logger.error(msg)
+            raise Exception(msg)
+        try:
+            FindingRouter.parse_routes(self.enclave_routes)
+        except Exception as e:
+            msg = "Invalid ENCLAVE_ROUTES.  {}".format(e)
+            logger.error(msg)
+            raise Exception(msg)
+        try:
+            FindingFilter.parse_rules(self.finding_filter)
+        except Exception as e:
+            msg = "Invalid FINDING_FILTER.  {}".format(e)
+            logger.error(msg)
+            raise Exception(msg)
+        try:
+            self.build_aggregator()
+        except Exception as e:
+            msg = "Invalid ROLLUP_* settings.  {}".format(e)
+            logger.error(msg)
+            raise Exception(msg)
+        if self.report_body_format not in GuardDutyReportBuilder.BODY_FORMATS:
+            msg = ("Unknown REPORT_BODY_FORMAT '{}'.  Use one of '{}'."
+                   .format(self.report_body_format,
+                           "', '".join(GuardDutyReportBuilder.BODY_FORMATS)))
+            logger.error(msg)
+            raise Exception(msg)
+        if self.saved_report_check not in self.SAVED_REPORT_CHECKS:
+            msg = ("Unknown SAVED_REPORT_CHECK '{}'.  Use one of '{}'."
+                   .format(self.saved_report_check,
+                           "', '".join(self.SAVED_REPORT_CHECKS)))
+            logger.error(msg)
+            raise Exception(msg)
+        if (self.report_index is not None
+                and self.report_index not in self.REPORT_INDEX_BACKENDS):
+            msg = ("Unknown REPORT_INDEX '{}'.  Use one of '{}', or an "
+                   "empty string to disable the index."
+                   .format(self.report_index,
+                           "', '".join(self.REPORT_INDEX_BACKENDS)))
+            logger.error(msg)
+            raise Exception(msg)
+        if (self.idempotency_store is not None
+                and self.idempotency_store not in self.IDEMPOTENCY_BACKENDS):
+            msg = ("Unknown IDEMPOTENCY_STORE '{}'.  Use one of '{}', or an "
+                   "empty string to process every delivery."
+                   .format(self.idempotency_store,
+                           "', '".join(self.IDEMPOTENCY_BACKENDS)))
+            logger.error(msg)
+            raise Exception(msg)
+        if (self.upsert_spool is not None
+                and self.upsert_spool not in self.UPSERT_SPOOL_BACKENDS):
+            msg = ("Unknown UPSERT_SPOOL '{}'.  Use one of '{}', or an empty "
+                   "string to fail the findings whose upserts fail."
+                   .format(self.upsert_spool,
+                           "', '".join(self.UPSERT_SPOOL_BACKENDS)))
+            logger.error(msg)
+            raise Exception(msg)
+
+    @property
+    def fingerprint(self):                                   # type: () -> str
+        """ A digest of every config value.  If it changes, anything built
+        from the previous configs must be rebuilt. """
+        s = json.dumps(vars(self), sort_keys=True)
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    @property
+    def credentials_fingerprint(self):                       # type: () -> str
+        """ A digest that identifies the API creds and the Station they
+        are used with, without revealing the creds. """
+        params = self.client_params
+        s = '|'.join(str(params.get(p)) for p in ('user_api_key',
+                                                  'user_api_secret',
+                                                  'auth_endpoint',
+                                                  'api_endpoint'))
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    @property
+    def defers_saved_report_check(self):                    # type: () -> bool
+        """ Whether the saved report is checked by a later verification
+        pass instead of during the invocation that upserted it. """
+        return (self.return_saved_report
+                and self.saved_report_check == 'deferred')
+
+    def retry_policy(self, max_attempts):       # type: (int) -> RetryPolicy
+        """ A RetryPolicy with the configured backoff. """
+        return RetryPolicy(max_attempts=max_attempts,
+                           base_delay=self.retry_base_delay,
+                           max_delay=self.retry_max_delay)
+
+    def build_circuit_breaker(self, metrics=None     # type: MetricsRecorder
+                              ):  # type: (...) -> Optional[CircuitBreaker]
+        """ A breaker that stops calling Station after
+        'circuit_breaker_threshold' throttled or failed calls in a row, or
+        None if the threshold is 0. """
+        if self.circuit_breaker_threshold < 1:
+            return None
+        return CircuitBreaker(
+            failure_threshold=self.circuit_breaker_threshold,
+            reset_timeout=self.circuit_breaker_reset,
+            is_failure=StationErrorClassifier.is_transient,
+            metrics=metrics)
+
+    def build_rate_limiter(self, metrics=None        # type: MetricsRecorder
+                           ):          # type: (...) -> StationRateLimiter
+        """ A limiter that keeps reads and writes to the configured rates
+        (unlimited if not set) and waits out Station's 429s. """
+        return StationRateLimiter(
+            reads_per_second=self.station_reads_per_second,
+            writes_per_second=self.station_writes_per_second,
+            burst=self.station_rate_burst,
+            max_throttled_attempts=self.station_max_throttled_attempts,
+            metrics=metrics)
+
+    def build_token_provider(self, metrics=None      # type: MetricsRecorder
+                             ):                  # type: (...) -> TokenProvider
+        """ Hands out the OAuth token of the configured creds, cached in
+        memory and in the token cache file. """
+        return TokenProvider(self.client_params,
+                             self.credentials_fingerprint,
+                             file_path=self.token_cache_path,
+                             refresh_margin=self.token_refresh_margin,
+                             metrics=metrics)
+
+    @property
+    def report_index_settings(self):                       # type: () -> Tuple
+        """ The settings that, if they change, call for a new index. """
+        return (self.report_index, self.report_index_max_entries,
+                self.report_index_path, self.report_index_table,
+                self.report_index_endpoint_url)
+
+    def build_report_index(self):         # type: () -> Optional[ReportIndex]
+        """ The configured external ID -> report ID index, or None if it
+        is disabled. """
+        if self.report_index == 'memory':
+            return MemoryReportIndex(self.report_index_max_entries)
+        if self.report_index == 'file':
+            if not self.report_index_path:
+                return MemoryReportIndex(self.report_index_max_entries)
+            return FileReportIndex(self.report_index_path,
+                                   self.report_index_max_entries)
+        if self.report_index == 'dynamodb':
+            return DynamoDbReportIndex(
+                self.report_index_table,
+                endpoint_url=self.report_index_endpoint_url)
+        return None
+
+    @property
+    def idempotency_settings(self):                        # type: () -> Tuple
+        """ The settings that, if they change, call for a new store. """
+        return (self.idempotency_store, self.idempotency_ttl,
+                self.idempotency_lease, self.idempotency_max_entries,
+                self.idempotency_path,
+                self.idempotency_table, self.idempotency_endpoint_url)
+
+    def build_idempotency_store(self
+                                ):     # type: () -> Optional[IdempotencyStore]
+        """ The configured store of the events already processed, or None
+        if every delivery should be processed. """
+        if self.idempotency_store == 'memory':
+            return MemoryIdempotencyStore(
+                self.idempotency_max_entries, self.idempotency_ttl,
+                lease_seconds=self.idempotency_lease)
+        if self.idempotency_store == 'file':
+            if not self.idempotency_path:
+                return MemoryIdempotencyStore(
+                    self.idempotency_max_entries, self.idempotency_ttl,
+                    lease_seconds=self.idempotency_lease)
+            return FileIdempotencyStore(self.idempotency_path,
+                                        self.idempotency_max_entries,
+                                        self.idempotency_ttl,
+                                        lease_seconds=self.idempotency_lease)
+        if self.idempotency_store == 'dynamodb':
+            return DynamoDbIdempotencyStore(
+                self.idempotency_table,
+                endpoint_url=self.idempotency_endpoint_url,
+                ttl_seconds=self.idempotency_ttl,
+                lease_seconds=self.idempotency_lease)
+        return None
+
+    @property
+    def upsert_spool_settings(self):                       # type: () -> Tuple
+        """ The settings that, if they change, call for a new spool. """
+        return (self.upsert_spool, self.upsert_spool_path,
+                self.upsert_spool_bucket, self.upsert_spool_prefix,
+                self.upsert_spool_endpoint_url, self.upsert_spool_max_bytes,
+                self.upsert_spool_backoff)
+
+    def build_upsert_spool(self, metrics=None        # type: MetricsRecorder
+                           ):            # type: (...) -> Optional[UpsertSpool]
+        """ The configured spool of the reports whose upserts failed, or
+        None if those findings should fail. """
+        kwargs = dict(max_bytes=self.upsert_spool_max_bytes,
+                      backoff_seconds=self.upsert_spool_backoff,
+                      metrics=metrics)
+        if self.upsert_spool == 'file':
+            return FileUpsertSpool(self.upsert_spool_path, **kwargs)
+        if self.upsert_spool == 's3':
+            return S3UpsertSpool(self.upsert_spool_bucket,
+                                 prefix=self.upsert_spool_prefix or '',
+                                 endpoint_url=self.upsert_spool_endpoint_url,
+                                 **kwargs)
+        return None
+
+    def build_finding_router(self, metrics=None      # type: MetricsRecorder
+                             ):                  # type: (...) -> FindingRouter
+        """ The router that sends each finding to the enclaves of the first
+        of the ENCLAVE_ROUTES it matches, or else to ENCLAVE_ID. """
+        return FindingRouter.from_json(self.enclave_id, self.enclave_routes,
+                                       metrics=metrics)
+
+    def build_finding_filter(self, metrics=None      # type: MetricsRecorder
+                             ):                  # type: (...) -> FindingFilter
+        """ The filter that drops the findings FINDING_FILTER rules out
+        before their reports are built. """
+        return FindingFilter.from_json(self.finding_filter, metrics=metrics)
+
+    @staticmethod
+    def split(value):                      # type: (Optional[str]) -> List[str]
+        """ The items of a comma-separated setting. """
+        return [s.strip() for s in (value or '').split(',') if s.strip()]
+
+    def build_aggregator(self, metrics=None          # type: MetricsRecorder
+                         ):        # type: (...) -> Optional[FindingAggregator]
+        """ The aggregator that rolls findings up into one report per
+        group of ROLLUP_KEYS, or None if findings aren't rolled up. """
+        if not self.rollup_keys:
+            return None
+        return FindingAggregator(
+            self.split(self.rollup_keys),
+            bucket_seconds=self.rollup_bucket_seconds,
+            types=self.split(self.rollup_types) or None,
+            max_members=self.rollup_max_members,
+            max_groups=self.rollup_max_groups,
+            metrics=metrics)
+
+    def build_body_shaper(self, metrics=None         # type: MetricsRecorder
+                          ):                       # type: (...) -> BodyShaper
+        """ The shaper that keeps report bodies to a bounded size. """
+        return BodyShaper(max_list_items=self.report_body_max_list_items,
+                          max_string_chars=self.report_body_max_string_chars,
+                          max_body_bytes=self.report_body_max_bytes,
+                          metrics=metrics)
+
+    def build_report_digester(self):   # type: () -> Optional[ReportDigester]
+        """ The digester that lets the upserter skip writes that would not
+        change the report, or None if every upsert should write. """
+        if not self.skip_unchanged_reports:
+            return None
+        return ReportDigester(self.split(self.volatile_report_fields))
+
+    @property
+    def metrics_settings(self):                            # type: () -> Tuple
+        """ The settings that, if they change, call for a new recorder. """
+        return self.metrics, self.metrics_namespace, self.function_name
+
+    def build_metrics_recorder(self):           # type: () -> MetricsRecorder
+        """ A recorder that emits CloudWatch Embedded Metric Format, or a
+        recorder that records nothing if metrics are disabled. """
+        if self.metrics != 'emf':
+            return MetricsRecorder()
+        return MetricsRecorder(
+            [EmfMetricsSink()], namespace=self.metrics_namespace,
+            dimensions={'FunctionName': self.function_name or 'local'})
+
+    @classmethod
+    def parse(cls, value, type_):                  # type: (str, type) -> Any
+        """ Converts an env var's string value to the setting's type. """
+        if type_ is bool:
+            return cls.parse_bool(value)
+        if type_ is str:
+            return value or None
+        try:
+            return type_(value)
+        except ValueError:
+            msg = ("Could not parse env var value '{}' as '{}'."
+                   .format(value, type_.__name__))
+            logger.error(msg)
+            raise Exception(msg)
+
+    @staticmethod
+    def parse_bool(value):                 # type: (Optional[str]) -> bool
+        """ Env vars arrive as strings, only "True" turns a flag on. """
+        if isinstance(value, bool):
+            return value
+        return value == "True"
@@ -0,0 +1,4 @@
+# encoding = utf-8
+
+""" Subpackage of helpers specific to the AWS event sources that invoke
+the Lambda (SQS, EventBridge).  """
@@ -0,0 +1,72 @@
+# encoding = utf-8
+
+""" BatchEventParser class definition. """
+
+import json
+from logging import getLogger
+
+from .batch_item import BatchItem
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Union
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BatchEventParser:
+    """ Splits the event a batch invocation receives into BatchItems.
+    Accepts:
+    - an SQS batch ({"Records": [...]}) whose message bodies are
+      EventBridge GuardDuty events.  Items are identified by messageId.
+    - a list of EventBridge GuardDuty events.  Items are identified by
+      the event's "id".
+    - a single EventBridge GuardDuty event. """
+
+    @classmethod
+    def parse(cls, event                           # type: Union[Dict, List]
+              ):                              # type: (...) -> List[BatchItem]
+        """ Returns one BatchItem per finding in the event. """
+        if isinstance(event, list):
+            items = [cls.from_eventbridge(e, i) for i, e in enumerate(event)]
+        elif isinstance(event, dict) and 'Records' in event:
+            items = [cls.from_sqs_record(r) for r in event['Records']]
+        elif isinstance(event, dict):
+            items = [cls.from_eventbridge(event, 0)]
+        else:
+            raise Exception("Batch event must be an SQS batch, a list of "
+                            "EventBridge events or a single EventBridge "
+                            "event.  Got '{}'.".format(type(event).__name__))
+        logger.info("Parsed batch event into '{}' item(s).".format(len(items)))
+        return items
+
+    @staticmethod
+    def from_eventbridge(event, index):        # type: (Dict, int) -> BatchItem
+        """ Wraps an EventBridge event. """
+        item_id = event.get('id') if isinstance(event, dict) else None
+        if not item_id:
+            item_id = str(index)
+        return BatchItem(item_id, finding=event)
+
+    @staticmethod
+    def from_sqs_record(record):                   # type: (Dict) -> BatchItem
+        """ Decodes the EventBridge event in an SQS message's body.  A
+        body that can't be decoded, or isn't a JSON object, becomes a
+        failed item so the message is reported back to SQS instead of
+        failing the whole batch. """
+        item_id = record.get('messageId')
+        # noinspection PyBroadException
+        try:
+            finding = json.loads(record['body'])
+        except Exception as e:
+            logger.error("Could not decode body of SQS message '{}'."
+                         .format(item_id))
+            return BatchItem(item_id, error=e)
+        if not isinstance(finding, dict):
+            logger.error("Body of SQS message '{}' is not a JSON object."
+                         .format(item_id))
+            return BatchItem(item_id, error=Exception(
+                "SQS message body must be a JSON object.  Got '{}'."
+                .format(type(finding).__name__)))
+        return BatchItem(item_id, finding=finding)
@@ -0,0 +1,26 @@
+# encoding = utf-8
+
+""" BatchItem class definition. """
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Optional
+
+
+class BatchItem:
+    """ One finding from a batch of findings, plus the outcome of
+    processing it. """
+
+    def __init__(self, item_id,                                   # type: str
+                 finding=None,                          # type: Optional[Dict]
+                 error=None                        # type: Optional[Exception]
+                 ):
+        self.item_id = item_id                                     # type: str
+        self.finding = finding                          # type: Optional[Dict]
+        self.error = error                         # type: Optional[Exception]
+        self.result = None                              # type: Optional[Dict]
+        self.seconds = 0.0                                       # type: float
+
+    @property
+    def failed(self):                                       # type: () -> bool
+        return self.error is not None
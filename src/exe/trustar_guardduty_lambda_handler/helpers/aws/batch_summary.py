@@ -0,0 +1,60 @@
+# encoding = utf-8
+
+""" BatchSummary class definition. """
+
+from logging import getLogger
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List
+    from logging import Logger
+    from .batch_item import BatchItem
+    from ..common.metrics_recorder import MetricsRecorder
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BatchSummary:
+    """ Summarizes a processed batch:  builds the partial-batch-failure
+    response Lambda expects and logs throughput / latency. """
+
+    def __init__(self, items,                          # type: List[BatchItem]
+                 seconds                                         # type: float
+                 ):
+        self.items = items                             # type: List[BatchItem]
+        self.seconds = seconds                                   # type: float
+
+    @property
+    def failures(self):                          # type: () -> List[BatchItem]
+        return [i for i in self.items if i.failed]
+
+    def response(self):                                     # type: () -> Dict
+        """ The "batchItemFailures" shape.  Lambda redelivers only these
+        items when the event source mapping reports batch item
+        failures. """
+        return {'batchItemFailures': [{'itemIdentifier': i.item_id}
+                                      for i in self.failures]}
+
+    def stats(self):                                        # type: () -> Dict
+        """ Throughput and latency numbers for the batch. """
+        n = len(self.items)
+        latencies = sorted(i.seconds for i in self.items)
+        return {'findings': n,
+                'failed': len(self.failures),
+                'seconds': round(self.seconds, 3),
+                'findings_per_second': (round(n / self.seconds, 2)
+                                        if self.seconds else None),
+                'p50_ms': round(1000 * latencies[n // 2], 1) if n else None,
+                'max_ms': round(1000 * latencies[-1], 1) if n else None}
+
+    def log(self):                                          # type: () -> None
+        stats = self.stats()
+        logger.info("Processed batch of '{findings}' finding(s) in "
+                    "'{seconds}' s ('{findings_per_second}' findings/s), "
+                    "'{failed}' failed.  Per-finding latency p50 "
+                    "'{p50_ms}' ms, max '{max_ms}' ms.".format(**stats))
+
+    def record(self, metrics):              # type: (MetricsRecorder) -> None
+        """ Adds the batch's size and failures to the metrics. """
+        metrics.increment('BatchItems', len(self.items))
+        metrics.increment('BatchItemFailures', len(self.failures))
@@ -0,0 +1,107 @@
+# encoding = utf-8
+
+""" DynamoDbIdempotencyStore class definition. """
+
+from logging import getLogger
+import time
+
+from .idempotency_store import DEFAULT_LEASE_SECONDS, DEFAULT_TTL_SECONDS, \
+    IdempotencyStore
+
+try:
+    import boto3
+except ImportError:                                       # pragma: no cover
+    boto3 = None
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class DynamoDbIdempotencyStore(IdempotencyStore):
+    """ Keeps the keys in a DynamoDB table whose partition key is the
+    string attribute 'idempotency_key', so every container of every
+    function shares them.  A claim is one conditional put, which only
+    succeeds if the key is absent or its lease or TTL ran out;  completing
+    the key is one unconditional put.  Enable the table's TTL on the
+    'expires_at' attribute to have DynamoDB delete expired keys.
+
+    'endpoint_url' points the client at a DynamoDB-compatible stand-in
+    (ex:  DynamoDB Local) instead of AWS.  A failed table call is logged
+    and the event is processed, as if the store were not there. """
+
+    KEY = 'idempotency_key'
+    EXPIRES_AT = 'expires_at'
+    CONDITION = 'attribute_not_exists(#key) OR #expires_at <= :now'
+
+    def __init__(self, table_name,                                 # type: str
+                 endpoint_url=None,                      # type: Optional[str]
+                 region_name=None,                       # type: Optional[str]
+                 client=None,                                      # type: Any
+                 ttl_seconds=DEFAULT_TTL_SECONDS,                # type: float
+                 clock=time.time,                # type: Callable[[], float]
+                 lease_seconds=DEFAULT_LEASE_SECONDS             # type: float
+                 ):
+        super().__init__(ttl_seconds, clock, lease_seconds)
+        if client is None:
+            if boto3 is None:
+                raise Exception("The DynamoDB idempotency store requires the "
+                                "'boto3' library.")
+            client = boto3.client('dynamodb', endpoint_url=endpoint_url,
+                                  region_name=region_name)
+        self.table_name = table_name                               # type: str
+        self.client = client
+
+    def _key(self, key):                                 # type: (str) -> Dict
+        return {self.KEY: {'S': key}}
+
+    def put_if_absent(self, key,                                   # type: str
+                      now,                                       # type: float
+                      expires_at                                 # type: float
+                      ):                                # type: (...) -> bool
+        item = self._key(key)
+        item[self.EXPIRES_AT] = {'N': str(int(expires_at))}
+        # noinspection PyBroadException
+        try:
+            self.client.put_item(
+                TableName=self.table_name, Item=item,
+                ConditionExpression=self.CONDITION,
+                ExpressionAttributeNames={'#key': self.KEY,
+                                          '#expires_at': self.EXPIRES_AT},
+                ExpressionAttributeValues={':now': {'N': str(int(now))}})
+        except Exception as e:
+            if self.error_code_of(e) == 'ConditionalCheckFailedException':
+                return False
+            logger.warning("Could not write to idempotency table '{}':  {}"
+                           .format(self.table_name, e))
+        return True
+
+    def put(self, key,                                             # type: str
+            expires_at                                           # type: float
+            ):                                          # type: (...) -> None
+        item = self._key(key)
+        item[self.EXPIRES_AT] = {'N': str(int(expires_at))}
+        # noinspection PyBroadException
+        try:
+            self.client.put_item(TableName=self.table_name, Item=item)
+        except Exception as e:
+            logger.warning("Could not write to idempotency table '{}':  {}"
+                           .format(self.table_name, e))
+
+    def delete(self, key):                                # type: (str) -> None
+        # noinspection PyBroadException
+        try:
+            self.client.delete_item(TableName=self.table_name,
+                                    Key=self._key(key))
+        except Exception as e:
+            logger.warning("Could not delete from idempotency table '{}':  "
+                           "{}".format(self.table_name, e))
+
+    @staticmethod
+    def error_code_of(e):                         # type: (Exception) -> str
+        """ The error code of a botocore ClientError. """
+        response = getattr(e, 'response', None) or {}
+        return response.get('Error', {}).get('Code')
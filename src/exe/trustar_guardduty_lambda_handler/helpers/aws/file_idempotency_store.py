@@ -0,0 +1,107 @@
+# encoding = utf-8
+
+""" FileIdempotencyStore class definition. """
+
+import json
+from logging import getLogger
+import os
+import time
+
+from ..common.file_lock import FileLock
+from .idempotency_store import DEFAULT_LEASE_SECONDS, DEFAULT_TTL_SECONDS
+from .memory_idempotency_store import MemoryIdempotencyStore
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Optional, Tuple
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class FileIdempotencyStore(MemoryIdempotencyStore):
+    """ A MemoryIdempotencyStore that is also persisted to a file (ex:  in
+    /tmp), so that the processes sharing the file see each other's
+    claims.  A claim, completion or release holds an exclusive lock on
+    "<file_path>.lock" while it re-reads the file (if another process
+    replaced it) and writes it back;  expired keys are dropped on
+    write. """
+
+    def __init__(self, file_path,                                  # type: str
+                 max_entries=MemoryIdempotencyStore.DEFAULT_MAX_ENTRIES,
+                                                                   # type: int
+                 ttl_seconds=DEFAULT_TTL_SECONDS,                # type: float
+                 clock=time.time,                # type: Callable[[], float]
+                 lease_seconds=DEFAULT_LEASE_SECONDS             # type: float
+                 ):
+        super().__init__(max_entries, ttl_seconds, clock, lease_seconds)
+        self.file_path = file_path                                 # type: str
+        self._version = None                           # type: Optional[Tuple]
+
+    def put_if_absent(self, key,                                   # type: str
+                      now,                                       # type: float
+                      expires_at                                 # type: float
+                      ):                                # type: (...) -> bool
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._expiries.get(key, now) > now:
+                return False
+            MemoryIdempotencyStore.put(self, key, expires_at)
+            self._save(now)
+            return True
+
+    def put(self, key,                                             # type: str
+            expires_at                                           # type: float
+            ):                                          # type: (...) -> None
+        with self._lock, self._file_lock():
+            self._sync()
+            super().put(key, expires_at)
+            self._save(self.clock())
+
+    def delete(self, key):                                # type: (str) -> None
+        with self._lock, self._file_lock():
+            self._sync()
+            super().delete(key)
+            self._save(self.clock())
+
+    def _file_lock(self):
+        return FileLock(self.file_path + '.lock')
+
+    def _file_version(self):                     # type: () -> Optional[Tuple]
+        try:
+            st = os.stat(self.file_path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _sync(self):                                        # type: () -> None
+        """ Reloads the keys if the file changed since it was last read or
+        written by this store. """
+        version = self._file_version()
+        if version is None or version == self._version:
+            return
+        # noinspection PyBroadException
+        try:
+            with open(self.file_path) as f:
+                d = json.load(f)
+        except Exception:
+            logger.warning("Could not read idempotency file '{}'.  Ignoring "
+                           "it.".format(self.file_path))
+            return
+        self._expiries.clear()
+        for key, expires_at in sorted(d.items(), key=lambda kv: kv[1]):
+            self._expiries[key] = expires_at
+        self._version = version
+
+    def _save(self, now):                             # type: (float) -> None
+        d = {k: e for k, e in self._expiries.items() if e > now}
+        tmp_path = "{}.{}.tmp".format(self.file_path, os.getpid())
+        # noinspection PyBroadException
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(d, f)
+            os.replace(tmp_path, self.file_path)
+            self._version = self._file_version()
+        except Exception:
+            logger.warning("Could not write idempotency file '{}'."
+                           .format(self.file_path))
@@ -0,0 +1,119 @@
+# encoding = utf-8
+
+""" FileUpsertSpool class definition. """
+
+from contextlib import contextmanager
+from logging import getLogger
+import os
+
+from ..common.file_lock import FileLock
+from .upsert_spool import UpsertSpool
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Iterator, List, Optional, Tuple
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class FileUpsertSpool(UpsertSpool):
+    """ Keeps the segments as files in a directory (ex:  in /tmp).  Writes
+    are appended to the newest segment until it reaches 'segment_bytes',
+    then a new one is started.  Appends, and compactions from the read to
+    the deletes, hold an exclusive lock on "<directory>/.lock", so the
+    processes sharing the directory don't interleave their lines, or
+    append to a segment a compaction is about to delete. """
+
+    def __init__(self, directory,                                  # type: str
+                 segment_bytes=1000000,                            # type: int
+                 **kwargs                                          # type: Any
+                 ):
+        super().__init__(**kwargs)
+        self.directory = directory                                 # type: str
+        self.segment_bytes = segment_bytes                         # type: int
+        self._active = None                              # type: Optional[str]
+        # how many 'exclusive' blocks hold the lock;  the spool's own lock
+        # keeps the other threads out.
+        self._lock_depth = 0                                       # type: int
+
+    def _path(self, name):                                # type: (str) -> str
+        return os.path.join(self.directory, name)
+
+    def segment_names(self):                           # type: () -> List[str]
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(n for n in names if n.startswith(self.SEGMENT_PREFIX)
+                      and n.endswith(self.SEGMENT_SUFFIX))
+
+    def segment_stamp(self, names):                # type: (List[str]) -> Tuple
+        sizes = []                                         # type: List[Tuple]
+        for name in names:
+            try:
+                sizes.append((name, os.path.getsize(self._path(name))))
+            except OSError:
+                pass
+        return tuple(sizes)
+
+    def read_segment(self, name):             # type: (str) -> Optional[bytes]
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @contextmanager
+    def exclusive(self):                              # type: () -> Iterator
+        """ Holds the directory's lock, unless an outer block does. """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with FileLock(self._path('.lock')):
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+
+    def append_segment(self, data):                     # type: (bytes) -> str
+        with self.exclusive():
+            if self._active is not None:
+                try:
+                    size = os.path.getsize(self._path(self._active))
+                except OSError:
+                    size = None
+                if size is None or size >= self.segment_bytes:
+                    self._active = None
+            if self._active is None:
+                self._active = self.new_segment_name()
+            with open(self._path(self._active), 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        return self._active
+
+    def write_segment(self, name, data):         # type: (str, bytes) -> None
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path('{}.{}.tmp'.format(name, os.getpid()))
+        with self.exclusive():
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(name))
+
+    def delete_segment(self, name):                       # type: (str) -> None
+        if name == self._active:
+            self._active = None
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            logger.warning("Could not delete upsert spool segment '{}'."
+                           .format(name))
@@ -0,0 +1,212 @@
+# encoding = utf-8
+
+""" FindingSource class definition. """
+
+import gzip
+import io
+import json
+from logging import getLogger
+import os
+import re
+
+try:
+    import boto3
+except ImportError:                                       # pragma: no cover
+    boto3 = None
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, BinaryIO, Dict, Iterator, List, Optional, \
+        TextIO, Tuple
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class FindingSource:
+    """ Streams GuardDuty findings out of exported files:  local files,
+    the files under local directories, and the objects under "s3://bucket
+    /prefix" URLs (ex:  a GuardDuty findings export).
+
+    A file holds JSON lines (or any whitespace-separated JSON values) or
+    one JSON array, and is gunzipped on the fly if its name ends in ".gz".
+    Values are decoded a chunk at a time, so memory stays bounded by the
+    largest finding, not the file.  A value may be an EventBridge event,
+    a bare finding (as GuardDuty exports them;  it's wrapped in an event)
+    or a "get-findings" response, whose "Findings" are expanded.
+
+    'bytes_read' counts the (compressed) bytes read so far, for progress
+    reporting.  'endpoint_url' points the S3 client at an S3-compatible
+    store instead of AWS. """
+
+    S3_SCHEME = 's3://'
+    SUFFIXES = ('.json', '.jsonl', '.ndjson', '.gz')
+    CHUNK_CHARS = 65536
+    _WHITESPACE = re.compile(r'\s*')
+    _SEPARATORS = re.compile(r'[\s,]*')
+
+    def __init__(self, locations,                            # type: List[str]
+                 s3_client=None,                                   # type: Any
+                 endpoint_url=None                       # type: Optional[str]
+                 ):
+        self.locations = list(locations)                     # type: List[str]
+        self.endpoint_url = endpoint_url                 # type: Optional[str]
+        self._s3_client = s3_client
+        self.bytes_read = 0                                        # type: int
+
+    @property
+    def s3_client(self):                                     # type: () -> Any
+        if self._s3_client is None:
+            if boto3 is None:
+                raise Exception("Reading findings from S3 requires the "
+                                "'boto3' library.")
+            self._s3_client = boto3.client('s3',
+                                           endpoint_url=self.endpoint_url)
+        return self._s3_client
+
+    def objects(self):                  # type: () -> Iterator[Tuple[str, int]]
+        """ Every file or S3 object to read, with its size in bytes, in a
+        stable order. """
+        for location in self.locations:
+            if location.startswith(self.S3_SCHEME):
+                yield from self._s3_objects(location)
+            elif os.path.isdir(location):
+                for root, dirs, files in os.walk(location):
+                    dirs.sort()
+                    for name in sorted(files):
+                        path = os.path.join(root, name)
+                        if self.is_findings_file(name):
+                            yield path, os.path.getsize(path)
+            else:
+                yield location, os.path.getsize(location)
+
+    def _s3_objects(self, url):      # type: (str) -> Iterator[Tuple[str, int]]
+        bucket, _, prefix = url[len(self.S3_SCHEME):].partition('/')
+        kwargs = {'Bucket': bucket, 'Prefix': prefix}
+        while True:
+            page = self.s3_client.list_objects_v2(**kwargs)
+            for obj in page.get('Contents', []):
+                if self.is_findings_file(obj['Key']):
+                    yield ("{}{}/{}".format(self.S3_SCHEME, bucket,
+                                            obj['Key']), obj['Size'])
+            if not page.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+    @classmethod
+    def is_findings_file(cls, name):                     # type: (str) -> bool
+        return name.lower().endswith(cls.SUFFIXES)
+
+    def findings(self, location):             # type: (str) -> Iterator[Dict]
+        """ The EventBridge events of the findings in a file or S3
+        object, in order. """
+        with self.open(location) as raw:
+            if location.lower().endswith('.gz'):
+                binary = gzip.GzipFile(fileobj=raw, mode='rb')
+            else:
+                binary = io.BufferedReader(raw)
+            with io.TextIOWrapper(binary, encoding='utf-8') as f:
+                for value in self.iter_values(f):
+                    yield from self.events_from(value)
+
+    def open(self, location):                # type: (str) -> _CountingReader
+        """ Opens a file or S3 object for reading, as is. """
+        if location.startswith(self.S3_SCHEME):
+            bucket, _, key = location[len(self.S3_SCHEME):].partition('/')
+            raw = self.s3_client.get_object(Bucket=bucket, Key=key)['Body']
+        else:
+            raw = open(location, 'rb')
+        return _CountingReader(raw, self)
+
+    @classmethod
+    def iter_values(cls, f):                       # type: (TextIO) -> Iterator
+        """ Decodes the whitespace-separated JSON values of a stream, or
+        the items of a JSON array, one at a time. """
+        decoder = json.JSONDecoder()
+        buf, pos, eof = '', 0, False
+        in_array = None                                # type: Optional[bool]
+        while True:
+            skip = cls._SEPARATORS if in_array else cls._WHITESPACE
+            pos = skip.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
+                    return
+                more = f.read(cls.CHUNK_CHARS)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if in_array is None:
+                in_array = buf[pos] == '['
+                pos += int(in_array)
+                continue
+            if in_array and buf[pos] == ']':
+                return
+            try:
+                value, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # read at least as much again, so a value spanning many
+                # chunks is decoded in linear time.
+                more = f.read(max(cls.CHUNK_CHARS, len(buf) - pos))
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield value
+
+    @classmethod
+    def events_from(cls, value):                    # type: (Any) -> List[Dict]
+        """ The EventBridge events in a decoded value. """
+        if isinstance(value, list):
+            return [e for v in value for e in cls.events_from(v)]
+        if not isinstance(value, dict):
+            raise Exception("Expected a GuardDuty finding or event.  Got "
+                            "'{}'.".format(type(value).__name__))
+        if 'Findings' in value:
+            return cls.events_from(value['Findings'])
+        if 'detail' in value:
+            return [value]
+        return [cls.event_for(value)]
+
+    @staticmethod
+    def event_for(finding):                             # type: (Dict) -> Dict
+        """ Wraps a bare finding the way EventBridge delivers it.  The
+        event takes the finding's ID, so the same version of a finding
+        always gets the same idempotency key. """
+        return {'version': '0',
+                'id': finding.get('id'),
+                'detail-type': 'GuardDuty Finding',
+                'source': 'aws.guardduty',
+                'account': finding.get('accountId'),
+                'time': finding.get('updatedAt'),
+                'region': finding.get('region'),
+                'resources': [],
+                'detail': finding}
+
+
+class _CountingReader(io.RawIOBase):
+    """ Reads a binary stream, adding the bytes read to the source's
+    'bytes_read'. """
+
+    def __init__(self, raw,                                   # type: BinaryIO
+                 source                                  # type: FindingSource
+                 ):
+        super().__init__()
+        self.raw = raw
+        self.source = source                             # type: FindingSource
+
+    def readable(self):                                     # type: () -> bool
+        return True
+
+    def readinto(self, b):                                # type: (Any) -> int
+        data = self.raw.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.source.bytes_read += n
+        return n
+
+    def close(self):                                        # type: () -> None
+        close = getattr(self.raw, 'close', None)
+        if close is not None:
+            close()
+        super().close()
@@ -0,0 +1,103 @@
+# encoding = utf-8
+
+""" IdempotencyStore class definition. """
+
+from logging import getLogger
+import time
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+DEFAULT_TTL_SECONDS = 3600.0
+# the longest a Lambda invocation can run.
+DEFAULT_LEASE_SECONDS = 900.0
+
+
+class IdempotencyStore:
+    """ Remembers the events that were already processed, so that an event
+    delivered again (EventBridge and SQS deliver at least once, and Lambda
+    retries failed invocations) is acknowledged without calling Station.
+
+    An event is keyed on its event ID, finding ID and the finding's
+    "updatedAt".  Processing 'claim's the key with a lease of
+    'lease_seconds', about the function's timeout, so that a delivery
+    that arrives while the event is processed is dropped, but one that
+    arrives after the processing container died is not.  Once the event
+    is processed, the key is 'complete'd, and held for 'ttl_seconds';  if
+    the processing fails, the key is 'release'd so the redelivery goes
+    through.  Subclasses pick where the keys are kept. """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS,          # type: float
+                 clock=time.time,                # type: Callable[[], float]
+                 lease_seconds=DEFAULT_LEASE_SECONDS             # type: float
+                 ):
+        self.ttl_seconds = ttl_seconds                           # type: float
+        self.lease_seconds = lease_seconds                       # type: float
+        self.clock = clock
+
+    @staticmethod
+    def key_for(event):                        # type: (Dict) -> Optional[str]
+        """ The event's idempotency key, or None if the event has no ID to
+        tell its deliveries apart by, or isn't an object. """
+        if not isinstance(event, dict):
+            return None
+        detail = event.get('detail') or {}
+        if not isinstance(detail, dict):
+            return None
+        if not event.get('id') or not detail.get('id'):
+            return None
+        return '{}|{}|{}'.format(event['id'], detail['id'],
+                                 detail.get('updatedAt'))
+
+    def claim_event(self, event):                        # type: (Dict) -> bool
+        """ Claims the event's key.  Returns False if the event is a
+        duplicate;  an event without a key is never one. """
+        key = self.key_for(event)
+        return key is None or self.claim(key)
+
+    def complete_event(self, event):                     # type: (Dict) -> None
+        key = self.key_for(event)
+        if key is not None:
+            self.complete(key)
+
+    def release_event(self, event):                      # type: (Dict) -> None
+        key = self.key_for(event)
+        if key is not None:
+            self.release(key)
+
+    def claim(self, key):                                 # type: (str) -> bool
+        """ Leases the key, unless it's completed or leased and the lease
+        hasn't run out.  Returns False if it was, ex:  the event is a
+        duplicate. """
+        now = self.clock()
+        return self.put_if_absent(key, now, now + self.lease_seconds)
+
+    def complete(self, key):                              # type: (str) -> None
+        """ Holds the key for 'ttl_seconds', once the event is processed. """
+        self.put(key, self.clock() + self.ttl_seconds)
+
+    def release(self, key):                               # type: (str) -> None
+        """ Gives up the key, ex:  because processing the event failed. """
+        self.delete(key)
+
+    def put_if_absent(self, key,                                   # type: str
+                      now,                                       # type: float
+                      expires_at                                 # type: float
+                      ):                                # type: (...) -> bool
+        """ Records the key unless it's recorded and expires after 'now'.
+        Returns whether it recorded the key. """
+        raise NotImplementedError
+
+    def put(self, key,                                             # type: str
+            expires_at                                           # type: float
+            ):                                          # type: (...) -> None
+        """ Records the key, whether or not it's recorded. """
+        raise NotImplementedError
+
+    def delete(self, key):                                # type: (str) -> None
+        """ Forgets the key, if it's recorded. """
+        raise NotImplementedError
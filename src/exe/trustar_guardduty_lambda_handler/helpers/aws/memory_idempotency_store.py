@@ -0,0 +1,60 @@
+# encoding = utf-8
+
+""" MemoryIdempotencyStore class definition. """
+
+from collections import OrderedDict
+import threading
+import time
+
+from .idempotency_store import DEFAULT_LEASE_SECONDS, DEFAULT_TTL_SECONDS, \
+    IdempotencyStore
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """ Keeps the most recently claimed 'max_entries' keys in process
+    memory.  Lives as long as the Lambda container, so it only catches
+    the duplicates delivered to the same container. """
+
+    DEFAULT_MAX_ENTRIES = 10000
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,            # type: int
+                 ttl_seconds=DEFAULT_TTL_SECONDS,                # type: float
+                 clock=time.time,                # type: Callable[[], float]
+                 lease_seconds=DEFAULT_LEASE_SECONDS             # type: float
+                 ):
+        super().__init__(ttl_seconds, clock, lease_seconds)
+        if max_entries < 1:
+            raise Exception("max_entries must be at least 1.")
+        self.max_entries = max_entries                             # type: int
+        self._expiries = OrderedDict()                # type: Dict[str, float]
+        self._lock = threading.RLock()
+
+    def __len__(self):                                       # type: () -> int
+        return len(self._expiries)
+
+    def put_if_absent(self, key,                                   # type: str
+                      now,                                       # type: float
+                      expires_at                                 # type: float
+                      ):                                # type: (...) -> bool
+        with self._lock:
+            if self._expiries.get(key, now) > now:
+                return False
+            self.put(key, expires_at)
+            return True
+
+    def put(self, key,                                             # type: str
+            expires_at                                           # type: float
+            ):                                          # type: (...) -> None
+        with self._lock:
+            self._expiries[key] = expires_at
+            self._expiries.move_to_end(key)
+            while len(self._expiries) > self.max_entries:
+                self._expiries.popitem(last=False)
+
+    def delete(self, key):                                # type: (str) -> None
+        with self._lock:
+            self._expiries.pop(key, None)
@@ -0,0 +1,83 @@
+# encoding = utf-8
+
+""" S3UpsertSpool class definition. """
+
+from logging import getLogger
+
+from .upsert_spool import UpsertSpool
+
+try:
+    import boto3
+except ImportError:                                       # pragma: no cover
+    boto3 = None
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, List, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class S3UpsertSpool(UpsertSpool):
+    """ Keeps the segments as objects under "s3://bucket/prefix", so the
+    spool outlives the container and every container can drain it.  S3
+    objects can't be appended to:  each write is a new segment, and
+    compaction merges them.
+
+    'endpoint_url' points the client at an S3-compatible stand-in (ex:
+    MinIO) instead of AWS. """
+
+    def __init__(self, bucket,                                     # type: str
+                 prefix='',                                        # type: str
+                 endpoint_url=None,                      # type: Optional[str]
+                 client=None,                                      # type: Any
+                 **kwargs                                          # type: Any
+                 ):
+        super().__init__(**kwargs)
+        if client is None:
+            if boto3 is None:
+                raise Exception("The S3 upsert spool requires the 'boto3' "
+                                "library.")
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket                                       # type: str
+        self.prefix = prefix                                       # type: str
+        self.client = client
+
+    def segment_names(self):                           # type: () -> List[str]
+        names = []                                         # type: List[str]
+        kwargs = {'Bucket': self.bucket,
+                  'Prefix': self.prefix + self.SEGMENT_PREFIX}
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(self.prefix):]
+                if name.endswith(self.SEGMENT_SUFFIX):
+                    names.append(name)
+            if not page.get('IsTruncated'):
+                return sorted(names)
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+    def read_segment(self, name):             # type: (str) -> Optional[bytes]
+        # noinspection PyBroadException
+        try:
+            response = self.client.get_object(Bucket=self.bucket,
+                                              Key=self.prefix + name)
+            return response['Body'].read()
+        except Exception:
+            # ex:  another container compacted it away since the listing.
+            logger.warning("Could not read upsert spool segment '{}'."
+                           .format(name))
+            return None
+
+    def append_segment(self, data):                     # type: (bytes) -> str
+        name = self.new_segment_name()
+        self.write_segment(name, data)
+        return name
+
+    def write_segment(self, name, data):         # type: (str, bytes) -> None
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name,
+                               Body=data)
+
+    def delete_segment(self, name):                       # type: (str) -> None
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + name)
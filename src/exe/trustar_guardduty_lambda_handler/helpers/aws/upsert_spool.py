@@ -0,0 +1,351 @@
+# encoding = utf-8
+
+""" UpsertSpool and SpoolEntry class definitions. """
+
+from collections import OrderedDict
+from contextlib import nullcontext
+import itertools
+import json
+from logging import getLogger
+import threading
+import time
+import uuid
+
+from trustar import Report
+
+from ..ts.station_error_classifier import StationErrorClassifier
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+    from logging import Logger
+    from ..common.metrics_recorder import MetricsRecorder
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class SpoolEntry:
+    """ A report whose upsert failed, the finding it was built from and
+    when to try it again. """
+
+    def __init__(self, finding,                                   # type: Dict
+                 report,                                        # type: Report
+                 error,                                            # type: str
+                 attempts=1,                                       # type: int
+                 spooled_at=0.0,                                 # type: float
+                 retry_at=0.0                                    # type: float
+                 ):
+        self.finding = finding                                    # type: Dict
+        self.report = report                                    # type: Report
+        self.error = error                                         # type: str
+        self.attempts = attempts                                   # type: int
+        self.spooled_at = spooled_at                             # type: float
+        self.retry_at = retry_at                                 # type: float
+
+    @property
+    def key(self):                                           # type: () -> str
+        return self.report.external_id
+
+    def to_dict(self):                                      # type: () -> Dict
+        return {'finding': self.finding,
+                'report': self.report.to_dict(remove_nones=True),
+                'error': self.error,
+                'attempts': self.attempts,
+                'spooledAt': self.spooled_at,
+                'retryAt': self.retry_at}
+
+    @classmethod
+    def from_dict(cls, d):                         # type: (Dict) -> SpoolEntry
+        return cls(d.get('finding'), Report.from_dict(d['report']),
+                   d.get('error'), d.get('attempts', 1),
+                   d.get('spooledAt', 0.0), d.get('retryAt', 0.0))
+
+
+class UpsertSpool:
+    """ A write-ahead spool of the reports whose upserts failed because
+    Station was struggling (throttled, 5xx, unreachable or the circuit
+    breaker open), so the findings are acknowledged instead of lost or
+    retried with the whole invocation.  A drain upserts them again once
+    Station is healthy.
+
+    The spool is a sequence of append-only segments of JSON lines, each
+    either {"op": "put", "entry": ...} or {"op": "ack", "key": ...} (the
+    entry's report was upserted), replayed in name order:  the last put
+    of a report's external ID wins, so a newer failure of the same report
+    replaces the older one.  Once dead lines make up most of the spool,
+    or a write would go over 'max_bytes', the live entries are rewritten
+    into one segment that sorts where the last one read did, and the
+    segments read are deleted;  a crash in between replays duplicates,
+    never loses an entry.  A write that still doesn't fit is refused.
+
+    A failed retry is tried again after 'backoff_seconds', doubled with
+    each attempt up to 'max_backoff_seconds'.  Counts EntriesSpooled,
+    SpoolRejected, SpoolDrained, SpoolRetriesFailed and SpoolCompactions,
+    and records the SpoolDepth, SpoolAgeSeconds (of the oldest entry) and
+    SpoolBytes gauges.  Subclasses pick where the segments are kept. """
+
+    SEGMENT_PREFIX = 'segment-'
+    SEGMENT_SUFFIX = '.jsonl'
+    # compact once this many lines are dead and they outnumber the live.
+    MIN_DEAD_LINES = 100
+
+    def __init__(self, max_bytes=50000000,                         # type: int
+                 backoff_seconds=30.0,                           # type: float
+                 max_backoff_seconds=3600.0,                     # type: float
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 clock=time.time                 # type: Callable[[], float]
+                 ):
+        self.max_bytes = max_bytes                                 # type: int
+        self.backoff_seconds = backoff_seconds                   # type: float
+        self.max_backoff_seconds = max_backoff_seconds           # type: float
+        self.metrics = metrics             # type: Optional[MetricsRecorder]
+        self.clock = clock
+        self._entries = OrderedDict()          # type: Dict[str, SpoolEntry]
+        self._segments = []                                # type: List[str]
+        self._lines = 0                                            # type: int
+        self._bytes = 0                                            # type: int
+        self._loaded = False                                      # type: bool
+        # what the segments looked like when they were last read.
+        self._stamp = None                             # type: Optional[Tuple]
+        self._writer_id = uuid.uuid4().hex[:8]                     # type: str
+        self._writes = itertools.count()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def is_spoolable(e):                           # type: (Exception) -> bool
+        """ True if the upsert failed because Station was struggling, so
+        trying it again later may succeed. """
+        return (StationErrorClassifier.is_transient(e)
+                or StationErrorClassifier.classify(e)
+                == StationErrorClassifier.CIRCUIT_OPEN)
+
+    def spool(self, finding,                                      # type: Dict
+              reports,                                    # type: List[Report]
+              error                                          # type: Exception
+              ):                                        # type: (...) -> bool
+        """ Records the finding's reports.  Returns False, and records
+        nothing, if they would not fit. """
+        now = self.clock()
+        with self._lock:
+            self.load_once()
+            entries = []                              # type: List[SpoolEntry]
+            for report in reports:
+                old = self._entries.get(report.external_id)
+                attempts = old.attempts + 1 if old else 1
+                entries.append(SpoolEntry(
+                    finding, report, type(error).__name__, attempts,
+                    old.spooled_at if old else now,
+                    now + self.backoff_for(attempts)))
+            if not self._write([{'op': 'put', 'entry': e.to_dict()}
+                                for e in entries]):
+                self.increment('SpoolRejected')
+                logger.error("Upsert spool is full ('{}' bytes).  Not "
+                             "spooling the reports of finding '{}'."
+                             .format(self._bytes, (finding.get('detail')
+                                                   or {}).get('id')))
+                return False
+            for entry in entries:
+                self._entries.pop(entry.key, None)
+                self._entries[entry.key] = entry
+            self.increment('EntriesSpooled', len(entries))
+            return True
+
+    def due(self, limit=None):   # type: (Optional[int]) -> List[SpoolEntry]
+        """ The entries due to be tried again, oldest first.  Re-reads the
+        segments first, to see what other writers spooled or drained. """
+        now = self.clock()
+        with self._lock:
+            self.load()
+            due = [e for e in self._entries.values() if e.retry_at <= now]
+        due.sort(key=lambda e: e.spooled_at)
+        return due[:limit] if limit is not None else due
+
+    def ack(self, keys,                                  # type: Iterable[str]
+            metric='SpoolDrained'                                  # type: str
+            ):                                          # type: (...) -> None
+        """ Forgets the entries whose reports were upserted.  Only the keys
+        the spool holds are acked, so an upsert of a report that was never
+        spooled writes nothing.  The segments are read again first if
+        another writer changed them since they were read;  the drain
+        catches what is spooled after that. """
+        keys = list(OrderedDict.fromkeys(keys))
+        if not keys:
+            return
+        with self._lock:
+            self.load_once()
+            if (any(k not in self._entries for k in keys)
+                    and self.segment_stamp(self.segment_names())
+                    != self._stamp):
+                self.load()
+            acked = [k for k in keys if k in self._entries]
+            if not acked:
+                return
+            # an ack is tiny and frees room, so it is never refused.
+            self._write([{'op': 'ack', 'key': k} for k in acked], force=True)
+            for key in acked:
+                del self._entries[key]
+            self.increment(metric, len(acked))
+            self.compact_if_dead()
+
+    def retry_later(self, entry,                            # type: SpoolEntry
+                    error                                    # type: Exception
+                    ):                                  # type: (...) -> None
+        """ Records another failed attempt at the entry's report. """
+        entry.attempts += 1
+        entry.error = type(error).__name__
+        entry.retry_at = self.clock() + self.backoff_for(entry.attempts)
+        with self._lock:
+            self._write([{'op': 'put', 'entry': entry.to_dict()}], force=True)
+            self._entries[entry.key] = entry
+            self.increment('SpoolRetriesFailed')
+
+    def backoff_for(self, attempts):                   # type: (int) -> float
+        return min(self.backoff_seconds * 2 ** (attempts - 1),
+                   self.max_backoff_seconds)
+
+    def __len__(self):                                       # type: () -> int
+        with self._lock:
+            self.load_once()
+            return len(self._entries)
+
+    def record_gauges(self):                                # type: () -> None
+        """ Records the spool's depth, age and size. """
+        if self.metrics is None:
+            return
+        with self._lock:
+            self.load_once()
+            oldest = min((e.spooled_at for e in self._entries.values()),
+                         default=None)
+            self.metrics.add_gauge('SpoolDepth', len(self._entries))
+            self.metrics.add_gauge(
+                'SpoolAgeSeconds',
+                self.clock() - oldest if oldest is not None else 0.0,
+                'Seconds')
+            self.metrics.add_size('SpoolBytes', self._bytes)
+
+    def load_once(self):                                    # type: () -> None
+        if not self._loaded:
+            self.load()
+
+    def load(self):                                         # type: () -> None
+        """ Replays the segments into the live entries. """
+        entries = OrderedDict()                # type: Dict[str, SpoolEntry]
+        segments = self.segment_names()
+        stamp = self.segment_stamp(segments)
+        lines = n_bytes = 0
+        for name in segments:
+            data = self.read_segment(name)
+            if data is None:
+                continue
+            n_bytes += len(data)
+            for line in data.splitlines():
+                # noinspection PyBroadException
+                try:
+                    record = json.loads(line)
+                    if record['op'] == 'put':
+                        entry = SpoolEntry.from_dict(record['entry'])
+                        entries.pop(entry.key, None)
+                        entries[entry.key] = entry
+                    else:
+                        entries.pop(record['key'], None)
+                except Exception:
+                    # ex:  the tail of a segment whose write was cut off.
+                    logger.warning("Skipping unreadable line in upsert "
+                                   "spool segment '{}'.".format(name))
+                lines += 1
+        self._entries, self._segments = entries, segments
+        self._lines, self._bytes = lines, n_bytes
+        self._stamp = stamp
+        self._loaded = True
+
+    def _write(self, records,                               # type: List[Dict]
+               force=False                                        # type: bool
+               ):                                       # type: (...) -> bool
+        """ Appends the records, compacting first if they would not fit.
+        Returns False if they still don't, unless forced. """
+        data = ''.join(json.dumps(r, separators=(',', ':')) + '\n'
+                       for r in records).encode('utf-8')
+        if self._bytes + len(data) > self.max_bytes:
+            self.compact()
+            if self._bytes + len(data) > self.max_bytes and not force:
+                return False
+        name = self.append_segment(data)
+        if name not in self._segments:
+            self._segments.append(name)
+        self._lines += len(records)
+        self._bytes += len(data)
+        return True
+
+    def compact_if_dead(self):                              # type: () -> None
+        dead = self._lines - len(self._entries)
+        if dead >= self.MIN_DEAD_LINES and dead > len(self._entries):
+            self.compact()
+
+    def compact(self):                                      # type: () -> None
+        """ Rewrites the live entries into one segment and deletes the
+        segments they were read from, keeping the other writers out until
+        it's done. """
+        with self._lock, self.exclusive():
+            self.load()
+            if len(self._segments) < 2 and self._lines == len(self._entries):
+                return
+            old = list(self._segments)
+            data = ''.join(
+                json.dumps({'op': 'put', 'entry': e.to_dict()},
+                           separators=(',', ':')) + '\n'
+                for e in self._entries.values()).encode('utf-8')
+            name = None
+            if data and old:
+                # sorts right after the last segment read, so segments
+                # written since still replay after it.
+                name = (old[-1][:-len(self.SEGMENT_SUFFIX)] + 'c'
+                        + self.SEGMENT_SUFFIX)
+                self.write_segment(name, data)
+            for segment in old:
+                if segment != name:
+                    self.delete_segment(segment)
+            self._segments = [name] if name else []
+            self._lines, self._bytes = len(self._entries), len(data)
+            self.increment('SpoolCompactions')
+
+    def new_segment_name(self):                              # type: () -> str
+        """ Sorts by creation time, then by this writer's count of its
+        segments;  unique across writers. """
+        return '{}{:013d}-{}-{:08d}{}'.format(
+            self.SEGMENT_PREFIX, int(self.clock() * 1000), self._writer_id,
+            next(self._writes), self.SEGMENT_SUFFIX)
+
+    def increment(self, name, value=1):              # type: (str, int) -> None
+        if self.metrics is not None:
+            self.metrics.increment(name, value)
+
+    def exclusive(self):                                     # type: () -> Any
+        """ A context that keeps the other writers from appending to the
+        segments, for a compaction.  Segments that are never appended to
+        need none. """
+        return nullcontext()
+
+    def segment_names(self):                           # type: () -> List[str]
+        """ The names of the segments, sorted. """
+        raise NotImplementedError
+
+    def segment_stamp(self, names):                # type: (List[str]) -> Tuple
+        """ Changes whenever a writer adds to the segments.  Segments that
+        are never appended to only need their names. """
+        return tuple(names)
+
+    def read_segment(self, name):             # type: (str) -> Optional[bytes]
+        """ The segment's bytes, or None if it is gone. """
+        raise NotImplementedError
+
+    def append_segment(self, data):                     # type: (bytes) -> str
+        """ Appends the data to the segment being written, or to a new
+        one, and returns its name. """
+        raise NotImplementedError
+
+    def write_segment(self, name, data):         # type: (str, bytes) -> None
+        """ Writes a whole segment, atomically. """
+        raise NotImplementedError
+
+    def delete_segment(self, name):                       # type: (str) -> None
+        raise NotImplementedError
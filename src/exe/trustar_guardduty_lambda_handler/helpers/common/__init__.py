@@ -0,0 +1,4 @@
+# encoding = utf-8
+
+""" Subpackage of general-purpose helpers that aren't particular to
+TruSTAR, Guard Duty or AWS.  """
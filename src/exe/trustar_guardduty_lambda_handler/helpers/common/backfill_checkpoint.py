@@ -0,0 +1,78 @@
+# encoding = utf-8
+
+""" BackfillCheckpoint class definition. """
+
+import json
+from logging import getLogger
+import os
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BackfillCheckpoint:
+    """ Remembers how far a backfill got:  for each file or S3 object, how
+    many of its findings were upserted and whether all of them were, plus
+    the run's totals.  Persisted to a JSON file, if a path is given, so
+    that an interrupted backfill resumes where it stopped. """
+
+    VERSION = 1
+
+    def __init__(self, file_path=None):        # type: (Optional[str]) -> None
+        self.file_path = file_path                       # type: Optional[str]
+        self.objects = {}                        # type: Dict[str, Dict]
+        self.totals = {'findings': 0, 'failed': 0}      # type: Dict[str, int]
+        self._load()
+
+    def done(self, location):                             # type: (str) -> int
+        """ How many of the location's findings were already upserted. """
+        return self.objects.get(location, {}).get('done', 0)
+
+    def is_complete(self, location):                     # type: (str) -> bool
+        return self.objects.get(location, {}).get('complete', False)
+
+    def advance(self, location,                                    # type: str
+                findings,                                          # type: int
+                failed=0                                           # type: int
+                ):                                      # type: (...) -> None
+        """ Records that the location's next 'findings' were processed,
+        'failed' of which failed. """
+        entry = self.objects.setdefault(location, {'done': 0,
+                                                   'complete': False})
+        entry['done'] += findings
+        self.totals['findings'] += findings
+        self.totals['failed'] += failed
+
+    def complete(self, location):                         # type: (str) -> None
+        self.objects.setdefault(location, {'done': 0})['complete'] = True
+
+    def save(self):                                         # type: () -> None
+        """ Writes the checkpoint.  Writes to a temp file first so an
+        interrupted write never corrupts the previous checkpoint. """
+        if not self.file_path:
+            return
+        tmp_path = "{}.{}.tmp".format(self.file_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': self.VERSION, 'totals': self.totals,
+                       'objects': self.objects}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.file_path)
+
+    def _load(self):                                        # type: () -> None
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        with open(self.file_path) as f:
+            d = json.load(f)
+        if d.get('version') != self.VERSION:
+            raise Exception("Backfill checkpoint '{}' has version '{}'.  "
+                            "Expected '{}'.".format(self.file_path,
+                                                    d.get('version'),
+                                                    self.VERSION))
+        self.objects = d['objects']
+        self.totals = d['totals']
+        logger.info("Resuming backfill from checkpoint '{}':  '{}' "
+                    "finding(s) already processed.".format(
+                        self.file_path, self.totals['findings']))
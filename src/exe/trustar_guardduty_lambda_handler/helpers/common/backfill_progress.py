@@ -0,0 +1,79 @@
+# encoding = utf-8
+
+""" BackfillProgress class definition. """
+
+from logging import getLogger
+import time
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BackfillProgress:
+    """ Tracks a backfill's findings per second and, from the share of
+    the input bytes read so far, its ETA.  Logs a progress line at most
+    every 'log_every' seconds. """
+
+    def __init__(self, total_bytes,                                # type: int
+                 log_every=10.0,                                 # type: float
+                 clock=time.monotonic            # type: Callable[[], float]
+                 ):
+        self.total_bytes = total_bytes                             # type: int
+        self.log_every = log_every                               # type: float
+        self.clock = clock
+        self.started_at = clock()                                # type: float
+        self.logged_at = self.started_at                         # type: float
+        self.findings = 0                                          # type: int
+        self.failed = 0                                            # type: int
+        self.bytes_read = 0                                        # type: int
+
+    def update(self, findings,                                     # type: int
+               failed,                                             # type: int
+               bytes_read                                          # type: int
+               ):                                       # type: (...) -> None
+        """ Adds a chunk's findings and sets the bytes read so far. """
+        self.findings += findings
+        self.failed += failed
+        self.bytes_read = bytes_read
+        now = self.clock()
+        if now - self.logged_at >= self.log_every:
+            self.logged_at = now
+            logger.info(self.line())
+
+    @property
+    def elapsed(self):                                     # type: () -> float
+        return self.clock() - self.started_at
+
+    @property
+    def rate(self):                                        # type: () -> float
+        """ Findings per second. """
+        elapsed = self.elapsed
+        return self.findings / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):                               # type: () -> Optional[float]
+        """ Seconds left, or None until there's something to go by. """
+        if not self.bytes_read or not self.total_bytes:
+            return None
+        left = max(0, self.total_bytes - self.bytes_read)
+        return self.elapsed * left / self.bytes_read
+
+    @staticmethod
+    def hms(seconds):                                   # type: (float) -> str
+        minutes, seconds = divmod(int(round(seconds)), 60)
+        hours, minutes = divmod(minutes, 60)
+        return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+    def line(self):                                          # type: () -> str
+        eta = self.eta
+        done = (100.0 * self.bytes_read / self.total_bytes
+                if self.total_bytes else 100.0)
+        return ("{} finding(s), {} failed, {:.1f}/s ({:.0f}/h), {:.1f}% of "
+                "the input, elapsed {}, ETA {}.".format(
+                    self.findings, self.failed, self.rate, self.rate * 3600,
+                    min(done, 100.0), self.hms(self.elapsed),
+                    self.hms(eta) if eta is not None else 'unknown'))
@@ -0,0 +1,128 @@
+# encoding = utf-8
+
+""" CircuitBreaker and CircuitOpenError class definitions. """
+
+from logging import getLogger
+import threading
+import time
+
+from .metrics_recorder import MetricsRecorder
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class CircuitOpenError(Exception):
+    """ Raised instead of calling a service the breaker considers
+    unhealthy. """
+
+
+class CircuitBreaker:
+    """ Stops calling a service after 'failure_threshold' failures in a
+    row, so a struggling service isn't hammered and callers fail fast.
+
+    CLOSED:  calls go through.  OPEN:  calls raise CircuitOpenError without
+    being made, until 'reset_timeout' seconds have passed.  HALF_OPEN:  one
+    trial call goes through;  if it succeeds the breaker closes, if it
+    fails the breaker opens again.  Only errors 'is_failure' accepts count
+    as failures;  others (ex:  a 404) show the service is up.
+
+    Safe to share between threads and coroutines.  State changes are
+    counted as CircuitOpened / CircuitHalfOpened / CircuitClosed metrics and
+    rejected calls as CircuitRejections. """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5,                        # type: int
+                 reset_timeout=30.0,                             # type: float
+                 is_failure=None,                    # type: Optional[Callable]
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 clock=time.monotonic            # type: Callable[[], float]
+                 ):
+        if failure_threshold < 1:
+            raise Exception("failure_threshold must be at least 1.")
+        self.failure_threshold = failure_threshold                 # type: int
+        self.reset_timeout = reset_timeout                       # type: float
+        self.is_failure = is_failure or (lambda e: True)
+        self.metrics = metrics or MetricsRecorder()    # type: MetricsRecorder
+        self.clock = clock
+        self.state = self.CLOSED                                   # type: str
+        self.failures = 0                                          # type: int
+        self.opened_at = 0.0                                     # type: float
+        self._trial_in_flight = False                             # type: bool
+        self._lock = threading.Lock()
+
+    def call(self, fn):                      # type: (Callable[[], Any]) -> Any
+        """ Calls fn unless the breaker is open.  Re-raises fn's errors. """
+        self.before_call()
+        try:
+            value = fn()
+        except Exception as e:
+            self.record_error(e)
+            raise e
+        self.record_success()
+        return value
+
+    async def call_async(self, fn):    # type: (Callable[[], Awaitable]) -> Any
+        """ The asyncio counterpart of 'call'.  fn returns an awaitable. """
+        self.before_call()
+        try:
+            value = await fn()
+        except Exception as e:
+            self.record_error(e)
+            raise e
+        self.record_success()
+        return value
+
+    def before_call(self):                                  # type: () -> None
+        """ Raises CircuitOpenError if the call must not be made. """
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    self._reject()
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self._reject()
+                self._trial_in_flight = True
+
+    def record_success(self):                               # type: () -> None
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_error(self, e):                    # type: (Exception) -> None
+        if not self.is_failure(e):
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def _reject(self):                                      # type: () -> None
+        self.metrics.increment('CircuitRejections')
+        raise CircuitOpenError(
+            "Circuit breaker is open after '{}' failure(s) in a row.  Not "
+            "calling the service for up to '{}' second(s)."
+            .format(self.failures, self.reset_timeout))
+
+    def _transition(self, state):                         # type: (str) -> None
+        logger.warning("Circuit breaker going from '{}' to '{}'."
+                       .format(self.state, state))
+        self.state = state
+        self.metrics.increment({self.OPEN: 'CircuitOpened',
+                                self.HALF_OPEN: 'CircuitHalfOpened',
+                                self.CLOSED: 'CircuitClosed'}[state])
@@ -0,0 +1,68 @@
+# encoding = utf-8
+
+""" EmfMetricsSink class definition. """
+
+import json
+import sys
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, IO, List
+    from .metrics_recorder import MetricsSnapshot
+
+
+class EmfMetricsSink:
+    """ Writes each snapshot as CloudWatch Embedded Metric Format JSON
+    lines.  Lambda forwards stdout to CloudWatch Logs, which turns the
+    lines into metrics;  CloudWatch computes the p50 / p99 of each stage
+    from the raw durations.  EMF allows 'MAX_VALUES' values per metric, so
+    a stage timed more often than that is spread across more than one
+    line. """
+
+    MAX_VALUES = 100
+
+    def __init__(self, stream=None):                      # type: (IO) -> None
+        self.stream = stream
+
+    def emit(self, snapshot):                 # type: (MetricsSnapshot) -> None
+        stream = self.stream or sys.stdout
+        for doc in self.documents_for(snapshot):
+            stream.write(json.dumps(doc) + '\n')
+        stream.flush()
+
+    @classmethod
+    def documents_for(cls, snapshot
+                      ):                # type: (MetricsSnapshot) -> List[Dict]
+        """ The first document carries the counters;  every document
+        carries up to MAX_VALUES durations of each stage. """
+        n = cls.MAX_VALUES
+        longest = max([len(v) for v in snapshot.timings.values()] or [0])
+        docs = []                                         # type: List[Dict]
+        for start in range(0, max(longest, 1), n):
+            timings = {name: values[start:start + n]
+                       for name, values in snapshot.timings.items()
+                       if values[start:start + n]}
+            counters = snapshot.counters if start == 0 else {}
+            docs.append(cls.document_for(snapshot, timings, counters))
+        return docs
+
+    @staticmethod
+    def document_for(snapshot,                       # type: MetricsSnapshot
+                     timings,                   # type: Dict[str, List[float]]
+                     counters                           # type: Dict[str, int]
+                     ):                                 # type: (...) -> Dict
+        metrics = [{'Name': name,
+                    'Unit': snapshot.units.get(name, 'Milliseconds')}
+                   for name in sorted(timings)]
+        metrics += [{'Name': name, 'Unit': 'Count'}
+                    for name in sorted(counters)]
+        doc = {'_aws': {
+            'Timestamp': snapshot.timestamp,
+            'CloudWatchMetrics': [{
+                'Namespace': snapshot.namespace,
+                'Dimensions': [sorted(snapshot.dimensions)],
+                'Metrics': metrics}]}}
+        doc.update(snapshot.dimensions)
+        doc.update(timings)
+        doc.update(counters)
+        return doc
@@ -0,0 +1,36 @@
+# encoding = utf-8
+
+""" FileLock class definition. """
+
+import fcntl
+from logging import getLogger
+import os
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class FileLock:
+    """ An exclusive flock on a file, for a 'with' block.  If the lock
+    file can't be opened, the block runs unlocked. """
+
+    def __init__(self, path):                             # type: (str) -> None
+        self.path = path                                           # type: str
+        self._fd = None                                  # type: Optional[int]
+
+    def __enter__(self):
+        try:
+            self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except OSError:
+            logger.warning("Could not lock '{}'.".format(self.path))
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,26 @@
+# encoding = utf-8
+
+""" MemoryMetricsSink class definition. """
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import List
+    from .metrics_recorder import MetricsSnapshot
+
+
+class MemoryMetricsSink:
+    """ Keeps every snapshot in memory, for tests and benchmarks. """
+
+    def __init__(self):
+        self.snapshots = []                      # type: List[MetricsSnapshot]
+
+    def emit(self, snapshot):                 # type: (MetricsSnapshot) -> None
+        self.snapshots.append(snapshot)
+
+    def timings(self, name):                       # type: (str) -> List[float]
+        """ Every duration recorded for the stage, across snapshots. """
+        return [ms for s in self.snapshots for ms in s.timings.get(name, [])]
+
+    def count(self, name):                                 # type: (str) -> int
+        """ The counter's total across snapshots. """
+        return sum(s.counters.get(name, 0) for s in self.snapshots)
@@ -0,0 +1,145 @@
+# encoding = utf-8
+
+""" MetricsRecorder and MetricsSnapshot class definitions. """
+
+from contextlib import contextmanager
+from logging import getLogger
+import threading
+import time
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Iterator, List, Optional
+    from logging import Logger
+    from .retry_policy import RetryOutcome
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class MetricsSnapshot:
+    """ The timings (in milliseconds) and counters recorded during one
+    invocation.  'timings' also holds the sizes and gauges recorded, whose
+    unit is in 'units' (ex:  'Bytes');  anything not in 'units' is in
+    milliseconds. """
+
+    def __init__(self, namespace,                                  # type: str
+                 dimensions,                            # type: Dict[str, str]
+                 timings,                        # type: Dict[str, List[float]]
+                 counters,                              # type: Dict[str, int]
+                 units=None                    # type: Optional[Dict[str, str]]
+                 ):
+        self.namespace = namespace                                 # type: str
+        self.dimensions = dimensions                    # type: Dict[str, str]
+        self.timings = timings                   # type: Dict[str, List[float]]
+        self.counters = counters                        # type: Dict[str, int]
+        self.units = units or {}                        # type: Dict[str, str]
+        self.timestamp = int(time.time() * 1000)                   # type: int
+
+
+class MetricsRecorder:
+    """ Collects per-stage latencies and counters while an invocation runs
+    and hands them to its sinks in one snapshot when the invocation ends.
+
+    Stages are timed with 'span' context managers;  a stage that runs more
+    than once (ex:  once per report of a batch) keeps every duration, so
+    the sink can report percentiles.  Safe to share between the upsert
+    worker threads.  Without sinks, recording is a no-op. """
+
+    DEFAULT_NAMESPACE = 'TruSTAR/GuardDuty'
+
+    def __init__(self, sinks=(),
+                 namespace=DEFAULT_NAMESPACE,                      # type: str
+                 dimensions=None               # type: Optional[Dict[str, str]]
+                 ):
+        self.sinks = list(sinks)
+        self.enabled = bool(self.sinks)                           # type: bool
+        self.namespace = namespace                                 # type: str
+        self.dimensions = dict(dimensions or {})        # type: Dict[str, str]
+        self._timings = {}                       # type: Dict[str, List[float]]
+        self._counters = {}                             # type: Dict[str, int]
+        self._units = {}                                # type: Dict[str, str]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):                       # type: (str) -> Iterator[None]
+        """ Times the stage run inside the 'with' block, even if it
+        raises. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, (time.perf_counter() - start) * 1000.0)
+
+    @contextmanager
+    def invocation(self):             # type: () -> Iterator[MetricsRecorder]
+        """ Times the invocation, counts it as failed if it raises, and
+        flushes everything recorded since the last invocation ended. """
+        try:
+            with self.span('Invocation'):
+                yield self
+        except Exception:
+            self.increment('InvocationFailures')
+            raise
+        finally:
+            self.flush()
+
+    def add_timing(self, name, ms):                # type: (str, float) -> None
+        if not self.enabled:
+            return
+        with self._lock:
+            self._timings.setdefault(name, []).append(ms)
+
+    def add_size(self, name, n_bytes):             # type: (str, int) -> None
+        """ Records a size, ex:  of a request payload.  Kept like a
+        timing, so the sink can report percentiles, but in Bytes. """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._units[name] = 'Bytes'
+            self._timings.setdefault(name, []).append(n_bytes)
+
+    def add_gauge(self, name,                                      # type: str
+                  value,                                         # type: float
+                  unit='Count'                                     # type: str
+                  ):                                    # type: (...) -> None
+        """ Records a level, ex:  the depth of a queue.  Kept like a timing,
+        in 'unit' ('Count', 'Seconds', ...). """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._units[name] = unit
+            self._timings.setdefault(name, []).append(value)
+
+    def increment(self, name, value=1):              # type: (str, int) -> None
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record_retries(self, name, outcome):
+                                           # type: (str, RetryOutcome) -> None
+        """ Records how many attempts a retried call took and how long it
+        waited between them. """
+        self.increment(name + 'Attempts', outcome.attempts)
+        if outcome.total_wait:
+            self.add_timing(name + 'RetryWait', outcome.total_wait * 1000.0)
+
+    def flush(self):                                        # type: () -> None
+        """ Hands what was recorded since the last flush to the sinks.  A
+        sink that fails is logged, never raised. """
+        with self._lock:
+            timings, self._timings = self._timings, {}
+            counters, self._counters = self._counters, {}
+        if not timings and not counters:
+            return
+        units = {n: u for n, u in self._units.items() if n in timings}
+        snapshot = MetricsSnapshot(self.namespace, self.dimensions,
+                                   timings, counters, units)
+        for sink in self.sinks:
+            # noinspection PyBroadException
+            try:
+                sink.emit(snapshot)
+            except Exception:
+                logger.warning("Failed to emit metrics to '{}'."
+                               .format(sink.__class__.__name__),
+                               exc_info=True)
@@ -0,0 +1,144 @@
+# encoding = utf-8
+
+""" RetryPolicy class definition. """
+
+import asyncio
+from logging import getLogger
+import random
+import time
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Iterator, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class RetryOutcome:
+    """ What happened when a RetryPolicy ran a call. """
+
+    def __init__(self):
+        self.value = None                                          # type: Any
+        self.error = None                          # type: Optional[Exception]
+        self.attempts = 0                                          # type: int
+        self.total_wait = 0.0                                    # type: float
+        self.stopped_for_deadline = False                         # type: bool
+
+    @property
+    def succeeded(self):                                    # type: () -> bool
+        return self.attempts > 0 and self.error is None
+
+
+class RetryPolicy:
+    """ Runs a call until it succeeds, with an immediate first attempt and
+    exponential backoff with jitter (capped) between the ones that follow.
+
+    If a Lambda context is given, stops retrying before the Lambda's
+    deadline:  an attempt is only started if, after waiting for it, at
+    least 'deadline_margin' seconds of the invocation would remain. """
+
+    def __init__(self, max_attempts=5,                             # type: int
+                 base_delay=0.5,                                 # type: float
+                 max_delay=4.0,                                  # type: float
+                 multiplier=2.0,                                 # type: float
+                 jitter=True,                                     # type: bool
+                 deadline_margin=1.0                             # type: float
+                 ):
+        if max_attempts < 1:
+            raise Exception("max_attempts must be at least 1.")
+        self.max_attempts = max_attempts                           # type: int
+        self.base_delay = base_delay                             # type: float
+        self.max_delay = max_delay                               # type: float
+        self.multiplier = multiplier                             # type: float
+        self.jitter = jitter                                      # type: bool
+        self.deadline_margin = deadline_margin                   # type: float
+
+    def delays(self):                             # type: () -> Iterator[float]
+        """ The waits before the 2nd, 3rd, ... attempts.  With jitter, each
+        wait is between half and all of the capped exponential delay. """
+        delay = self.base_delay
+        for _ in range(self.max_attempts - 1):
+            capped = min(delay, self.max_delay)
+            if self.jitter:
+                yield capped / 2 + random.uniform(0, capped / 2)
+            else:
+                yield capped
+            delay *= self.multiplier
+
+    @staticmethod
+    def remaining_seconds(context):           # type: (Any) -> Optional[float]
+        """ Seconds left in the Lambda invocation, or None if unknown. """
+        get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        if get_remaining is None:
+            return None
+        return get_remaining() / 1000.0
+
+    def _may_wait(self, delay, context):       # type: (float, Any) -> bool
+        remaining = self.remaining_seconds(context)
+        if remaining is None:
+            return True
+        return remaining - delay >= self.deadline_margin
+
+    def call(self, fn,                                # type: Callable[[], Any]
+             context=None,                                         # type: Any
+             is_retryable=None   # type: Optional[Callable[[Exception], bool]]
+             ):                                   # type: (...) -> RetryOutcome
+        """ Calls fn until it returns without raising, it raises an error
+        that is not retryable, the attempts run out or the deadline is
+        near.  Never raises fn's errors;  see the outcome's 'error'. """
+        outcome = RetryOutcome()
+        delays = self.delays()
+        while True:
+            outcome.attempts += 1
+            # noinspection PyBroadException
+            try:
+                outcome.value = fn()
+                outcome.error = None
+                return outcome
+            except Exception as e:
+                outcome.error = e
+            delay = self._next_delay(outcome, delays, context, is_retryable)
+            if delay is None:
+                return outcome
+            time.sleep(delay)
+            outcome.total_wait += delay
+
+    async def call_async(self, fn,          # type: Callable[[], Awaitable]
+                         context=None,                             # type: Any
+                         is_retryable=None
+                         ):                       # type: (...) -> RetryOutcome
+        """ The asyncio counterpart of 'call'.  fn returns an awaitable. """
+        outcome = RetryOutcome()
+        delays = self.delays()
+        while True:
+            outcome.attempts += 1
+            # noinspection PyBroadException
+            try:
+                outcome.value = await fn()
+                outcome.error = None
+                return outcome
+            except Exception as e:
+                outcome.error = e
+            delay = self._next_delay(outcome, delays, context, is_retryable)
+            if delay is None:
+                return outcome
+            await asyncio.sleep(delay)
+            outcome.total_wait += delay
+
+    def _next_delay(self, outcome,                      # type: RetryOutcome
+                    delays,                            # type: Iterator[float]
+                    context,                                       # type: Any
+                    is_retryable  # type: Optional[Callable[[Exception], bool]]
+                    ):                         # type: (...) -> Optional[float]
+        """ The wait before the next attempt, or None to give up. """
+        if is_retryable is not None and not is_retryable(outcome.error):
+            return None
+        delay = next(delays, None)
+        if delay is None:
+            return None
+        if not self._may_wait(delay, context):
+            logger.info("Not retrying:  the Lambda's deadline is too close.")
+            outcome.stopped_for_deadline = True
+            return None
+        return delay
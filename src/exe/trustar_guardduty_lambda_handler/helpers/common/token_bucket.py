@@ -0,0 +1,88 @@
+# encoding = utf-8
+
+""" TokenBucket class definition. """
+
+import asyncio
+import threading
+import time
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Optional
+
+
+class TokenBucket:
+    """ Spaces calls out to at most 'rate' per second, with bursts of up to
+    'burst' calls.  A caller that finds the bucket empty reserves the next
+    token and waits for it, so callers queue in order instead of failing.
+    Without a 'rate', calls are only held back while the bucket is paused.
+
+    Adapts to the server:  'throttled' pauses every caller (ex:  for the
+    server's Retry-After) and halves the rate, down to 'min_rate_fraction'
+    of the configured rate;  each 'succeeded' call wins back
+    'recovery_fraction' of it.  Safe to share between threads and
+    coroutines:  waits happen outside the lock. """
+
+    def __init__(self, rate=None,                      # type: Optional[float]
+                 burst=None,                           # type: Optional[float]
+                 min_rate_fraction=0.1,                          # type: float
+                 recovery_fraction=0.05,                         # type: float
+                 clock=time.monotonic            # type: Callable[[], float]
+                 ):
+        self.max_rate = rate                           # type: Optional[float]
+        self.rate = rate                               # type: Optional[float]
+        self.burst = burst or max(rate or 1.0, 1.0)              # type: float
+        self.min_rate = (rate or 0.0) * min_rate_fraction        # type: float
+        self.recovery = (rate or 0.0) * recovery_fraction        # type: float
+        self.clock = clock
+        self.tokens = self.burst                                 # type: float
+        self.updated_at = clock()                                # type: float
+        self.paused_until = 0.0                                  # type: float
+        self._lock = threading.Lock()
+
+    def reserve(self):                                     # type: () -> float
+        """ Takes a token and returns how many seconds the caller must
+        wait before using it. """
+        with self._lock:
+            now = self.clock()
+            wait = max(0.0, self.paused_until - now)
+            if self.rate is None:
+                return wait
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1.0
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def acquire(self):                                     # type: () -> float
+        """ Waits for a token.  Returns the seconds waited. """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):                         # type: () -> float
+        """ The asyncio counterpart of 'acquire'. """
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def throttled(self, pause):                         # type: (float) -> None
+        """ The server refused a call for being over its limit:  hold every
+        caller back for 'pause' seconds and slow down. """
+        with self._lock:
+            now = self.clock()
+            self.paused_until = max(self.paused_until, now + pause)
+            if self.rate is not None:
+                self.rate = max(self.min_rate, self.rate / 2.0)
+                self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):                                    # type: () -> None
+        """ A call went through:  win back some of the rate given up. """
+        if self.rate is None or self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
@@ -0,0 +1,186 @@
+# encoding = utf-8
+
+""" BodyShaper class definition. """
+
+from collections import Counter
+from logging import getLogger
+
+from ..common.metrics_recorder import MetricsRecorder
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class BodyShaper:
+    """ Keeps report bodies of oversized findings (ex:  the port probe
+    details of a long-running scan) to a bounded size.
+
+    Lists longer than 'max_list_items' keep their first items;  a summary
+    of the whole list (its length, the 'top_n' most common IP addresses,
+    ports, API calls and domains, and the first and last times seen) goes
+    under the body's "truncated" key, by the list's dotted path.  Strings
+    longer than 'max_string_chars' are cut.  If the serialized body is
+    still over 'max_body_bytes', both caps are halved until it fits;  if
+    it never does, only the body's scalar values are kept.  A cap of 0 or
+    None turns it off.
+
+    Records the size of every body (BodyBytes) and counts the bodies that
+    were truncated (BodiesTruncated) or had to be shrunk to fit the byte
+    budget (BodiesOverBudget). """
+
+    SUMMARY_KEY = 'truncated'
+    # leaf keys whose values are tallied, and the summary key they go to.
+    TOP_KEYS = {'ipAddressV4': 'topIpAddresses',
+                'port': 'topPorts',
+                'api': 'topApis',
+                'domain': 'topDomains'}
+    FIRST_SEEN_KEYS = ('firstSeen', 'eventFirstSeen')
+    LAST_SEEN_KEYS = ('lastSeen', 'eventLastSeen')
+    # floors of the caps while shrinking a body to its byte budget.
+    MIN_LIST_ITEMS = 1
+    MIN_STRING_CHARS = 64
+    # where the caps start shrinking from when they're turned off.
+    UNCAPPED_LIST_ITEMS = 1024
+    UNCAPPED_STRING_CHARS = 65536
+
+    def __init__(self, max_list_items=100,               # type: Optional[int]
+                 max_string_chars=4096,                  # type: Optional[int]
+                 max_body_bytes=None,                    # type: Optional[int]
+                 top_n=10,                                         # type: int
+                 metrics=None                 # type: Optional[MetricsRecorder]
+                 ):
+        self.max_list_items = max_list_items             # type: Optional[int]
+        self.max_string_chars = max_string_chars         # type: Optional[int]
+        self.max_body_bytes = max_body_bytes             # type: Optional[int]
+        self.top_n = top_n                                         # type: int
+        self.metrics = metrics or MetricsRecorder()    # type: MetricsRecorder
+
+    def render(self, body,                                        # type: Dict
+               dumps                               # type: Callable[[Any], str]
+               ):                                          # type: (...) -> str
+        """ Shapes the body and serializes it with 'dumps'. """
+        max_items, max_chars = self.max_list_items, self.max_string_chars
+        over_budget = False
+        while True:
+            shaped, truncated = self.shape(body, max_items, max_chars)
+            s = dumps(shaped)                                      # type: str
+            size = self.size_of(s)
+            if not self.max_body_bytes or size <= self.max_body_bytes:
+                break
+            over_budget = True
+            if (max_items == self.MIN_LIST_ITEMS and
+                    max_chars == self.MIN_STRING_CHARS):
+                logger.warning("Report body is '{}' bytes even with its "
+                               "lists and strings cut short.  Keeping only "
+                               "its scalar values.".format(size))
+                s = dumps(self.skeleton(body, size))
+                size = self.size_of(s)
+                break
+            max_items = max(self.MIN_LIST_ITEMS,
+                            (max_items or self.UNCAPPED_LIST_ITEMS) // 2)
+            max_chars = max(self.MIN_STRING_CHARS,
+                            (max_chars or self.UNCAPPED_STRING_CHARS) // 2)
+        self.metrics.add_size('BodyBytes', size)
+        if truncated or over_budget:
+            self.metrics.increment('BodiesTruncated')
+        if over_budget:
+            self.metrics.increment('BodiesOverBudget')
+        return s
+
+    def shape(self, body,                                         # type: Dict
+              max_items,                                 # type: Optional[int]
+              max_chars                                  # type: Optional[int]
+              ):                           # type: (...) -> Tuple[Dict, bool]
+        """ A copy of the body within the caps, and whether anything was
+        cut. """
+        summaries = {}                                 # type: Dict[str, Dict]
+        cut = []                                            # type: List[str]
+        shaped = self._shape(body, '', max_items, max_chars, summaries, cut)
+        if summaries:
+            shaped[self.SUMMARY_KEY] = summaries
+        return shaped, bool(summaries or cut)
+
+    def _shape(self, value, path, max_items, max_chars, summaries, cut):
+        if isinstance(value, dict):
+            return {k: self._shape(v, self.join(path, k), max_items,
+                                   max_chars, summaries, cut)
+                    for k, v in value.items()}
+        if isinstance(value, list):
+            if max_items and len(value) > max_items:
+                summaries[path] = self.summarize(value, max_items)
+                value = value[:max_items]
+            return [self._shape(v, path + '[]', max_items, max_chars,
+                                summaries, cut) for v in value]
+        if isinstance(value, str) and max_chars and len(value) > max_chars:
+            cut.append(path)
+            return "{}... [{} more chars]".format(value[:max_chars],
+                                                  len(value) - max_chars)
+        return value
+
+    @staticmethod
+    def join(path, key):                           # type: (str, str) -> str
+        return '{}.{}'.format(path, key) if path else key
+
+    def summarize(self, items,                                    # type: List
+                  kept                                             # type: int
+                  ):                                      # type: (...) -> Dict
+        """ Summarizes every item of a list, including the dropped ones. """
+        tallies = {k: Counter() for k in self.TOP_KEYS}
+        first_seen = []                                     # type: List[str]
+        last_seen = []                                      # type: List[str]
+        stack = list(items)
+        while stack:
+            value = stack.pop()
+            if isinstance(value, list):
+                stack.extend(value)
+            elif isinstance(value, dict):
+                for k, v in value.items():
+                    if isinstance(v, (dict, list)):
+                        stack.append(v)
+                    elif v is None:
+                        continue
+                    elif k in tallies:
+                        tallies[k][v] += 1
+                    elif not isinstance(v, str):
+                        continue
+                    elif k in self.FIRST_SEEN_KEYS:
+                        first_seen.append(v)
+                    elif k in self.LAST_SEEN_KEYS:
+                        last_seen.append(v)
+        summary = {'count': len(items), 'kept': kept}
+        for k, tally in tallies.items():
+            if tally:
+                summary[self.TOP_KEYS[k]] = [
+                    {'value': v, 'count': n}
+                    for v, n in tally.most_common(self.top_n)]
+        if first_seen:
+            summary['firstSeen'] = min(first_seen)
+        if last_seen:
+            summary['lastSeen'] = max(last_seen)
+        return summary
+
+    def skeleton(self, body,                                      # type: Dict
+                 size                                              # type: int
+                 ):                                       # type: (...) -> Dict
+        """ The body's scalar values, at the top level and one level down,
+        with the strings cut to MIN_STRING_CHARS. """
+        def scalars(d):
+            return {k: self._shape(v, k, None, self.MIN_STRING_CHARS, {}, [])
+                    for k, v in d.items()
+                    if not isinstance(v, (dict, list))}
+        skeleton = scalars(body)
+        for k, v in body.items():
+            if isinstance(v, dict):
+                skeleton[k] = scalars(v)
+        skeleton[self.SUMMARY_KEY] = {
+            'body': {'bytes': size, 'maxBytes': self.max_body_bytes}}
+        return skeleton
+
+    @staticmethod
+    def size_of(s):                                       # type: (str) -> int
+        """ The string's size in bytes, once encoded as UTF-8. """
+        return len(s) if s.isascii() else len(s.encode('utf-8'))
@@ -0,0 +1,329 @@
+# encoding = utf-8
+
+""" FindingAggregator class definition. """
+
+from collections import OrderedDict
+import hashlib
+import json
+from logging import getLogger
+
+from trustar import Report
+
+from ..ts.external_id_encoder import ExternalIdEncoder
+from ..ts.time_converter import TimeConverter
+from .finding_router import EnclaveRoute
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Optional, Tuple
+    from logging import Logger
+    from ..common.metrics_recorder import MetricsRecorder
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+def dumps(d):                                             # type: (Dict) -> str
+    return json.dumps(d, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False)
+
+
+class RollupGroup:
+    """ The findings of one group, in one enclave and time bucket, kept so
+    that adding a member only serializes that member:  each member's JSON
+    is kept, and so is the join of the listed members', which a new member
+    is appended to.  Only the first 'max_members' members are listed;  the
+    others are counted (once per container:  after a restore, an unlisted
+    member seen again is counted again). """
+
+    def __init__(self, external_id,                                # type: str
+                 enclave_id,                                       # type: str
+                 fields,                                # type: Dict[str, str]
+                 bucket_start,                                     # type: str
+                 max_members                                       # type: int
+                 ):
+        self.external_id = external_id                             # type: str
+        self.enclave_id = enclave_id                               # type: str
+        self.fields = fields                            # type: Dict[str, str]
+        self.bucket_start = bucket_start                           # type: str
+        self.max_members = max_members                             # type: int
+        # False until the rollup report already in Station, if any, was
+        # read back.
+        self.loaded = False                                       # type: bool
+        self.member_ids = set()                                   # type: set
+        self.updated_at = {}                  # type: Dict[str, Optional[str]]
+        self.listed = OrderedDict()                     # type: Dict[str, str]
+        self.first_seen = None                           # type: Optional[str]
+        self.last_seen = None                            # type: Optional[str]
+        self.max_severity = 0.0                                  # type: float
+        self.event_count = 0                                       # type: int
+        self.restored_unlisted = 0                                 # type: int
+        self._counts = {}                               # type: Dict[str, int]
+        self._joined = ''                                # type: Optional[str]
+
+    def __len__(self):                                       # type: () -> int
+        return len(self.member_ids) + self.restored_unlisted
+
+    def add(self, member):                              # type: (Dict) -> bool
+        """ Adds a member, or the newer version of one.  True if it is a
+        new member. """
+        finding_id = member['id']
+        is_new = finding_id not in self.member_ids
+        self.member_ids.add(finding_id)
+        self.updated_at[finding_id] = member.get('updatedAt')
+        self._widen(member)
+        count = member.get('count') or 0
+        self.event_count += count - self._counts.get(finding_id, 0)
+        self._counts[finding_id] = count
+        if finding_id in self.listed:
+            self.listed[finding_id] = dumps(member)
+            self._joined = None
+        elif len(self.listed) < self.max_members:
+            fragment = dumps(member)
+            self.listed[finding_id] = fragment
+            if self._joined is not None:
+                self._joined += (',' if self._joined else '') + fragment
+        return is_new
+
+    def _widen(self, member):                         # type: (Dict) -> None
+        """ Widens the group's time range and severity to the member's. """
+        first_seen, last_seen = member.get('firstSeen'), member.get('lastSeen')
+        if first_seen and (self.first_seen is None
+                           or first_seen < self.first_seen):
+            self.first_seen = first_seen
+        if last_seen and (self.last_seen is None
+                          or last_seen > self.last_seen):
+            self.last_seen = last_seen
+        self.max_severity = max(self.max_severity,
+                                member.get('severity') or 0.0)
+
+    def restore(self, body):                  # type: (Optional[str]) -> None
+        """ Merges in the members of the rollup report saved in Station, so
+        that a group that was evicted, or built by another container, keeps
+        their members.  A saved member replaces this group's version of it
+        only if it was updated later. """
+        self.loaded = True
+        if not body:
+            return
+        try:
+            saved = json.loads(body)
+        except ValueError:
+            logger.warning("Could not read the members of rollup report "
+                           "'{}' back.  Starting it over."
+                           .format(self.external_id))
+            return
+        for member in saved.get('members') or []:
+            finding_id = member.get('id')
+            if (finding_id not in self.member_ids
+                    or (member.get('updatedAt') or '')
+                    > (self.updated_at.get(finding_id) or '')):
+                self.add(member)
+        rollup = saved.get('rollup') or {}
+        self.restored_unlisted = max(
+            0, (rollup.get('memberCount') or 0) - len(self.member_ids))
+        self.event_count = max(self.event_count,
+                               rollup.get('eventCount') or 0)
+
+    @property
+    def members_json(self):                                  # type: () -> str
+        if self._joined is None:
+            self._joined = ','.join(self.listed.values())
+        return self._joined
+
+    def body(self):                                          # type: () -> str
+        """ The rollup report's body:  the group's summary under "rollup",
+        then its listed members. """
+        summary = {'rollup': {'enclaveId': self.enclave_id,
+                              'groupedBy': self.fields,
+                              'bucketStart': self.bucket_start,
+                              'memberCount': len(self),
+                              'listedCount': len(self.listed),
+                              'eventCount': self.event_count,
+                              'firstSeen': self.first_seen,
+                              'lastSeen': self.last_seen,
+                              'maxSeverity': self.max_severity}}
+        return '{}{}{}]}}'.format(dumps(summary)[:-1], ',"members":[',
+                                  self.members_json)
+
+
+class FindingAggregator:
+    """ Rolls related findings up into one report per group, instead of
+    one report per finding, ex:  every port probe from one remote IP
+    within an hour.  Findings are grouped by the values of 'keys', by the
+    enclave they are routed to and by the 'bucket_seconds' time bucket of
+    their "createdAt" (so every version of a finding stays in its group).
+    Only findings whose type matches one of 'types' (globs) are rolled
+    up, every finding if none are given.
+
+    A key is "type", "account", "region", "resource" (ex:  the EC2
+    instance ID), "remote_ip", or a dotted path into the finding's
+    detail.  The group's external ID is encoded by the ExternalIdEncoder
+    from a digest of its enclave, key values and bucket, so it is the same
+    in every container.  The 'max_groups' most recently used groups are
+    kept;  a group that isn't must be 'restore'd from its report in
+    Station before members are added to it.  A kept group isn't read back
+    again, so a new member costs one update;  the members other containers
+    added to it since are overwritten.  Counts RollupGroupsCreated,
+    RollupMembersAdded and RollupMembersUpdated. """
+
+    ROLLUP_PREFIX = 'rollup-'
+    REMOTE_IP_ACTIONS = ('networkConnectionAction', 'awsApiCallAction',
+                         'kubernetesApiCallAction')
+    RESOURCE_IDS = (('instanceDetails', 'instanceId'),
+                    ('accessKeyDetails', 'accessKeyId'),
+                    ('s3BucketDetails', 'name'),
+                    ('eksClusterDetails', 'name'))
+
+    def __init__(self, keys,                                 # type: List[str]
+                 bucket_seconds=3600.0,                          # type: float
+                 types=None,                       # type: Optional[List[str]]
+                 max_members=500,                                  # type: int
+                 max_groups=1000,                                  # type: int
+                 metrics=None                 # type: Optional[MetricsRecorder]
+                 ):
+        if not keys:
+            raise Exception("Rollups need at least one key.")
+        if bucket_seconds <= 0:
+            raise Exception("Rollup buckets must be longer than 0 seconds.")
+        self.extractors = [(key, self.extractor_for(key))
+                           for key in keys]  # type: List[Tuple[str, Callable]]
+        self.bucket_seconds = bucket_seconds                     # type: float
+        self.types = EnclaveRoute.compile(types)
+        self.max_members = max_members                             # type: int
+        self.max_groups = max_groups                               # type: int
+        self.metrics = metrics             # type: Optional[MetricsRecorder]
+        self.ext_id_encoder = ExternalIdEncoder()
+        self._groups = OrderedDict()          # type: Dict[str, RollupGroup]
+
+    @classmethod
+    def extractor_for(cls, key):         # type: (str) -> Callable[[Dict], str]
+        extractors = {'type': lambda d: d.get('type'),
+                      'account': lambda d: d.get('accountId'),
+                      'region': lambda d: d.get('region'),
+                      'resource': cls.resource_of,
+                      'remote_ip': cls.remote_ip_of}
+        if key in extractors:
+            return extractors[key]
+        if '.' not in key:
+            raise Exception("Unknown rollup key '{}'.  Use one of '{}', or a "
+                            "dotted path into the finding's detail."
+                            .format(key, "', '".join(sorted(extractors))))
+        path = key.split('.')
+        return lambda d: cls.value_at(d, path)
+
+    @staticmethod
+    def value_at(d, path):                     # type: (Dict, List[str]) -> str
+        for part in path:
+            d = d.get(part) if isinstance(d, dict) else None
+        return d
+
+    @classmethod
+    def resource_of(cls, detail):               # type: (Dict) -> Optional[str]
+        """ The ID of the finding's resource, ex:  its EC2 instance ID. """
+        resource = detail.get('resource') or {}
+        for details_key, id_key in cls.RESOURCE_IDS:
+            details = resource.get(details_key)
+            if isinstance(details, list):
+                details = details[0] if details else None
+            if details and details.get(id_key):
+                return details[id_key]
+        return resource.get('resourceType')
+
+    @classmethod
+    def remote_ip_of(cls, detail):              # type: (Dict) -> Optional[str]
+        """ The remote IP address of the finding's action, if any. """
+        action = (detail.get('service') or {}).get('action') or {}
+        for action_key in cls.REMOTE_IP_ACTIONS:
+            if action_key in action:
+                remote = action[action_key].get('remoteIpDetails') or {}
+                return remote.get('ipAddressV4')
+        probes = (action.get('portProbeAction') or {}).get(
+            'portProbeDetails') or []
+        if probes:
+            return (probes[0].get('remoteIpDetails') or {}).get('ipAddressV4')
+        return None
+
+    @classmethod
+    def is_rollup(cls, external_id):                     # type: (str) -> bool
+        """ Whether the external ID is a rollup report's. """
+        try:
+            s = ExternalIdEncoder.reverse(external_id)
+        except ValueError:
+            return False
+        return s.split('|', 1)[-1].startswith(cls.ROLLUP_PREFIX)
+
+    def aggregates(self, finding):                      # type: (Dict) -> bool
+        """ Whether the finding is rolled up. """
+        if self.types is None:
+            return True
+        type_ = (finding.get('detail') or {}).get('type') or ''
+        return self.types.match(type_) is not None
+
+    def group_for(self, finding,                                  # type: Dict
+                  enclave_id                                       # type: str
+                  ):                               # type: (...) -> RollupGroup
+        """ The group the finding belongs to in the enclave, created if
+        needed.  A new group isn't 'loaded'. """
+        detail = finding.get('detail') or {}
+        fields = OrderedDict((key, str(extract(detail)))
+                             for key, extract in self.extractors)
+        bucket_start = self.bucket_start_of(detail)
+        digest = hashlib.sha1('|'.join(
+            [enclave_id, bucket_start] + list(fields.values()))
+            .encode('utf-8')).hexdigest()
+        group = self._groups.get(digest)
+        if group is not None:
+            self._groups.move_to_end(digest)
+            return group
+        group = RollupGroup(
+            self.ext_id_encoder.reversible(enclave_id,
+                                           self.ROLLUP_PREFIX + digest),
+            enclave_id, dict(fields), bucket_start, self.max_members)
+        self._groups[digest] = group
+        if len(self._groups) > self.max_groups:
+            self._groups.popitem(last=False)
+        self.increment('RollupGroupsCreated')
+        return group
+
+    def bucket_start_of(self, detail):                   # type: (Dict) -> str
+        created = detail.get('createdAt') or detail.get('updatedAt')
+        if not created:
+            return 'unknown'
+        ms = TimeConverter.iso_to_ms(created.replace('Z', '+00:00'))
+        bucket_ms = int(self.bucket_seconds * 1000)
+        return TimeConverter.ms_to_iso_utc(ms - ms % bucket_ms)
+
+    def add(self, finding, group):        # type: (Dict, RollupGroup) -> None
+        """ Adds the finding to its group. """
+        is_new = group.add(self.member_of(finding.get('detail') or {}))
+        self.increment('RollupMembersAdded' if is_new
+                       else 'RollupMembersUpdated')
+
+    @classmethod
+    def member_of(cls, detail):                          # type: (Dict) -> Dict
+        """ What a rollup lists about each member. """
+        service = detail.get('service') or {}
+        return {'id': detail.get('id'),
+                'arn': detail.get('arn'),
+                'title': detail.get('title'),
+                'severity': detail.get('severity'),
+                'resource': cls.resource_of(detail),
+                'remoteIp': cls.remote_ip_of(detail),
+                'firstSeen': service.get('eventFirstSeen'),
+                'lastSeen': service.get('eventLastSeen'),
+                'count': service.get('count'),
+                'updatedAt': detail.get('updatedAt')}
+
+    @staticmethod
+    def report_for(group):                      # type: (RollupGroup) -> Report
+        """ The group's rollup report. """
+        title = "GuardDuty rollup:  {} ({} finding(s))".format(
+            ', '.join(group.fields.values()), len(group))
+        return Report(title=title,
+                      body=group.body(),
+                      time_began=group.first_seen,
+                      external_id=group.external_id,
+                      enclave_ids=[group.enclave_id])
+
+    def increment(self, name):                            # type: (str) -> None
+        if self.metrics is not None:
+            self.metrics.increment(name)
@@ -0,0 +1,149 @@
+# encoding = utf-8
+
+""" FindingCoalescer class definition. """
+
+from collections import OrderedDict
+from itertools import count
+from logging import getLogger
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Optional, Tuple
+    from logging import Logger
+    from ..aws.batch_item import BatchItem
+    from ..common.metrics_recorder import MetricsRecorder
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class CoalescedFinding:
+    """ The newest version of a finding, and the batch items carrying the
+    older versions it supersedes. """
+
+    def __init__(self, key,                                        # type: str
+                 item                                        # type: BatchItem
+                 ):
+        self.key = key                                             # type: str
+        self.item = item                                     # type: BatchItem
+        self.superseded = []                           # type: List[BatchItem]
+
+    def share_outcome(self):                                # type: () -> None
+        """ Gives the superseded items the newest item's result or error,
+        since it was upserted on their behalf. """
+        for item in self.superseded:
+            item.result = self.item.result
+            item.error = self.item.error
+
+
+class FindingCoalescer:
+    """ Buffers a batch's findings so that only the newest version of
+    each is upserted.  GuardDuty emits a new event for the same finding
+    every time its count goes up.
+
+    Findings are keyed by 'key_for', ex:  the report's encoded external
+    ID.  The newest version is the one with the latest 'updatedAt', then
+    the highest 'service.count', then the latest arrival.  Callers flush
+    the buffer at the end of the batch.  If the buffer holds
+    'max_buffered' findings, adding another flushes the oldest one
+    early. """
+
+    DEFAULT_MAX_BUFFERED = 1000
+
+    def __init__(self, key_for,     # type: Optional[Callable[[Dict], str]]
+                 max_buffered=DEFAULT_MAX_BUFFERED                 # type: int
+                 ):
+        if max_buffered < 1:
+            raise Exception("max_buffered must be at least 1.")
+        self.key_for = key_for
+        self.max_buffered = max_buffered                           # type: int
+        self.received = 0                                          # type: int
+        self.written = 0                                           # type: int
+        self._buffer = OrderedDict()     # type: Dict[str, CoalescedFinding]
+        self._unkeyed = count()
+
+    @classmethod
+    def coalesce_batch(cls, items,                     # type: List[BatchItem]
+                       key_for,     # type: Optional[Callable[[Dict], str]]
+                       max_buffered=DEFAULT_MAX_BUFFERED,          # type: int
+                       metrics=None           # type: Optional[MetricsRecorder]
+                       ):             # type: (...) -> List[CoalescedFinding]
+        """ Coalesces one batch's items, flushing them all at the end of the
+        batch.  Items without a finding are skipped.  With no 'key_for',
+        every item is its own finding. """
+        coalescer = cls(key_for, max_buffered=max_buffered)
+        coalesced = []                          # type: List[CoalescedFinding]
+        for item in items:
+            if item.finding is not None:
+                coalesced.extend(coalescer.add(item))
+        coalesced.extend(coalescer.flush())
+        coalescer.log_counts()
+        if metrics is not None:
+            metrics.increment('FindingsReceived', coalescer.received)
+            metrics.increment('FindingsCoalesced', coalescer.coalesced)
+        return coalesced
+
+    def __len__(self):                                       # type: () -> int
+        return len(self._buffer)
+
+    @property
+    def coalesced(self):                                     # type: () -> int
+        """ Number of findings that were superseded instead of written. """
+        return self.received - self.written - len(self._buffer)
+
+    def add(self, item):       # type: (BatchItem) -> List[CoalescedFinding]
+        """ Buffers the item's finding.  Returns the findings flushed to
+        make room for it, if any. """
+        self.received += 1
+        key = self._key_of(item.finding)
+        current = self._buffer.get(key)
+        if current is None:
+            self._buffer[key] = CoalescedFinding(key, item)
+            return self._take_overflow()
+        if self.version_of(item.finding) >= \
+                self.version_of(current.item.finding):
+            current.superseded.append(current.item)
+            current.item = item
+        else:
+            current.superseded.append(item)
+        return []
+
+    def flush(self):                       # type: () -> List[CoalescedFinding]
+        """ Flushes every buffered finding. """
+        flushed = []                            # type: List[CoalescedFinding]
+        while self._buffer:
+            flushed.append(self._pop_oldest())
+        return flushed
+
+    def log_counts(self):                                   # type: () -> None
+        logger.info("Received '{}' finding event(s), writing '{}' report(s) "
+                    "('{}' superseded by newer versions of their finding)."
+                    .format(self.received, self.written, self.coalesced))
+
+    def _key_of(self, finding):                           # type: (Dict) -> str
+        """ Findings that can't be keyed are never coalesced;  building
+        their report will surface the problem. """
+        if self.key_for is not None:
+            # noinspection PyBroadException
+            try:
+                return self.key_for(finding)
+            except Exception:
+                pass
+        return "unkeyed-{}".format(next(self._unkeyed))
+
+    def _take_overflow(self):              # type: () -> List[CoalescedFinding]
+        if len(self._buffer) <= self.max_buffered:
+            return []
+        logger.info("Finding coalescer buffer is full.  Flushing the oldest "
+                    "finding early.")
+        return [self._pop_oldest()]
+
+    def _pop_oldest(self):                      # type: () -> CoalescedFinding
+        _, coalesced = self._buffer.popitem(last=False)
+        self.written += 1
+        return coalesced
+
+    @staticmethod
+    def version_of(finding):                            # type: (Dict) -> Tuple
+        detail = finding.get('detail') or {}
+        service = detail.get('service') or {}
+        return detail.get('updatedAt') or '', service.get('count') or 0
@@ -0,0 +1,180 @@
+# encoding = utf-8
+
+""" FindingFilter class definition. """
+
+import json
+from logging import getLogger
+import zlib
+
+from .finding_router import EnclaveRoute
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Optional, Pattern, Tuple
+    from logging import Logger
+    from ..common.metrics_recorder import MetricsRecorder
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class FilterRule:
+    """ One check of the filter:  'keep' takes a finding's detail and
+    returns whether the finding passes. """
+
+    def __init__(self, name,                                       # type: str
+                 keep                            # type: Callable[[Dict], bool]
+                 ):
+        self.name = name                                           # type: str
+        self.keep = keep                         # type: Callable[[Dict], bool]
+        self.passed_metric = 'Filter{}Passed'.format(name)         # type: str
+        self.dropped_metric = 'Filter{}Dropped'.format(name)       # type: str
+
+
+class FindingFilter:
+    """ Drops low-value findings before their reports are built, so they
+    cost no Station calls.  Built from a JSON object whose keys each turn
+    on one rule, ex:
+    {"min_severity": 4, "exclude_types": ["*IntegTest*"],
+     "drop_archived": true, "sample": {"Recon:*": 0.1}}
+
+    The rules run in the order of RULES;  the first that fails a finding
+    drops it.  "types" / "exclude_types" are glob patterns, compiled once
+    into one regex each;  "accounts", "exclude_accounts", "regions" and
+    "exclude_regions" are exact lists.  "sample" keeps the given share of
+    the findings whose type matches each glob (the first glob that
+    matches applies).  Sampling hashes the finding's ID, so every version
+    of a finding gets the same decision, in every container.  Counts
+    FindingsFiltered and, per rule, "Filter" + the rule's name + "Passed"
+    or "Dropped". """
+
+    # key -> rule name, in the order the rules run.
+    RULES = (('min_severity', 'MinSeverity'),
+             ('drop_archived', 'Archived'),
+             ('accounts', 'Accounts'),
+             ('exclude_accounts', 'ExcludeAccounts'),
+             ('regions', 'Regions'),
+             ('exclude_regions', 'ExcludeRegions'),
+             ('types', 'Types'),
+             ('exclude_types', 'ExcludeTypes'),
+             ('sample', 'Sample'))
+
+    def __init__(self, rules=(),                   # type: List[FilterRule]
+                 metrics=None                 # type: Optional[MetricsRecorder]
+                 ):
+        self.rules = list(rules)                      # type: List[FilterRule]
+        self.metrics = metrics             # type: Optional[MetricsRecorder]
+
+    @classmethod
+    def from_json(cls, spec,                             # type: Optional[str]
+                  metrics=None               # type: Optional[MetricsRecorder]
+                  ):                           # type: (...) -> FindingFilter
+        return cls(cls.parse_rules(spec), metrics=metrics)
+
+    @classmethod
+    def parse_rules(cls, spec):     # type: (Optional[str]) -> List[FilterRule]
+        """ Raises exception if the filter isn't valid. """
+        if not spec:
+            return []
+        try:
+            d = json.loads(spec)
+        except ValueError as e:
+            raise Exception("Could not parse the finding filter as JSON:  {}"
+                            .format(e))
+        if not isinstance(d, dict):
+            raise Exception("The finding filter must be a JSON object.")
+        keys = [key for key, _ in cls.RULES]
+        unknown = sorted(set(d) - set(keys))
+        if unknown:
+            raise Exception("Unknown finding filter key(s) '{}'.  Use '{}'."
+                            .format("', '".join(unknown),
+                                    "', '".join(keys)))
+        rules = []                                    # type: List[FilterRule]
+        for key, name in cls.RULES:
+            if d.get(key) is not None and d.get(key) is not False:
+                rules.append(FilterRule(name, cls.compile(key, d[key])))
+        return rules
+
+    @classmethod
+    def compile(cls, key, value):      # type: (str, object) -> Callable
+        """ The 'keep' function of a rule. """
+        if key == 'min_severity':
+            threshold = float(value)
+            return lambda detail: cls.severity_of(detail) >= threshold
+        if key == 'drop_archived':
+            return lambda detail: not (detail.get('service')
+                                       or {}).get('archived')
+        if key in ('accounts', 'exclude_accounts'):
+            return cls.member_of(cls.as_list(value), 'accountId',
+                                 key == 'accounts')
+        if key in ('regions', 'exclude_regions'):
+            return cls.member_of(cls.as_list(value), 'region',
+                                 key == 'regions')
+        if key in ('types', 'exclude_types'):
+            pattern = EnclaveRoute.compile(cls.as_list(value))
+            allow = key == 'types'
+            return lambda detail: (pattern.match(detail.get('type') or '')
+                                   is not None) == allow
+        return cls.sampler(value)
+
+    @staticmethod
+    def as_list(value):                             # type: (object) -> List
+        if isinstance(value, str):
+            return [value]
+        if not isinstance(value, list) or not value:
+            raise Exception("Expected a string or a non-empty list, got "
+                            "'{}'.".format(value))
+        return value
+
+    @staticmethod
+    def member_of(values,                                       # type: List
+                  field,                                           # type: str
+                  allow                                           # type: bool
+                  ):                                  # type: (...) -> Callable
+        values = frozenset(str(v) for v in values)
+        return lambda detail: (detail.get(field) in values) == allow
+
+    @classmethod
+    def sampler(cls, rates):                         # type: (Dict) -> Callable
+        """ Keeps a finding if the hash of its ID, as a fraction of the
+        hash space, is below the rate of its type. """
+        if not isinstance(rates, dict):
+            raise Exception("\"sample\" must map type globs to rates.")
+        compiled = []                   # type: List[Tuple[Pattern, int]]
+        for glob, rate in rates.items():
+            rate = float(rate)
+            if not 0.0 <= rate <= 1.0:
+                raise Exception("Sampling rate '{}' of '{}' is not between "
+                                "0 and 1.".format(rate, glob))
+            compiled.append((EnclaveRoute.compile([glob]),
+                             int(rate * 0x100000000)))
+
+        def keep(detail):                                # type: (Dict) -> bool
+            type_ = detail.get('type') or ''
+            for pattern, cutoff in compiled:
+                if pattern.match(type_):
+                    finding_id = str(detail.get('id')).encode('utf-8')
+                    return zlib.crc32(finding_id) < cutoff
+            return True
+        return keep
+
+    @staticmethod
+    def severity_of(detail):                           # type: (Dict) -> float
+        try:
+            return float(detail.get('severity'))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def rejecting_rule(self, finding):         # type: (Dict) -> Optional[str]
+        """ The name of the rule that drops the finding, or None if it
+        passes every rule. """
+        detail = finding.get('detail') or {}
+        metrics = self.metrics
+        for rule in self.rules:
+            if not rule.keep(detail):
+                if metrics is not None:
+                    metrics.increment(rule.dropped_metric)
+                    metrics.increment('FindingsFiltered')
+                return rule.name
+            if metrics is not None:
+                metrics.increment(rule.passed_metric)
+        return None
@@ -0,0 +1,203 @@
+# encoding = utf-8
+
+""" FindingRouter class definition. """
+
+from fnmatch import translate
+import json
+from logging import getLogger
+import re
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Optional, Pattern, Tuple, Union
+    from logging import Logger
+    from ..common.metrics_recorder import MetricsRecorder
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class EnclaveRoute:
+    """ One row of the routing table:  the findings it matches and the
+    enclaves they are upserted to.  Each rule is a list of glob patterns
+    (or severity bands), any of which may match;  a rule that isn't given
+    matches every finding.  The patterns are compiled once, into one
+    regex per rule. """
+
+    # GuardDuty's severity bands, by their lower bound.
+    SEVERITY_BANDS = (('critical', 9.0), ('high', 7.0), ('medium', 4.0),
+                      ('low', 0.0))
+    RULES = ('accounts', 'regions', 'severities', 'types')
+
+    def __init__(self, name,                                       # type: str
+                 enclave_ids,                                # type: List[str]
+                 accounts=None,                    # type: Optional[List[str]]
+                 regions=None,                     # type: Optional[List[str]]
+                 severities=None,                  # type: Optional[List[str]]
+                 types=None                        # type: Optional[List[str]]
+                 ):
+        bands = [band for band, _ in self.SEVERITY_BANDS]
+        unknown = [s for s in severities or () if s.lower() not in bands]
+        if unknown:
+            raise Exception("Route '{}' has unknown severity band(s) '{}'.  "
+                            "Use '{}'.".format(name, "', '".join(unknown),
+                                               "', '".join(bands)))
+        self.name = name                                           # type: str
+        self.enclave_ids = tuple(enclave_ids)          # type: Tuple[str, ...]
+        self.accounts = self.compile(accounts)       # type: Optional[Pattern]
+        self.regions = self.compile(regions)         # type: Optional[Pattern]
+        self.types = self.compile(types)             # type: Optional[Pattern]
+        self.severities = (frozenset(s.lower() for s in severities)
+                           if severities else None)
+
+    @staticmethod
+    def compile(patterns):   # type: (Optional[List[str]]) -> Optional[Pattern]
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:{})'.format(translate(str(p)))
+                                   for p in patterns))
+
+    @classmethod
+    def severity_band(cls, severity):     # type: (float) -> Optional[str]
+        """ The band of a GuardDuty severity, ex:  5.0 -> "medium". """
+        try:
+            severity = float(severity)
+        except (TypeError, ValueError):
+            return None
+        for band, lower_bound in cls.SEVERITY_BANDS:
+            if severity >= lower_bound:
+                return band
+        return None
+
+    def matches(self, account,                           # type: Optional[str]
+                region,                                  # type: Optional[str]
+                band,                                    # type: Optional[str]
+                type_                                    # type: Optional[str]
+                ):                                       # type: (...) -> bool
+        return (self._matches(self.accounts, account)
+                and self._matches(self.regions, region)
+                and (self.severities is None or band in self.severities)
+                and self._matches(self.types, type_))
+
+    @staticmethod
+    def _matches(pattern, value):  # type: (Optional[Pattern], str) -> bool
+        return pattern is None or (value is not None
+                                   and pattern.match(value) is not None)
+
+
+class FindingRouter:
+    """ Decides which enclaves each finding is upserted to.  The routes are
+    tried in order;  the first one that matches the finding's account ID,
+    region, severity band and type wins, and the finding is upserted to
+    each of its enclaves.  A route without enclaves drops the findings it
+    matches.  Findings no route matches go to the default enclave.
+
+    A finding's route depends only on those four values, so decisions are
+    remembered, up to 'max_decisions' of them, and most findings of a
+    batch are routed with one dict lookup.  Counts FindingsRouted,
+    FindingsUnrouted (routed to no enclave), FindingsFannedOut (routed to
+    more than one), ReportsRouted and, per route, "Route" + its name. """
+
+    DEFAULT_ROUTE = 'Default'
+    DEFAULT_MAX_DECISIONS = 4096
+
+    def __init__(self, default_enclave_id,                         # type: str
+                 routes=(),                      # type: Iterable[EnclaveRoute]
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 max_decisions=DEFAULT_MAX_DECISIONS               # type: int
+                 ):
+        self.default_route = EnclaveRoute(self.DEFAULT_ROUTE,
+                                          [default_enclave_id])
+        self.routes = list(routes)                  # type: List[EnclaveRoute]
+        self.metrics = metrics             # type: Optional[MetricsRecorder]
+        self.max_decisions = max_decisions                         # type: int
+        self._decisions = {}             # type: Dict[Tuple, EnclaveRoute]
+
+    @classmethod
+    def from_json(cls, default_enclave_id,                         # type: str
+                  spec,                                  # type: Optional[str]
+                  metrics=None               # type: Optional[MetricsRecorder]
+                  ):                           # type: (...) -> FindingRouter
+        """ Builds a router from a JSON list of routes, ex:
+        [{"name": "Critical", "severities": ["critical"],
+          "enclaves": ["<enclave ID>", "<enclave ID>"]},
+         {"name": "Sandbox", "accounts": ["1111*"], "enclaves": []}]
+        Each rule ("accounts", "regions", "severities", "types") may be a
+        string or a list of strings. """
+        return cls(default_enclave_id, cls.parse_routes(spec),
+                   metrics=metrics)
+
+    @classmethod
+    def parse_routes(cls, spec):  # type: (Optional[str]) -> List[EnclaveRoute]
+        """ Raises exception if the routes aren't valid. """
+        if not spec:
+            return []
+        try:
+            routes = json.loads(spec)
+        except ValueError as e:
+            raise Exception("Could not parse the enclave routes as JSON:  {}"
+                            .format(e))
+        if not isinstance(routes, list):
+            raise Exception("The enclave routes must be a JSON list.")
+        return [cls.route_from(i, d) for i, d in enumerate(routes)]
+
+    @staticmethod
+    def route_from(i, d):               # type: (int, Dict) -> EnclaveRoute
+        name = str(d.get('name') or i) if isinstance(d, dict) else str(i)
+        if not isinstance(d, dict) or not isinstance(d.get('enclaves'),
+                                                     list):
+            raise Exception("Enclave route '{}' must be an object with an "
+                            "\"enclaves\" list.".format(name))
+        unknown = set(d) - set(EnclaveRoute.RULES) - {'name', 'enclaves'}
+        if unknown:
+            raise Exception("Enclave route '{}' has unknown key(s) '{}'."
+                            .format(name, "', '".join(sorted(unknown))))
+        rules = {}                   # type: Dict[str, Union[str, List[str]]]
+        for rule in EnclaveRoute.RULES:
+            value = d.get(rule)
+            rules[rule] = [value] if isinstance(value, str) else value
+        return EnclaveRoute(name, d['enclaves'], **rules)
+
+    @property
+    def enclave_ids(self):                             # type: () -> List[str]
+        """ Every enclave a finding may be routed to, the default enclave
+        first. """
+        enclave_ids = []                                # type: List[str]
+        for route in [self.default_route] + self.routes:
+            enclave_ids.extend(e for e in route.enclave_ids
+                               if e not in enclave_ids)
+        return enclave_ids
+
+    def route(self, finding):                # type: (Dict) -> Tuple[str, ...]
+        """ The enclaves the finding is upserted to. """
+        detail = finding.get('detail') or {}
+        key = (detail.get('accountId'), detail.get('region'),
+               EnclaveRoute.severity_band(detail.get('severity')),
+               detail.get('type'))
+        route = self._decisions.get(key)
+        if route is None:
+            route = self.decide(*key)
+            if len(self._decisions) >= self.max_decisions:
+                self._decisions.clear()
+            self._decisions[key] = route
+        self.count(route)
+        return route.enclave_ids
+
+    def decide(self, account,                            # type: Optional[str]
+               region,                                   # type: Optional[str]
+               band,                                     # type: Optional[str]
+               type_                                     # type: Optional[str]
+               ):                                # type: (...) -> EnclaveRoute
+        for route in self.routes:
+            if route.matches(account, region, band, type_):
+                return route
+        return self.default_route
+
+    def count(self, route):                     # type: (EnclaveRoute) -> None
+        if self.metrics is None:
+            return
+        n = len(route.enclave_ids)
+        self.metrics.increment('Route' + route.name)
+        self.metrics.increment('FindingsRouted' if n else 'FindingsUnrouted')
+        if n > 1:
+            self.metrics.increment('FindingsFannedOut')
+        self.metrics.increment('ReportsRouted', n)
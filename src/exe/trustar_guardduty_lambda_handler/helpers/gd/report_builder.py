@@ -2,37 +2,67 @@
 
 """ An object that converts a Guard Duty Finding to a TruSTAR Report. """
 
+import copy
 import json
-from logging import getLogger
+from logging import DEBUG, getLogger
+
+try:
+    import orjson
+except ImportError:                                       # pragma: no cover
+    orjson = None
 
 from trustar import Report
 
 from ..ts.external_id_encoder import ExternalIdEncoder
+from .body_shaper import BodyShaper
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import Dict
+    from typing import Dict, Iterable, List, Optional
     from logging import Logger
 
 logger = getLogger(__name__)                                    # type: Logger
 
 class GuardDutyReportBuilder:
     """ Builds TruSTAR report from Guard Duty Finding event.
-    NOTE: No validation of attribute values done by this object.  """
+    NOTE: No validation of attribute values done by this object.
+
+    The report body is the finding's detail as JSON, either 'pretty'
+    (indented, the original format) or 'compact' (no whitespace, encoded
+    with orjson when it is installed).  Both sort their keys, so a
+    finding always gets the same body.  The BodyShaper keeps the bodies of
+    oversized findings to a bounded size.  """
 
     GD_FINDING_DETAIL_KEYS = ('title', 'description', 'severity',
                               'createdAt', 'updatedAt', 'service')
 
     DEFAULT_TITLE = 'NO TITLE FOUND IN GUARDDUTY EVENT'
 
-    def __init__(self, enclave_id):
+    PRETTY = 'pretty'
+    COMPACT = 'compact'
+    BODY_FORMATS = (PRETTY, COMPACT)
+
+    def __init__(self, enclave_id,                                 # type: str
+                 body_format=PRETTY,                               # type: str
+                 shaper=None                       # type: Optional[BodyShaper]
+                 ):
+        if body_format not in self.BODY_FORMATS:
+            raise Exception("Unknown report body format '{}'.  Use one of "
+                            "'{}'.".format(body_format,
+                                           "', '".join(self.BODY_FORMATS)))
         self.enclave_id = enclave_id                               # type: str
+        self.body_format = body_format                             # type: str
+        self.shaper = shaper or BodyShaper()                # type: BodyShaper
         self.ext_id_encoder = ExternalIdEncoder()
 
-    def build_for(self, finding):                      # type: (Dict) -> Report
-        """ Builds a Report for an event.
+    def build_for(self, finding,                                  # type: Dict
+                  enclave_id=None                        # type: Optional[str]
+                  ):                                    # type: (...) -> Report
+        """ Builds a Report for an event, for the builder's enclave unless
+        another is given.
         Note:  Does NOT validate report attribute values to ensure they
         are valid / reasonable. """
+        enclave_id = enclave_id or self.enclave_id
 
         detail = finding.get('detail')
         if not detail:
@@ -41,27 +71,57 @@ class GuardDutyReportBuilder:
                             "reports from that key's value.")
 
         title = detail.get('title', self.DEFAULT_TITLE)
-        body = self._body_from_detail(detail)
+        body = self.body_from_detail(detail)
         time_began = self._time_began_from_detail(detail)
         external_url = detail.get('arn')
-        external_id = self.ext_id_encoder.reversible(self.enclave_id,
-                                                     detail.get('id'))
+        external_id = self.external_id_for(finding, enclave_id)
 
         r = Report(title=title,
                    body=body,
                    time_began=time_began,
                    external_url=external_url,
                    external_id=external_id,
-                   enclave_ids=[self.enclave_id])
-
-        logger.info("TimeBegan in ReportBuilder after assigning to the "
-                    "report object:  '{}'".format(r.time_began))
-        logger.info("TimeBegan type:  '{}'.".format(str(type(r.time_began))))
-        d = r.to_dict()
-        logger.info("TimeBegan in ReportBuiilder after converting report to "
-                    "dict:  '{}'.".format(d['timeBegan']))
+                   enclave_ids=[enclave_id])
+
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("TimeBegan in ReportBuilder after assigning to the "
+                         "report object:  '{}' ({}).  After converting the "
+                         "report to dict:  '{}'."
+                         .format(r.time_began, type(r.time_began),
+                                 r.to_dict()['timeBegan']))
         return r
 
+    def build_many(self, findings               # type: Iterable[Dict]
+                   ):                             # type: (...) -> List[Report]
+        """ Builds a Report for each event, in order.  Raises on the first
+        event that has no 'detail'. """
+        return [self.build_for(finding) for finding in findings]
+
+    def build_for_enclaves(self, finding,                         # type: Dict
+                           enclave_ids                  # type: Iterable[str]
+                           ):                     # type: (...) -> List[Report]
+        """ Builds the finding's report once, then a copy of it for each
+        enclave, with that enclave's external ID.  The copies share the
+        body. """
+        reports = []                                      # type: List[Report]
+        for enclave_id in enclave_ids:
+            if not reports:
+                reports.append(self.build_for(finding, enclave_id))
+                continue
+            r = copy.copy(reports[0])
+            r.external_id = self.external_id_for(finding, enclave_id)
+            r.enclave_ids = [enclave_id]
+            reports.append(r)
+        return reports
+
+    def external_id_for(self, finding,                            # type: Dict
+                        enclave_id=None                  # type: Optional[str]
+                        ):                                 # type: (...) -> str
+        """ The external ID of the report built for the finding, in the
+        builder's enclave unless another is given. """
+        return self.ext_id_encoder.reversible(enclave_id or self.enclave_id,
+                                              finding['detail'].get('id'))
+
     @staticmethod
     def _time_began_from_detail(detail):         # type: (Dict) -> str or None
         """ Gets the time_began from the detail dict. """
@@ -69,11 +129,26 @@ class GuardDutyReportBuilder:
         time_began = None                                  # type: None or str
         if service:
             time_began = service.get('eventFirstSeen')
-        logger.info("TimeBegan found in GD event:  {}"
-                    .format(time_began))
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("TimeBegan found in GD event:  {}"
+                         .format(time_began))
         return time_began
 
-    @classmethod
-    def _body_from_detail(cls, detail):          # type: (Dict) -> str
-        body = {k: detail.get(k) for k in cls.GD_FINDING_DETAIL_KEYS}
-        return json.dumps(body, indent=4, sort_keys=True)
+    def body_from_detail(self, detail):                  # type: (Dict) -> str
+        """ The report body:  the detail's GD_FINDING_DETAIL_KEYS as JSON,
+        in the builder's body format, shaped to a bounded size. """
+        body = {k: detail.get(k) for k in self.GD_FINDING_DETAIL_KEYS}
+        return self.shaper.render(body, self.dumps)
+
+    def dumps(self, body):                               # type: (Dict) -> str
+        """ The body as JSON, in the builder's body format. """
+        if self.body_format == self.PRETTY:
+            return json.dumps(body, indent=4, sort_keys=True)
+        if orjson is not None:
+            try:
+                return orjson.dumps(body,
+                                    option=orjson.OPT_SORT_KEYS).decode()
+            except TypeError:
+                pass      # ex:  ints beyond 64 bits;  the json module copes.
+        return json.dumps(body, sort_keys=True, separators=(',', ':'),
+                          ensure_ascii=False)
@@ -0,0 +1,34 @@
+# encoding = utf-8
+
+""" AsyncReportDetailsFetcher class definition. """
+
+from logging import getLogger
+
+from trustar import IdType
+
+from .report_details_fetcher import ReportDetailsFetcher
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Optional
+    from logging import Logger
+    from trustar import Report
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class AsyncReportDetailsFetcher(ReportDetailsFetcher):
+    """ The asyncio counterpart of the ReportDetailsFetcher.  Waiting
+    between attempts doesn't block the other findings in flight. """
+
+    async def fetch_for(self, external_id,                         # type: str
+                        context=None                               # type: Any
+                        ):                    # type: (...) -> Optional[Report]
+        """ Fetch a report's details from TruStar. """
+        logger.info("Fetching report saved in TruSTAR.")
+        with self.metrics.span('SavedReportFetch'):
+            outcome = await self.retry_policy.call_async(
+                lambda: self.ts.get_report_details(external_id,
+                                                   id_type=IdType.EXTERNAL),
+                context=context)
+        return self.report_from(outcome, external_id)
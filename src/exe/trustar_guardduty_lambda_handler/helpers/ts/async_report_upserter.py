@@ -0,0 +1,154 @@
+# encoding = utf-8
+
+""" Upserts TruSTAR Report objects through the AsyncStationClient. """
+
+from logging import getLogger
+
+from trustar import IdType
+
+from .report_upserter import ReportUpserter
+from .station_error_classifier import StationErrorClassifier
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Optional
+    from logging import Logger
+    from trustar import Report
+    from .report_index import ReportIndexEntry
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class AsyncReportUpserter(ReportUpserter):
+    """ The asyncio counterpart of the ReportUpserter.  Same decisions,
+    same enclave checks and messages;  only the Station calls are
+    awaited.  Index calls are not:  they are in-memory or file lookups,
+    or, with DynamoDB, a single-digit-millisecond request. """
+
+    async def upsert(self, report):                 # type: (Report) -> Report
+        """ Upserts report. """
+        logger.info("Starting upsert for report with external ID '{}'."
+                    .format(report.external_id))
+
+        if not report.enclave_ids:
+            report.enclave_ids = [self.enclave_id]
+
+        if not self.eq_upserter_enclaves(report.enclave_ids):
+            msg = self.msg_new_rpt_encls_dont_match(report)
+            self.handle_enclaves_mismatch(msg)
+
+        entry = self.indexed_entry(report.external_id)
+        if entry:
+            r = await self.update_indexed_report(entry, report)
+            if r:
+                logger.info("Upsert operation complete.")
+                return r
+
+        existing_report = await self.fetch_existing_report(
+            report.external_id)                     # type: Optional[Report]
+
+        if existing_report:
+
+            if not self.eq_upserter_enclaves(existing_report.enclave_ids):
+                msg = self.msg_existing_rpt_encls_dont_match(existing_report)
+                self.handle_enclaves_mismatch(msg)
+
+            if self.is_unchanged(existing_report, report):
+                r = existing_report
+            else:
+                r = await self.update_report(existing_report=existing_report,
+                                             gd_report=report)
+        else:
+            r = await self.submit_report(report)
+
+        self.index_upserted(r)
+        logger.info("Upsert operation complete.")
+        return r
+
+    async def update_indexed_report(self, entry,      # type: ReportIndexEntry
+                                    gd_report                   # type: Report
+                                    ):        # type: (...) -> Optional[Report]
+        """ Updates the report the index says the finding was upserted as,
+        without looking it up first.  If Station no longer has that report,
+        drops the stale entry and returns None. """
+        logger.info("Report with external ID '{}' is indexed as report ID "
+                    "'{}'.  Updating it without looking it up."
+                    .format(gd_report.external_id, entry.report_id))
+        self.metrics.increment('IndexHits')
+        existing_report = self.indexed_report(entry, gd_report)
+        if entry.digest and entry.digest == self.digest_of(gd_report):
+            self.log_unchanged(gd_report)
+            return self.merged_report(existing_report, gd_report)
+        try:
+            r = await self.update_report(existing_report=existing_report,
+                                         gd_report=gd_report)
+        except Exception as e:
+            if StationErrorClassifier.status_code_of(e) != 404:
+                raise e
+            self.drop_stale_entry(gd_report.external_id)
+            return None
+        self.index_upserted(r)
+        return r
+
+    async def fetch_existing_report(self, external_id              # type: str
+                                    ):        # type: (...) -> Optional[Report]
+        """ Returns the existing report, or None if Station says there is
+        none. """
+        with self.metrics.span('LookupExisting'):
+            outcome = await self.retry_policy.call_async(
+                lambda: self.call_station(lambda: self.ts.get_report_details(
+                    external_id, id_type=IdType.EXTERNAL)),
+                context=self.context,
+                is_retryable=self.is_retryable_lookup_error)
+        self.metrics.record_retries('Lookup', outcome)
+        return self.existing_report_from(outcome, external_id)
+
+    async def call_station(self, fn):
+                                     # type: (Callable[[], Awaitable]) -> Any
+        """ Makes a Station call through the breaker, if there is one. """
+        if self.breaker is None:
+            return await fn()
+        return await self.breaker.call_async(fn)
+
+    async def update_report(self, existing_report,     # type: Report
+                            gd_report                  # type: Report
+                            ):                         # type: (...) -> Report
+        """ Updates the existing report in Station. """
+        new_report = self.merged_report(existing_report, gd_report)
+        try:
+            with self.metrics.span('Update'):
+                updated_report = await self.call_station(
+                    lambda: self.ts.update_report(new_report))
+            self.metrics.increment('Updates')
+            logger.info("Updated report with ID '{}', external ID '{}', "
+                        "title '{}'.".format(updated_report.id,
+                                             updated_report.external_id,
+                                             updated_report.title))
+        except Exception as e:
+            logger.error("Failed to update report with ID '{}', external ID "
+                         "'{}', title '{}'."
+                         .format(existing_report.id,
+                                 existing_report.external_id,
+                                 existing_report.title))
+            self.handle_write_failure(e)
+            raise e
+        return updated_report
+
+    async def submit_report(self, report):          # type: (Report) -> Report
+        """ Submits the report, log error & throw exception if fail."""
+        try:
+            with self.metrics.span('Submit'):
+                submitted_report = await self.call_station(
+                    lambda: self.ts.submit_report(report))
+            self.metrics.increment('Submits')
+            logger.info("Submitted report with ID '{}', external ID '{}', "
+                        "title '{}'.".format(submitted_report.id,
+                                             submitted_report.external_id,
+                                             submitted_report.title))
+        except Exception as e:
+            logger.error("Failed to submit report with external ID '{}', "
+                         "title '{}'.".format(report.external_id,
+                                              report.title))
+            self.handle_write_failure(e)
+            raise e
+        return submitted_report
@@ -0,0 +1,53 @@
+# encoding = utf-8
+
+""" Verifies saved reports through the AsyncStationClient. """
+
+from logging import getLogger
+
+from .saved_report_verifier import SavedReportVerifier
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List
+    from logging import Logger
+    from trustar import Report
+    from .verification_queue import PendingVerification
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class AsyncSavedReportVerifier(SavedReportVerifier):
+    """ The asyncio counterpart of the SavedReportVerifier.  Same queue,
+    window and checks;  only the report search is awaited. """
+
+    async def verify_due(self, context=None,                       # type: Any
+                         everything=False                         # type: bool
+                         ):                              # type: (...) -> int
+        """ Verifies the due entries.  Returns how many were checked. """
+        entries = self.due(context, everything)
+        if not entries:
+            return 0
+        logger.info("Verifying '{}' saved report(s).".format(len(entries)))
+        with self.metrics.span('VerifySavedReports'):
+            # noinspection PyBroadException
+            try:
+                saved = await self.search(entries)
+            except Exception:
+                logger.exception("Failed to search Station for the saved "
+                                 "reports.  Will try again later.")
+                self.queue.requeue(entries)
+                return 0
+            self.check(entries, saved)
+        return len(entries)
+
+    async def search(self, entries       # type: List[PendingVerification]
+                     ):                      # type: (...) -> Dict[str, Report]
+        wanted = {e.external_id for e in entries}
+        found = {}                                    # type: Dict[str, Report]
+        from_time, to_time = self.window_for(entries)
+        while to_time is not None and to_time >= from_time:
+            page = await self.ts.get_reports_page(
+                is_enclave=True, enclave_ids=self.enclave_ids,
+                from_time=from_time, to_time=to_time)
+            to_time = self.collect(page, wanted, found, to_time)
+        return found
@@ -0,0 +1,259 @@
+# encoding = utf-8
+
+""" AsyncStationClient class definition. """
+
+import asyncio
+from datetime import datetime, timezone
+import json
+from logging import getLogger
+
+from requests import HTTPError, Response
+from requests.structures import CaseInsensitiveDict
+from trustar import EnclavePermissions, IdType, Report, TruStar
+from trustar.models import NumberedPage
+
+try:
+    import aiohttp
+except ImportError:                                       # pragma: no cover
+    aiohttp = None
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+    from logging import Logger
+    from .station_rate_limiter import StationRateLimiter
+    from .token_provider import TokenProvider
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class AsyncStationClient:
+    """ An asyncio counterpart to the parts of the TruStar client the
+    upsert pipeline uses:  get_report_details, submit_report,
+    update_report, get_user_enclaves and get_reports_page.
+
+    All calls share one pooled aiohttp session, so a single container can
+    keep many requests in flight without a thread per request.  Errors are
+    raised as the same requests.HTTPError the TruStar client raises, so
+    StationErrorClassifier handles both clients' errors.  With a limiter,
+    API calls (not token requests) go through it:  GETs as reads, the rest
+    as writes.  With a token provider, the OAuth token comes from it, and
+    the calls that have to wait on the auth endpoint run in the loop's
+    executor. """
+
+    TOKEN_ERROR_MESSAGES = ("Expired oauth2 access token",
+                            "Invalid oauth2 access token")
+
+    def __init__(self, params,                        # type: Dict[str, str]
+                 client_metatag,                                   # type: str
+                 max_connections=100,                              # type: int
+                 timeout=60,                                     # type: float
+                 limiter=None,     # type: Optional[StationRateLimiter]
+                 token_provider=None           # type: Optional[TokenProvider]
+                 ):
+        if aiohttp is None:
+            raise Exception("The async pipeline requires the 'aiohttp' "
+                            "library.  Install it to use this client.")
+        config = dict(TruStar.DEFAULTS)
+        config.update({TruStar.REMAPPED_KEYS.get(k, k): v
+                       for k, v in params.items() if v is not None})
+        self.auth = config['auth']                                 # type: str
+        self.base = config['base'].rstrip('/')                     # type: str
+        self.api_key = config['api_key']                           # type: str
+        self.api_secret = config['api_secret']                     # type: str
+        self.proxy = config.get('https_proxy') or config.get('http_proxy')
+        self.headers = {'Client-Type': config['client_type'],
+                        'Client-Version': config['client_version'],
+                        'Client-Metatag': client_metatag}
+        self.enclave_ids = []                   # TruStar client compatibility
+        self.max_connections = max_connections                     # type: int
+        self.timeout = timeout                                   # type: float
+        self.limiter = limiter         # type: Optional[StationRateLimiter]
+        self.token_provider = token_provider  # type: Optional[TokenProvider]
+        self.token = None                                # type: Optional[str]
+        self._session = None        # type: Optional[aiohttp.ClientSession]
+        self._token_lock = None               # type: Optional[asyncio.Lock]
+
+    @property
+    def session(self):                     # type: () -> aiohttp.ClientSession
+        """ The pooled session, created on first use inside the running
+        event loop. """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):                                  # type: () -> None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _token(self):                                  # type: () -> str
+        """ The current OAuth token, fetched if there is none. """
+        if self.token_provider is None:
+            return self.token or await self._refresh_token()
+        token = self.token_provider.cached()
+        if token is None:
+            loop = asyncio.get_event_loop()
+            token = await loop.run_in_executor(None, self.token_provider.get)
+        return token
+
+    async def _refresh_token(self, stale=None):
+                                           # type: (Optional[str]) -> str
+        """ Fetches a new OAuth token unless another coroutine already
+        replaced the stale one while this one waited for the lock. """
+        if self.token_provider is not None:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None, self.token_provider.refresh, stale)
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self.token is not None and self.token != stale:
+                return self.token
+            async with self.session.post(
+                    self.auth,
+                    auth=aiohttp.BasicAuth(self.api_key, self.api_secret),
+                    data={'grant_type': 'client_credentials'},
+                    proxy=self.proxy) as resp:
+                body = await resp.read()
+                if resp.status >= 400:
+                    raise self._http_error(resp, body, "unable to get token")
+                self.token = json.loads(body.decode('utf-8'))['access_token']
+            return self.token
+
+    async def request(self, method,                                # type: str
+                      path,                                        # type: str
+                      params=None,                      # type: Optional[Dict]
+                      data=None                          # type: Optional[str]
+                      ):                                 # type: (...) -> bytes
+        """ Makes an API call through the limiter, if there is one.
+        Returns the response body. """
+        if self.limiter is None:
+            return await self._request(method, path, params, data)
+        kind = (self.limiter.READ if method == 'GET'
+                else self.limiter.WRITE)                           # type: str
+        return await self.limiter.call_async(
+            kind, lambda: self._request(method, path, params, data))
+
+    async def _request(self, method,                               # type: str
+                       path,                                       # type: str
+                       params=None,                     # type: Optional[Dict]
+                       data=None                         # type: Optional[str]
+                       ):                                # type: (...) -> bytes
+        """ Makes an API call, refreshing the token once if Station says it
+        expired.  Returns the response body. """
+        url = "{}/{}".format(self.base, path)
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        token = await self._token()
+        for attempt in (1, 2):
+            headers = dict(self.headers)
+            headers['Authorization'] = 'Bearer ' + token
+            if method in ('POST', 'PUT'):
+                headers['Content-Type'] = 'application/json'
+            async with self.session.request(method, url, headers=headers,
+                                            params=params, data=data,
+                                            proxy=self.proxy) as resp:
+                body = await resp.read()
+                if attempt == 1 and self._is_token_error(resp.status, body):
+                    token = await self._refresh_token(stale=token)
+                    continue
+                if resp.status >= 400:
+                    raise self._http_error(resp, body)
+                return body
+
+    def _is_token_error(self, status, body):   # type: (int, bytes) -> bool
+        if status == 401:
+            return True
+        if status != 400:
+            return False
+        # noinspection PyBroadException
+        try:
+            description = json.loads(body.decode('utf-8')).get(
+                'error_description')
+        except Exception:
+            return False
+        return description in self.TOKEN_ERROR_MESSAGES
+
+    @staticmethod
+    def _http_error(resp,                     # type: aiohttp.ClientResponse
+                    body,                                        # type: bytes
+                    reason=None                          # type: Optional[str]
+                    ):                              # type: (...) -> HTTPError
+        """ Wraps the aiohttp response in the requests.HTTPError the TruStar
+        client would have raised. """
+        response = Response()
+        response.status_code = resp.status
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response._content = body
+        response.url = str(resp.url)
+        if reason is None:
+            # noinspection PyBroadException
+            try:
+                reason = json.loads(body.decode('utf-8')).get('message')
+            except Exception:
+                reason = None
+        msg = "{} {} Error (Trace-Id: {}): {}".format(
+            resp.status, "Client" if resp.status < 500 else "Server",
+            resp.headers.get('Trace-Id'), reason or "unknown cause")
+        return HTTPError(msg, response=response)
+
+    async def get_user_enclaves(self):
+                                     # type: () -> List[EnclavePermissions]
+        body = await self.request('GET', 'enclaves')
+        return [EnclavePermissions.from_dict(e) for e in json.loads(body)]
+
+    async def get_report_details(self, report_id, id_type=None):
+                                                 # type: (str, str) -> Report
+        body = await self.request('GET', 'reports/{}'.format(report_id),
+                                  params={'idType': id_type})
+        return Report.from_dict(json.loads(body))
+
+    async def get_reports_page(self, is_enclave=None,         # type: bool
+                               enclave_ids=None,         # type: List[str]
+                               from_time=None,                     # type: int
+                               to_time=None                        # type: int
+                               ):                # type: (...) -> NumberedPage
+        """ Mirrors TruStar.get_reports_page:  the reports updated within
+        the window, newest first. """
+        if is_enclave is None:
+            distribution_type = None
+        else:
+            distribution_type = 'ENCLAVE' if is_enclave else 'COMMUNITY'
+        body = await self.request('GET', 'reports', params={
+            'from': from_time,
+            'to': to_time,
+            'distributionType': distribution_type,
+            'enclaveIds': ','.join(enclave_ids) if enclave_ids else None})
+        return NumberedPage.from_dict(json.loads(body), content_type=Report)
+
+    async def submit_report(self, report):       # type: (Report) -> Report
+        """ Mirrors TruStar.submit_report. """
+        if report.is_enclave is None:
+            report.is_enclave = True
+        if not report.enclave_ids:
+            raise Exception("Cannot submit a report of distribution type "
+                            "'ENCLAVE' with an empty set of enclaves.")
+        if report.time_began is None:
+            # the same default as the TruStar client, already in UTC:  newer
+            # tzlocal versions can't localize the naive time it passes.
+            report.set_time_began(datetime.now(timezone.utc))
+        body = await self.request('POST', 'reports',
+                                  data=json.dumps(report.to_dict()))
+        report.id = body.decode('utf-8')
+        return report
+
+    async def update_report(self, report):       # type: (Report) -> Report
+        """ Mirrors TruStar.update_report. """
+        if report.id is not None:
+            report_id, id_type = report.id, IdType.INTERNAL
+        elif report.external_id is not None:
+            report_id, id_type = report.external_id, IdType.EXTERNAL
+        else:
+            raise Exception("Cannot update report without either an ID or "
+                            "an external ID.")
+        await self.request('PUT', 'reports/{}'.format(report_id),
+                           params={'idType': id_type},
+                           data=json.dumps(report.to_dict()))
+        return report
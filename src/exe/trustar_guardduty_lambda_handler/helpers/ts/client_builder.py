@@ -7,10 +7,16 @@ import os
 
 from trustar import TruStar
 
+from .rate_limited_client import RateLimitedClient
+from .token_api_client import TokenApiClient
+
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+    from typing import Dict, Optional
     from logging import Logger
     from trustar import TruStar
+    from .station_rate_limiter import StationRateLimiter
+    from .token_provider import TokenProvider
 
 logger = getLogger(__name__)                                    # type: Logger
 
@@ -28,10 +34,35 @@ class ClientBuilder:
     @classmethod
     def from_env_vars(cls, client_metatag):           # type: (str) -> TruStar
         """ Builds TruStar client. """
+        config = {param: os.environ.get(param.upper()) for param in
+                  cls.TRUSTAR_CLIENT_PARAMS}
+        return cls.from_params(client_metatag, config)
+
+    @classmethod
+    def from_params(cls, client_metatag,                          # type: str
+                    params,                           # type: Dict[str, str]
+                    limiter=None,          # type: Optional[StationRateLimiter]
+                    token_provider=None        # type: Optional[TokenProvider]
+                    ):                                # type: (...) -> TruStar
+        """ Builds TruStar client from an already-loaded dict of the
+        TRUSTAR_CLIENT_PARAMS.  With a limiter, the client's calls go
+        through it, and the limiter (not the client) waits out 429s.  With
+        a token provider, the client takes its OAuth token from it instead
+        of fetching its own. """
         if not client_metatag:
             raise Exception("must specify a client_metatag.")
 
-        config = {param: os.environ.get(param.upper()) for param in
+        config = {param: params.get(param) for param in
                   cls.TRUSTAR_CLIENT_PARAMS}
         config['client_metatag'] = client_metatag
-        return TruStar(config=config)
+        logger.info("Building TruStar client.")
+        if limiter is not None:
+            # the client still retries after refreshing an expired token,
+            # but raises 429s for the limiter instead of sleeping on them.
+            config['max_wait_time'] = 0
+        ts = TruStar(config=config)
+        if token_provider is not None:
+            ts._client = TokenApiClient.replacing(ts._client, token_provider)
+        if limiter is None:
+            return ts
+        return RateLimitedClient(ts, limiter)
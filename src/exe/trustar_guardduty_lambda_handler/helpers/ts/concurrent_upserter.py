@@ -0,0 +1,106 @@
+# encoding = utf-8
+
+""" ConcurrentUpserter class definition. """
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+import threading
+import time
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+    from logging import Logger
+    from trustar import Report
+    from .report_upserter import ReportUpserter
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class UpsertResult:
+    """ The outcome of upserting one report of a batch. """
+
+    def __init__(self, index,                                      # type: int
+                 report                                         # type: Report
+                 ):
+        self.index = index                                         # type: int
+        self.report = report                                    # type: Report
+        self.upserted = None                          # type: Optional[Report]
+        self.error = None                          # type: Optional[Exception]
+        self.seconds = 0.0                                       # type: float
+
+    @property
+    def failed(self):                                       # type: () -> bool
+        return self.error is not None
+
+
+class ConcurrentUpserter:
+    """ Upserts a batch of reports with a bounded pool of worker threads
+    around one ReportUpserter.
+
+    Reports that share an external ID are upserted one after the other,
+    in the order they were given, by the same worker so that they don't
+    race each other (two concurrent "submit"s would create duplicates).
+    Reports with different external IDs are upserted concurrently. """
+
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(self, upserter,                        # type: ReportUpserter
+                 max_workers=DEFAULT_MAX_WORKERS                   # type: int
+                 ):
+        if max_workers < 1:
+            raise Exception("max_workers must be at least 1.")
+        self.upserter = upserter                        # type: ReportUpserter
+        self.max_workers = max_workers                             # type: int
+        self._executor = None             # type: Optional[ThreadPoolExecutor]
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):                       # type: () -> ThreadPoolExecutor
+        """ The worker pool, created on first use and kept for the life of
+        the upserter so warm invocations don't pay for thread start-up. """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='upsert')
+            return self._executor
+
+    def upsert_all(self, reports             # type: List[Report]
+                   ):                       # type: (...) -> List[UpsertResult]
+        """ Upserts the reports.  Returns one result per report, in the
+        same order as the reports.  Never raises for a single report's
+        failure;  the error is recorded on its result instead. """
+        results = [UpsertResult(i, r) for i, r in enumerate(reports)]
+        groups = OrderedDict()            # type: Dict[str, List[UpsertResult]]
+        for result in results:
+            groups.setdefault(result.report.external_id, []).append(result)
+
+        logger.info("Upserting '{}' report(s) ('{}' distinct external IDs) "
+                    "with up to '{}' workers."
+                    .format(len(reports), len(groups), self.max_workers))
+        futures = [self.executor.submit(self._upsert_in_order, group)
+                   for group in groups.values()]
+        for future in futures:
+            future.result()
+        return results
+
+    def _upsert_in_order(self, group):   # type: (List[UpsertResult]) -> None
+        for result in group:
+            start = time.perf_counter()
+            # noinspection PyBroadException
+            try:
+                result.upserted = self.upserter.upsert(result.report)
+            except Exception as e:
+                logger.error("Failed to upsert report with external ID "
+                             "'{}':  {}".format(result.report.external_id, e))
+                result.error = e
+            result.seconds = time.perf_counter() - start
+
+    def shutdown(self):                                     # type: () -> None
+        """ Stops the worker threads. """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
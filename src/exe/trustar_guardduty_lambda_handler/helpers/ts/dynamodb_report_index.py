@@ -0,0 +1,90 @@
+# encoding = utf-8
+
+""" DynamoDbReportIndex class definition. """
+
+from logging import getLogger
+
+from .report_index import ReportIndex, ReportIndexEntry
+
+try:
+    import boto3
+except ImportError:                                       # pragma: no cover
+    boto3 = None
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class DynamoDbReportIndex(ReportIndex):
+    """ Keeps the entries in a DynamoDB table whose partition key is the
+    string attribute 'external_id', so every container of every function
+    shares them.
+
+    'endpoint_url' points the client at a DynamoDB-compatible stand-in
+    (ex:  DynamoDB Local) instead of AWS.  A failed table call is logged
+    and treated as a miss;  it never fails the upsert. """
+
+    KEY = 'external_id'
+
+    def __init__(self, table_name,                                 # type: str
+                 endpoint_url=None,                      # type: Optional[str]
+                 region_name=None,                       # type: Optional[str]
+                 client=None                                       # type: Any
+                 ):
+        if client is None:
+            if boto3 is None:
+                raise Exception("The DynamoDB report index requires the "
+                                "'boto3' library.")
+            client = boto3.client('dynamodb', endpoint_url=endpoint_url,
+                                  region_name=region_name)
+        self.table_name = table_name                               # type: str
+        self.client = client
+
+    def _key(self, external_id):                         # type: (str) -> Dict
+        return {self.KEY: {'S': external_id}}
+
+    def get(self, external_id
+            ):                      # type: (str) -> Optional[ReportIndexEntry]
+        # noinspection PyBroadException
+        try:
+            item = self.client.get_item(TableName=self.table_name,
+                                        Key=self._key(external_id)
+                                        ).get('Item')
+        except Exception as e:
+            logger.warning("Could not read report index table '{}':  {}"
+                           .format(self.table_name, e))
+            return None
+        if not item:
+            return None
+        digest = item.get('digest', {}).get('S')
+        return ReportIndexEntry(item['report_id']['S'],
+                                [e['S'] for e in item['enclave_ids']['L']],
+                                digest)
+
+    def put(self, external_id,                                     # type: str
+            entry                                     # type: ReportIndexEntry
+            ):                                          # type: (...) -> None
+        item = self._key(external_id)
+        item['report_id'] = {'S': entry.report_id}
+        item['enclave_ids'] = {'L': [{'S': e} for e in entry.enclave_ids]}
+        if entry.digest:
+            item['digest'] = {'S': entry.digest}
+        # noinspection PyBroadException
+        try:
+            self.client.put_item(TableName=self.table_name, Item=item)
+        except Exception as e:
+            logger.warning("Could not write to report index table '{}':  {}"
+                           .format(self.table_name, e))
+
+    def delete(self, external_id):                        # type: (str) -> None
+        # noinspection PyBroadException
+        try:
+            self.client.delete_item(TableName=self.table_name,
+                                    Key=self._key(external_id))
+        except Exception as e:
+            logger.warning("Could not delete from report index table '{}':  "
+                           "{}".format(self.table_name, e))
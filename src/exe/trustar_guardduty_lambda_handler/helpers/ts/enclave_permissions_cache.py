@@ -0,0 +1,124 @@
+# encoding = utf-8
+
+""" EnclavePermissionsCache class definition. """
+
+import json
+from logging import getLogger
+import os
+import threading
+import time
+
+from trustar import EnclavePermissions
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Optional, Tuple
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class EnclavePermissionsCache:
+    """ Caches the enclave permissions returned by 'get_user_enclaves' for
+    a configurable number of seconds.
+
+    Entries live in process memory and, if a file path is given, are also
+    persisted to that file (ex:  in /tmp) so that other containers on the
+    same host can skip the call.  Entries are keyed by a fingerprint of
+    the API creds, never by the creds themselves. """
+
+    DEFAULT_TTL_SECONDS = 900
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS,          # type: float
+                 file_path=None                          # type: Optional[str]
+                 ):
+        self.ttl_seconds = ttl_seconds                           # type: float
+        self.file_path = file_path                       # type: Optional[str]
+        self._entries = {}          # type: Dict[str, Tuple[float, List[Dict]]]
+        self._lock = threading.Lock()
+
+    def get(self, key,                                             # type: str
+            fetch            # type: Callable[[], List[EnclavePermissions]]
+            ):                       # type: (...) -> List[EnclavePermissions]
+        """ Returns the cached permissions for the key, calling 'fetch' to
+        refresh them if they are missing or older than the TTL. """
+        enclaves = self.peek(key)
+        if enclaves is None:
+            logger.info("Enclave permissions not cached or expired.  "
+                        "Fetching them from Station.")
+            enclaves = fetch()
+            self.put(key, enclaves)
+        return enclaves
+
+    def peek(self, key
+             ):            # type: (str) -> Optional[List[EnclavePermissions]]
+        """ Returns the cached permissions for the key, or None if they
+        are missing or older than the TTL. """
+        with self._lock:
+            entry = self._entries.get(key) or self._load_from_file(key)
+            if not entry or not self._is_fresh(entry):
+                return None
+            logger.info("Using cached enclave permissions.")
+            self._entries[key] = entry
+            return [EnclavePermissions.from_dict(d) for d in entry[1]]
+
+    def put(self, key,                                             # type: str
+            enclaves                         # type: List[EnclavePermissions]
+            ):                                          # type: (...) -> None
+        """ Caches freshly-fetched permissions for the key. """
+        entry = (time.time(), [e.to_dict() for e in enclaves])
+        with self._lock:
+            self._entries[key] = entry
+            self._save_to_file(key, entry)
+
+    def invalidate(self, key):                            # type: (str) -> None
+        """ Drops the key's cached permissions from memory and from the
+        file. """
+        logger.info("Invalidating cached enclave permissions.")
+        with self._lock:
+            self._entries.pop(key, None)
+            self._save_to_file(key, None)
+
+    def _is_fresh(self, entry):            # type: (Tuple[float, List]) -> bool
+        return time.time() - entry[0] < self.ttl_seconds
+
+    def _read_file(self):                                   # type: () -> Dict
+        if not self.file_path or not os.path.exists(self.file_path):
+            return {}
+        # noinspection PyBroadException
+        try:
+            with open(self.file_path) as f:
+                return json.load(f)
+        except Exception:
+            logger.warning("Could not read enclave permissions cache file "
+                           "'{}'.  Ignoring it.".format(self.file_path))
+            return {}
+
+    def _load_from_file(self, key
+                        ):        # type: (str) -> Optional[Tuple[float, List]]
+        d = self._read_file().get(key)
+        if not d:
+            return None
+        return d['fetched_at'], d['enclaves']
+
+    def _save_to_file(self, key,                                   # type: str
+                      entry             # type: Optional[Tuple[float, List]]
+                      ):                                # type: (...) -> None
+        """ Writes the entry (or removes it, if None) to the file.  Writes
+        to a temp file first so readers never see a partial file. """
+        if not self.file_path:
+            return
+        d = self._read_file()
+        if entry is None:
+            d.pop(key, None)
+        else:
+            d[key] = {'fetched_at': entry[0], 'enclaves': entry[1]}
+        tmp_path = "{}.{}.tmp".format(self.file_path, os.getpid())
+        # noinspection PyBroadException
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(d, f)
+            os.replace(tmp_path, self.file_path)
+        except Exception:
+            logger.warning("Could not write enclave permissions cache file "
+                           "'{}'.".format(self.file_path))
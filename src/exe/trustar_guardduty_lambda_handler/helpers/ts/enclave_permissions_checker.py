@@ -7,9 +7,10 @@ from logging import getLogger
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import List, Dict
+    from typing import List, Dict, Optional
     from logging import Logger
     from trustar import TruStar, EnclavePermissions
+    from .enclave_permissions_cache import EnclavePermissionsCache
 
 logger = getLogger(__name__)                                    # type: Logger
 
@@ -18,11 +19,26 @@ class EnclavePermissionsChecker:
     """ Verifies that the TruStar client's API creds have the specified
     level of access to the specified enclave. """
 
-    def __init__(self, ts):                   # type: (TruStar) -> None
-        enclaves = ts.get_user_enclaves()     # type: List[EnclavePermissions]
+    def __init__(self, ts,                                      # type: TruStar
+                 cache=None,          # type: Optional[EnclavePermissionsCache]
+                 cache_key=None                          # type: Optional[str]
+                 ):
+        if cache and cache_key:
+            enclaves = cache.get(cache_key, ts.get_user_enclaves)
+        else:
+            enclaves = ts.get_user_enclaves()
         self.permissions = {e.id: e for e in
                             enclaves}         # type: Dict[EnclavePermissions]
 
+    @classmethod
+    def from_enclaves(cls, enclaves   # type: List[EnclavePermissions]
+                      ):           # type: (...) -> EnclavePermissionsChecker
+        """ Builds a checker from permissions that were already fetched,
+        ex: by an async client. """
+        checker = cls.__new__(cls)
+        checker.permissions = {e.id: e for e in enclaves}
+        return checker
+
     def get_perms(self, enclave_id         # type: str
                   ):                       # type: (...) -> EnclavePermissions
         """ Raises exception if no access at all to the enclave. """
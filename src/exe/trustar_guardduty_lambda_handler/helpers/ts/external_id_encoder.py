@@ -3,11 +3,15 @@
 """ An object that encodes TruSTAR external IDs. """
 
 import base64
+import functools
+import hashlib
+import itertools
 from logging import getLogger
 import uuid
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+    from typing import Any, List, Sequence, Tuple
     from logging import Logger
 
 logger = getLogger(__name__)                                    # type: Logger
@@ -19,33 +23,89 @@ class ExternalIdEncoder:
     """ Encodes eternal IDs for TruSTAR reports.
     External IDs need to:
     - calculate to the same thing every time, given the same inputs.
-    - be url-encodeable. (some endpoints use them in query-string-params). """
+    - be url-encodeable. (some endpoints use them in query-string-params).
 
-    def __init__(self, exception_if_reversible_fails=True         # type: bool
+    What only depends on the enclave ID (its namespace UUID, the base64 of
+    its "<enclave ID>|" prefix) is computed once per enclave.  'reversible'
+    checks that its ID reverses every 'check_every' calls (1:  every call,
+    0:  never), starting with the first. """
+
+    DEFAULT_CHECK_EVERY = 1000
+
+    def __init__(self, exception_if_reversible_fails=True,        # type: bool
+                 check_every=DEFAULT_CHECK_EVERY                   # type: int
                  ):
         self.exc_if_rev_fail = exception_if_reversible_fails      # type: bool
+        self.check_every = check_every                             # type: int
+        self._calls = itertools.count()
 
     @staticmethod
-    def irreversible(enclave_id, external_id):       # type: (str, str) -> str
-        """ Uses enclave ID and desired external ID to produce an
-        external ID that will always work with Station. """
-
+    @functools.lru_cache(maxsize=128)
+    def namespace_for(enclave_id):                 # type: (str) -> uuid.UUID
+        """ The UUID that an enclave's irreversible IDs are made in. """
         try:
-            namespace_uuid = uuid.UUID(enclave_id)
+            return uuid.UUID(enclave_id)
         except ValueError:
             # if the enclave_id was not a valid UUID, hash it to create one.
             # some staging enclave_ids are not valid UUIDs.
-            namespace_uuid = uuid.uuid5(ENCLAVE_UUID_NAMESPACE,
-                                        enclave_id)
+            return uuid.uuid5(ENCLAVE_UUID_NAMESPACE, enclave_id)
+
+    @classmethod
+    @functools.lru_cache(maxsize=128)
+    def namespace_hash_for(cls, enclave_id):           # type: (str) -> Any
+        """ SHA-1 of the enclave's namespace UUID, ready to be copied and
+        fed an external ID (as uuid.uuid5 does). """
+        return hashlib.sha1(cls.namespace_for(enclave_id).bytes)
 
-        return str(uuid.uuid5(namespace_uuid, external_id))
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def prefix_for(enclave_id):              # type: (str) -> Tuple[str, bytes]
+        """ Splits "<enclave ID>|" at the last whole base64 group:  the
+        base64 of the bytes before it, and the 0 to 2 bytes after it, which
+        are encoded along with each external ID. """
+        b = (enclave_id + '|').encode('utf-8')                   # type: bytes
+        split = len(b) - len(b) % 3
+        return base64.b64encode(b[:split]).decode('ascii'), b[split:]
+
+    @classmethod
+    def irreversible(cls, enclave_id, external_id):  # type: (str, str) -> str
+        """ Uses enclave ID and desired external ID to produce an
+        external ID that will always work with Station. """
+        h = cls.namespace_hash_for(enclave_id).copy()
+        h.update(external_id.encode('utf-8'))
+        b = bytearray(h.digest()[:16])
+        b[6] = (b[6] & 0x0f) | 0x50                     # version 5
+        b[8] = (b[8] & 0x3f) | 0x80                     # RFC 4122 variant
+        x = b.hex()
+        return '{}-{}-{}-{}-{}'.format(x[:8], x[8:12], x[12:16], x[16:20],
+                                       x[20:])
 
     def reversible(self, enclave_id, external_id):   # type: (str, str) -> str
         """ Makes a reversible external ID. """
-        s = enclave_id + '|' + external_id                       # type: str
-        b = s.encode('utf-8')                                    # type: bytes
-        encoded = base64.b64encode(b)                            # type: bytes
-        stringified_b64_encoding = encoded.decode('utf-8')       # type: str
+        head, rest = self.prefix_for(enclave_id)
+        encoded = head + base64.b64encode(
+            rest + external_id.encode('utf-8')).decode('ascii')  # type: str
+        if self.check_every and next(self._calls) % self.check_every == 0:
+            self.check(enclave_id + '|' + external_id, encoded)
+        return encoded
+
+    def encode_many(self, enclave_id,                              # type: str
+                    external_ids                         # type: Sequence[str]
+                    ):                               # type: (...) -> List[str]
+        """ The reversible external IDs of many external IDs, in order.
+        Checks the first and every 'check_every'-th one. """
+        head, rest = self.prefix_for(enclave_id)
+        b64encode = base64.b64encode
+        encoded = [head + b64encode(rest + x.encode('utf-8')).decode('ascii')
+                   for x in external_ids]                  # type: List[str]
+        if self.check_every:
+            for i in range(0, len(encoded), self.check_every):
+                self.check(enclave_id + '|' + external_ids[i], encoded[i])
+        return encoded
+
+    def check(self, s, stringified_b64_encoding):    # type: (str, str) -> None
+        """ Logs, and raises if configured to, when the encoding does not
+        reverse to s. """
         if self.reverse(stringified_b64_encoding) != s:
             msg = ("External ID encoder's 'reversible' method produced an  "
                    "external ID that its 'reverse' method did not "
@@ -56,8 +116,6 @@ class ExternalIdEncoder:
             if self.exc_if_rev_fail:
                 raise Exception(msg)
 
-        return stringified_b64_encoding
-
     @staticmethod
     def reverse(stringified_b64_encoding):                # type: (str) -> str
         """ Reverses an external ID created by the 'reversible' method. """
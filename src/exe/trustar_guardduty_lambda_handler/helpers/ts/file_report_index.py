@@ -0,0 +1,159 @@
+# encoding = utf-8
+
+""" FileReportIndex class definition. """
+
+import json
+from logging import getLogger
+import os
+
+from ..common.file_lock import FileLock
+from .memory_report_index import MemoryReportIndex
+from .report_index import ReportIndexEntry
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class FileReportIndex(MemoryReportIndex):
+    """ A MemoryReportIndex that is also persisted to a file (ex:  in
+    /tmp), so that new containers on the same host start with the entries
+    the others wrote.
+
+    The file is a log of JSON lines, {"k": external ID, "e": entry}, with
+    a null entry for a delete:  each put or delete appends one line, and
+    other processes read only the lines added since they last looked.
+    Once dead lines (replaced, deleted or evicted entries) make up most of
+    the file, the live entries are rewritten to a temp file that replaces
+    it, so readers never see a partial file.  Writes hold an exclusive
+    lock on "<file_path>.lock". """
+
+    # compact once this many lines are dead and they outnumber the live.
+    MIN_DEAD_LINES = 1000
+
+    def __init__(self, file_path,                                  # type: str
+                 max_entries=MemoryReportIndex.DEFAULT_MAX_ENTRIES  # type: int
+                 ):
+        super().__init__(max_entries)
+        self.file_path = file_path                                 # type: str
+        self._inode = None                               # type: Optional[int]
+        self._offset = 0                                           # type: int
+        self._lines = 0                                            # type: int
+
+    def __len__(self):                                       # type: () -> int
+        with self._lock:
+            self._sync()
+            return super().__len__()
+
+    def get(self, external_id
+            ):                      # type: (str) -> Optional[ReportIndexEntry]
+        with self._lock:
+            self._sync()
+            return super().get(external_id)
+
+    def put(self, external_id,                                     # type: str
+            entry                                     # type: ReportIndexEntry
+            ):                                          # type: (...) -> None
+        with self._lock:
+            self._write(external_id, entry)
+
+    def delete(self, external_id):                        # type: (str) -> None
+        with self._lock:
+            self._write(external_id, None)
+
+    def _sync(self):                                        # type: () -> None
+        """ Applies the lines written since the file was last read or
+        written by this index, or reloads it if it was compacted. """
+        try:
+            st = os.stat(self.file_path)
+        except OSError:
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._entries.clear()
+            self._inode, self._offset, self._lines = st.st_ino, 0, 0
+        if st.st_size == self._offset:
+            return
+        try:
+            with open(self.file_path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            logger.warning("Could not read report index file '{}'.  "
+                           "Ignoring it.".format(self.file_path))
+            return
+        # a line still being written is read on the next sync.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            self._apply(line)
+        self._offset += end
+
+    def _apply(self, line):                             # type: (bytes) -> None
+        self._lines += 1
+        # noinspection PyBroadException
+        try:
+            record = json.loads(line)
+            self._change(record['k'], ReportIndexEntry.from_dict(record['e'])
+                         if record['e'] is not None else None)
+        except Exception:
+            logger.warning("Skipping unreadable line in report index file "
+                           "'{}'.".format(self.file_path))
+
+    def _change(self, external_id,                                 # type: str
+                entry                       # type: Optional[ReportIndexEntry]
+                ):                                      # type: (...) -> None
+        if entry is None:
+            MemoryReportIndex.delete(self, external_id)
+        else:
+            MemoryReportIndex.put(self, external_id, entry)
+
+    def _write(self, external_id,                                  # type: str
+               entry                        # type: Optional[ReportIndexEntry]
+               ):                                       # type: (...) -> None
+        """ Applies the change and appends its line, after the lines the
+        other processes wrote. """
+        line = json.dumps({'k': external_id,
+                           'e': entry.to_dict() if entry else None},
+                          separators=(',', ':')) + '\n'
+        # noinspection PyBroadException
+        try:
+            with FileLock(self.file_path + '.lock'):
+                self._sync()
+                self._change(external_id, entry)
+                if self._file_size() > self._offset:
+                    # the torn tail of a write that was cut off.
+                    line = '\n' + line
+                    self._lines += 1
+                with open(self.file_path, 'ab') as f:
+                    f.write(line.encode('utf-8'))
+                st = os.stat(self.file_path)
+                self._inode, self._offset = st.st_ino, st.st_size
+                self._lines += 1
+                dead = self._lines - len(self._entries)
+                if dead >= self.MIN_DEAD_LINES and dead > len(self._entries):
+                    self._compact()
+        except Exception:
+            logger.warning("Could not write report index file '{}'."
+                           .format(self.file_path))
+            self._change(external_id, entry)
+
+    def _file_size(self):                                    # type: () -> int
+        try:
+            return os.path.getsize(self.file_path)
+        except OSError:
+            return 0
+
+    def _compact(self):                                     # type: () -> None
+        """ Rewrites the file with only the live entries. """
+        data = ''.join(json.dumps({'k': k, 'e': e.to_dict()},
+                                  separators=(',', ':')) + '\n'
+                       for k, e in self._entries.items()).encode('utf-8')
+        tmp_path = "{}.{}.tmp".format(self.file_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.file_path)
+        st = os.stat(self.file_path)
+        self._inode, self._offset = st.st_ino, st.st_size
+        self._lines = len(self._entries)
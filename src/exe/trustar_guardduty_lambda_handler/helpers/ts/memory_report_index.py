@@ -0,0 +1,51 @@
+# encoding = utf-8
+
+""" MemoryReportIndex class definition. """
+
+from collections import OrderedDict
+import threading
+
+from .report_index import ReportIndex
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Optional
+    from .report_index import ReportIndexEntry
+
+
+class MemoryReportIndex(ReportIndex):
+    """ Keeps the most recently used 'max_entries' entries in process
+    memory.  Lives as long as the Lambda container. """
+
+    DEFAULT_MAX_ENTRIES = 10000
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):  # type: (int) -> None
+        if max_entries < 1:
+            raise Exception("max_entries must be at least 1.")
+        self.max_entries = max_entries                             # type: int
+        self._entries = OrderedDict()   # type: Dict[str, ReportIndexEntry]
+        self._lock = threading.RLock()
+
+    def __len__(self):                                       # type: () -> int
+        return len(self._entries)
+
+    def get(self, external_id
+            ):                      # type: (str) -> Optional[ReportIndexEntry]
+        with self._lock:
+            entry = self._entries.get(external_id)
+            if entry is not None:
+                self._entries.move_to_end(external_id)
+            return entry
+
+    def put(self, external_id,                                     # type: str
+            entry                                     # type: ReportIndexEntry
+            ):                                          # type: (...) -> None
+        with self._lock:
+            self._entries[external_id] = entry
+            self._entries.move_to_end(external_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, external_id):                        # type: (str) -> None
+        with self._lock:
+            self._entries.pop(external_id, None)
@@ -0,0 +1,42 @@
+# encoding = utf-8
+
+""" RateLimitedClient class definition. """
+
+import functools
+
+from .station_rate_limiter import StationRateLimiter
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any
+    from trustar import TruStar
+
+
+class RateLimitedClient:
+    """ Wraps a TruStar client so that its report and enclave calls go
+    through a StationRateLimiter.  Everything else (attributes, other
+    methods) is passed straight to the wrapped client. """
+
+    READS = ('get_report_details', 'get_reports', 'get_reports_page',
+             'get_user_enclaves', 'search_reports', 'search_reports_page')
+    WRITES = ('submit_report', 'update_report', 'delete_report')
+
+    def __init__(self, ts,                                      # type: TruStar
+                 limiter                            # type: StationRateLimiter
+                 ):
+        self.ts = ts                                            # type: TruStar
+        self.limiter = limiter                      # type: StationRateLimiter
+
+    def __getattr__(self, name):                          # type: (str) -> Any
+        attr = getattr(self.ts, name)
+        if name in self.READS:
+            kind = StationRateLimiter.READ
+        elif name in self.WRITES:
+            kind = StationRateLimiter.WRITE
+        else:
+            return attr
+
+        @functools.wraps(attr)
+        def limited(*args, **kwargs):
+            return self.limiter.call(kind, lambda: attr(*args, **kwargs))
+        return limited
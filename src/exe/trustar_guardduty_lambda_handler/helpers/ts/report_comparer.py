@@ -31,8 +31,8 @@ class ReportComparer:
             enclave_val = getattr(from_enclave, v)
             upserted_val = getattr(upserted, v)
             if v == 'time_began':
-                are_reports_equal = cls.compare_time_begans(
-                    upserted_val, enclave_val)                    # type: bool
+                if not cls.compare_time_begans(upserted_val, enclave_val):
+                    are_reports_equal = False
             elif not enclave_val == upserted_val:
                 msg = ("For instance-var '{}', upserted:  '{}', " 
                        "found in enclave:  '{}'."
@@ -41,9 +41,9 @@ class ReportComparer:
                 are_reports_equal = False
         logger.info("Done comparing reports.")
         if are_reports_equal:
-            logger.info("Reports have differences.")
-        else:
             logger.info("Reports are same.")
+        else:
+            logger.info("Reports have differences.")
         return are_reports_equal
 
     @staticmethod
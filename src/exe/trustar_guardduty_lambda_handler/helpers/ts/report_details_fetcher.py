@@ -2,43 +2,65 @@
 
 """ RepoortDetailsFetcher class definition. """
 
-import time
 from logging import getLogger
 
 from trustar import IdType
 
+from ..common.metrics_recorder import MetricsRecorder
+from ..common.retry_policy import RetryPolicy
+
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+    from typing import Any, Optional
     from logging import Logger
     from trustar import Report, TruStar
+    from ..common.retry_policy import RetryOutcome
 
 logger = getLogger(__name__)                                    # type: Logger
 
 class ReportDetailsFetcher:
     """ A class for fetching report details. """
 
-    def __init__(self, ts):                          # type: (TruStar) -> None
+    # a report that was just upserted may take a moment to show up, so
+    # keep trying for a while:  at most 11.5 s of waits, half the 22 s the
+    # fixed sleeps took.
+    DEFAULT_RETRY_POLICY = RetryPolicy(max_attempts=6, base_delay=0.5,
+                                       max_delay=4.0)
+
+    def __init__(self, ts,                                  # type: TruStar
+                 retry_policy=None,               # type: Optional[RetryPolicy]
+                 metrics=None                 # type: Optional[MetricsRecorder]
+                 ):
         self.ts = ts                                 # type: TruStar
+        self.retry_policy = (retry_policy or
+                             self.DEFAULT_RETRY_POLICY)  # type: RetryPolicy
+        self.metrics = metrics or MetricsRecorder()  # type: MetricsRecorder
 
-    def fetch_for(self, external_id):          # type: (str) -> Report or None
-        """ Fetch a report's details from TruStar. """
+    def fetch_for(self, external_id,                               # type: str
+                  context=None                                     # type: Any
+                  ):                          # type: (...) -> Optional[Report]
+        """ Fetch a report's details from TruStar.  Gives up early if the
+        Lambda 'context' says the invocation's deadline is near. """
         logger.info("Fetching report saved in TruSTAR.")
-        attempt = 0
-        max_n_attempts = 10
-        while attempt <= max_n_attempts:
-            attempt += 1
-            time.sleep(2)
-            # noinspection PyUnusedLocal
-            r = None                                   # type:  Report or None
-            # noinspection PyBroadException
-            try:
-                r = self.ts.get_report_details(
-                    external_id, id_type=IdType.EXTERNAL)
-                logger.info("successfully fetched report.")
-                return r
-            except:
-                logger.error("Failed attempt '{}' fetching report with ext "
-                             "ID '{}'."
-                             .format(attempt, external_id))
-        logger.info("Done attempting to fetch report.  Failed.")
+        with self.metrics.span('SavedReportFetch'):
+            outcome = self.retry_policy.call(
+                lambda: self.ts.get_report_details(external_id,
+                                                   id_type=IdType.EXTERNAL),
+                context=context)
+        return self.report_from(outcome, external_id)
+
+    def report_from(self, outcome, external_id
+                    ):      # type: (RetryOutcome, str) -> Optional[Report]
+        """ Records the attempt count and total wait, returns the report or
+        None. """
+        self.metrics.record_retries('SavedReport', outcome)
+        logger.info("Fetching report with ext ID '{}':  attempts '{}', "
+                    "total wait '{:.3f}' s."
+                    .format(external_id, outcome.attempts,
+                            outcome.total_wait))
+        if outcome.succeeded:
+            logger.info("successfully fetched report.")
+            return outcome.value
+        logger.error("Done attempting to fetch report with ext ID '{}'.  "
+                     "Failed:  {}".format(external_id, outcome.error))
         return None
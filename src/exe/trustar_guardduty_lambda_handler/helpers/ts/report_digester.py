@@ -0,0 +1,82 @@
+# encoding = utf-8
+
+""" ReportDigester class definition. """
+
+import hashlib
+import json
+from logging import getLogger
+
+from .time_converter import TimeConverter
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterable, List, Optional, Tuple
+    from logging import Logger
+    from trustar import Report
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class ReportDigester:
+    """ Computes a digest of the report content the upserter writes:
+    title, body, time_began and external_url.  Two reports with the same
+    digest would leave Station unchanged, so the write can be skipped.
+
+    Reports built from the same finding can differ in ways nobody reads,
+    so equal content is compared canonically:  time_began as millis (the
+    built report carries an ISO string, Station returns millis), and a JSON
+    body re-serialized with its 'volatile_fields' removed.  Volatile fields
+    are dotted paths into the body, ex:  "service.count", "updatedAt". """
+
+    def __init__(self, volatile_fields=()):     # type: (Iterable[str]) -> None
+        self.volatile_fields = tuple(volatile_fields)       # type: Tuple
+        self._paths = [f.split('.') for f in self.volatile_fields
+                       ]                                # type: List[List[str]]
+
+    def digest(self, report):                           # type: (Report) -> str
+        content = [report.title,
+                   self.canonical_body(report.body),
+                   self.canonical_time(report.time_began),
+                   report.external_url]
+        s = json.dumps(content, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    def unchanged(self, existing,                               # type: Report
+                  new                                           # type: Report
+                  ):                                    # type: (...) -> bool
+        """ Whether writing 'new' over 'existing' would change nothing
+        meaningful. """
+        return self.digest(existing) == self.digest(new)
+
+    def canonical_body(self, body):              # type: (Optional[str]) -> Any
+        """ The body's JSON without the volatile fields, or the body as is
+        if it isn't JSON. """
+        if not body:
+            return None
+        # noinspection PyBroadException
+        try:
+            d = json.loads(body)
+        except Exception:
+            return body
+        if isinstance(d, dict):
+            for path in self._paths:
+                self._remove(d, path)
+        return d
+
+    @staticmethod
+    def _remove(d, path):                     # type: (Dict, List[str]) -> None
+        for key in path[:-1]:
+            d = d.get(key)
+            if not isinstance(d, dict):
+                return
+        d.pop(path[-1], None)
+
+    @staticmethod
+    def canonical_time(time_began):                      # type: (Any) -> Any
+        if isinstance(time_began, str):
+            # noinspection PyBroadException
+            try:
+                return TimeConverter.iso_to_ms(time_began)
+            except Exception:
+                return time_began
+        return time_began
@@ -0,0 +1,54 @@
+# encoding = utf-8
+
+""" ReportIndex and ReportIndexEntry class definitions. """
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+
+
+class ReportIndexEntry:
+    """ What the index remembers about the report a finding was last
+    upserted as. """
+
+    def __init__(self, report_id,                                  # type: str
+                 enclave_ids,                                # type: List[str]
+                 digest=None                             # type: Optional[str]
+                 ):
+        self.report_id = report_id                                 # type: str
+        self.enclave_ids = list(enclave_ids)               # type: List[str]
+        # the ReportDigester's digest of the report's content.
+        self.digest = digest                             # type: Optional[str]
+
+    def to_dict(self):                                      # type: () -> Dict
+        return {'reportId': self.report_id,
+                'enclaveIds': self.enclave_ids,
+                'digest': self.digest}
+
+    @classmethod
+    def from_dict(cls, d):                   # type: (Dict) -> ReportIndexEntry
+        return cls(d['reportId'], d['enclaveIds'], d.get('digest'))
+
+
+class ReportIndex:
+    """ Maps external IDs to the Station reports they were upserted as, so
+    the upserter can update a known report without first looking it up.
+
+    The index is only a hint:  Station remains the source of truth, and
+    the upserter drops entries that Station contradicts.  Subclasses pick
+    where the entries are kept. """
+
+    def get(self, external_id
+            ):                      # type: (str) -> Optional[ReportIndexEntry]
+        """ Returns the external ID's entry, or None. """
+        raise NotImplementedError
+
+    def put(self, external_id,                                     # type: str
+            entry                                     # type: ReportIndexEntry
+            ):                                          # type: (...) -> None
+        """ Adds or replaces the external ID's entry. """
+        raise NotImplementedError
+
+    def delete(self, external_id):                        # type: (str) -> None
+        """ Drops the external ID's entry, if there is one. """
+        raise NotImplementedError
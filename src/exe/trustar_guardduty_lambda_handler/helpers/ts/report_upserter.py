@@ -6,13 +6,22 @@ import copy
 import json
 from logging import getLogger
 
-from trustar import TruStar, IdType
+from trustar import TruStar, IdType, Report
+
+from ..common.circuit_breaker import CircuitBreaker
+from ..common.metrics_recorder import MetricsRecorder
+from ..common.retry_policy import RetryPolicy
+from .report_index import ReportIndexEntry
+from .station_error_classifier import StationErrorClassifier
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import List
+    from typing import Any, Callable, List, Optional
+    from ..common.retry_policy import RetryOutcome
     from logging import Logger
-    from trustar import Report
+    from .report_digester import ReportDigester
+    from .report_index import ReportIndex
+    from .station_rate_limiter import StationRateLimiter
 
 logger = getLogger(__name__)                                    # type: Logger
 
@@ -21,7 +30,14 @@ class ReportUpserter:
 
     def __init__(self, ts,                                  # type: TruStar
                  enclave_id,                                # type: str
-                 exc_if_rpt_encls_diff=True                 # type: bool
+                 exc_if_rpt_encls_diff=True,                # type: bool
+                 on_forbidden=None,        # type: Optional[Callable[[], None]]
+                 retry_policy=None,         # type: Optional[RetryPolicy]
+                 index=None,                # type: Optional[ReportIndex]
+                 digester=None,          # type: Optional[ReportDigester]
+                 metrics=None,               # type: Optional[MetricsRecorder]
+                 breaker=None,                # type: Optional[CircuitBreaker]
+                 limiter=None             # type: Optional[StationRateLimiter]
                  ):
         if ts.enclave_ids:
             msg = self.msg_dont_use_ts_client_encl_ids()
@@ -30,6 +46,19 @@ class ReportUpserter:
         self.ts = ts                                        # type: TruStar
         self.enclave_id = enclave_id                        # type: str
         self.exc_if_encls_diff = exc_if_rpt_encls_diff      # type: bool
+        self.on_forbidden = on_forbidden  # type: Optional[Callable[[], None]]
+        # by default, look an existing report up once.
+        self.retry_policy = (retry_policy or
+                             RetryPolicy(max_attempts=1))  # type: RetryPolicy
+        self.index = index                      # type: Optional[ReportIndex]
+        # without a digester, every upsert writes.
+        self.digester = digester             # type: Optional[ReportDigester]
+        self.metrics = metrics or MetricsRecorder()  # type: MetricsRecorder
+        # without a breaker, every call is made, however unhealthy Station.
+        self.breaker = breaker               # type: Optional[CircuitBreaker]
+        # holds the Lambda context of the invocation in progress, so the
+        # lookup retries stop before its deadline.
+        self.limiter = limiter           # type: Optional[StationRateLimiter]
 
     def upsert(self, report):                       # type: (Report) -> Report
         """ Upserts report, returns True if success, False if fail. """
@@ -43,6 +72,13 @@ class ReportUpserter:
             msg = self.msg_new_rpt_encls_dont_match(report)
             self.handle_enclaves_mismatch(msg)
 
+        entry = self.indexed_entry(report.external_id)
+        if entry:
+            r = self.update_indexed_report(entry, report)
+            if r:
+                logger.info("Upsert operation complete.")
+                return r
+
         existing_report = self.fetch_existing_report(
             report.external_id)                         # type: Report or None
 
@@ -52,14 +88,107 @@ class ReportUpserter:
                 msg = self.msg_existing_rpt_encls_dont_match(existing_report)
                 self.handle_enclaves_mismatch(msg)
 
-            r = self.update_report(existing_report=existing_report,
-                                   gd_report=report)            # type: Report
+            if self.is_unchanged(existing_report, report):
+                r = existing_report                             # type: Report
+            else:
+                r = self.update_report(existing_report=existing_report,
+                                       gd_report=report)
         else:
             r = self.submit_report(report)                      # type: Report
 
+        self.index_upserted(r)
         logger.info("Upsert operation complete.")
         return r
 
+    def indexed_entry(self, external_id
+                      ):            # type: (str) -> Optional[ReportIndexEntry]
+        """ Returns the index's entry for the external ID, unless there is
+        no index, no entry, or the entry's report lives in other enclaves
+        (then the lookup decides what to do with it). """
+        if self.index is None:
+            return None
+        entry = self.index.get(external_id)
+        if entry and not self.eq_upserter_enclaves(entry.enclave_ids):
+            logger.info("Indexed report with external ID '{}' resides in "
+                        "enclave(s) '{}'.  Looking it up instead."
+                        .format(external_id, entry.enclave_ids))
+            return None
+        return entry
+
+    def update_indexed_report(self, entry,            # type: ReportIndexEntry
+                              gd_report                         # type: Report
+                              ):               # type: (...) -> Report or None
+        """ Updates the report the index says the finding was upserted as,
+        without looking it up first.  If Station no longer has that report,
+        drops the stale entry and returns None. """
+        logger.info("Report with external ID '{}' is indexed as report ID "
+                    "'{}'.  Updating it without looking it up."
+                    .format(gd_report.external_id, entry.report_id))
+        self.metrics.increment('IndexHits')
+        existing_report = self.indexed_report(entry, gd_report)
+        if entry.digest and entry.digest == self.digest_of(gd_report):
+            self.log_unchanged(gd_report)
+            return self.merged_report(existing_report, gd_report)
+        try:
+            r = self.update_report(existing_report=existing_report,
+                                   gd_report=gd_report)         # type: Report
+        except Exception as e:
+            if StationErrorClassifier.status_code_of(e) != 404:
+                raise e
+            self.drop_stale_entry(gd_report.external_id)
+            return None
+        self.index_upserted(r)
+        return r
+
+    @staticmethod
+    def indexed_report(entry,                         # type: ReportIndexEntry
+                       gd_report                                # type: Report
+                       ):                               # type: (...) -> Report
+        """ Stands in for the existing report when updating from the index.
+        The Report model only carries the attributes the upserter writes,
+        so merging onto this is the same as merging onto the report fetched
+        from Station. """
+        return Report(id=entry.report_id,
+                      external_id=gd_report.external_id,
+                      enclave_ids=list(entry.enclave_ids))
+
+    def drop_stale_entry(self, external_id):              # type: (str) -> None
+        logger.warning("Station no longer has the report indexed for "
+                       "external ID '{}'.  Dropping the stale index entry "
+                       "and looking the report up.".format(external_id))
+        self.metrics.increment('StaleIndexEntries')
+        self.index.delete(external_id)
+
+    def index_upserted(self, report):                 # type: (Report) -> None
+        """ Remembers which report the finding was upserted as. """
+        if self.index is not None and report.id:
+            self.index.put(report.external_id,
+                           ReportIndexEntry(report.id,
+                                            report.enclave_ids or [],
+                                            self.digest_of(report)))
+
+    def digest_of(self, report):            # type: (Report) -> Optional[str]
+        if self.digester is None:
+            return None
+        return self.digester.digest(report)
+
+    def is_unchanged(self, existing_report,                     # type: Report
+                     gd_report                                  # type: Report
+                     ):                                 # type: (...) -> bool
+        """ Whether updating the existing report would change nothing
+        meaningful, so the write can be skipped. """
+        if self.digester is None:
+            return False
+        if not self.digester.unchanged(existing_report, gd_report):
+            return False
+        self.log_unchanged(gd_report)
+        return True
+
+    def log_unchanged(self, gd_report):               # type: (Report) -> None
+        self.metrics.increment('UnchangedSkips')
+        logger.info("Report with external ID '{}' is unchanged.  Skipping "
+                    "the update.".format(gd_report.external_id))
+
     def eq_upserter_enclaves(self, report_enclave_ids    # type: List[str]
                              ):                          # type: (...) -> bool
         """ Compares a report's list of enclave IDs to the upserter's
@@ -75,46 +204,70 @@ class ReportUpserter:
 
     def fetch_existing_report(self, external_id                    # type: str
                               ):               # type: (...) -> Report or None
-        """ Returns the existing report or None. """
-        # TODO:  This assumes that the only reason for failure is that
-        #  the report doesn't exist.  Could also fail because Station
-        #  is down.  Add code that handles those two cases differently.
+        """ Returns the existing report, or None if Station says there is
+        none. """
+        with self.metrics.span('LookupExisting'):
+            outcome = self.retry_policy.call(
+                lambda: self.call_station(lambda: self.ts.get_report_details(
+                    external_id, id_type=IdType.EXTERNAL)),
+                context=self.context,
+                is_retryable=self.is_retryable_lookup_error)
+        self.metrics.record_retries('Lookup', outcome)
+        return self.existing_report_from(outcome, external_id)
 
-        existing_report = None
-        # noinspection PyBroadException
-        try:
-            existing_report = self.ts.get_report_details(
-                external_id, id_type=IdType.EXTERNAL)
+    def existing_report_from(self, outcome,             # type: RetryOutcome
+                             external_id                           # type: str
+                             ):                # type: (...) -> Report or None
+        """ Only a 404 means that no report exists.  Any other failure
+        (Station throttling, down or refusing the creds, or the breaker
+        open) is raised, so the finding fails and is retried later instead
+        of being submitted as a duplicate of a report that exists. """
+        if outcome.succeeded:
             logger.info("Report with external ID '{}' found.  It "
                         "resides in enclave(s) '{}'."
-                        .format(external_id, existing_report.enclave_ids))
-        except:
-            logger.info("Call to check for an existing report by this "
-                        "external ID failed.  Assuming that no report with "
-                        "external ID '{}' exists in Station, but it is "
-                        "possible that this failure was a fluke."
+                        .format(external_id, outcome.value.enclave_ids))
+            return outcome.value
+        category = StationErrorClassifier.classify(outcome.error)  # type: str
+        self.metrics.increment('Lookup' + category)
+        if category == StationErrorClassifier.NOT_FOUND:
+            logger.info("No report with external ID '{}' exists in Station."
                         .format(external_id))
-        return existing_report
+            return None
+        logger.error("Failed to look up the report with external ID '{}' "
+                     "after '{}' attempt(s) ('{}' error).  Not submitting "
+                     "it, in case it already exists."
+                     .format(external_id, outcome.attempts, category))
+        raise outcome.error
+
+    @property
+    def context(self):                                       # type: () -> Any
+        """ The Lambda context of the invocation in progress, if known. """
+        return self.limiter.context if self.limiter is not None else None
+
+    @staticmethod
+    def is_retryable_lookup_error(e):              # type: (Exception) -> bool
+        """ Only throttling and server errors may clear up if asked again.
+        A 404 means the report doesn't exist, and an open breaker or an
+        auth error won't change within the backoff. """
+        return StationErrorClassifier.is_transient(e)
+
+    def call_station(self, fn):             # type: (Callable[[], Any]) -> Any
+        """ Makes a Station call through the breaker, if there is one. """
+        if self.breaker is None:
+            return fn()
+        return self.breaker.call(fn)
 
     def update_report(self, existing_report,           # type: Report
                       gd_report                        # type: Report
                       ):                               # type: (...) -> Report
         """ Updates the existing report in Station. """
 
-        # overwrite the existing report with the gd_report's values so you
-        # preserve the existing report's values for other attrs that are
-        # not pertinent here but might have values in Station.
-        # If we don't do this, Station overwrites existing attribute values
-        # with null.
-        new_report = copy.copy(existing_report)
-        new_report.title = gd_report.title
-        new_report.time_began = gd_report.time_began
-        new_report.external_url = gd_report.external_url
-        new_report.external_id = gd_report.external_id
-        new_report.body = gd_report.body
-
+        new_report = self.merged_report(existing_report, gd_report)
         try:
-            updated_report = self.ts.update_report(new_report)
+            with self.metrics.span('Update'):
+                updated_report = self.call_station(
+                    lambda: self.ts.update_report(new_report))
+            self.metrics.increment('Updates')
             logger.info("Updated report with ID '{}', external ID '{}', "
                         "title '{}'.".format(updated_report.id,
                                              updated_report.external_id,
@@ -126,13 +279,34 @@ class ReportUpserter:
                          .format(existing_report.id,
                                  existing_report.external_id,
                                  existing_report.title))
+            self.handle_write_failure(e)
             raise e
         return updated_report
 
+    @staticmethod
+    def merged_report(existing_report,                # type: Report
+                      gd_report                       # type: Report
+                      ):                              # type: (...) -> Report
+        """ Overwrites the existing report with the gd_report's values so
+        you preserve the existing report's values for other attrs that are
+        not pertinent here but might have values in Station.
+        If we don't do this, Station overwrites existing attribute values
+        with null. """
+        new_report = copy.copy(existing_report)
+        new_report.title = gd_report.title
+        new_report.time_began = gd_report.time_began
+        new_report.external_url = gd_report.external_url
+        new_report.external_id = gd_report.external_id
+        new_report.body = gd_report.body
+        return new_report
+
     def submit_report(self, report):                # type: (Report) -> Report
         """ Submits the report, log error & throw exception if fail."""
         try:
-            submitted_report = self.ts.submit_report(report)    # type: Report
+            with self.metrics.span('Submit'):
+                submitted_report = self.call_station(
+                    lambda: self.ts.submit_report(report))
+            self.metrics.increment('Submits')
             logger.info("Submitted report with ID '{}', external ID '{}', "
                         "title '{}'.".format(submitted_report.id,
                                              submitted_report.external_id,
@@ -141,9 +315,19 @@ class ReportUpserter:
             logger.error(("Failed to submit report with external ID '{}', "
                           "title '{}'.".format(report.external_id,
                                                report.title)))
+            self.handle_write_failure(e)
             raise e
         return submitted_report
 
+    def handle_write_failure(self, e):            # type: (Exception) -> None
+        """ Lets the owner of any cached enclave permissions know that
+        they are stale when Station refuses a write with a 403. """
+        self.metrics.increment('WriteFailures')
+        if self.on_forbidden and StationErrorClassifier.is_forbidden(e):
+            logger.warning("Station refused the write with a 403.  "
+                           "Invalidating cached enclave permissions.")
+            self.on_forbidden()
+
     def msg_dont_use_ts_client_encl_ids(self):  # type: () -> str
         msg = ("Do not specify the TruStar client's 'enclave_ids' "
                "attribute when using the '{}' class.  This can lead to "
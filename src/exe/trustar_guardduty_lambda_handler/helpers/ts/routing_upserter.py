@@ -0,0 +1,49 @@
+# encoding = utf-8
+
+""" RoutingUpserter class definition. """
+
+from logging import getLogger
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Iterable
+    from logging import Logger
+    from trustar import Report
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class RoutingUpserter:
+    """ Hands each report to the upserter of the enclave it was built for.
+    Stands in for a single ReportUpserter (or AsyncReportUpserter, whose
+    coroutine it returns), ex:  behind a ConcurrentUpserter.  Reports for
+    different enclaves have different external IDs, so they are upserted
+    concurrently. """
+
+    def __init__(self, upserters):                     # type: (Dict) -> None
+        self.upserters = upserters                       # type: Dict[str, Any]
+
+    @classmethod
+    def for_enclaves(cls, enclave_ids,                 # type: Iterable[str]
+                     build                        # type: Callable[[str], Any]
+                     ):                        # type: (...) -> RoutingUpserter
+        """ Builds one upserter per enclave with 'build(enclave_id)'. """
+        return cls({enclave_id: build(enclave_id)
+                    for enclave_id in enclave_ids})
+
+    def for_report(self, report):                     # type: (Report) -> Any
+        enclave_ids = report.enclave_ids or []
+        upserter = (self.upserters.get(enclave_ids[0])
+                    if len(enclave_ids) == 1 else None)
+        if upserter is None:
+            msg = ("No upserter for report with external ID '{}' and "
+                   "enclave(s) '{}'.  Reports are upserted to one of the "
+                   "routed enclaves '{}'."
+                   .format(report.external_id, enclave_ids,
+                           "', '".join(self.upserters)))
+            logger.error(msg)
+            raise Exception(msg)
+        return upserter
+
+    def upsert(self, report):                         # type: (Report) -> Any
+        return self.for_report(report).upsert(report)
@@ -0,0 +1,175 @@
+# encoding = utf-8
+
+""" SavedReportVerifier class definition. """
+
+from logging import getLogger
+import time
+
+from ..common.metrics_recorder import MetricsRecorder
+from ..common.retry_policy import RetryPolicy
+from .report_comparer import ReportComparer
+from .verification_queue import PendingVerification, VerificationQueue
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+    from logging import Logger
+    from trustar import Report, TruStar
+    from trustar.models import NumberedPage
+    from .report_digester import ReportDigester
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class SavedReportVerifier:
+    """ Checks upserted reports against the reports saved in Station off
+    the hot path:  'defer' queues an upserted report, and 'verify_due'
+    later fetches every queued report that is at least 'delay' seconds old
+    with one windowed report search (a page per 'get_reports_page' call)
+    rather than one lookup per report, and compares them.
+
+    A report whose digest matches the saved report's is verified without
+    comparing field by field;  otherwise the ReportComparer logs the
+    differences.  A report missing from the search is queued again, up to
+    'max_attempts' times.  Counts SavedReportsVerified,
+    SavedReportMismatches and SavedReportsMissing. """
+
+    # Station stamps "updated" before the upsert returns;  widen the
+    # search window for clock skew between Station and the Lambda.
+    WINDOW_SLACK_MS = 60000
+    # skip a pass rather than start one this close to the deadline.
+    MIN_REMAINING_SECONDS = 5.0
+
+    def __init__(self, ts,                                      # type: TruStar
+                 enclave_ids,                                # type: List[str]
+                 vars_to_skip=(),                                # type: Tuple
+                 queue=None,                # type: Optional[VerificationQueue]
+                 digester=None,                # type: Optional[ReportDigester]
+                 delay=30.0,                                     # type: float
+                 max_attempts=3,                                   # type: int
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 clock=time.time                 # type: Callable[[], float]
+                 ):
+        self.ts = ts                                            # type: TruStar
+        self.enclave_ids = list(enclave_ids)                 # type: List[str]
+        self.vars_to_skip = vars_to_skip                         # type: Tuple
+        self.queue = queue or VerificationQueue()    # type: VerificationQueue
+        self.digester = digester               # type: Optional[ReportDigester]
+        self.delay = delay                                       # type: float
+        self.max_attempts = max_attempts                           # type: int
+        self.metrics = metrics or MetricsRecorder()    # type: MetricsRecorder
+        self.clock = clock
+
+    def defer(self, upserted):                        # type: (Report) -> None
+        """ Queues the upserted report for a later verification pass. """
+        digest = (self.digester.digest(upserted) if self.digester
+                  else None)                             # type: Optional[str]
+        self.queue.put(PendingVerification(upserted, digest, self.clock()))
+
+    def due(self, context=None, everything=False
+            ):              # type: (Any, bool) -> List[PendingVerification]
+        """ Takes the entries to verify now:  none if the Lambda's deadline
+        is close, else those queued at least 'delay' seconds ago (or all of
+        them). """
+        remaining = RetryPolicy.remaining_seconds(context)
+        if remaining is not None and remaining < self.MIN_REMAINING_SECONDS:
+            return []
+        if everything:
+            return self.queue.take()
+        return self.queue.take(queued_before=self.clock() - self.delay)
+
+    def verify_due(self, context=None,                             # type: Any
+                   everything=False                               # type: bool
+                   ):                                    # type: (...) -> int
+        """ Verifies the due entries.  Returns how many were checked.
+        Never raises:  if the search fails, the entries are queued again. """
+        entries = self.due(context, everything)
+        if not entries:
+            return 0
+        logger.info("Verifying '{}' saved report(s).".format(len(entries)))
+        with self.metrics.span('VerifySavedReports'):
+            # noinspection PyBroadException
+            try:
+                saved = self.search(entries)
+            except Exception:
+                logger.exception("Failed to search Station for the saved "
+                                 "reports.  Will try again later.")
+                self.queue.requeue(entries)
+                return 0
+            self.check(entries, saved)
+        return len(entries)
+
+    def search(self, entries            # type: List[PendingVerification]
+               ):                            # type: (...) -> Dict[str, Report]
+        """ Pages through the reports updated since the oldest entry was
+        queued, newest first, until every entry's report is found. """
+        wanted = {e.external_id for e in entries}
+        found = {}                                    # type: Dict[str, Report]
+        from_time, to_time = self.window_for(entries)
+        while to_time is not None and to_time >= from_time:
+            page = self.ts.get_reports_page(
+                is_enclave=True, enclave_ids=self.enclave_ids,
+                from_time=from_time, to_time=to_time)
+            to_time = self.collect(page, wanted, found, to_time)
+        return found
+
+    def window_for(self, entries          # type: List[PendingVerification]
+                   ):                          # type: (...) -> Tuple[int, int]
+        """ The search window, in millis. """
+        oldest = min(e.queued_at for e in entries)
+        return (int(oldest * 1000) - self.WINDOW_SLACK_MS,
+                int(self.clock() * 1000) + self.WINDOW_SLACK_MS)
+
+    @staticmethod
+    def collect(page,                                    # type: NumberedPage
+                wanted,                                           # type: set
+                found,                                # type: Dict[str, Report]
+                to_time                                            # type: int
+                ):                               # type: (...) -> Optional[int]
+        """ Keeps the page's wanted reports.  Returns the end of the window
+        of the next page to fetch, or None if there is none.  The window
+        moves back past the page's oldest report, by when it was updated,
+        or created if Station didn't say;  reports with neither are
+        skipped. """
+        for report in page.items:
+            if report.external_id in wanted:
+                found.setdefault(report.external_id, report)
+        if len(found) == len(wanted):
+            return None
+        times = [r.updated or r.created for r in page.items
+                 if r.updated or r.created]               # type: List[int]
+        if not times:
+            return None
+        next_to_time = min(times) - 1
+        return next_to_time if next_to_time < to_time else None
+
+    def check(self, entries,             # type: List[PendingVerification]
+              saved                               # type: Dict[str, Report]
+              ):                                         # type: (...) -> None
+        retry = []                           # type: List[PendingVerification]
+        for entry in entries:
+            saved_report = saved.get(entry.external_id)
+            if saved_report is None:
+                entry.attempts += 1
+                if entry.attempts < self.max_attempts:
+                    retry.append(entry)
+                    continue
+                logger.error("Report with external ID '{}' was not found in "
+                             "Station after '{}' verification pass(es)."
+                             .format(entry.external_id, entry.attempts))
+                self.metrics.increment('SavedReportsMissing')
+            elif self.matches(entry, saved_report):
+                self.metrics.increment('SavedReportsVerified')
+            else:
+                logger.error("Report with external ID '{}' saved in Station "
+                             "differs from the upserted report."
+                             .format(entry.external_id))
+                self.metrics.increment('SavedReportMismatches')
+        self.queue.requeue(retry)
+
+    def matches(self, entry,                       # type: PendingVerification
+                saved                                           # type: Report
+                ):                                      # type: (...) -> bool
+        if entry.digest and self.digester.digest(saved) == entry.digest:
+            return True
+        return ReportComparer.compare(entry.report, saved, self.vars_to_skip)
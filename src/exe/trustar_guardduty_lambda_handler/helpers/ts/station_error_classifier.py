@@ -0,0 +1,97 @@
+# encoding = utf-8
+
+""" StationErrorClassifier class definition. """
+
+import asyncio
+from logging import getLogger
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:                                       # pragma: no cover
+    aiohttp = None
+
+from ..common.circuit_breaker import CircuitOpenError
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class StationErrorClassifier:
+    """ Inspects exceptions raised by the TruStar client to figure out
+    why a call to Station failed. """
+
+    AUTH_STATUS_CODES = (401, 403)
+    TOKEN_ERROR_MESSAGES = ("Expired oauth2 access token",
+                            "Invalid oauth2 access token",
+                            "unable to get token")
+
+    # the categories 'classify' sorts errors into.  They double as metric
+    # names.
+    NOT_FOUND = 'NotFound'
+    THROTTLED = 'Throttled'
+    AUTH = 'Auth'
+    SERVER_ERROR = 'ServerError'
+    CLIENT_ERROR = 'ClientError'
+    CIRCUIT_OPEN = 'CircuitOpen'
+    OTHER = 'Other'
+
+    # errors raised when Station could not be reached at all.
+    CONNECTION_ERRORS = ((ConnectionError, requests.ConnectionError,
+                          requests.Timeout, asyncio.TimeoutError) +
+                         ((aiohttp.ClientConnectionError,) if aiohttp
+                          else ()))
+
+    @staticmethod
+    def status_code_of(e):                       # type: (Exception) -> int
+        """ Returns the HTTP status code of the response attached to the
+        exception, or None if there isn't one. """
+        response = getattr(e, 'response', None)
+        return getattr(response, 'status_code', None)
+
+    @classmethod
+    def is_forbidden(cls, e):                      # type: (Exception) -> bool
+        """ True if Station says the creds lack permission for the call. """
+        return cls.status_code_of(e) == 403
+
+    @classmethod
+    def is_auth_error(cls, e):                     # type: (Exception) -> bool
+        """ True if the exception indicates that Station rejected the
+        client's credentials or token. """
+        if cls.status_code_of(e) in cls.AUTH_STATUS_CODES:
+            return True
+        msg = str(e)
+        return any(m in msg for m in cls.TOKEN_ERROR_MESSAGES)
+
+    @classmethod
+    def classify(cls, e):                           # type: (Exception) -> str
+        """ Sorts a failed Station call into NOT_FOUND, THROTTLED, AUTH,
+        SERVER_ERROR (5xx, or Station unreachable), CLIENT_ERROR (any
+        other 4xx), CIRCUIT_OPEN (the call was not made) or OTHER (not an
+        HTTP failure at all). """
+        if isinstance(e, CircuitOpenError):
+            return cls.CIRCUIT_OPEN
+        status = cls.status_code_of(e)
+        if status == 404:
+            return cls.NOT_FOUND
+        if status == 429:
+            return cls.THROTTLED
+        if cls.is_auth_error(e):
+            return cls.AUTH
+        if status is not None and status >= 500:
+            return cls.SERVER_ERROR
+        if status is not None and status >= 400:
+            return cls.CLIENT_ERROR
+        if isinstance(e, cls.CONNECTION_ERRORS):
+            return cls.SERVER_ERROR
+        return cls.OTHER
+
+    @classmethod
+    def is_transient(cls, e):                      # type: (Exception) -> bool
+        """ True if Station is struggling rather than refusing the call:
+        asking again later may succeed. """
+        return cls.classify(e) in (cls.THROTTLED, cls.SERVER_ERROR)
@@ -0,0 +1,145 @@
+# encoding = utf-8
+
+""" StationRateLimiter class definition. """
+
+import json
+from logging import getLogger
+import time
+
+from ..common.metrics_recorder import MetricsRecorder
+from ..common.retry_policy import RetryPolicy
+from ..common.token_bucket import TokenBucket
+from .station_error_classifier import StationErrorClassifier
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Optional
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class StationRateLimiter:
+    """ Keeps calls to Station within its rate limits:  one token bucket
+    for reads, one for writes.  When Station still answers with a 429, the
+    bucket pauses every caller for the response's Retry-After header (or
+    its "waitTime"), slows down, and the call is queued and made again, up
+    to 'max_throttled_attempts' times.
+
+    The handler sets 'context' to the Lambda context of the invocation in
+    progress:  a 429 is then raised instead of waited out if, after the
+    pause, less than 'deadline_margin' seconds of the invocation would
+    remain.
+
+    Records how long calls waited on the limiter (RateLimitWait) apart
+    from how long Station took to answer them (StationRequest), and counts
+    the 429s (Throttles). """
+
+    READ = 'read'
+    WRITE = 'write'
+
+    def __init__(self, reads_per_second=None,          # type: Optional[float]
+                 writes_per_second=None,               # type: Optional[float]
+                 burst=None,                           # type: Optional[float]
+                 max_throttled_attempts=5,                         # type: int
+                 default_pause=1.0,                              # type: float
+                 max_pause=60.0,                                 # type: float
+                 deadline_margin=1.0,                            # type: float
+                 metrics=None                 # type: Optional[MetricsRecorder]
+                 ):
+        self.buckets = {self.READ: TokenBucket(reads_per_second, burst),
+                        self.WRITE: TokenBucket(writes_per_second, burst)}
+        self.max_throttled_attempts = max_throttled_attempts       # type: int
+        self.default_pause = default_pause                       # type: float
+        self.max_pause = max_pause                               # type: float
+        self.deadline_margin = deadline_margin                   # type: float
+        self.metrics = metrics or MetricsRecorder()    # type: MetricsRecorder
+        self.context = None                                        # type: Any
+
+    def call(self, kind,                                           # type: str
+             fn                                       # type: Callable[[], Any]
+             ):                                            # type: (...) -> Any
+        """ Makes the call once the 'kind' bucket allows it. """
+        bucket = self.buckets[kind]
+        attempt = 0
+        while True:
+            attempt += 1
+            self.record_wait(bucket.acquire())
+            start = time.perf_counter()
+            try:
+                value = fn()
+            except Exception as e:
+                self.record_request(start)
+                self.handle_error(bucket, e, attempt)
+                continue
+            self.record_request(start)
+            bucket.succeeded()
+            return value
+
+    async def call_async(self, kind,                               # type: str
+                         fn                     # type: Callable[[], Awaitable]
+                         ):                                # type: (...) -> Any
+        """ The asyncio counterpart of 'call'.  fn returns an awaitable. """
+        bucket = self.buckets[kind]
+        attempt = 0
+        while True:
+            attempt += 1
+            self.record_wait(await bucket.acquire_async())
+            start = time.perf_counter()
+            try:
+                value = await fn()
+            except Exception as e:
+                self.record_request(start)
+                self.handle_error(bucket, e, attempt)
+                continue
+            self.record_request(start)
+            bucket.succeeded()
+            return value
+
+    def handle_error(self, bucket,                         # type: TokenBucket
+                     e,                                       # type: Exception
+                     attempt                                       # type: int
+                     ):                                 # type: (...) -> None
+        """ Re-raises e, unless it's a 429 worth waiting out:  then pauses
+        the bucket so the call can be queued again. """
+        if StationErrorClassifier.status_code_of(e) != 429:
+            raise e
+        self.metrics.increment('Throttles')
+        pause = self.pause_for(e)
+        if attempt >= self.max_throttled_attempts or pause > self.max_pause:
+            logger.error("Station throttled the call '{}' time(s);  asked to "
+                         "wait '{}' second(s).  Giving up."
+                         .format(attempt, pause))
+            raise e
+        remaining = RetryPolicy.remaining_seconds(self.context)
+        if remaining is not None and remaining - pause < self.deadline_margin:
+            logger.error("Station asked to wait '{}' second(s), but the "
+                         "Lambda's deadline is '{}' second(s) away.  Giving "
+                         "up.".format(pause, remaining))
+            raise e
+        logger.warning("Station throttled the call.  Pausing calls for '{}' "
+                       "second(s).".format(pause))
+        bucket.throttled(pause)
+
+    def pause_for(self, e):                       # type: (Exception) -> float
+        """ Station's Retry-After header, else the "waitTime" (ms) in the
+        response body, else 'default_pause'. """
+        response = getattr(e, 'response', None)
+        headers = getattr(response, 'headers', None) or {}
+        # noinspection PyBroadException
+        try:
+            return float(headers['Retry-After'])
+        except Exception:
+            pass
+        # noinspection PyBroadException
+        try:
+            return json.loads(response.content)['waitTime'] / 1000.0
+        except Exception:
+            return self.default_pause
+
+    def record_wait(self, seconds):                     # type: (float) -> None
+        self.metrics.add_timing('RateLimitWait', seconds * 1000.0)
+
+    def record_request(self, start):                    # type: (float) -> None
+        self.metrics.add_timing('StationRequest',
+                                (time.perf_counter() - start) * 1000.0)
@@ -0,0 +1,68 @@
+# encoding = utf-8
+
+""" TokenApiClient class definition. """
+
+import threading
+
+from trustar.api_client import ApiClient
+
+from .token_provider import TokenProvider
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict
+    from requests import Response
+
+
+class TokenApiClient(ApiClient):
+    """ The TruStar client's ApiClient, with its OAuth token taken from a
+    TokenProvider instead of fetched by each client.
+
+    A request whose token Station rejects (a 401, or the 400 Station sends
+    for an expired token) is retried once with a fresh token;  if that one
+    is rejected too, the error is raised.  Tokens are tracked per thread,
+    since the concurrent upserter shares one client between threads. """
+
+    def __init__(self, config,                                    # type: Dict
+                 provider                                # type: TokenProvider
+                 ):
+        super().__init__(config=config)
+        self.provider = provider                         # type: TokenProvider
+        self._local = threading.local()
+
+    @classmethod
+    def replacing(cls, client,                               # type: ApiClient
+                  provider                               # type: TokenProvider
+                  ):                                # type: (...) -> ApiClient
+        """ A TokenApiClient configured like the TruStar client's own
+        'client'. """
+        token_client = cls.__new__(cls)
+        token_client.__dict__.update(vars(client))
+        token_client.provider = provider
+        token_client._local = threading.local()
+        return token_client
+
+    def request(self, method, path, headers=None, params=None, data=None,
+                **kwargs):                        # type: (...) -> Response
+        self._local.refreshed = False
+        return super().request(method, path, headers=headers, params=params,
+                               data=data, **kwargs)
+
+    def _get_token(self):                                    # type: () -> str
+        self.token = self._local.token = self.provider.get()
+        return self.token
+
+    def _refresh_token(self):                               # type: () -> None
+        self.token = self.provider.refresh(
+            stale=getattr(self._local, 'token', None))
+
+    def _is_expired_token_response(self, response):
+                                                   # type: (Response) -> bool
+        """ True the first time a request's token is rejected, which has
+        ApiClient.request refresh it and retry. """
+        if getattr(self._local, 'refreshed', False):
+            return False
+        rejected = (response.status_code == 401 or
+                    ApiClient._is_expired_token_response(response))
+        self._local.refreshed = rejected
+        return rejected
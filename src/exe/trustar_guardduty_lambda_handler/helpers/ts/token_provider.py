@@ -0,0 +1,185 @@
+# encoding = utf-8
+
+""" TokenProvider class definition. """
+
+import json
+from logging import getLogger
+import os
+import threading
+import time
+
+import requests
+from requests import HTTPError
+from trustar import TruStar
+
+from ..common.metrics_recorder import MetricsRecorder
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Optional, Tuple
+    from logging import Logger
+
+logger = getLogger(__name__)                                    # type: Logger
+
+
+class TokenProvider:
+    """ Hands out the OAuth token of one set of API creds, so that the
+    TruStar clients built for them don't each fetch their own.
+
+    The token and its expiry live in process memory and, if a file path
+    is given, are also persisted to that file (ex:  in /tmp) so that the
+    next handler built in a warm container, or another container on the
+    same host, skips the auth call.  Entries are keyed by a fingerprint of
+    the API creds, never by the creds themselves.
+
+    Within 'refresh_margin' seconds of its expiry, the token is still
+    handed out but a background thread fetches the next one.  Only an
+    expired or rejected token makes a caller wait on the auth endpoint.
+    Each fetch is timed (AuthRequest) and counted (TokenRefreshes). """
+
+    # how long a token is assumed to live if Station doesn't say.
+    DEFAULT_EXPIRES_IN = 600.0
+    DEFAULT_REFRESH_MARGIN = 300.0
+
+    def __init__(self, params,                        # type: Dict[str, str]
+                 cache_key,                                        # type: str
+                 file_path=None,                         # type: Optional[str]
+                 refresh_margin=DEFAULT_REFRESH_MARGIN,          # type: float
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 clock=time.time                 # type: Callable[[], float]
+                 ):
+        config = dict(TruStar.DEFAULTS)
+        config.update({TruStar.REMAPPED_KEYS.get(k, k): v
+                       for k, v in params.items() if v is not None})
+        self.auth = config['auth']                                 # type: str
+        self.api_key = config['api_key']                           # type: str
+        self.api_secret = config['api_secret']                     # type: str
+        self.proxies = {k: config[k + '_proxy'] for k in ('http', 'https')
+                        if config.get(k + '_proxy')}    # type: Dict[str, str]
+        self.verify = TruStar.parse_boolean(config.get('verify'))
+        self.cache_key = cache_key                                 # type: str
+        self.file_path = file_path                       # type: Optional[str]
+        self.refresh_margin = refresh_margin                     # type: float
+        self.metrics = metrics or MetricsRecorder()    # type: MetricsRecorder
+        self.clock = clock
+        self._entry = None          # type: Optional[Tuple[str, float]]
+        self._lock = threading.Lock()
+        # separate, so that starting a background refresh never waits on
+        # a refresh that holds '_lock'.
+        self._background_lock = threading.Lock()
+        self._background = None              # type: Optional[threading.Thread]
+
+    def get(self):                                           # type: () -> str
+        """ Returns a live token, fetching one if there is none. """
+        return self.cached() or self.refresh()
+
+    def cached(self):                              # type: () -> Optional[str]
+        """ Returns the cached token, or None if it's missing or expired.
+        Never waits on the auth endpoint;  if the token is about to
+        expire, the next one is fetched in the background. """
+        entry = self._entry
+        if entry is None:
+            with self._lock:
+                entry = self._entry = self._entry or self._load_from_file()
+        if entry is None:
+            return None
+        token, expires_at = entry
+        now = self.clock()
+        if now >= expires_at:
+            return None
+        if now >= expires_at - self.refresh_margin:
+            self.refresh_in_background(token)
+        return token
+
+    def refresh(self, stale=None):          # type: (Optional[str]) -> str
+        """ Fetches a new token unless another thread already replaced the
+        stale one (ex:  the token Station just rejected) while this one
+        waited for the lock. """
+        with self._lock:
+            entry = self._entry
+            if (entry is not None and entry[0] != stale
+                    and self.clock() < entry[1]):
+                return entry[0]
+            with self.metrics.span('AuthRequest'):
+                token, expires_in = self.fetch()
+            self.metrics.increment('TokenRefreshes')
+            self._entry = (token, self.clock() + expires_in)
+            self._save_to_file(self._entry)
+            return token
+
+    def refresh_in_background(self, stale):               # type: (str) -> None
+        """ Starts fetching the next token, unless that's already
+        underway. """
+        with self._background_lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            self._background = threading.Thread(
+                target=self._refresh_quietly, args=(stale,),
+                name='token-refresh', daemon=True)
+            self._background.start()
+
+    def _refresh_quietly(self, stale):                    # type: (str) -> None
+        # noinspection PyBroadException
+        try:
+            self.refresh(stale)
+        except Exception as e:
+            logger.warning("Could not refresh the OAuth token ahead of its "
+                           "expiry:  {}".format(e))
+
+    def fetch(self):                            # type: () -> Tuple[str, float]
+        """ Calls the auth endpoint.  Returns the token and the seconds it
+        lives for. """
+        logger.info("Fetching an OAuth token from Station.")
+        response = requests.post(
+            self.auth,
+            auth=requests.auth.HTTPBasicAuth(self.api_key, self.api_secret),
+            data={'grant_type': 'client_credentials'},
+            verify=self.verify, proxies=self.proxies)
+        if response.status_code >= 400:
+            msg = "{} {} Error (Trace-Id: {}): unable to get token".format(
+                response.status_code,
+                "Client" if response.status_code < 500 else "Server",
+                response.headers.get('Trace-Id'))
+            raise HTTPError(msg, response=response)
+        body = response.json()
+        return (body['access_token'],
+                float(body.get('expires_in') or self.DEFAULT_EXPIRES_IN))
+
+    def _read_file(self):                                   # type: () -> Dict
+        if not self.file_path or not os.path.exists(self.file_path):
+            return {}
+        # noinspection PyBroadException
+        try:
+            with open(self.file_path) as f:
+                return json.load(f)
+        except Exception:
+            logger.warning("Could not read OAuth token cache file '{}'.  "
+                           "Ignoring it.".format(self.file_path))
+            return {}
+
+    def _load_from_file(self):        # type: () -> Optional[Tuple[str, float]]
+        d = self._read_file().get(self.cache_key)
+        if not d:
+            return None
+        return d['access_token'], d['expires_at']
+
+    def _save_to_file(self, entry):         # type: (Tuple[str, float]) -> None
+        """ Writes the entry to the file, readable only by this user.
+        Writes to a temp file first so readers never see a partial
+        file. """
+        if not self.file_path:
+            return
+        d = self._read_file()
+        d[self.cache_key] = {'access_token': entry[0],
+                             'expires_at': entry[1]}
+        tmp_path = "{}.{}.tmp".format(self.file_path, os.getpid())
+        # noinspection PyBroadException
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(d, f)
+            os.replace(tmp_path, self.file_path)
+        except Exception:
+            logger.warning("Could not write OAuth token cache file '{}'."
+                           .format(self.file_path))
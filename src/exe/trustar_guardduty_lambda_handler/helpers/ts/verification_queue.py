@@ -0,0 +1,83 @@
+# encoding = utf-8
+
+""" VerificationQueue and PendingVerification class definitions. """
+
+from collections import OrderedDict
+import threading
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+    from trustar import Report
+
+
+class PendingVerification:
+    """ An upserted report waiting to be checked against Station. """
+
+    def __init__(self, report,                                  # type: Report
+                 digest,                                 # type: Optional[str]
+                 queued_at,                                      # type: float
+                 attempts=0                                        # type: int
+                 ):
+        self.report = report                                    # type: Report
+        self.digest = digest                             # type: Optional[str]
+        self.queued_at = queued_at                               # type: float
+        self.attempts = attempts                                   # type: int
+
+    @property
+    def external_id(self):                                   # type: () -> str
+        return self.report.external_id
+
+
+class VerificationQueue:
+    """ Holds upserted reports until they are verified, oldest first.  A
+    report upserted again replaces its pending version, since only the
+    latest upsert should be in Station.  Keeps at most 'max_entries',
+    dropping the oldest.  Lives as long as the Lambda container. """
+
+    DEFAULT_MAX_ENTRIES = 10000
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):  # type: (int) -> None
+        if max_entries < 1:
+            raise Exception("max_entries must be at least 1.")
+        self.max_entries = max_entries                             # type: int
+        self._entries = OrderedDict()  # type: Dict[str, PendingVerification]
+        self.dropped = 0                                           # type: int
+        self._lock = threading.Lock()
+
+    def __len__(self):                                       # type: () -> int
+        return len(self._entries)
+
+    def put(self, entry):                 # type: (PendingVerification) -> None
+        with self._lock:
+            self._entries.pop(entry.external_id, None)
+            self._entries[entry.external_id] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.dropped += 1
+
+    def take(self, queued_before=None,             # type: Optional[float]
+             max_entries=None                        # type: Optional[int]
+             ):                      # type: (...) -> List[PendingVerification]
+        """ Removes and returns, oldest first, the entries queued before
+        'queued_before' (all of them if None), up to 'max_entries'. """
+        taken = []                           # type: List[PendingVerification]
+        with self._lock:
+            for external_id, entry in list(self._entries.items()):
+                if max_entries is not None and len(taken) >= max_entries:
+                    break
+                if queued_before is not None and \
+                        entry.queued_at >= queued_before:
+                    break
+                del self._entries[external_id]
+                taken.append(entry)
+        return taken
+
+    def requeue(self, entries):     # type: (List[PendingVerification]) -> None
+        """ Puts entries back, unless a newer version was queued since they
+        were taken. """
+        with self._lock:
+            for entry in reversed(entries):
+                if entry.external_id not in self._entries:
+                    self._entries[entry.external_id] = entry
+                    self._entries.move_to_end(entry.external_id, last=False)
@@ -2,79 +2,408 @@
 
 """ TruSTAR's Guard Duty Finding Lambda Handler. """
 
+from collections import OrderedDict
 from logging import getLogger
-import os
+import time
 
-from .helpers.gd.report_builder import GuardDutyReportBuilder
+from trustar import IdType
+
+from .base_handler import BaseHandler
+from .helpers.aws.batch_event_parser import BatchEventParser
+from .helpers.aws.batch_summary import BatchSummary
+from .helpers.common.retry_policy import RetryPolicy
+from .helpers.ts.concurrent_upserter import ConcurrentUpserter
 from .helpers.ts.enclave_permissions_checker import EnclavePermissionsChecker
 from .helpers.ts.report_upserter import ReportUpserter
 from .helpers.ts.client_builder import ClientBuilder
 from .helpers.ts.report_comparer import ReportComparer
 from .helpers.ts.report_details_fetcher import ReportDetailsFetcher
+from .helpers.ts.routing_upserter import RoutingUpserter
+from .helpers.ts.saved_report_verifier import SavedReportVerifier
+from .helpers.ts.station_error_classifier import StationErrorClassifier
+from .helpers.ts.verification_queue import VerificationQueue
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import Dict
+    from typing import Any, Dict, List, Optional, Set, Tuple, Union
     from logging import Logger
+    from .handler_config import HandlerConfig
+    from .helpers.aws.idempotency_store import IdempotencyStore
+    from .helpers.aws.upsert_spool import SpoolEntry, UpsertSpool
+    from .helpers.ts.report_index import ReportIndex
+    from .helpers.aws.batch_item import BatchItem
+    from .helpers.common.metrics_recorder import MetricsRecorder
+    from .helpers.gd.finding_aggregator import RollupGroup
+    from .helpers.gd.finding_coalescer import CoalescedFinding
+    from .helpers.ts.enclave_permissions_cache import EnclavePermissionsCache
+    from .helpers.ts.concurrent_upserter import UpsertResult
     from trustar import Report, TruStar
 
 logger = getLogger(__name__)                                    # type: Logger
 
 
-class TruStarGuardDutyLambdaHandler:
+class TruStarGuardDutyLambdaHandler(BaseHandler):
     """ The Lambda function handler for Guard Duty events. """
 
-    CLIENT_METATAG = "AWS_GUARD_DUTY"
-    VARS_TO_SKIP = ("created", "updated", "id")
+    # a drain stops taking batches with less of the invocation left.
+    DRAIN_MIN_REMAINING_SECONDS = 10.0
 
-    def __init__(self):
+    def __init__(self, config=None,                    # type: HandlerConfig
+                 permissions_cache=None,       # type: EnclavePermissionsCache
+                 report_index=None,             # type: Optional[ReportIndex]
+                 metrics=None,                # type: Optional[MetricsRecorder]
+                 idempotency_store=None,   # type: Optional[IdempotencyStore]
+                 upsert_spool=None              # type: Optional[UpsertSpool]
+                 ):
         logger.info("Initializing lambda handler.")
-        destination_enclave = os.environ['ENCLAVE_ID']             # type: str
-        ts = ClientBuilder.from_env_vars(
-            client_metatag=self.CLIENT_METATAG)                # type: TruStar
+        super().__init__(config, permissions_cache, report_index, metrics,
+                         idempotency_store, upsert_spool)
+        config = self.config                             # type: HandlerConfig
+        permissions_cache = self.permissions_cache
+        perms_key = self.perms_key                                 # type: str
+        destination_enclaves = self.router.enclave_ids       # type: List[str]
+        with self.metrics.span('ClientBuild'):
+            ts = ClientBuilder.from_params(
+                client_metatag=self.CLIENT_METATAG,
+                params=config.client_params,
+                limiter=self.limiter,
+                token_provider=config.build_token_provider(
+                    self.metrics))                             # type: TruStar
 
-        permissions_checker = EnclavePermissionsChecker(ts)
-        if not permissions_checker.can_create(destination_enclave):
+        with self.metrics.span('PermissionCheck'):
+            permissions_checker = EnclavePermissionsChecker(
+                ts, cache=permissions_cache, cache_key=perms_key)
+            forbidden = [e for e in destination_enclaves
+                         if not permissions_checker.can_create(e)]
+        if forbidden:
+            permissions_cache.invalidate(perms_key)
             raise Exception("TruSTAR API creds do not have permissions to "
-                            "write to enclave '{}'."
-                            .format(destination_enclave))
+                            "write to enclave(s) '{}'."
+                            .format("', '".join(forbidden)))
 
-        self.builder = GuardDutyReportBuilder(destination_enclave)
-        self.upserter = ReportUpserter(ts, destination_enclave)
-        self.details_fetcher = ReportDetailsFetcher(ts)
+        self.upserter = RoutingUpserter.for_enclaves(
+            destination_enclaves, lambda enclave_id: ReportUpserter(
+                ts, enclave_id,
+                on_forbidden=lambda: permissions_cache.invalidate(perms_key),
+                retry_policy=config.retry_policy(config.lookup_max_attempts),
+                index=self.report_index,
+                digester=self.digester,
+                metrics=self.metrics,
+                breaker=self.breaker,
+                limiter=self.limiter))
+        self.concurrent_upserter = ConcurrentUpserter(
+            self.upserter, max_workers=config.upsert_workers)
+        self.details_fetcher = ReportDetailsFetcher(
+            ts, config.retry_policy(config.saved_report_max_attempts),
+            metrics=self.metrics)
+        self.verifier = None          # type: Optional[SavedReportVerifier]
+        if config.defers_saved_report_check:
+            self.verifier = SavedReportVerifier(
+                ts, destination_enclaves, self.VARS_TO_SKIP,
+                queue=VerificationQueue(config.verification_queue_max_entries),
+                digester=config.build_report_digester(),
+                delay=config.saved_report_verify_delay,
+                metrics=self.metrics)
         self.ts = ts
 
-    def handle(self, event):                            # type: (Dict) -> Dict
-        """ Processes a Guard-duty event. """
+    def handle(self, event,                                       # type: Dict
+               context=None                                        # type: Any
+               ):                                       # type: (...) -> Dict
+        """ Processes a Guard-duty event.  The Lambda 'context', if given,
+        is used to stop waiting on Station before the Lambda's deadline. """
         logger.info("starting lambda handler.")
-        report = self.builder.build_for(event)                  # type: Report
-        upserted = self.upserter.upsert(report)                 # type: Report
+        self.limiter.context = context
+        if self.is_duplicate(event):
+            return self.duplicate_result(event)
+        filtered = self.filtered_result(event)          # type: Optional[Dict]
+        if filtered is not None:
+            self.settle_claim(event, failed=False)
+            return filtered
+        reports = []                                      # type: List[Report]
+        try:
+            with self.metrics.span('BuildReport'):
+                reports = self.build_routed(event)
+            upserted = self.upsert_routed(reports)        # type: List[Report]
+        except Exception as e:
+            spooled = self.spooled_result(event, reports, e)
+            self.settle_claim(event, failed=spooled is None)
+            if spooled is not None:
+                return spooled
+            raise
+        self.settle_claim(event, failed=False)
+        self.supersede_spooled([r.external_id for r in upserted])
+        result = self.routed_result(
+            [self.result_for(r, context) for r in upserted], event)
+        self.verify_due(context)
+        return result
+
+    def build_routed(self, finding):             # type: (Dict) -> List[Report]
+        """ Builds the finding's report for each enclave it is routed to,
+        none if it is routed nowhere.  If findings are rolled up, these are
+        the reports of the finding's groups, with the finding added. """
+        enclave_ids = self.router.route(finding)
+        if self.aggregator is None or not self.aggregator.aggregates(finding):
+            return self.builder.build_for_enclaves(finding, enclave_ids)
+        reports = []                                      # type: List[Report]
+        for enclave_id in enclave_ids:
+            group = self.aggregator.group_for(finding, enclave_id)
+            if not group.loaded:
+                self.load_rollup(group)
+            self.aggregator.add(finding, group)
+            reports.append(self.aggregator.report_for(group))
+        return reports
+
+    def load_rollup(self, group):                # type: (RollupGroup) -> None
+        """ Reads a group's members back from its report in Station, the
+        first time the container sees the group.  Indexes the report, so
+        that upserting it next is a single update. """
+        upserter = self.upserter.upserters[group.enclave_id]
+        with self.metrics.span('LoadRollup'):
+            existing = upserter.fetch_existing_report(group.external_id)
+        group.restore(existing.body if existing else None)
+        if existing:
+            upserter.index_upserted(existing)
+
+    def upsert_routed(self, reports):    # type: (List[Report]) -> List[Report]
+        """ Upserts one finding's reports, concurrently if it was routed to
+        more than one enclave.  Raises the first failure. """
+        if len(reports) == 1:
+            with self.metrics.span('Upsert'):
+                return [self.upserter.upsert(reports[0])]
+        results = self.concurrent_upserter.upsert_all(
+            reports)                               # type: List[UpsertResult]
+        for result in results:
+            self.metrics.add_timing('Upsert', result.seconds * 1000.0)
+        for result in results:
+            if result.failed:
+                raise result.error
+        return [result.upserted for result in results]
+
+    def result_for(self, upserted,                              # type: Report
+                   context=None                                    # type: Any
+                   ):                                   # type: (...) -> Dict
+        """ Returns the upserted report, or the report saved in Station if
+        the user wants the saved report checked. """
         if not self.check_saved_report:
             logger.info("lambda handler complete. returning upserted.")
             return upserted.to_dict()
 
+        if self.verifier is not None:
+            self.verifier.defer(upserted)
+            logger.info("lambda handler complete. saved report check "
+                        "deferred, returning upserted.")
+            return upserted.to_dict()
+
         saved = self.details_fetcher.fetch_for(
-            upserted.external_id)                       # type: Report or None
+            upserted.external_id, context)              # type: Report or None
         if not saved:
             logger.error("Failed to fetch saved report from Station. "
                          "Ending lambda, returning the upserted report.")
             return upserted.to_dict()
 
-        _ = ReportComparer.compare(upserted, saved, self.VARS_TO_SKIP)
+        with self.metrics.span('CompareReport'):
+            _ = ReportComparer.compare(upserted, saved, self.VARS_TO_SKIP)
         logger.info("lambda handler complete. returning report from "
                     "enclave.")
         return saved.to_dict()
 
+    def handle_batch(self, event,                  # type: Union[Dict, List]
+                     context=None                                  # type: Any
+                     ):                                 # type: (...) -> Dict
+        """ Processes an SQS batch or a list of Guard-duty events.  Returns
+        the "batchItemFailures" of the findings that failed. """
+        items = BatchEventParser.parse(event)          # type: List[BatchItem]
+        start = time.perf_counter()
+        self.process_batch(items, context)
+        summary = BatchSummary(items, time.perf_counter() - start)
+        summary.log()
+        return summary.response()
+
+    def process_batch(self, items,                     # type: List[BatchItem]
+                      context=None                                 # type: Any
+                      ):                                # type: (...) -> None
+        """ Builds a report for the newest version of each finding, in each
+        enclave it is routed to, and upserts the reports concurrently.
+        Records each item's result or error on the item instead of raising.
+        Items whose events were already delivered, and findings the filter
+        drops, are acknowledged without calling Station.  A rollup report is
+        upserted once per batch, with every member the batch added.  Items
+        whose upserts failed because Station was struggling are spooled, if
+        there is a spool, and acknowledged. """
+        self.limiter.context = context
+        claimed = self.drop_duplicates(items)          # type: List[BatchItem]
+        coalesced = self.coalesce(claimed)      # type: List[CoalescedFinding]
+        # a rollup's newest report replaces the batch's previous one.
+        built = OrderedDict()      # type: Dict[Any, Tuple[List, Report]]
+        routed = OrderedDict()        # type: Dict[BatchItem, List[Dict]]
+        item_reports = {}              # type: Dict[BatchItem, List[Report]]
+        for item in [c.item for c in coalesced]:
+            start = time.perf_counter()
+            # noinspection PyBroadException
+            try:
+                item.result = self.filtered_result(item.finding)
+                if item.result is not None:
+                    continue
+                with self.metrics.span('BuildReport'):
+                    reports = self.build_routed(item.finding)
+                for report in reports:
+                    key = (report.external_id if self.is_rollup(report)
+                           else id(report))
+                    built_items = built.get(key, ([], None))[0]
+                    built[key] = (built_items + [item], report)
+                routed[item] = []
+                item_reports[item] = reports
+                item.error = None
+            except Exception as e:
+                logger.exception("Failed to build report for batch item "
+                                 "'{}'.".format(item.item_id))
+                item.error = e
+            item.seconds = time.perf_counter() - start
+
+        reports = [report for _, report in built.values()]
+        results = self.concurrent_upserter.upsert_all(
+            reports)                              # type: List[UpsertResult]
+        for (built_items, _), result in zip(built.values(), results):
+            self.metrics.add_timing('Upsert', result.seconds * 1000.0)
+            start = time.perf_counter()
+            upserted = (None if result.failed else
+                        self.result_for(result.upserted, context))
+            seconds = result.seconds + time.perf_counter() - start
+            for item in built_items:
+                item.seconds += seconds
+                if result.failed:
+                    item.error = result.error
+                else:
+                    routed[item].append(upserted)
+        self.supersede_spooled([r.upserted.external_id for r in results
+                                if not r.failed])
+        for item, item_results in routed.items():
+            if not item.failed:
+                item.result = self.routed_result(item_results, item.finding)
+                continue
+            spooled = self.spooled_result(item.finding, item_reports[item],
+                                          item.error)
+            if spooled is not None:
+                item.error, item.result = None, spooled
+        for c in coalesced:
+            c.share_outcome()
+        self.settle_claims(claimed)
+        self.record_spool_gauges()
+        self.verify_due(context)
+
+    def drain_spool(self, context=None):                  # type: (Any) -> Dict
+        """ Upserts the spooled reports that are due, concurrently, a batch
+        at a time, until none are due, the circuit breaker opens or the
+        Lambda's deadline is near.  Each report is tried once per drain.
+        A report that fails again is tried again after a longer backoff,
+        unless Station refused it for good (ex:  a 400), then it is
+        dropped.  A report that Station saved again since it was spooled
+        is dropped without being upserted.  Returns how many reports were
+        drained, failed again, dropped and are left. """
+        self.limiter.context = context
+        spool = self.upsert_spool
+        if spool is None:
+            return {'drained': 0, 'failed': 0, 'dropped': 0, 'depth': 0}
+        drained = failed = dropped = 0
+        tried = set()
+        with self.metrics.span('DrainSpool'):
+            while not self.drain_deadline_near(context):
+                entries = [e for e in spool.due() if e.key not in tried
+                           ][:self.config.upsert_spool_drain_batch]
+                if not entries:
+                    break
+                tried.update(e.key for e in entries)
+                superseded = self.superseded_keys(entries)
+                if superseded:
+                    spool.ack(superseded, 'SpoolSuperseded')
+                    entries = [e for e in entries if e.key not in superseded]
+                    if not entries:
+                        continue
+                results = self.concurrent_upserter.upsert_all(
+                    [e.report for e in entries])  # type: List[UpsertResult]
+                done, refused = [], []                     # type: List[str]
+                for entry, result in zip(entries, results):
+                    if not result.failed:
+                        done.append(entry.key)
+                    elif (StationErrorClassifier.classify(result.error)
+                          == StationErrorClassifier.CIRCUIT_OPEN):
+                        # a call the breaker refused isn't an attempt.
+                        tried.discard(entry.key)
+                    elif (spool.is_spoolable(result.error)
+                          or StationErrorClassifier.is_auth_error(
+                              result.error)):
+                        spool.retry_later(entry, result.error)
+                        failed += 1
+                    else:
+                        logger.error("Station refused spooled report '{}':"
+                                     "  {}  Dropping it."
+                                     .format(entry.key, result.error))
+                        refused.append(entry.key)
+                spool.ack(done)
+                spool.ack(refused, 'SpoolDropped')
+                drained += len(done)
+                dropped += len(refused)
+                if not tried.intersection(e.key for e in entries):
+                    # every call was refused by the breaker.
+                    break
+                if self.breaker is not None and (
+                        self.breaker.state == self.breaker.OPEN):
+                    logger.warning("Circuit breaker opened.  Stopping the "
+                                   "spool drain.")
+                    break
+        spool.record_gauges()
+        logger.info("Drained '{}' spooled report(s);  '{}' failed again, "
+                    "'{}' dropped.".format(drained, failed, dropped))
+        return {'drained': drained, 'failed': failed, 'dropped': dropped,
+                'depth': len(spool)}
+
+    def superseded_keys(self, entries     # type: List[SpoolEntry]
+                        ):                            # type: (...) -> Set[str]
+        """ The keys of the spooled reports that Station saved again after
+        they were spooled, ex:  by another container, which only acks
+        the spool entries it read.  Upserting them would overwrite a newer
+        version.  A report that can't be fetched is upserted. """
+        def is_superseded(entry):                # type: (SpoolEntry) -> bool
+            def fetch():                                  # type: () -> Report
+                return self.ts.get_report_details(entry.key,
+                                                  id_type=IdType.EXTERNAL)
+            # noinspection PyBroadException
+            try:
+                saved = (fetch() if self.breaker is None
+                         else self.breaker.call(fetch))    # type: Report
+            except Exception:
+                return False
+            return (saved.updated is not None
+                    and saved.updated > entry.spooled_at * 1000)
+        return {e.key for e, superseded in zip(
+            entries, self.concurrent_upserter.executor.map(
+                is_superseded, entries)) if superseded}
+
+    def drain_deadline_near(self, context):               # type: (Any) -> bool
+        remaining = RetryPolicy.remaining_seconds(context)
+        return (remaining is not None
+                and remaining < self.DRAIN_MIN_REMAINING_SECONDS)
+
+    def verify_due(self, context=None,                             # type: Any
+                   everything=False                               # type: bool
+                   ):                                    # type: (...) -> int
+        """ Runs a verification pass over the deferred saved report checks
+        that are due, if checks are deferred.  Returns how many reports
+        were checked. """
+        self.limiter.context = context
+        if self.verifier is None:
+            return 0
+        return self.verifier.verify_due(context, everything)
+
+    def close(self):                                        # type: () -> None
+        """ Releases the handler's worker threads. """
+        self.concurrent_upserter.shutdown()
+
     @property
     def check_saved_report(self):                           # type: () -> bool
         """ Determines whether the user specified to check the report saved
         in Station against the report it upserted. """
-        check = False
-        env_var = os.environ.get("RETURN_SAVED_REPORT")
-        if isinstance(env_var, str):
-            check = env_var == "True"
-        elif isinstance(env_var, bool):
-            check = env_var
+        check = self.config.return_saved_report                  # type: bool
         if check:
             logger.info("user wants saved report checked.")
         else:
@@ -0,0 +1,19 @@
+# encoding = utf-8
+
+""" Benchmarks that measure the lambda handler's performance against a
+fake, local stand-in for TruSTAR Station.  They do not need an internet
+connection.  Run them from the repo root with "src/exe" on the
+PYTHONPATH, e.g.:
+
+    $ PYTHONPATH=src/exe python -m tests.benchmarks.bench_handler_reuse
+
+"bench_suite" drives the Lambda entry points over real HTTP against a local
+Station server ("station_server"), optionally injecting 500s and 429s, and
+can save its results as a baseline and compare later runs against it.
+"finding_generator" generates synthetic findings across the GuardDuty
+finding families, as JSONL or fed straight into a handler at a set rate.
+"bench_report_builder" times building reports from small and large
+findings in each report body format;  "bench_body_shaper" measures the
+body bytes and peak memory of pathological findings, shaped or not.
+"bench_external_ids" times the per-ID cost of encoding external IDs.
+"""
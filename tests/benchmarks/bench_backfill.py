@@ -0,0 +1,127 @@
+# encoding = utf-8
+
+""" Backfills generated findings, written to gzipped JSON lines files,
+into a fake Station with per-call latency, and reports the throughput
+(findings per second and per hour) and the peak memory (tracemalloc) of
+the run, and of only reading the files.  The latter should not grow with
+-n;  the former also holds the fake Station's reports and the handler's
+(bounded) report index and idempotency store. """
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import tempfile
+import tracemalloc
+from unittest import mock
+
+from trustar_guardduty_lambda_handler import BackfillRunner, HandlerConfig, \
+    TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler.helpers.aws.finding_source import \
+    FindingSource
+from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+    ClientBuilder
+
+from .fake_station import FakeStation, FakeTruStar
+from .finding_generator import FindingGenerator
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+
+class BackfillBenchmark:
+    """ Writes 'n' findings across 'n_files' files, then backfills them. """
+
+    def __init__(self, n,                                          # type: int
+                 n_files,                                          # type: int
+                 latency,                                        # type: float
+                 workers,                                          # type: int
+                 batch_size                                        # type: int
+                 ):
+        self.n = n                                                 # type: int
+        self.n_files = n_files                                     # type: int
+        self.workers = workers                                     # type: int
+        self.batch_size = batch_size                               # type: int
+        self.station = FakeStation([ENCLAVE_ID], latency=latency)
+
+    def write_files(self, directory):                     # type: (str) -> int
+        gen = FindingGenerator(seed=0, unique_ratio=0.7)
+        per_file = -(-self.n // self.n_files)
+        for i in range(self.n_files):
+            path = os.path.join(directory, 'findings-{:04d}.jsonl.gz'
+                                .format(i))
+            with gzip.open(path, 'wt') as f:
+                for _ in range(min(per_file, self.n - i * per_file)):
+                    f.write(json.dumps(gen.next_event()['detail']) + '\n')
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for name in os.listdir(directory))
+
+    @staticmethod
+    def read_peak(directory):                             # type: (str) -> int
+        """ The peak memory of streaming every finding, without
+        upserting them. """
+        source = FindingSource([directory])
+        tracemalloc.start()
+        try:
+            for location, _ in source.objects():
+                for _ in source.findings(location):
+                    pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def run(self):                                          # type: () -> Dict
+        env = {'ENCLAVE_ID': ENCLAVE_ID,
+               'USER_API_KEY': 'bench-key',
+               'USER_API_SECRET': 'bench-secret',
+               'PERMISSIONS_CACHE_PATH': '',
+               'TOKEN_CACHE_PATH': '',
+               'UPSERT_WORKERS': str(self.workers)}
+        build = lambda *args, **kwargs: FakeTruStar(self.station)
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(os.environ, env), \
+                mock.patch.object(ClientBuilder, 'from_params', build):
+            input_bytes = self.write_files(directory)
+            read_peak = self.read_peak(directory)
+            handler = TruStarGuardDutyLambdaHandler(
+                HandlerConfig.from_env_vars())
+            runner = BackfillRunner(handler, FindingSource([directory]),
+                                    batch_size=self.batch_size,
+                                    log_every=5.0)
+            tracemalloc.start()
+            try:
+                result = runner.run()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                handler.close()
+        result.update({
+            'input_kb': round(input_bytes / 1024.0, 1),
+            'findings_per_hour': int(result['findings_per_second'] * 3600),
+            'peak_mem_kb': round(peak / 1024.0, 1),
+            'read_peak_mem_kb': round(read_peak / 1024.0, 1),
+            'station_calls': dict(self.station.calls)})
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=5000)
+    parser.add_argument('--files', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="simulated seconds per Station API call")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('trustar_guardduty_lambda_handler.backfill_runner') \
+        .setLevel(logging.INFO)
+    logging.getLogger('trustar_guardduty_lambda_handler.helpers.common.'
+                      'backfill_progress').setLevel(logging.INFO)
+    b = BackfillBenchmark(args.n, args.files, args.latency, args.workers,
+                          args.batch_size)
+    print(json.dumps(b.run(), indent=4))
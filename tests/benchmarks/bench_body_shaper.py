@@ -0,0 +1,119 @@
+# encoding = utf-8
+
+""" Builds reports from pathological findings (port scans with thousands
+of probes, credential exfiltration with thousands of API calls, huge
+strings) with and without the BodyShaper, and reports the body bytes,
+build time and peak memory (tracemalloc) per finding. """
+
+import argparse
+import copy
+import json
+import logging
+import time
+import tracemalloc
+
+from trustar_guardduty_lambda_handler.helpers.gd.body_shaper import \
+    BodyShaper
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+
+from .finding_generator import FindingGenerator
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+
+def port_scan(n_probes, seed=0):                    # type: (int, int) -> Dict
+    """ A port probe finding with 'n_probes' probe details. """
+    gen = FindingGenerator(seed=seed, family_weights={'EC2': 1.0})
+    event = gen.next_event()
+    event['detail']['service']['action'] = {
+        'actionType': 'PORT_PROBE', 'portProbeAction': {
+            'blocked': False,
+            'portProbeDetails': [{
+                'localPortDetails': {'port': 1 + i % 1024,
+                                     'portName': 'Unknown'},
+                'remoteIpDetails': dict(gen.remote_ip_details(),
+                                        ipAddressV4='198.51.100.{}'
+                                        .format(i % 7)),
+                'firstSeen': FindingGenerator.iso(
+                    FindingGenerator.BASE_TIME),
+                'lastSeen': gen.iso(FindingGenerator.BASE_TIME)}
+                for i in range(n_probes)]}}
+    return event
+
+
+def api_calls(n_calls, seed=0):                     # type: (int, int) -> Dict
+    """ A credential exfiltration finding with 'n_calls' API calls. """
+    gen = FindingGenerator(seed=seed, family_weights={'IAM': 1.0})
+    event = gen.next_event()
+    event['detail']['service']['action'] = {
+        'actionType': 'AWS_API_CALL', 'awsApiCallAction': {
+            'calls': [{'api': ('GetObject', 'ListBuckets')[i % 2],
+                       'serviceName': 's3.amazonaws.com',
+                       'remoteIpDetails': gen.remote_ip_details()}
+                      for i in range(n_calls)]}}
+    return event
+
+
+def long_strings(n_chars, seed=0):                  # type: (int, int) -> Dict
+    """ A finding whose description is 'n_chars' long. """
+    event = FindingGenerator(seed=seed).next_event()
+    event['detail']['description'] = 'x' * n_chars
+    return event
+
+
+class BodyShaperBenchmark:
+    """ Builds each pathological finding with an unbounded builder and
+    with the default BodyShaper. """
+
+    def __init__(self, size,                                       # type: int
+                 max_body_bytes                                    # type: int
+                 ):
+        self.findings = {'port_scan': port_scan(size),
+                         'api_calls': api_calls(size),
+                         'long_strings': long_strings(size * 100)}
+        self.builders = {
+            'unbounded': GuardDutyReportBuilder(
+                ENCLAVE_ID, shaper=BodyShaper(None, None, None)),
+            'shaped': GuardDutyReportBuilder(
+                ENCLAVE_ID, shaper=BodyShaper(max_body_bytes=max_body_bytes))}
+
+    def run(self):                                          # type: () -> Dict
+        results = {}
+        for name, finding in self.findings.items():
+            results[name] = {'finding_kb': round(
+                len(json.dumps(finding)) / 1024.0, 1)}
+            for builder_name, builder in self.builders.items():
+                results[name][builder_name] = self.measure(builder, finding)
+        return results
+
+    @staticmethod
+    def measure(builder,                        # type: GuardDutyReportBuilder
+                finding                                           # type: Dict
+                ):                                        # type: (...) -> Dict
+        finding = copy.deepcopy(finding)
+        tracemalloc.start()
+        start = time.perf_counter()
+        report = builder.build_for(finding)
+        ms = (time.perf_counter() - start) * 1000.0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'body_kb': round(len(report.body.encode('utf-8')) / 1024.0,
+                                 1),
+                'build_ms': round(ms, 3),
+                'peak_mem_kb': round(peak / 1024.0, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=5000,
+                        help="probes / API calls per finding")
+    parser.add_argument('--max-body-bytes', type=int, default=100000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    b = BodyShaperBenchmark(args.size, args.max_body_bytes)
+    print(json.dumps(b.run(), indent=4))
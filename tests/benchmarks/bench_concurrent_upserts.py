@@ -0,0 +1,81 @@
+# encoding = utf-8
+
+""" Measures batch upsert throughput against the fake Station as the
+ConcurrentUpserter's worker count grows. """
+
+import argparse
+import copy
+import json
+import logging
+import os
+import time
+
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+from trustar_guardduty_lambda_handler.helpers.ts.concurrent_upserter import \
+    ConcurrentUpserter
+from trustar_guardduty_lambda_handler.helpers.ts.report_upserter import \
+    ReportUpserter
+
+from .fake_station import FakeStation, FakeTruStar
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_EVENT_PATH = os.path.join(THIS_DIR, '..', 'data', 'test_event.json')
+
+
+class ConcurrentUpsertBenchmark:
+    """ Upserts the same batch of findings with 1..N workers. """
+
+    def __init__(self, n_findings,                                 # type: int
+                 n_distinct,                                       # type: int
+                 latency                                         # type: float
+                 ):
+        self.latency = latency                                   # type: float
+        with open(TEST_EVENT_PATH) as f:
+            event = json.load(f)
+        self.findings = []                                # type: List[Dict]
+        for i in range(n_findings):
+            finding = copy.deepcopy(event)
+            finding['detail']['id'] = 'finding-{}'.format(i % n_distinct)
+            self.findings.append(finding)
+
+    def run(self, worker_counts):               # type: (List[int]) -> Dict
+        builder = GuardDutyReportBuilder(ENCLAVE_ID)
+        results = {}
+        for workers in worker_counts:
+            station = FakeStation([ENCLAVE_ID], latency=self.latency)
+            upserter = ConcurrentUpserter(
+                ReportUpserter(FakeTruStar(station), ENCLAVE_ID),
+                max_workers=workers)
+            reports = [builder.build_for(f) for f in self.findings]
+            start = time.perf_counter()
+            upserted = upserter.upsert_all(reports)
+            seconds = time.perf_counter() - start
+            upserter.shutdown()
+            results[workers] = {
+                'seconds': round(seconds, 3),
+                'findings_per_second': round(len(reports) / seconds, 1),
+                'failed': sum(1 for r in upserted if r.failed),
+                'station_calls': dict(station.calls)}
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=200,
+                        help="findings per batch")
+    parser.add_argument('--distinct', type=int, default=150,
+                        help="distinct finding IDs in the batch")
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="simulated seconds per Station API call")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    b = ConcurrentUpsertBenchmark(args.n, args.distinct, args.latency)
+    print(json.dumps(b.run(args.workers), indent=4))
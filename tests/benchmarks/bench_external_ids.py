@@ -0,0 +1,79 @@
+# encoding = utf-8
+
+""" Times the per-ID cost of the ExternalIdEncoder:  one ID at a time
+with the round-trip check on every call (the encoder's former behaviour)
+and sampled, a batch at a time with 'encode_many', and the replay path,
+where the report builder derives the IDs of a stream of findings that
+re-emits some of them.  Use -n to encode millions of IDs. """
+
+import argparse
+import json
+import time
+import uuid
+
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+from trustar_guardduty_lambda_handler.helpers.ts.external_id_encoder import \
+    ExternalIdEncoder
+
+from .finding_generator import FindingGenerator
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+
+def per_id(fn, n):                    # type: (Callable[[], None], int) -> Dict
+    """ Runs fn, which encodes n IDs, and returns the cost per ID of
+    its second run. """
+    fn()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    return {'ns_per_id': round(seconds / n * 1e9, 1),
+            'ids_per_second': int(n / seconds)}
+
+
+class ExternalIdBenchmark:
+    """ Encodes the same IDs along every path. """
+
+    def __init__(self, n, batch_size):               # type: (int, int) -> None
+        self.n = n                                                 # type: int
+        self.batch_size = batch_size                               # type: int
+        self.ids = [uuid.uuid4().hex for _ in range(n)]     # type: List[str]
+        gen = FindingGenerator(seed=0, unique_ratio=0.3, duplicate_ratio=0.5)
+        self.findings = gen.generate(min(n, 100000))       # type: List[Dict]
+
+    def run(self):                                          # type: () -> Dict
+        ids, size = self.ids, self.batch_size
+        checked = ExternalIdEncoder(check_every=1)
+        sampled = ExternalIdEncoder()
+        builder = GuardDutyReportBuilder(ENCLAVE_ID)
+        return {
+            'n': self.n,
+            'single_checked': per_id(
+                lambda: [checked.reversible(ENCLAVE_ID, x) for x in ids],
+                self.n),
+            'single_sampled': per_id(
+                lambda: [sampled.reversible(ENCLAVE_ID, x) for x in ids],
+                self.n),
+            'batch': per_id(
+                lambda: [sampled.encode_many(ENCLAVE_ID, ids[i:i + size])
+                         for i in range(0, len(ids), size)], self.n),
+            'irreversible': per_id(
+                lambda: [ExternalIdEncoder.irreversible(ENCLAVE_ID, x)
+                         for x in ids], self.n),
+            'replay': per_id(
+                lambda: [builder.external_id_for(f) for f in self.findings],
+                len(self.findings))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    b = ExternalIdBenchmark(args.n, args.batch_size)
+    print(json.dumps(b.run(), indent=4))
@@ -0,0 +1,76 @@
+# encoding = utf-8
+
+""" Times the FindingFilter's decision per finding, with every rule on,
+against the time it takes to build the report it may save, and reports
+the share of generated findings the filter drops. """
+
+import argparse
+import json
+import logging
+import time
+
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.gd.finding_filter import \
+    FindingFilter
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+
+from .bench_stats import percentile, summarize
+from .finding_generator import FindingGenerator
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+SPEC = {'min_severity': 4, 'drop_archived': True,
+        'exclude_accounts': ['111122223333', '444455556666'],
+        'regions': ['us-east-1', 'us-west-2', 'eu-west-1'],
+        'exclude_types': ['*IntegTest*', 'Policy:*'],
+        'sample': {'Recon:*': 0.1, 'Discovery:*': 0.5}}
+
+
+class FindingFilterBenchmark:
+    """ Filters, then builds, the same generated findings. """
+
+    def __init__(self, n):                                # type: (int) -> None
+        self.findings = FindingGenerator(seed=2).generate(n)
+
+    def run(self):                                          # type: () -> Dict
+        sink = MemoryMetricsSink()
+        finding_filter = FindingFilter.from_json(
+            json.dumps(SPEC), MetricsRecorder([sink]))
+        latencies = []
+        dropped = 0
+        for finding in self.findings:
+            start = time.perf_counter()
+            rule = finding_filter.rejecting_rule(finding)
+            latencies.append(time.perf_counter() - start)
+            dropped += rule is not None
+
+        builder = GuardDutyReportBuilder(ENCLAVE_ID)
+        build_latencies = []
+        for finding in self.findings:
+            start = time.perf_counter()
+            builder.build_for(finding)
+            build_latencies.append(time.perf_counter() - start)
+
+        filter_stats = summarize(latencies)
+        filter_stats['p50_us'] = round(percentile(latencies, 50) * 1e6, 2)
+        filter_stats['p99_us'] = round(percentile(latencies, 99) * 1e6, 2)
+        return {'filter': filter_stats,
+                'build': summarize(build_latencies),
+                'dropped_share': round(dropped / float(len(self.findings)),
+                                       3)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=20000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(FindingFilterBenchmark(args.n).run(), indent=4))
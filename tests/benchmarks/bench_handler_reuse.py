@@ -0,0 +1,81 @@
+# encoding = utf-8
+
+""" Compares the latency of cold invocations (a new lambda handler is
+built for every event, as if every event landed on a new container) to
+warm invocations (one HandlerCache re-used across events). """
+
+import argparse
+import json
+import logging
+import os
+import time
+from unittest import mock
+
+from trustar_guardduty_lambda_handler import HandlerCache
+from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+    ClientBuilder
+
+from .bench_stats import summarize
+from .fake_station import FakeStation, FakeTruStar
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_EVENT_PATH = os.path.join(THIS_DIR, '..', 'data', 'test_event.json')
+
+
+class HandlerReuseBenchmark:
+    """ Runs the same event through cold and warm handlers. """
+
+    def __init__(self, n_invocations,                              # type: int
+                 latency,                                        # type: float
+                 auth_latency                                    # type: float
+                 ):
+        self.n = n_invocations                                     # type: int
+        self.station = FakeStation([ENCLAVE_ID], latency=latency,
+                                   auth_latency=auth_latency)
+        with open(TEST_EVENT_PATH) as f:
+            self.event = json.load(f)                             # type: Dict
+
+    def run(self):                                          # type: () -> Dict
+        """ Runs both modes and returns the results. """
+        env = {'ENCLAVE_ID': ENCLAVE_ID,
+               'USER_API_KEY': 'bench-key',
+               'USER_API_SECRET': 'bench-secret',
+               # the event is replayed on purpose.
+               'IDEMPOTENCY_STORE': ''}
+        build = lambda *args, **kwargs: FakeTruStar(self.station)
+        with mock.patch.dict(os.environ, env), \
+                mock.patch.object(ClientBuilder, 'from_params', build):
+            return {'cold': self.time_mode(warm=False),
+                    'warm': self.time_mode(warm=True)}
+
+    def time_mode(self, warm):                         # type: (bool) -> Dict
+        self.station.calls.clear()
+        cache = HandlerCache()
+        latencies = []
+        for _ in range(self.n):
+            if not warm:
+                cache = HandlerCache()
+            start = time.perf_counter()
+            cache.handle(self.event)
+            latencies.append(time.perf_counter() - start)
+        results = summarize(latencies)
+        results['station_calls'] = dict(self.station.calls)
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help="simulated seconds per Station API call")
+    parser.add_argument('--auth-latency', type=float, default=0.02,
+                        help="simulated seconds per OAuth token request")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    b = HandlerReuseBenchmark(args.n, args.latency, args.auth_latency)
+    print(json.dumps(b.run(), indent=4))
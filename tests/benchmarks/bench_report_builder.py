@@ -0,0 +1,80 @@
+# encoding = utf-8
+
+""" Times the GuardDutyReportBuilder on small findings and on findings
+padded to a few hundred KB, in each report body format.  Logging stays at
+INFO, as in the Lambda, so that debug-only work shows up if it leaks back
+into the build path. """
+
+import argparse
+import json
+import logging
+import time
+
+from trustar_guardduty_lambda_handler.helpers.gd import report_builder
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+
+from .bench_stats import summarize
+from .finding_generator import FindingGenerator
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+
+class ReportBuilderBenchmark:
+    """ Builds the same findings with every body format. """
+
+    def __init__(self, n_findings,                                 # type: int
+                 sizes                                # type: Dict[str, int]
+                 ):
+        self.findings = {
+            name: FindingGenerator(seed=1, payload_median=median,
+                                   payload_sigma=0.1).generate(n_findings)
+            for name, median in sizes.items()}   # type: Dict[str, List[Dict]]
+
+    def run(self):                                          # type: () -> Dict
+        results = {'orjson': report_builder.orjson is not None}
+        for name, findings in self.findings.items():
+            results[name] = {
+                'finding_kb': round(sum(len(json.dumps(f)) for f in findings)
+                                    / len(findings) / 1024.0, 1)}
+            for body_format in GuardDutyReportBuilder.BODY_FORMATS:
+                results[name][body_format] = self.time_format(findings,
+                                                              body_format)
+        return results
+
+    @staticmethod
+    def time_format(findings,                               # type: List[Dict]
+                    body_format                                    # type: str
+                    ):                                    # type: (...) -> Dict
+        builder = GuardDutyReportBuilder(ENCLAVE_ID, body_format)
+        latencies = []
+        body_bytes = 0
+        for finding in findings:
+            start = time.perf_counter()
+            report = builder.build_for(finding)
+            latencies.append(time.perf_counter() - start)
+            body_bytes += len(report.body)
+        start = time.perf_counter()
+        builder.build_many(findings)
+        results = summarize(latencies)
+        results['build_many_ms'] = round(
+            (time.perf_counter() - start) * 1000.0, 3)
+        results['body_kb'] = round(body_bytes / len(findings) / 1024.0, 1)
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=200)
+    parser.add_argument('--large-bytes', type=int, default=300000,
+                        help="median padding of the large findings")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger(report_builder.__name__).setLevel(logging.INFO)
+    b = ReportBuilderBenchmark(args.n, {'small': 0,
+                                        'large': args.large_bytes})
+    print(json.dumps(b.run(), indent=4))
@@ -0,0 +1,28 @@
+# encoding = utf-8
+
+""" Helpers that summarize benchmark measurements. """
+
+import math
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List
+
+
+def percentile(values, pct):            # type: (List[float], float) -> float
+    """ Nearest-rank percentile of the values. """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(seconds):                        # type: (List[float]) -> Dict
+    """ Summarizes a list of latencies (seconds) in milliseconds. """
+    n = len(seconds)
+    return {'n': n,
+            'mean_ms': round(1000.0 * sum(seconds) / n, 3) if n else 0.0,
+            'p50_ms': round(1000.0 * percentile(seconds, 50), 3),
+            'p99_ms': round(1000.0 * percentile(seconds, 99), 3),
+            'max_ms': round(1000.0 * max(seconds), 3) if n else 0.0}
@@ -0,0 +1,261 @@
+# encoding = utf-8
+
+""" Drives the Lambda entry points in "lambda_function" against a local
+HTTP Station server and reports, per scenario, invocations per second,
+invocation latency percentiles, per-stage latency percentiles (from the
+handler's own metrics) and the process' peak RSS.
+
+Results can be saved as a JSON baseline and compared with a later run:
+
+    $ PYTHONPATH=src/exe python -m tests.benchmarks.bench_suite \\
+        --save /tmp/baseline.json
+    $ PYTHONPATH=src/exe python -m tests.benchmarks.bench_suite \\
+        --compare /tmp/baseline.json
+"""
+
+import argparse
+import copy
+import importlib
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+from unittest import mock
+
+from trustar_guardduty_lambda_handler import HandlerConfig
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+
+from .bench_stats import percentile, summarize
+from .fake_station import FakeStation
+from .station_server import StationServer
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_EVENT_PATH = os.path.join(THIS_DIR, '..', 'data', 'test_event.json')
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+
+class FakeContext:
+    """ A Lambda context with plenty of time left. """
+
+    @staticmethod
+    def get_remaining_time_in_millis():                      # type: () -> int
+        return 900000
+
+
+def peak_rss_mb():                                         # type: () -> float
+    """ The process' peak resident set size so far. """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS.
+    return round(rss / (1024.0 * 1024.0 if sys.platform == 'darwin'
+                        else 1024.0), 1)
+
+
+class BenchmarkSuite:
+    """ Runs each scenario against a fresh Station server, with a freshly
+    imported "lambda_function" so every scenario starts cold. """
+
+    def __init__(self, invocations,                                # type: int
+                 batch_size,                                       # type: int
+                 latency,                                        # type: float
+                 error_rate,                                     # type: float
+                 throttle_rate                                   # type: float
+                 ):
+        self.invocations = invocations                             # type: int
+        self.batch_size = batch_size                               # type: int
+        self.latency = latency                                   # type: float
+        self.error_rate = error_rate                             # type: float
+        self.throttle_rate = throttle_rate                       # type: float
+        with open(TEST_EVENT_PATH) as f:
+            self.sample = json.load(f)                            # type: Dict
+
+    @property
+    def scenarios(self):              # type: () -> Dict[str, Callable]
+        return {'sample_event': self.sample_event,
+                'synthetic_events': self.synthetic_events,
+                'synthetic_batches': self.synthetic_batches,
+                'synthetic_async_batches': self.synthetic_async_batches}
+
+    def synthetic(self, i):                               # type: (int) -> Dict
+        """ A copy of the sample event for a distinct finding. """
+        event = copy.deepcopy(self.sample)
+        event['id'] = 'event-{}'.format(i)
+        event['detail']['id'] = 'finding-{}'.format(i)
+        event['detail']['service']['count'] = i
+        return event
+
+    def sample_event(self, module):            # type: (...) -> List[Callable]
+        return [lambda: module.lambda_handler(self.sample, FakeContext())
+                for _ in range(self.invocations)]
+
+    def synthetic_events(self, module):        # type: (...) -> List[Callable]
+        return [lambda e=self.synthetic(i):
+                module.lambda_handler(e, FakeContext())
+                for i in range(self.invocations)]
+
+    def batches(self):                              # type: () -> List[List]
+        n = self.batch_size
+        return [[self.synthetic(i * n + j) for j in range(n)]
+                for i in range(self.invocations)]
+
+    def synthetic_batches(self, module):       # type: (...) -> List[Callable]
+        return [lambda b=b: module.batch_lambda_handler(b, FakeContext())
+                for b in self.batches()]
+
+    def synthetic_async_batches(self, module):
+                                               # type: (...) -> List[Callable]
+        return [lambda b=b: module.async_batch_lambda_handler(b, FakeContext())
+                for b in self.batches()]
+
+    def run(self, names=None):                      # type: (List[str]) -> Dict
+        results = {'python': platform.python_version(),
+                   'params': {'invocations': self.invocations,
+                              'batch_size': self.batch_size,
+                              'latency': self.latency,
+                              'error_rate': self.error_rate,
+                              'throttle_rate': self.throttle_rate},
+                   'scenarios': {}}
+        for name in names or list(self.scenarios):
+            results['scenarios'][name] = self.run_scenario(name)
+        results['peak_rss_mb'] = peak_rss_mb()
+        return results
+
+    def run_scenario(self, name):                         # type: (str) -> Dict
+        station = FakeStation([ENCLAVE_ID], latency=self.latency)
+        server = StationServer(station, error_rate=self.error_rate,
+                               throttle_rate=self.throttle_rate, seed=0)
+        sink = MemoryMetricsSink()
+        recorder = lambda config: MetricsRecorder([sink])
+        with server, \
+                mock.patch.dict(os.environ, dict(server.env(),
+                                                 PERMISSIONS_CACHE_PATH='',
+                                                 TOKEN_CACHE_PATH='',
+                                                 IDEMPOTENCY_STORE='')), \
+                mock.patch.object(HandlerConfig, 'build_metrics_recorder',
+                                  recorder):
+            module = self.fresh_lambda_function()
+            calls = self.scenarios[name](module)
+            latencies, failures = [], 0
+            start = time.perf_counter()
+            for call in calls:
+                t = time.perf_counter()
+                # noinspection PyBroadException
+                try:
+                    response = call()
+                    if isinstance(response, dict):
+                        failures += len(response.get('batchItemFailures', []))
+                except Exception:
+                    failures += 1
+                latencies.append(time.perf_counter() - t)
+            seconds = time.perf_counter() - start
+            injected = dict(server.injected)
+        findings = (len(calls) * self.batch_size if 'batch' in name
+                    else len(calls))
+        return {'invocations': len(calls),
+                'seconds': round(seconds, 3),
+                'invocations_per_second': round(len(calls) / seconds, 2),
+                'findings_per_second': round(findings / seconds, 2),
+                'failures': failures,
+                'latency': summarize(latencies),
+                'stages': self.stages(sink),
+                'counters': self.counters(sink),
+                'station_calls': dict(station.calls),
+                'injected': injected,
+                'peak_rss_mb': peak_rss_mb()}
+
+    @staticmethod
+    def fresh_lambda_function():
+        """ Imports "lambda_function" anew, as a new container would. """
+        if 'lambda_function' in sys.modules:
+            module = sys.modules['lambda_function']
+            cache = getattr(module, 'ASYNC_HANDLER_CACHE', None)
+            if cache is not None:
+                cache.loop.run_until_complete(cache.invalidate())
+                cache.loop.close()
+            return importlib.reload(module)
+        return importlib.import_module('lambda_function')
+
+    @staticmethod
+    def stages(sink):                     # type: (MemoryMetricsSink) -> Dict
+        names = sorted({n for s in sink.snapshots for n in s.timings})
+        stages = {}
+        for name in names:
+            ms = sink.timings(name)
+            stages[name] = {'n': len(ms),
+                            'p50_ms': round(percentile(ms, 50), 3),
+                            'p99_ms': round(percentile(ms, 99), 3)}
+        return stages
+
+    @staticmethod
+    def counters(sink):                   # type: (MemoryMetricsSink) -> Dict
+        names = sorted({n for s in sink.snapshots for n in s.counters})
+        return {name: sink.count(name) for name in names}
+
+
+def compare(baseline, current):                  # type: (Dict, Dict) -> Dict
+    """ The % change of each scenario's throughput and of each stage's p50
+    and p99, from the baseline to the current run. """
+    def change(old, new):
+        return round(100.0 * (new - old) / old, 1) if old else None
+
+    diff = {}
+    for name, cur in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        d = {'invocations_per_second_pct': change(
+            base['invocations_per_second'], cur['invocations_per_second']),
+             'peak_rss_mb_pct': change(base['peak_rss_mb'],
+                                       cur['peak_rss_mb']),
+             'stages': {}}
+        for stage, s in cur['stages'].items():
+            b = base['stages'].get(stage)
+            if b:
+                d['stages'][stage] = {
+                    'p50_pct': change(b['p50_ms'], s['p50_ms']),
+                    'p99_pct': change(b['p99_ms'], s['p99_ms'])}
+        diff[name] = d
+    return diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--invocations', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help="seconds the server sleeps per API call")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="share of API calls that fail with a 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="share of API calls refused with a 429")
+    parser.add_argument('--scenario', action='append',
+                        help="run only this scenario (repeatable)")
+    parser.add_argument('--save', help="write the results to this file")
+    parser.add_argument('--compare',
+                        help="compare the results to this baseline file")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    suite = BenchmarkSuite(args.invocations, args.batch_size, args.latency,
+                           args.error_rate, args.throttle_rate)
+    out = suite.run(args.scenario)
+    if args.compare:
+        with open(args.compare) as f:
+            out['compared_to'] = {'baseline': args.compare,
+                                  'changes': compare(json.load(f), out)}
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)),
+                    exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(out, f, indent=4, sort_keys=True)
+    print(json.dumps(out, indent=4, sort_keys=True))
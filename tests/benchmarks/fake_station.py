@@ -0,0 +1,221 @@
+# encoding = utf-8
+
+""" An in-process stand-in for TruSTAR Station and the TruStar client. """
+
+import asyncio
+from collections import Counter
+import threading
+import time
+import uuid
+
+from requests import HTTPError, Response
+from trustar import EnclavePermissions, IdType, Report
+from trustar.models import NumberedPage
+
+from trustar_guardduty_lambda_handler.helpers.ts.time_converter import \
+    TimeConverter
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+
+
+class FakeStation:
+    """ Stores reports in memory the way Station would.  The clients that
+    talk to it simulate 'latency' seconds of network time per call, and
+    'auth_latency' per token request. """
+
+    PAGE_SIZE = 25
+
+    def __init__(self, enclave_ids,                          # type: List[str]
+                 latency=0.0,                                    # type: float
+                 auth_latency=0.0                                # type: float
+                 ):
+        self.enclave_ids = enclave_ids                     # type: List[str]
+        self.latency = latency                                   # type: float
+        self.auth_latency = auth_latency                         # type: float
+        self.reports = {}                              # type: Dict[str, Dict]
+        self.ids_by_external_id = {}                    # type: Dict[str, str]
+        self.calls = Counter()                                 # type: Counter
+        self.last_updated = 0                                      # type: int
+        self._lock = threading.Lock()
+
+    def _call(self, name):                                # type: (str) -> None
+        """ Counts the call. """
+        with self._lock:
+            self.calls[name] += 1
+
+    def latency_of(self, name):                       # type: (str) -> float
+        return self.auth_latency if name == 'auth' else self.latency
+
+    @staticmethod
+    def http_error(status_code, message):   # type: (int, str) -> HTTPError
+        """ Builds the kind of exception the TruStar client raises. """
+        response = Response()
+        response.status_code = status_code
+        return HTTPError("{} Error: {}".format(status_code, message),
+                         response=response)
+
+    def auth(self):                                       # type: () -> str
+        self._call('auth')
+        return str(uuid.uuid4())
+
+    def get_enclaves(self):                               # type: () -> List
+        self._call('get_enclaves')
+        return [{'id': e, 'name': e, 'type': 'CLOSED', 'read': True,
+                 'create': True, 'update': True} for e in self.enclave_ids]
+
+    def get_report(self, report_id, id_type=None):
+                                               # type: (str, str) -> Dict
+        self._call('get_report')
+        with self._lock:
+            if id_type == IdType.EXTERNAL:
+                report_id = self.ids_by_external_id.get(report_id)
+            d = self.reports.get(report_id)
+        if d is None:
+            raise self.http_error(404, "Report not found.")
+        return dict(d)
+
+    def submit_report(self, d):                           # type: (Dict) -> str
+        self._call('submit_report')
+        d = self._normalized(d)
+        with self._lock:
+            d['id'] = str(uuid.uuid4())
+            d['created'] = d['updated'] = self._now()
+            self.reports[d['id']] = d
+            if d.get('externalTrackingId'):
+                self.ids_by_external_id[d['externalTrackingId']] = d['id']
+        return d['id']
+
+    def update_report(self, report_id, id_type, d):
+                                               # type: (str, str, Dict) -> None
+        self._call('update_report')
+        d = self._normalized(d)
+        with self._lock:
+            if id_type == IdType.EXTERNAL:
+                report_id = self.ids_by_external_id.get(report_id)
+            existing = self.reports.get(report_id)
+            if existing is None:
+                raise self.http_error(404, "Report not found.")
+            existing.update({k: v for k, v in d.items()
+                             if v is not None and k not in ('id', 'created')})
+            existing['updated'] = self._now()
+
+    def get_reports_page(self, from_time, to_time, enclave_ids=None):
+                                          # type: (int, int, List[str]) -> Dict
+        """ The reports updated between from_time and to_time, newest
+        first, a page at a time. """
+        self._call('get_reports_page')
+        with self._lock:
+            items = [dict(d) for d in self.reports.values()
+                     if from_time <= d['updated'] <= to_time and
+                     (not enclave_ids or
+                      set(enclave_ids) & set(d.get('enclaveIds') or []))]
+        items.sort(key=lambda d: d['updated'], reverse=True)
+        return {'items': items[:self.PAGE_SIZE], 'pageNumber': 0,
+                'pageSize': self.PAGE_SIZE, 'totalElements': len(items),
+                'hasNext': len(items) > self.PAGE_SIZE}
+
+    def _now(self):                                       # type: () -> int
+        """ Millis, strictly increasing so paging by time never skips a
+        report.  Call with the lock held. """
+        self.last_updated = max(self.last_updated + 1,
+                                int(time.time() * 1000))
+        return self.last_updated
+
+    @staticmethod
+    def _normalized(d):                                  # type: (Dict) -> Dict
+        """ Station stores timeBegan as millis. """
+        d = dict(d)
+        time_began = d.get('timeBegan')
+        if isinstance(time_began, str):
+            d['timeBegan'] = TimeConverter.iso_to_ms(time_began)
+        return d
+
+
+class FakeTruStar:
+    """ Quacks like the TruStar client, but talks to a FakeStation. """
+
+    def __init__(self, station):                 # type: (FakeStation) -> None
+        self.station = station                             # type: FakeStation
+        self.enclave_ids = []                              # type: List[str]
+        self.token = None                                 # type: Optional[str]
+
+    def _call(self, name, *args):
+        """ Sleeps to simulate the round-trip, then calls the station. """
+        if self.token is None:
+            time.sleep(self.station.latency_of('auth'))
+            self.token = self.station.auth()
+        time.sleep(self.station.latency_of(name))
+        return getattr(self.station, name)(*args)
+
+    def get_user_enclaves(self):       # type: () -> List[EnclavePermissions]
+        return [EnclavePermissions.from_dict(e)
+                for e in self._call('get_enclaves')]
+
+    def get_report_details(self, report_id, id_type=None):
+                                               # type: (str, str) -> Report
+        return Report.from_dict(self._call('get_report', report_id, id_type))
+
+    def get_reports_page(self, is_enclave=None, enclave_ids=None, tag=None,
+                         excluded_tags=None, from_time=None, to_time=None):
+        d = self._call('get_reports_page', from_time, to_time, enclave_ids)
+        return NumberedPage.from_dict(d, content_type=Report)
+
+    def submit_report(self, report):                 # type: (Report) -> Report
+        report.id = self._call('submit_report', report.to_dict())
+        return report
+
+    def update_report(self, report):                 # type: (Report) -> Report
+        if report.id is not None:
+            report_id, id_type = report.id, IdType.INTERNAL
+        else:
+            report_id, id_type = report.external_id, IdType.EXTERNAL
+        self._call('update_report', report_id, id_type, report.to_dict())
+        return report
+
+
+class FakeAsyncTruStar(FakeTruStar):
+    """ Quacks like the AsyncStationClient, but talks to a FakeStation.
+    Latency is simulated with asyncio.sleep so calls overlap. """
+
+    def __init__(self, station, *args, **kwargs):
+        super().__init__(station)
+
+    async def _call(self, name, *args):
+        if self.token is None:
+            self.token = 'pending'
+            await asyncio.sleep(self.station.latency_of('auth'))
+            self.token = self.station.auth()
+        await asyncio.sleep(self.station.latency_of(name))
+        return getattr(self.station, name)(*args)
+
+    async def get_user_enclaves(self):
+        return [EnclavePermissions.from_dict(e)
+                for e in await self._call('get_enclaves')]
+
+    async def get_report_details(self, report_id, id_type=None):
+        d = await self._call('get_report', report_id, id_type)
+        return Report.from_dict(d)
+
+    async def get_reports_page(self, is_enclave=None, enclave_ids=None,
+                               from_time=None, to_time=None):
+        d = await self._call('get_reports_page', from_time, to_time,
+                             enclave_ids)
+        return NumberedPage.from_dict(d, content_type=Report)
+
+    async def submit_report(self, report):
+        report.id = await self._call('submit_report', report.to_dict())
+        return report
+
+    async def update_report(self, report):
+        if report.id is not None:
+            report_id, id_type = report.id, IdType.INTERNAL
+        else:
+            report_id, id_type = report.external_id, IdType.EXTERNAL
+        await self._call('update_report', report_id, id_type,
+                         report.to_dict())
+        return report
+
+    async def close(self):
+        pass
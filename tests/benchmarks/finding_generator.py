@@ -0,0 +1,440 @@
+# encoding = utf-8
+
+""" Generates synthetic GuardDuty findings for load tests, and either
+writes them out as JSONL or feeds them straight into a handler at a target
+rate:
+
+    $ PYTHONPATH=src/exe python -m tests.benchmarks.finding_generator \\
+        jsonl -n 1000 --out /tmp/findings.jsonl
+    $ PYTHONPATH=src/exe python -m tests.benchmarks.finding_generator \\
+        feed -n 5000 --rate 500 --batch-size 10 --unique-ratio 0.3
+
+The findings cover the EC2, IAM, S3 and Kubernetes finding families, with
+port-probe, DNS, network-connection and API-call "service.action" shapes.
+A re-emitted finding keeps its ID and gets a higher "service.count" and a
+later "updatedAt", the way GuardDuty re-emits an ongoing finding.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from trustar_guardduty_lambda_handler import HandlerCache, HandlerConfig
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+    ClientBuilder
+
+from .bench_stats import summarize
+from .fake_station import FakeStation, FakeTruStar
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+# (finding type, action type) pairs of each family.
+FINDING_TYPES = {
+    'EC2': [('Recon:EC2/PortProbeUnprotectedPort', 'PORT_PROBE'),
+            ('Backdoor:EC2/C&CActivity.B!DNS', 'DNS_REQUEST'),
+            ('CryptoCurrency:EC2/BitcoinTool.B!DNS', 'DNS_REQUEST'),
+            ('UnauthorizedAccess:EC2/SSHBruteForce', 'NETWORK_CONNECTION'),
+            ('Trojan:EC2/BlackholeTraffic', 'NETWORK_CONNECTION')],
+    'IAM': [('Recon:IAMUser/MaliciousIPCaller', 'AWS_API_CALL'),
+            ('UnauthorizedAccess:IAMUser/'
+             'InstanceCredentialExfiltration.OutsideAWS', 'AWS_API_CALL'),
+            ('Persistence:IAMUser/AnomalousBehavior', 'AWS_API_CALL')],
+    'S3': [('Policy:S3/BucketBlockPublicAccessDisabled', 'AWS_API_CALL'),
+           ('Exfiltration:S3/AnomalousBehavior', 'AWS_API_CALL'),
+           ('Discovery:S3/MaliciousIPCaller', 'AWS_API_CALL')],
+    'Kubernetes': [
+        ('Discovery:Kubernetes/SuccessfulAnonymousAccess',
+         'KUBERNETES_API_CALL'),
+        ('PrivilegeEscalation:Kubernetes/PrivilegedContainer',
+         'KUBERNETES_API_CALL'),
+        ('Execution:Kubernetes/ExecInKubeSystemPod', 'KUBERNETES_API_CALL')]}
+
+# GuardDuty's severity bands.
+SEVERITY_BANDS = {'low': (1.0, 3.9), 'medium': (4.0, 6.9),
+                  'high': (7.0, 8.9)}
+
+DEFAULT_FAMILY_WEIGHTS = {'EC2': 0.5, 'IAM': 0.2, 'S3': 0.2,
+                          'Kubernetes': 0.1}
+DEFAULT_SEVERITY_WEIGHTS = {'low': 0.5, 'medium': 0.35, 'high': 0.15}
+
+
+def parse_weights(s):                         # type: (str) -> Dict[str, float]
+    """ Parses "EC2=0.5,IAM=0.5" into {'EC2': 0.5, 'IAM': 0.5}. """
+    weights = {}
+    for pair in s.split(','):
+        name, _, weight = pair.partition('=')
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class FindingGenerator:
+    """ Generates a reproducible stream of GuardDuty events.
+
+    'unique_ratio' is the share of events that carry a finding ID not seen
+    before;  the rest re-emit one of the last 'reemit_window' findings, and
+    'duplicate_ratio' of those re-emits are exact duplicates (as with
+    at-least-once delivery) rather than updates.  Payload sizes follow a
+    log-normal distribution around 'payload_median' bytes;  the extra bytes
+    go to "service.evidence.threatIntelligenceDetails". """
+
+    BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    ACCOUNT_ID = '123456789012'
+    REGION = 'us-east-1'
+
+    def __init__(self, seed=0,                                     # type: int
+                 unique_ratio=1.0,                               # type: float
+                 duplicate_ratio=0.0,                            # type: float
+                 reemit_window=1000,                               # type: int
+                 family_weights=None,        # type: Optional[Dict[str, float]]
+                 severity_weights=None,      # type: Optional[Dict[str, float]]
+                 payload_median=0,                                 # type: int
+                 payload_sigma=1.0                               # type: float
+                 ):
+        self.rng = random.Random(seed)                   # type: random.Random
+        self.unique_ratio = unique_ratio                         # type: float
+        self.duplicate_ratio = duplicate_ratio                   # type: float
+        self.reemit_window = reemit_window                         # type: int
+        family_weights = family_weights or DEFAULT_FAMILY_WEIGHTS
+        severity_weights = severity_weights or DEFAULT_SEVERITY_WEIGHTS
+        self.families = list(family_weights)                 # type: List[str]
+        self.family_weights = [family_weights[f] for f in self.families]
+        self.bands = list(severity_weights)                  # type: List[str]
+        self.band_weights = [severity_weights[b] for b in self.bands]
+        self.payload_median = payload_median                       # type: int
+        self.payload_sigma = payload_sigma                       # type: float
+        self.recent = []                                  # type: List[Dict]
+        self.n_generated = 0                                       # type: int
+        self.n_unique = 0                                          # type: int
+
+    def __iter__(self):                           # type: () -> Iterator[Dict]
+        while True:
+            yield self.next_event()
+
+    def generate(self, n):                         # type: (int) -> List[Dict]
+        return [self.next_event() for _ in range(n)]
+
+    def batches(self, n, batch_size):   # type: (int, int) -> List[List[Dict]]
+        """ 'n' events, split into lists of up to 'batch_size'. """
+        events = self.generate(n)
+        return [events[i:i + batch_size]
+                for i in range(0, len(events), batch_size)]
+
+    def next_event(self):                                   # type: () -> Dict
+        now = self.BASE_TIME + timedelta(seconds=self.n_generated)
+        self.n_generated += 1
+        if not self.recent or self.rng.random() < self.unique_ratio:
+            event = self.new_event(now)
+            self.n_unique += 1
+        else:
+            event = self.rng.choice(self.recent)
+            if self.rng.random() >= self.duplicate_ratio:
+                event = self.reemit(event, now)
+        self.remember(event)
+        return copy.deepcopy(event)
+
+    def remember(self, event):                           # type: (Dict) -> None
+        """ Keeps the latest version of each of the last 'reemit_window'
+        findings. """
+        finding_id = event['detail']['id']
+        self.recent = [e for e in self.recent
+                       if e['detail']['id'] != finding_id]
+        self.recent.append(event)
+        del self.recent[:-self.reemit_window]
+
+    def reemit(self, event, now):           # type: (Dict, datetime) -> Dict
+        event = copy.deepcopy(event)
+        event['id'] = self.uuid()
+        event['time'] = self.iso(now, millis=False)
+        service = event['detail']['service']
+        service['count'] += self.rng.randint(1, 5)
+        service['eventLastSeen'] = self.iso(now, millis=False)
+        event['detail']['updatedAt'] = self.iso(now)
+        return event
+
+    def new_event(self, now):                       # type: (datetime) -> Dict
+        family = self.rng.choices(self.families, self.family_weights)[0]
+        finding_type, action_type = self.rng.choice(FINDING_TYPES[family])
+        band = self.rng.choices(self.bands, self.band_weights)[0]
+        low, high = SEVERITY_BANDS[band]
+        finding_id = '{:032x}'.format(self.rng.getrandbits(128))
+        detector_id = '{:032x}'.format(self.rng.getrandbits(128))
+        first_seen = now - timedelta(minutes=self.rng.randint(0, 120))
+        service = {
+            'serviceName': 'guardduty',
+            'detectorId': detector_id,
+            'action': self.action_for(action_type),
+            'resourceRole': 'TARGET',
+            'additionalInfo': {'threatListName': 'ProofPoint'},
+            'eventFirstSeen': self.iso(first_seen, millis=False),
+            'eventLastSeen': self.iso(now, millis=False),
+            'archived': False,
+            'count': 1}
+        padding = self.padding()
+        if padding:
+            service['evidence'] = {'threatIntelligenceDetails': padding}
+        detail = {
+            'schemaVersion': '2.0',
+            'accountId': self.ACCOUNT_ID,
+            'region': self.REGION,
+            'partition': 'aws',
+            'id': finding_id,
+            'arn': 'arn:aws:guardduty:{}:{}:detector/{}/finding/{}'.format(
+                self.REGION, self.ACCOUNT_ID, detector_id, finding_id),
+            'type': finding_type,
+            'resource': self.resource_for(family),
+            'service': service,
+            'severity': round(self.rng.uniform(low, high), 1),
+            'createdAt': self.iso(now),
+            'updatedAt': self.iso(now),
+            'title': '{} finding {}'.format(finding_type, finding_id[:8]),
+            'description': 'Synthetic {} finding of type {}.'.format(
+                family, finding_type)}
+        return {'version': '0',
+                'id': self.uuid(),
+                'detail-type': 'GuardDuty Finding',
+                'source': 'aws.guardduty',
+                'account': self.ACCOUNT_ID,
+                'time': self.iso(now, millis=False),
+                'region': self.REGION,
+                'resources': [],
+                'detail': detail}
+
+    def action_for(self, action_type):                    # type: (str) -> Dict
+        remote_ip = self.remote_ip_details()
+        if action_type == 'PORT_PROBE':
+            port = self.rng.choice([22, 80, 443, 3389, 5432])
+            return {'actionType': action_type, 'portProbeAction': {
+                'blocked': False,
+                'portProbeDetails': [{
+                    'localPortDetails': {'port': port, 'portName': 'Unknown'},
+                    'remoteIpDetails': remote_ip}]}}
+        if action_type == 'DNS_REQUEST':
+            return {'actionType': action_type, 'dnsRequestAction': {
+                'domain': '{}.example.com'.format(self.token(10)),
+                'protocol': 'UDP',
+                'blocked': False}}
+        if action_type == 'NETWORK_CONNECTION':
+            return {'actionType': action_type, 'networkConnectionAction': {
+                'connectionDirection': self.rng.choice(['INBOUND',
+                                                        'OUTBOUND']),
+                'remoteIpDetails': remote_ip,
+                'remotePortDetails': {'port': 22, 'portName': 'SSH'},
+                'localPortDetails': {'port': self.rng.randint(1024, 65535),
+                                     'portName': 'Unknown'},
+                'protocol': 'TCP',
+                'blocked': False}}
+        if action_type == 'AWS_API_CALL':
+            return {'actionType': action_type, 'awsApiCallAction': {
+                'api': self.rng.choice(['GetObject', 'ListBuckets',
+                                        'PutBucketPublicAccessBlock',
+                                        'DescribeInstances', 'CreateUser']),
+                'serviceName': self.rng.choice(['s3.amazonaws.com',
+                                                'ec2.amazonaws.com',
+                                                'iam.amazonaws.com']),
+                'callerType': 'Remote IP',
+                'remoteIpDetails': remote_ip}}
+        return {'actionType': action_type, 'kubernetesApiCallAction': {
+            'requestUri': '/api/v1/namespaces/kube-system/pods/{}'.format(
+                self.token(8)),
+            'verb': self.rng.choice(['get', 'list', 'create']),
+            'userAgent': 'kubectl/v1.27.0',
+            'statusCode': self.rng.choice([200, 201, 403]),
+            'remoteIpDetails': remote_ip}}
+
+    def resource_for(self, family):                       # type: (str) -> Dict
+        if family == 'EC2':
+            return {'resourceType': 'Instance', 'instanceDetails': {
+                'instanceId': 'i-{:017x}'.format(self.rng.getrandbits(68)),
+                'instanceType': self.rng.choice(['t3.micro', 'm5.large']),
+                'instanceState': 'running',
+                'availabilityZone': self.REGION + 'b',
+                'tags': [{'key': 'Name', 'value': self.token(8)}]}}
+        if family == 'IAM':
+            return {'resourceType': 'AccessKey', 'accessKeyDetails': {
+                'accessKeyId': 'AKIA' + self.token(16).upper(),
+                'principalId': 'AIDA' + self.token(16).upper(),
+                'userName': 'user-' + self.token(6),
+                'userType': 'IAMUser'}}
+        if family == 'S3':
+            return {'resourceType': 'S3Bucket', 's3BucketDetails': [{
+                'name': 'bucket-' + self.token(10),
+                'type': 'Destination',
+                'arn': 'arn:aws:s3:::bucket-' + self.token(10)}]}
+        return {'resourceType': 'EKSCluster',
+                'eksClusterDetails': {'name': 'cluster-' + self.token(6),
+                                      'status': 'ACTIVE'},
+                'kubernetesDetails': {'kubernetesUserDetails': {
+                    'username': 'system:anonymous',
+                    'groups': ['system:unauthenticated']}}}
+
+    def remote_ip_details(self):                            # type: () -> Dict
+        ip = '198.51.100.{}'.format(self.rng.randint(1, 254))
+        return {'ipAddressV4': ip,
+                'organization': {'asn': str(self.rng.randint(1, 65000)),
+                                 'isp': 'SyntheticISP',
+                                 'org': 'SyntheticORG'},
+                'country': {'countryName': 'United States'},
+                'city': {'cityName': 'SyntheticCity'},
+                'geoLocation': {'lat': 0, 'lon': 0}}
+
+    def padding(self):                                # type: () -> List[Dict]
+        """ Threat intel entries that add roughly a log-normally
+        distributed number of bytes to the finding. """
+        if self.payload_median <= 0:
+            return []
+        size = self.payload_median * math.exp(
+            self.rng.gauss(0.0, self.payload_sigma))
+        # each entry serializes to about 100 bytes.
+        return [{'threatListName': 'SyntheticList',
+                 'threatNames': [self.token(40)]}
+                for _ in range(max(1, int(size / 100)))]
+
+    def token(self, n):                                    # type: (int) -> str
+        return '{:x}'.format(self.rng.getrandbits(4 * n)).zfill(n)[:n]
+
+    def uuid(self):                                         # type: () -> str
+        h = '{:032x}'.format(self.rng.getrandbits(128))
+        return '-'.join([h[:8], h[8:12], h[12:16], h[16:20], h[20:]])
+
+    @staticmethod
+    def iso(t, millis=True):                    # type: (datetime, bool) -> str
+        if millis:
+            return t.strftime('%Y-%m-%dT%H:%M:%S.') + \
+                '{:03d}Z'.format(t.microsecond // 1000)
+        return t.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def write_jsonl(self, n, stream):                # type: (int, IO) -> None
+        for _ in range(n):
+            stream.write(json.dumps(self.next_event()) + '\n')
+
+
+def feed(calls, rate):    # type: (List[Callable], float) -> Tuple[List, float]
+    """ Runs the calls in order, starting call 'i' no earlier than 'i /
+    rate' seconds after the first (as fast as possible if 'rate' is 0).
+    Returns each call's latency and the total seconds. """
+    latencies = []                                      # type: List[float]
+    start = time.perf_counter()
+    for i, call in enumerate(calls):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - start
+
+
+class FeedBenchmark:
+    """ Feeds generated findings through a warm HandlerCache backed by the
+    in-process fake Station, so the report builder, the external ID
+    encoder, the report upserter and its index see production-like
+    cardinality. """
+
+    def __init__(self, generator,                     # type: FindingGenerator
+                 n,                                                # type: int
+                 rate,                                           # type: float
+                 batch_size,                                       # type: int
+                 latency                                         # type: float
+                 ):
+        self.generator = generator                    # type: FindingGenerator
+        self.n = n                                                 # type: int
+        self.rate = rate                                         # type: float
+        self.batch_size = batch_size                               # type: int
+        self.station = FakeStation([ENCLAVE_ID], latency=latency)
+
+    def run(self):                                          # type: () -> Dict
+        env = {'ENCLAVE_ID': ENCLAVE_ID,
+               'USER_API_KEY': 'bench-key',
+               'USER_API_SECRET': 'bench-secret',
+               'PERMISSIONS_CACHE_PATH': ''}
+        sink = MemoryMetricsSink()
+        build = lambda *args, **kwargs: FakeTruStar(self.station)
+        recorder = lambda config: MetricsRecorder([sink])
+        with mock.patch.dict(os.environ, env), \
+                mock.patch.object(ClientBuilder, 'from_params', build), \
+                mock.patch.object(HandlerConfig, 'build_metrics_recorder',
+                                  recorder):
+            cache = HandlerCache()
+            if self.batch_size > 1:
+                calls = [lambda b=b: cache.handle_batch(b) for b in
+                         self.generator.batches(self.n, self.batch_size)]
+            else:
+                calls = [lambda e=e: cache.handle(e)
+                         for e in self.generator.generate(self.n)]
+            latencies, seconds = feed(calls, self.rate)
+        results = summarize(latencies)
+        results.update({
+            'findings': self.n,
+            'unique_findings': self.generator.n_unique,
+            'findings_per_second': round(self.n / seconds, 2),
+            'station_calls': dict(self.station.calls),
+            'counters': {name: sink.count(name) for name in sorted(
+                {n for s in sink.snapshots for n in s.counters})}})
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('mode', choices=['jsonl', 'feed'])
+    parser.add_argument('-n', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--unique-ratio', type=float, default=1.0,
+                        help="share of events with a new finding ID")
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0,
+                        help="share of re-emits that are exact duplicates")
+    parser.add_argument('--reemit-window', type=int, default=1000,
+                        help="how many recent findings re-emits draw from")
+    parser.add_argument('--families', type=parse_weights,
+                        help="family weights, ex: EC2=0.5,IAM=0.2,S3=0.2,"
+                             "Kubernetes=0.1")
+    parser.add_argument('--severities', type=parse_weights,
+                        help="severity weights, ex: low=0.5,medium=0.35,"
+                             "high=0.15")
+    parser.add_argument('--payload-median', type=int, default=0,
+                        help="median bytes of padding per finding")
+    parser.add_argument('--payload-sigma', type=float, default=1.0,
+                        help="log-normal sigma of the padding size")
+    parser.add_argument('--out', help="JSONL file to write (default stdout)")
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help="target invocations per second (0: no limit)")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="findings per invocation when feeding")
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help="simulated seconds per Station API call")
+    args = parser.parse_args()
+
+    gen = FindingGenerator(
+        seed=args.seed, unique_ratio=args.unique_ratio,
+        duplicate_ratio=args.duplicate_ratio,
+        reemit_window=args.reemit_window, family_weights=args.families,
+        severity_weights=args.severities,
+        payload_median=args.payload_median, payload_sigma=args.payload_sigma)
+    if args.mode == 'jsonl':
+        if args.out:
+            with open(args.out, 'w') as f:
+                gen.write_jsonl(args.n, f)
+        else:
+            gen.write_jsonl(args.n, sys.stdout)
+    else:
+        logging.disable(logging.INFO)
+        b = FeedBenchmark(gen, args.n, args.rate, args.batch_size,
+                          args.latency)
+        print(json.dumps(b.run(), indent=4))
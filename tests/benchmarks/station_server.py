@@ -0,0 +1,231 @@
+# encoding = utf-8
+
+""" A local HTTP stand-in for the TruSTAR Station endpoints the lambda
+handler calls, so the real TruStar client and the AsyncStationClient can
+be exercised without an internet connection. """
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from requests import HTTPError
+
+from .fake_station import FakeStation
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, Optional, Tuple
+
+
+class StationServer:
+    """ Serves a FakeStation over HTTP on localhost.
+
+    Every API call sleeps the station's latency for that call.  A share of
+    API calls ('error_rate') fails with a 500, and another share
+    ('throttle_rate') is refused with a 429 that carries Station's
+    'waitTime' (ms) and a Retry-After header.  Token requests are never
+    refused.  Use as a context manager, or call start() and stop(). """
+
+    AUTH_PATH = '/oauth/token'
+    API_PATH = '/api/1.3'
+
+    def __init__(self, station=None,              # type: Optional[FakeStation]
+                 error_rate=0.0,                                 # type: float
+                 throttle_rate=0.0,                              # type: float
+                 wait_time_ms=1000,                                # type: int
+                 seed=None                               # type: Optional[int]
+                 ):
+        self.station = station or FakeStation([str(uuid.uuid4())])
+        self.error_rate = error_rate                             # type: float
+        self.throttle_rate = throttle_rate                       # type: float
+        self.wait_time_ms = wait_time_ms                           # type: int
+        self.random = random.Random(seed)
+        self.tokens = set()
+        self.injected = {'errors': 0, 'throttles': 0}    # type: Dict[str, int]
+        self._lock = threading.Lock()
+        self._httpd = None                # type: Optional[ThreadingHTTPServer]
+        self._thread = None                  # type: Optional[threading.Thread]
+
+    @property
+    def url(self):                                           # type: () -> str
+        host, port = self._httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def auth_endpoint(self):                                 # type: () -> str
+        return self.url + self.AUTH_PATH
+
+    @property
+    def api_endpoint(self):                                  # type: () -> str
+        return self.url + self.API_PATH
+
+    def env(self):                                # type: () -> Dict[str, str]
+        """ The environment variables that point the lambda handler at
+        this server. """
+        return {'ENCLAVE_ID': self.station.enclave_ids[0],
+                'USER_API_KEY': 'key',
+                'USER_API_SECRET': 'secret',
+                'AUTH_ENDPOINT': self.auth_endpoint,
+                'API_ENDPOINT': self.api_endpoint}
+
+    def start(self):                                # type: () -> StationServer
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.station_server = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name='station-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):                                         # type: () -> None
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def expire_tokens(self):                                # type: () -> None
+        """ Makes Station reject every token issued so far. """
+        with self._lock:
+            self.tokens.clear()
+
+    def issue_token(self):                                   # type: () -> str
+        token = self.station.auth()
+        with self._lock:
+            self.tokens.add(token)
+        return token
+
+    def injected_failure(self):      # type: () -> Optional[Tuple[int, Dict]]
+        """ Rolls the dice for an injected 500 or 429. """
+        roll = self.random.random()
+        with self._lock:
+            if roll < self.error_rate:
+                self.injected['errors'] += 1
+                return 500, {'message': "Injected server error."}
+            if roll < self.error_rate + self.throttle_rate:
+                self.injected['throttles'] += 1
+                return 429, {'message': "Too many requests.",
+                             'waitTime': self.wait_time_ms}
+        return None
+
+    def dispatch(self, method,                                     # type: str
+                 path,                                             # type: str
+                 params,                                # type: Dict[str, str]
+                 body                                    # type: Optional[Dict]
+                 ):                            # type: (...) -> Tuple[int, Any]
+        """ Calls the station for an API path.  Returns the status and the
+        response body (a str is sent as text, anything else as JSON). """
+        station = self.station
+        id_type = params.get('idType')
+        parts = path.strip('/').split('/')
+        if method == 'GET' and parts == ['enclaves']:
+            return 200, station.get_enclaves()
+        if parts[0] == 'reports' and len(parts) == 2:
+            if method == 'GET':
+                return 200, station.get_report(parts[1], id_type)
+            if method == 'PUT':
+                station.update_report(parts[1], id_type, body)
+                return 200, ''
+        if method == 'GET' and parts == ['reports']:
+            return 200, station.get_reports_page(
+                int(params['from']), int(params['to']),
+                [e for e in params.get('enclaveIds', '').split(',') if e])
+        if method == 'POST' and parts == ['reports']:
+            return 200, station.submit_report(body)
+        return 404, {'message': "No such endpoint."}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Translates HTTP requests to StationServer calls. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def station_server(self):                      # type: () -> StationServer
+        return self.server.station_server
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _handle(self, method):                            # type: (str) -> None
+        server = self.station_server
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+
+        if method == 'POST' and url.path == server.AUTH_PATH:
+            time.sleep(server.station.latency_of('auth'))
+            self._send(200, {'access_token': server.issue_token(),
+                             'token_type': 'bearer',
+                             'expires_in': 3600})
+            return
+        if not url.path.startswith(server.API_PATH + '/'):
+            self._send(404, {'message': "No such endpoint."})
+            return
+
+        token = (self.headers.get('Authorization') or '')[len('Bearer '):]
+        if token not in server.tokens:
+            self._send(400, {'error': 'invalid_token',
+                             'error_description':
+                                 "Expired oauth2 access token"})
+            return
+
+        path = url.path[len(server.API_PATH):]
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        name = {'GET': 'get_report', 'POST': 'submit_report',
+                'PUT': 'update_report'}.get(method)
+        if path == '/enclaves':
+            name = 'get_enclaves'
+        elif method == 'GET' and path.rstrip('/') == '/reports':
+            name = 'get_reports_page'
+        time.sleep(server.station.latency_of(name))
+
+        failure = server.injected_failure()
+        if failure:
+            status, body = failure
+            headers = {}
+            if status == 429:
+                headers['Retry-After'] = str(
+                    max(1, server.wait_time_ms // 1000))
+            self._send(status, body, headers)
+            return
+        try:
+            status, body = server.dispatch(
+                method, path, params, json.loads(raw) if raw else None)
+        except HTTPError as e:
+            status = e.response.status_code
+            body = {'message': str(e)}
+        self._send(status, body)
+
+    def _send(self, status, body, headers=None):
+        if isinstance(body, str):
+            data, content_type = body.encode('utf-8'), 'text/plain'
+        else:
+            data, content_type = json.dumps(body).encode('utf-8'), \
+                'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Trace-Id', str(uuid.uuid4()))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
@@ -0,0 +1,46 @@
+# encoding = utf-8
+
+""" Puts the Lambda's source root on the path for pytest, the same way
+the IDE setup in the README marks "src/exe" as a sources root, and
+provides fixtures shared by the offline tests. """
+
+import json
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_ROOT = os.path.join(THIS_DIR, '..', 'src', 'exe')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+ENCLAVE_ID = 'a1b2c3d4-0000-4000-8000-000000000001'
+
+
+@pytest.fixture
+def station():
+    """ A fake Station.  Every TruStar client the lambda handler builds
+    while this fixture is active talks to it. """
+    from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+        ClientBuilder
+    from .benchmarks.fake_station import FakeStation, FakeTruStar
+
+    station = FakeStation([ENCLAVE_ID])
+    env = {'ENCLAVE_ID': ENCLAVE_ID,
+           'USER_API_KEY': 'key',
+           'USER_API_SECRET': 'secret',
+           'PERMISSIONS_CACHE_PATH': '',
+           'TOKEN_CACHE_PATH': ''}
+    build = lambda *args, **kwargs: FakeTruStar(station)
+    with mock.patch.dict(os.environ, env), \
+            mock.patch.object(ClientBuilder, 'from_params', build):
+        yield station
+
+
+@pytest.fixture
+def event():
+    """ The sample GuardDuty event. """
+    with open(os.path.join(THIS_DIR, 'data', 'test_event.json')) as f:
+        return json.load(f)
@@ -0,0 +1,87 @@
+# encoding = utf-8
+
+""" Tests for the asyncio batch pipeline. """
+
+import asyncio
+import copy
+import json
+from unittest import mock
+
+import pytest
+from trustar import Report
+
+from trustar_guardduty_lambda_handler import AsyncHandlerCache, \
+    AsyncTruStarGuardDutyLambdaHandler, HandlerConfig
+from trustar_guardduty_lambda_handler import async_ts_gd_lambda_handler
+from trustar_guardduty_lambda_handler.helpers.ts.async_station_client import \
+    AsyncStationClient
+
+from .benchmarks.fake_station import FakeAsyncTruStar, FakeStation
+
+
+def test_async_batch_upserts_every_finding(station, event):
+    events = []
+    for i in range(20):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i % 15)
+        e['detail']['service']['count'] = i
+        events.append(e)
+    records = [{'messageId': e['id'], 'body': json.dumps(e)} for e in events]
+    records.append({'messageId': 'bad-json', 'body': '{'})
+
+    station.latency = 0.01
+    client = lambda *args, **kwargs: FakeAsyncTruStar(station)
+    with mock.patch.object(async_ts_gd_lambda_handler, 'AsyncStationClient',
+                           client):
+        cache = AsyncHandlerCache()
+        response = cache.handle_batch({'Records': records})
+        # a new event for an old finding:  redeliveries are dropped.
+        replay = dict(events[0], id='event-replay')
+        cache.handle_batch([replay])
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'bad-json'}]}
+    assert len(station.reports) == 15
+    assert station.calls['submit_report'] == 15
+    # the 5 older versions in the first batch are superseded, not written.
+    assert station.calls['update_report'] == 1
+    assert station.calls['get_enclaves'] == 1
+
+
+def test_submit_defaults_time_began_like_the_trustar_client():
+    client = AsyncStationClient({'user_api_key': 'key',
+                                 'user_api_secret': 'secret'}, 'test')
+    report = Report(title='t', body='b', enclave_ids=['enclave'])
+    requests = []
+
+    async def request(*args, **kwargs):
+        requests.append(kwargs)
+        return b'report-id'
+
+    with mock.patch.object(client, 'request', request):
+        asyncio.get_event_loop().run_until_complete(
+            client.submit_report(report))
+    assert report.id == 'report-id'
+    assert report.time_began is not None
+    assert json.loads(requests[0]['data'])['timeBegan'] is not None
+
+
+def test_failed_permission_check_closes_the_session(station):
+    clients = []
+
+    def client(*args, **kwargs):
+        clients.append(FakeAsyncTruStar(station))
+        clients[-1].close = mock.Mock(wraps=clients[-1].close)
+        return clients[-1]
+
+    with mock.patch.object(async_ts_gd_lambda_handler, 'AsyncStationClient',
+                           client), \
+            mock.patch.object(FakeStation, 'get_enclaves',
+                              side_effect=FakeStation.http_error(
+                                  401, "expired")):
+        with pytest.raises(Exception, match="401"):
+            asyncio.get_event_loop().run_until_complete(
+                AsyncTruStarGuardDutyLambdaHandler.create(
+                    HandlerConfig.from_env_vars()))
+    assert len(clients) == 1
+    assert clients[0].close.call_count == 1
@@ -0,0 +1,177 @@
+# encoding = utf-8
+
+""" Tests for the backfill:  the FindingSource, the checkpoint and the
+BackfillRunner. """
+
+import gzip
+import io
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from trustar_guardduty_lambda_handler import BackfillRunner, HandlerConfig, \
+    TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler.helpers.aws.finding_source import \
+    FindingSource
+from trustar_guardduty_lambda_handler.helpers.common.backfill_checkpoint \
+    import BackfillCheckpoint
+from trustar_guardduty_lambda_handler.helpers.common.backfill_progress \
+    import BackfillProgress
+
+from .benchmarks.finding_generator import FindingGenerator
+
+import backfill
+
+
+class FakeS3Client:
+    """ Stands in for a boto3 S3 client, the way an S3-compatible store
+    would behind 'endpoint_url', serving the files under a directory.
+    Lists one object per page. """
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(k for k in os.listdir(os.path.join(self.root, Bucket))
+                      if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = {'Contents': [
+            {'Key': k, 'Size': os.path.getsize(os.path.join(self.root,
+                                                            Bucket, k))}
+            for k in keys[start:start + 1]],
+            'IsTruncated': start + 1 < len(keys)}
+        if page['IsTruncated']:
+            page['NextContinuationToken'] = str(start + 1)
+        return page
+
+    def get_object(self, Bucket, Key):
+        return {'Body': open(os.path.join(self.root, Bucket, Key), 'rb')}
+
+
+def write_jsonl_gz(path, events):
+    with gzip.open(path, 'wt') as f:
+        for e in events:
+            f.write(json.dumps(e) + '\n')
+
+
+def test_source_reads_every_format(tmp_path, event):
+    finding = event['detail']
+    (tmp_path / 'a.jsonl').write_text(
+        json.dumps(event) + '\n\n' + json.dumps(finding) + '\n')
+    write_jsonl_gz(str(tmp_path / 'b.jsonl.gz'), [finding])
+    (tmp_path / 'c.json').write_text(json.dumps([event, event], indent=2))
+    (tmp_path / 'd.json').write_text(json.dumps({'Findings': [finding]}))
+    (tmp_path / 'notes.txt').write_text('not findings')
+
+    source = FindingSource([str(tmp_path)])
+    locations = [location for location, _ in source.objects()]
+    assert [os.path.basename(l) for l in locations] == [
+        'a.jsonl', 'b.jsonl.gz', 'c.json', 'd.json']
+    events = [e for l in locations for e in source.findings(l)]
+    assert len(events) == 6
+    assert all(e['detail'] == finding for e in events)
+    assert events[1]['id'] == finding['id']
+    assert source.bytes_read == sum(size for _, size in source.objects())
+
+
+def test_source_decodes_values_larger_than_a_chunk():
+    values = [{'n': n, 'pad': 'x' * (n * 100)} for n in range(50)]
+    f = io.StringIO('[' + ', '.join(json.dumps(v) for v in values) + ']')
+    with mock.patch.object(FindingSource, 'CHUNK_CHARS', 64):
+        assert list(FindingSource.iter_values(f)) == values
+
+    with pytest.raises(ValueError):
+        list(FindingSource.iter_values(io.StringIO('{"truncated": ')))
+
+
+def test_source_lists_and_reads_s3_objects(tmp_path, event):
+    bucket = tmp_path / 'exports'
+    bucket.mkdir()
+    for n in range(3):
+        write_jsonl_gz(str(bucket / 'findings-{}.jsonl.gz'.format(n)),
+                       [event['detail']] * (n + 1))
+    source = FindingSource(['s3://exports/findings-'],
+                           s3_client=FakeS3Client(str(tmp_path)))
+    locations = [location for location, _ in source.objects()]
+    assert locations == ['s3://exports/findings-{}.jsonl.gz'.format(n)
+                         for n in range(3)]
+    assert sum(len(list(source.findings(l))) for l in locations) == 6
+
+
+def test_progress_reports_rate_and_eta():
+    now = [0.0]
+    progress = BackfillProgress(1000, clock=lambda: now[0])
+    now[0] = 10.0
+    progress.update(50, 1, 250)
+    assert progress.rate == 5.0
+    assert progress.eta == 30.0
+    assert progress.line() == ("50 finding(s), 1 failed, 5.0/s (18000/h), "
+                               "25.0% of the input, elapsed 0:00:10, ETA "
+                               "0:00:30.")
+
+
+def runner_for(path, checkpoint_path, **kwargs):
+    config = HandlerConfig.from_env_vars()
+    return BackfillRunner(TruStarGuardDutyLambdaHandler(config),
+                          FindingSource([path]),
+                          checkpoint=BackfillCheckpoint(checkpoint_path),
+                          batch_size=10, **kwargs)
+
+
+def test_interrupted_backfill_resumes_where_it_stopped(station, tmp_path):
+    path = str(tmp_path / 'findings.jsonl.gz')
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    write_jsonl_gz(path, FindingGenerator(seed=3).generate(45))
+
+    runner = runner_for(path, checkpoint_path, checkpoint_every=0)
+    process_batch = runner.handler.process_batch
+    calls = []
+
+    def interrupted(items):
+        calls.append(len(items))
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        process_batch(items)
+
+    with mock.patch.object(runner.handler, 'process_batch', interrupted):
+        with pytest.raises(KeyboardInterrupt):
+            runner.run()
+    assert BackfillCheckpoint(checkpoint_path).done(path) == 20
+
+    runner = runner_for(path, checkpoint_path)
+    result = runner.run()
+    assert result['findings'] == 25
+    assert result['totals'] == {'findings': 45, 'failed': 0}
+    assert station.calls['submit_report'] == 45
+
+    assert runner_for(path, checkpoint_path).run()['findings'] == 0
+
+
+def test_failed_findings_are_written_out(station, tmp_path, event):
+    path = str(tmp_path / 'findings.jsonl')
+    bad = dict(event, detail={'id': 'no-title'})
+    with open(path, 'w') as f:
+        f.write(json.dumps(event) + '\n' + json.dumps(bad) + '\n')
+    failed = io.StringIO()
+    runner = runner_for(path, None, failed_file=failed)
+    with mock.patch.object(runner.handler.builder, 'build_for',
+                           side_effect=[runner.handler.builder.build_for(
+                               event), Exception("bad finding")]):
+        result = runner.run()
+    assert result['failed'] == 1
+    assert json.loads(failed.getvalue()) == bad
+
+
+def test_cli_backfills_and_checkpoints(station, tmp_path, capsys):
+    path = str(tmp_path / 'findings.jsonl')
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    with open(path, 'w') as f:
+        FindingGenerator(seed=4).write_jsonl(12, f)
+
+    assert backfill.main([path, '--checkpoint', checkpoint_path,
+                          '--batch-size', '5', '--workers', '2']) == 0
+    assert json.loads(capsys.readouterr().out)['findings'] == 12
+    assert BackfillCheckpoint(checkpoint_path).is_complete(path)
+    assert len(station.reports) == 12
@@ -0,0 +1,47 @@
+# encoding = utf-8
+
+""" Tests for batch ingestion with partial-batch failure reporting. """
+
+import copy
+import json
+
+import pytest
+
+from trustar_guardduty_lambda_handler import HandlerCache
+
+
+@pytest.fixture
+def events(event):
+    events = []
+    for i in range(3):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i)
+        events.append(e)
+    return events
+
+
+def test_sqs_batch_reports_only_failed_items(station, events):
+    records = [{'messageId': 'm{}'.format(i), 'body': json.dumps(e)}
+               for i, e in enumerate(events)]
+    records.append({'messageId': 'bad-json', 'body': '{not json'})
+    records.append({'messageId': 'no-detail', 'body': json.dumps({})})
+    response = HandlerCache().handle_batch({'Records': records})
+    failed = [f['itemIdentifier'] for f in response['batchItemFailures']]
+    assert failed == ['bad-json', 'no-detail']
+    assert station.calls['submit_report'] == 3
+
+
+def test_list_of_eventbridge_events(station, events):
+    response = HandlerCache().handle_batch(events)
+    assert response == {'batchItemFailures': []}
+    assert len(station.reports) == 3
+
+
+def test_sqs_message_that_is_not_an_object_fails_alone(station, events):
+    records = [{'messageId': 'not-an-object', 'body': json.dumps([1])},
+               {'messageId': 'm0', 'body': json.dumps(events[0])}]
+    response = HandlerCache().handle_batch({'Records': records})
+    failed = [f['itemIdentifier'] for f in response['batchItemFailures']]
+    assert failed == ['not-an-object']
+    assert station.calls['submit_report'] == 1
@@ -0,0 +1,89 @@
+# encoding = utf-8
+
+""" Tests for the BodyShaper that keeps report bodies of oversized
+findings to a bounded size. """
+
+import io
+import json
+
+from trustar_guardduty_lambda_handler.helpers.common.emf_metrics_sink import \
+    EmfMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.gd.body_shaper import \
+    BodyShaper
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+
+from .benchmarks.bench_body_shaper import long_strings, port_scan
+from .conftest import ENCLAVE_ID
+
+PROBES = 'service.action.portProbeAction.portProbeDetails'
+
+
+def body_of(finding, **kwargs):
+    builder = GuardDutyReportBuilder(ENCLAVE_ID, shaper=BodyShaper(**kwargs))
+    return json.loads(builder.build_for(finding).body)
+
+
+def test_small_findings_are_not_shaped(event):
+    shaped = body_of(event)
+    assert shaped == body_of(event, max_list_items=None,
+                             max_string_chars=None)
+    assert BodyShaper.SUMMARY_KEY not in shaped
+
+
+def test_long_lists_keep_a_summary():
+    body = body_of(port_scan(500), max_list_items=10, top_n=3)
+    probes = body['service']['action']['portProbeAction']['portProbeDetails']
+    assert len(probes) == 10
+    summary = body[BodyShaper.SUMMARY_KEY][PROBES]
+    assert summary['count'] == 500 and summary['kept'] == 10
+    assert len(summary['topIpAddresses']) == 3
+    assert summary['topIpAddresses'][0]['count'] in (71, 72)
+    assert summary['topPorts'][0]['count'] == 1
+    assert summary['firstSeen'] <= summary['lastSeen']
+
+
+def test_long_strings_are_cut():
+    body = body_of(long_strings(10000), max_string_chars=100)
+    assert body['description'].startswith('x' * 100 + '...')
+    assert '9900 more chars' in body['description']
+
+
+def test_body_is_shrunk_to_its_byte_budget():
+    sink = MemoryMetricsSink()
+    metrics = MetricsRecorder([sink])
+    builder = GuardDutyReportBuilder(
+        ENCLAVE_ID, shaper=BodyShaper(max_body_bytes=20000, metrics=metrics))
+    body = builder.build_for(port_scan(2000)).body
+    assert len(body.encode('utf-8')) <= 20000
+    assert json.loads(body)[BodyShaper.SUMMARY_KEY][PROBES]['count'] == 2000
+
+    metrics.flush()
+    assert sink.count('BodiesTruncated') == 1
+    assert sink.count('BodiesOverBudget') == 1
+    assert sink.timings('BodyBytes') == [len(body.encode('utf-8'))]
+
+
+def test_body_that_never_fits_keeps_its_scalars():
+    body = body_of(port_scan(100), max_body_bytes=300)
+    assert body['title']
+    assert body['service']['eventFirstSeen']
+    assert 'action' not in body['service']
+    assert body[BodyShaper.SUMMARY_KEY]['body']['maxBytes'] == 300
+
+
+def test_sizes_are_emitted_in_bytes():
+    stream = io.StringIO()
+    metrics = MetricsRecorder([EmfMetricsSink(stream)])
+    metrics.add_size('BodyBytes', 1234)
+    metrics.add_timing('BuildReport', 1.5)
+    metrics.flush()
+    doc = json.loads(stream.getvalue())
+    units = {m['Name']: m['Unit']
+             for m in doc['_aws']['CloudWatchMetrics'][0]['Metrics']}
+    assert units == {'BodyBytes': 'Bytes', 'BuildReport': 'Milliseconds'}
+    assert doc['BodyBytes'] == [1234]
@@ -0,0 +1,197 @@
+# encoding = utf-8
+
+""" Tests for the CircuitBreaker, Station error classification and the
+ReportUpserter's handling of failed lookups. """
+
+import asyncio
+
+import pytest
+from requests import ConnectionError
+from trustar import Report
+
+from trustar_guardduty_lambda_handler.helpers.common.circuit_breaker import \
+    CircuitBreaker, CircuitOpenError
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.common.retry_policy import \
+    RetryPolicy
+from trustar_guardduty_lambda_handler.helpers.ts.report_upserter import \
+    ReportUpserter
+from trustar_guardduty_lambda_handler.helpers.ts.station_error_classifier \
+    import StationErrorClassifier as Classifier
+from trustar_guardduty_lambda_handler.helpers.ts.station_rate_limiter import \
+    StationRateLimiter
+
+from .benchmarks.fake_station import FakeStation, FakeTruStar
+from .conftest import ENCLAVE_ID
+
+http_error = FakeStation.http_error
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeContext:
+
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+
+def fail(e):
+    def fn():
+        raise e
+    return fn
+
+
+def breaker_with(sink, clock, threshold=2):
+    return CircuitBreaker(failure_threshold=threshold, reset_timeout=10.0,
+                          is_failure=Classifier.is_transient,
+                          metrics=MetricsRecorder([sink]), clock=clock)
+
+
+def test_classify():
+    assert Classifier.classify(http_error(404, "")) == Classifier.NOT_FOUND
+    assert Classifier.classify(http_error(429, "")) == Classifier.THROTTLED
+    assert Classifier.classify(http_error(401, "")) == Classifier.AUTH
+    assert Classifier.classify(http_error(
+        400, "Expired oauth2 access token")) == Classifier.AUTH
+    assert Classifier.classify(http_error(503, "")) == \
+        Classifier.SERVER_ERROR
+    assert Classifier.classify(ConnectionError()) == Classifier.SERVER_ERROR
+    assert Classifier.classify(http_error(422, "")) == \
+        Classifier.CLIENT_ERROR
+    assert Classifier.classify(CircuitOpenError()) == \
+        Classifier.CIRCUIT_OPEN
+    assert Classifier.classify(KeyError()) == Classifier.OTHER
+
+
+def test_breaker_opens_half_opens_and_closes():
+    sink, clock = MemoryMetricsSink(), FakeClock()
+    breaker = breaker_with(sink, clock)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            breaker.call(fail(http_error(500, "")))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: calls.append(1))
+    assert not calls
+
+    clock.now = 10.0
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.metrics.flush()
+    assert sink.count('CircuitOpened') == 1
+    assert sink.count('CircuitHalfOpened') == 1
+    assert sink.count('CircuitClosed') == 1
+    assert sink.count('CircuitRejections') == 1
+
+
+def test_failed_trial_reopens_breaker():
+    clock = FakeClock()
+    breaker = breaker_with(MemoryMetricsSink(), clock, threshold=1)
+    with pytest.raises(Exception):
+        breaker.call(fail(http_error(429, "")))
+    clock.now = 10.0
+    with pytest.raises(Exception):
+        breaker.call(fail(http_error(502, "")))
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 15.0
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 'ok')
+
+
+def test_only_transient_errors_trip_the_breaker():
+    breaker = breaker_with(MemoryMetricsSink(), FakeClock(), threshold=1)
+    for status in (404, 403, 422):
+        with pytest.raises(Exception):
+            breaker.call(fail(http_error(status, "")))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_breaker_rejects_while_open():
+    breaker = breaker_with(MemoryMetricsSink(), FakeClock(), threshold=1)
+
+    async def boom():
+        raise http_error(500, "")
+
+    async def run():
+        with pytest.raises(Exception):
+            await breaker.call_async(boom)
+        with pytest.raises(CircuitOpenError):
+            await breaker.call_async(boom)
+    asyncio.get_event_loop().run_until_complete(run())
+
+
+class BrownoutStation(FakeStation):
+    """ A Station whose report lookups fail with 'status'. """
+
+    def __init__(self, status):
+        super().__init__([ENCLAVE_ID])
+        self.status = status
+
+    def get_report(self, report_id, id_type=None):
+        self._call('get_report')
+        raise self.http_error(self.status, "Injected error.")
+
+
+def report(external_id):
+    return Report(title='t', body='b', external_id=external_id,
+                  time_began='2020-01-01T00:00:00+00:00')
+
+
+def test_failed_lookup_does_not_submit():
+    station = BrownoutStation(503)
+    sink = MemoryMetricsSink()
+    upserter = ReportUpserter(FakeTruStar(station), ENCLAVE_ID,
+                              metrics=MetricsRecorder([sink]))
+    with pytest.raises(Exception) as e:
+        upserter.upsert(report('x'))
+    assert Classifier.status_code_of(e.value) == 503
+    assert station.calls['submit_report'] == 0
+    upserter.metrics.flush()
+    assert sink.count('LookupServerError') == 1
+
+
+def test_lookup_retries_stop_before_the_lambda_deadline():
+    station = BrownoutStation(503)
+    limiter = StationRateLimiter()
+    limiter.context = FakeContext(0.5)
+    upserter = ReportUpserter(FakeTruStar(station), ENCLAVE_ID,
+                              retry_policy=RetryPolicy(max_attempts=5),
+                              limiter=limiter)
+    with pytest.raises(Exception):
+        upserter.upsert(report('x'))
+    assert station.calls['get_report'] == 1
+
+
+def test_missing_report_is_submitted():
+    station = BrownoutStation(404)
+    upserter = ReportUpserter(FakeTruStar(station), ENCLAVE_ID)
+    assert upserter.upsert(report('x')).id
+    assert station.calls['submit_report'] == 1
+
+
+def test_open_breaker_fails_upserts_fast():
+    station = BrownoutStation(500)
+    breaker = breaker_with(MemoryMetricsSink(), FakeClock())
+    upserter = ReportUpserter(FakeTruStar(station), ENCLAVE_ID,
+                              breaker=breaker)
+    for external_id in 'abcd':
+        with pytest.raises(Exception):
+            upserter.upsert(report(external_id))
+    assert station.calls['get_report'] == 2
+    assert station.calls['submit_report'] == 0
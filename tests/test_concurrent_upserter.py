@@ -0,0 +1,52 @@
+# encoding = utf-8
+
+""" Tests for the ConcurrentUpserter. """
+
+import threading
+import time
+
+from trustar import Report
+
+from trustar_guardduty_lambda_handler.helpers.ts.concurrent_upserter import \
+    ConcurrentUpserter
+
+
+class RecordingUpserter:
+    """ Records the order reports are upserted in, and whether two reports
+    with the same external ID were ever upserted at the same time. """
+
+    def __init__(self):
+        self.order = []
+        self.in_flight = set()
+        self.overlapped = False
+        self.lock = threading.Lock()
+
+    def upsert(self, report):
+        with self.lock:
+            if report.external_id in self.in_flight:
+                self.overlapped = True
+            self.in_flight.add(report.external_id)
+        time.sleep(0.005)
+        with self.lock:
+            self.in_flight.discard(report.external_id)
+            self.order.append(report.title)
+        if report.title == 'fail':
+            raise Exception("boom")
+        return report
+
+
+def test_results_are_ordered_and_same_external_ids_are_serialized():
+    reports = [Report(title='a1', external_id='a'),
+               Report(title='b1', external_id='b'),
+               Report(title='a2', external_id='a'),
+               Report(title='fail', external_id='c'),
+               Report(title='a3', external_id='a')]
+    upserter = RecordingUpserter()
+    results = ConcurrentUpserter(upserter, max_workers=4).upsert_all(reports)
+
+    assert [r.index for r in results] == [0, 1, 2, 3, 4]
+    assert [r.failed for r in results] == [False, False, False, True, False]
+    assert results[2].upserted is reports[2]
+    a_order = [t for t in upserter.order if t.startswith('a')]
+    assert a_order == ['a1', 'a2', 'a3']
+    assert not upserter.overlapped
@@ -0,0 +1,44 @@
+# encoding = utf-8
+
+""" Tests for the TTL-cached enclave permissions. """
+
+from unittest import mock
+
+from trustar import EnclavePermissions
+
+from trustar_guardduty_lambda_handler.helpers.ts.enclave_permissions_cache \
+    import EnclavePermissionsCache
+
+ENCLAVES = [EnclavePermissions(id='e1', read=True, create=True, update=True)]
+
+
+def test_entries_are_reused_until_they_expire():
+    cache = EnclavePermissionsCache(ttl_seconds=60)
+    fetch = mock.Mock(return_value=ENCLAVES)
+    with mock.patch('time.time', return_value=1000.0):
+        cache.get('k', fetch)
+        cache.get('k', fetch)
+    assert fetch.call_count == 1
+    with mock.patch('time.time', return_value=1061.0):
+        perms = cache.get('k', fetch)
+    assert fetch.call_count == 2
+    assert perms[0].create
+
+
+def test_entries_persist_to_file_across_instances(tmp_path):
+    path = str(tmp_path / 'perms.json')
+    fetch = mock.Mock(return_value=ENCLAVES)
+    EnclavePermissionsCache(file_path=path).get('k', fetch)
+    perms = EnclavePermissionsCache(file_path=path).get('k', fetch)
+    assert fetch.call_count == 1
+    assert perms[0].id == 'e1' and perms[0].create
+
+
+def test_invalidate_removes_entry_from_memory_and_file(tmp_path):
+    path = str(tmp_path / 'perms.json')
+    fetch = mock.Mock(return_value=ENCLAVES)
+    cache = EnclavePermissionsCache(file_path=path)
+    cache.get('k', fetch)
+    cache.invalidate('k')
+    EnclavePermissionsCache(file_path=path).get('k', fetch)
+    assert fetch.call_count == 2
@@ -0,0 +1,70 @@
+# encoding = utf-8
+
+""" Tests for the ExternalIdEncoder's precomputed, per-enclave encoding. """
+
+import base64
+from unittest import mock
+import uuid
+
+import pytest
+
+from trustar_guardduty_lambda_handler.helpers.ts.external_id_encoder import \
+    ENCLAVE_UUID_NAMESPACE, ExternalIdEncoder
+
+from .conftest import ENCLAVE_ID
+
+ENCLAVE_IDS = (ENCLAVE_ID, 'staging-enclave', 'ab', 'énclave-2')
+EXTERNAL_IDS = ('', 'a', 'ab', 'abc', '4eb02f2b3b8d4bd2b2e0aa8b8d1e4d9e',
+                'finding/with spaces?&', 'ünïcödé')
+
+
+def legacy_reversible(enclave_id, external_id):
+    s = enclave_id + '|' + external_id
+    return base64.b64encode(s.encode('utf-8')).decode('utf-8')
+
+
+@pytest.mark.parametrize('enclave_id', ENCLAVE_IDS)
+def test_reversible_matches_whole_string_encoding(enclave_id):
+    encoder = ExternalIdEncoder(check_every=1)
+    for external_id in EXTERNAL_IDS:
+        encoded = encoder.reversible(enclave_id, external_id)
+        assert encoded == legacy_reversible(enclave_id, external_id)
+        assert encoder.reverse(encoded) == enclave_id + '|' + external_id
+    assert encoder.encode_many(enclave_id, EXTERNAL_IDS) == \
+        [legacy_reversible(enclave_id, x) for x in EXTERNAL_IDS]
+
+
+def test_irreversible_uses_the_enclave_namespace():
+    for external_id in EXTERNAL_IDS:
+        assert ExternalIdEncoder.irreversible(ENCLAVE_ID, external_id) == \
+            str(uuid.uuid5(uuid.UUID(ENCLAVE_ID), external_id))
+    assert ExternalIdEncoder.irreversible('staging', 'x') == \
+        str(uuid.uuid5(uuid.uuid5(ENCLAVE_UUID_NAMESPACE, 'staging'), 'x'))
+
+
+def test_self_check_is_sampled():
+    encoder = ExternalIdEncoder(check_every=3)
+    with mock.patch.object(encoder, 'check') as check:
+        for n in range(7):
+            encoder.reversible(ENCLAVE_ID, str(n))
+        assert check.call_count == 3
+        check.reset_mock()
+        encoder.encode_many(ENCLAVE_ID, [str(n) for n in range(7)])
+        assert check.call_count == 3
+
+    never = ExternalIdEncoder(check_every=0)
+    with mock.patch.object(never, 'check') as check:
+        never.reversible(ENCLAVE_ID, 'x')
+        never.encode_many(ENCLAVE_ID, ['x'])
+    assert not check.called
+
+
+def test_failed_self_check_raises():
+    encoder = ExternalIdEncoder(check_every=1)
+    with mock.patch.object(encoder, 'reverse', return_value='wrong'):
+        with pytest.raises(Exception):
+            encoder.reversible(ENCLAVE_ID, 'x')
+    lenient = ExternalIdEncoder(exception_if_reversible_fails=False)
+    with mock.patch.object(lenient, 'reverse', return_value='wrong'):
+        assert lenient.reversible(ENCLAVE_ID, 'x') == \
+            legacy_reversible(ENCLAVE_ID, 'x')
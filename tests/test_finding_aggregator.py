@@ -0,0 +1,195 @@
+# encoding = utf-8
+
+""" Tests for rolling related findings up into one report per group. """
+
+import copy
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from trustar_guardduty_lambda_handler import AsyncHandlerCache, \
+    HandlerConfig, TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler import async_ts_gd_lambda_handler
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.gd.finding_aggregator import \
+    FindingAggregator
+
+from .benchmarks.fake_station import FakeAsyncTruStar
+from .conftest import ENCLAVE_ID
+
+
+def findings_from(event, n, remote_ip='198.51.100.0', first_id=0):
+    events = []
+    for i in range(first_id, first_id + n):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i)
+        e['detail']['service']['action']['networkConnectionAction'][
+            'remoteIpDetails']['ipAddressV4'] = remote_ip
+        events.append(e)
+    return events
+
+
+def rollups_in(station):
+    return [json.loads(d['reportBody']) for d in station.reports.values()]
+
+
+def test_groups_by_keys_enclave_and_bucket(event):
+    sink = MemoryMetricsSink()
+    metrics = MetricsRecorder([sink])
+    aggregator = FindingAggregator(['type', 'remote_ip'], metrics=metrics)
+    a, b, other_ip = findings_from(event, 2) + findings_from(
+        event, 1, remote_ip='203.0.113.9', first_id=2)
+    later = copy.deepcopy(a)
+    later['detail']['createdAt'] = '2017-11-01T00:16:23.824Z'
+
+    group = aggregator.group_for(a, ENCLAVE_ID)
+    assert aggregator.group_for(b, ENCLAVE_ID) is group
+    assert aggregator.group_for(other_ip, ENCLAVE_ID) is not group
+    assert aggregator.group_for(later, ENCLAVE_ID) is not group
+    assert aggregator.group_for(a, 'other-enclave') is not group
+    assert group.fields == {'type': event['detail']['type'],
+                            'remote_ip': '198.51.100.0'}
+    assert group.bucket_start == '2017-10-31T23:00:00+00:00'
+    assert FindingAggregator.is_rollup(group.external_id)
+    assert not FindingAggregator.is_rollup('not-a-rollup')
+
+    # the same group gets the same external ID in every container.
+    again = FindingAggregator(['type', 'remote_ip'])
+    assert again.group_for(b, ENCLAVE_ID).external_id == group.external_id
+
+    aggregator.add(a, group)
+    aggregator.add(b, group)
+    aggregator.add(a, group)
+    metrics.flush()
+    assert sink.count('RollupGroupsCreated') == 4
+    assert sink.count('RollupMembersAdded') == 2
+    assert sink.count('RollupMembersUpdated') == 1
+
+
+def test_members_are_appended_incrementally(event):
+    aggregator = FindingAggregator(['resource'], max_members=2)
+    findings = findings_from(event, 3)
+    group = aggregator.group_for(findings[0], ENCLAVE_ID)
+    for finding in findings:
+        aggregator.add(finding, group)
+        assert group._joined is not None
+
+    body = json.loads(aggregator.report_for(group).body)
+    assert body['rollup']['groupedBy'] == {
+        'resource': event['detail']['resource']['instanceDetails'][
+            'instanceId']}
+    assert body['rollup']['memberCount'] == 3
+    assert body['rollup']['listedCount'] == 2
+    assert body['rollup']['eventCount'] == 3
+    assert [m['id'] for m in body['members']] == ['finding-0', 'finding-1']
+
+    # a newer version of a listed member replaces it.
+    newer = copy.deepcopy(findings[1])
+    newer['detail']['service']['count'] = 5
+    newer['detail']['service']['eventLastSeen'] = '2017-10-31T23:50:00Z'
+    aggregator.add(newer, group)
+    body = json.loads(group.body())
+    assert body['rollup']['memberCount'] == 3
+    assert body['rollup']['eventCount'] == 7
+    assert body['rollup']['lastSeen'] == '2017-10-31T23:50:00Z'
+    assert body['members'][1]['count'] == 5
+
+
+@pytest.mark.parametrize('settings', [
+    {'rollup_keys': 'unknown'}, {'rollup_keys': ','},
+    {'rollup_keys': 'type', 'rollup_bucket_seconds': 0}])
+def test_invalid_rollups_are_refused(settings):
+    with pytest.raises(Exception, match="ROLLUP"):
+        HandlerConfig(ENCLAVE_ID, {'user_api_key': 'key',
+                                   'user_api_secret': 'secret'}, **settings)
+
+
+@pytest.fixture
+def rolled_up(station):
+    with mock.patch.dict(os.environ, {'ROLLUP_KEYS': 'type,remote_ip',
+                                      'ROLLUP_TYPES': '*IntegTest*'}):
+        yield station
+
+
+def test_batch_upserts_each_rollup_once(rolled_up, event):
+    events = findings_from(event, 3) + findings_from(
+        event, 1, remote_ip='203.0.113.9', first_id=3)
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    assert handler.handle_batch({'Records': [
+        {'messageId': e['id'], 'body': json.dumps(e)} for e in events
+    ]}) == {'batchItemFailures': []}
+
+    assert rolled_up.calls['submit_report'] == 2
+    rollups = sorted(rollups_in(rolled_up),
+                     key=lambda r: -r['rollup']['memberCount'])
+    assert [r['rollup']['memberCount'] for r in rollups] == [3, 1]
+    assert [m['id'] for m in rollups[0]['members']] == [
+        'finding-0', 'finding-1', 'finding-2']
+
+    # the next member costs one update, not a rebuild from Station.
+    calls = dict(rolled_up.calls)
+    handler.handle(findings_from(event, 1, first_id=4)[0])
+    handler.close()
+    assert rolled_up.calls['get_report'] == calls.get('get_report', 0)
+    assert rolled_up.calls['update_report'] == calls.get('update_report',
+                                                         0) + 1
+    assert rolled_up.calls['submit_report'] == 2
+    assert sorted(r['rollup']['memberCount']
+                  for r in rollups_in(rolled_up)) == [1, 4]
+
+
+def test_new_container_restores_the_group_from_station(rolled_up, event):
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    handler.handle_batch(findings_from(event, 2))
+    handler.close()
+
+    other = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    result = other.handle(findings_from(event, 1, first_id=2)[0])
+    other.close()
+    assert result['title'].endswith('(3 finding(s))')
+    rollup, = rollups_in(rolled_up)
+    assert [m['id'] for m in rollup['members']] == [
+        'finding-0', 'finding-1', 'finding-2']
+
+    # findings of other types get their own reports.
+    single = copy.deepcopy(event)
+    single['detail']['type'] = 'Recon:EC2/Portscan'
+    other = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    assert 'members' not in other.handle(single)['reportBody']
+
+
+def test_evicted_group_merges_the_members_saved_since(rolled_up, event):
+    first, second, third = findings_from(event, 3)
+    with mock.patch.dict(os.environ, {'ROLLUP_MAX_GROUPS': '1'}):
+        one = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    other = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    one.handle(first)
+    other.handle(second)
+    # another group evicts the first from 'one', which reads it back, and
+    # the member 'other' added, before updating it.
+    one.handle(findings_from(event, 1, remote_ip='203.0.113.9',
+                             first_id=3)[0])
+    one.handle(third)
+    one.close()
+    other.close()
+    rollup = max(rollups_in(rolled_up),
+                 key=lambda r: r['rollup']['memberCount'])
+    assert sorted(m['id'] for m in rollup['members']) == [
+        'finding-0', 'finding-1', 'finding-2']
+
+
+def test_async_handler_rolls_findings_up(rolled_up, event):
+    client = lambda *args, **kwargs: FakeAsyncTruStar(rolled_up)
+    with mock.patch.object(async_ts_gd_lambda_handler, 'AsyncStationClient',
+                           client):
+        response = AsyncHandlerCache().handle_batch(findings_from(event, 3))
+    assert response == {'batchItemFailures': []}
+    assert rolled_up.calls['submit_report'] == 1
+    rollup, = rollups_in(rolled_up)
+    assert rollup['rollup']['memberCount'] == 3
@@ -0,0 +1,50 @@
+# encoding = utf-8
+
+""" Tests for the FindingCoalescer. """
+
+import copy
+
+from trustar_guardduty_lambda_handler import HandlerCache
+from trustar_guardduty_lambda_handler.helpers.aws.batch_item import BatchItem
+from trustar_guardduty_lambda_handler.helpers.gd.finding_coalescer import \
+    FindingCoalescer
+
+
+def version(event, finding_id, count, item_id=None):
+    e = copy.deepcopy(event)
+    e['id'] = item_id or '{}-{}'.format(finding_id, count)
+    e['detail']['id'] = finding_id
+    e['detail']['service']['count'] = count
+    return e
+
+
+def key_for(finding):
+    return finding['detail']['id']
+
+
+def test_newest_version_wins_regardless_of_arrival_order(event):
+    items = [BatchItem(str(c), version(event, 'a', c)) for c in (2, 3, 1)]
+    coalesced = FindingCoalescer.coalesce_batch(items, key_for)
+    assert len(coalesced) == 1
+    assert coalesced[0].item is items[1]
+    assert set(coalesced[0].superseded) == {items[0], items[2]}
+
+
+def test_buffer_bound_flushes_the_oldest_early(event):
+    coalescer = FindingCoalescer(key_for, max_buffered=2)
+    assert coalescer.add(BatchItem('1', version(event, 'a', 1))) == []
+    assert coalescer.add(BatchItem('2', version(event, 'b', 1))) == []
+    overflow = coalescer.add(BatchItem('3', version(event, 'c', 1)))
+    assert [c.key for c in overflow] == ['a']
+    assert [c.key for c in coalescer.flush()] == ['b', 'c']
+    assert (coalescer.received, coalescer.written) == (3, 3)
+
+
+def test_batch_upserts_only_the_newest_version(station, event):
+    events = [version(event, 'a', c) for c in (1, 2, 3)]
+    response = HandlerCache().handle_batch(events)
+    assert response == {'batchItemFailures': []}
+    assert station.calls['submit_report'] == 1
+    assert station.calls['update_report'] == 0
+    saved, = station.reports.values()
+    assert '"count": 3' in saved['reportBody']
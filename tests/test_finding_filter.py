@@ -0,0 +1,133 @@
+# encoding = utf-8
+
+""" Tests for the filter stage that drops findings before any Station
+call. """
+
+import copy
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from trustar_guardduty_lambda_handler import HandlerConfig, \
+    TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.gd.finding_filter import \
+    FindingFilter
+
+from .conftest import ENCLAVE_ID
+
+SPEC = {'min_severity': 4, 'drop_archived': True,
+        'exclude_accounts': ['111122223333'],
+        'regions': ['us-east-1', 'eu-west-1'],
+        'exclude_types': ['*IntegTest*', 'Policy:*'],
+        'sample': {'Recon:*': 0.25}}
+
+
+def finding(finding_id='finding', severity=5, account='123456789012',
+            region='us-east-1', type_='Backdoor:EC2/Spambot',
+            archived=False):
+    return {'detail': {'id': finding_id, 'severity': severity,
+                       'accountId': account, 'region': region,
+                       'type': type_, 'service': {'archived': archived}}}
+
+
+def test_first_failing_rule_drops_the_finding():
+    sink = MemoryMetricsSink()
+    metrics = MetricsRecorder([sink])
+    f = FindingFilter.from_json(json.dumps(SPEC), metrics)
+
+    assert f.rejecting_rule(finding()) is None
+    assert f.rejecting_rule(finding(severity=3.9)) == 'MinSeverity'
+    assert f.rejecting_rule(finding(severity=None)) == 'MinSeverity'
+    assert f.rejecting_rule(finding(archived=True)) == 'Archived'
+    assert f.rejecting_rule(finding(account='111122223333')) == \
+        'ExcludeAccounts'
+    assert f.rejecting_rule(finding(region='ap-south-1')) == 'Regions'
+    assert f.rejecting_rule(finding(
+        type_='99:EC2/Stateless.IntegTest')) == 'ExcludeTypes'
+    assert f.rejecting_rule({}) == 'MinSeverity'
+
+    metrics.flush()
+    assert sink.count('FindingsFiltered') == 7
+    assert sink.count('FilterMinSeverityDropped') == 3
+    assert sink.count('FilterMinSeverityPassed') == 5
+    assert sink.count('FilterRegionsDropped') == 1
+    assert sink.count('FilterSamplePassed') == 1
+
+
+def test_sampling_is_deterministic_per_finding():
+    f = FindingFilter.from_json(json.dumps({'sample': {
+        'Recon:*': 0.25, '*': 0.0, 'Never:*': 1.0}}))
+    kept = [i for i in range(4000)
+            if f.rejecting_rule(finding('f{}'.format(i),
+                                        type_='Recon:EC2/Portscan')) is None]
+    assert 800 < len(kept) < 1200
+    # every version of a finding, and every container, decides the same.
+    again = FindingFilter.from_json(json.dumps({'sample': {'Recon:*': 0.25}}))
+    assert all(again.rejecting_rule(finding('f{}'.format(i),
+                                            type_='Recon:X')) is None
+               for i in kept)
+    # the first glob that matches applies.
+    assert f.rejecting_rule(finding(type_='Never:X')) == 'Sample'
+
+
+def test_allow_lists():
+    f = FindingFilter.from_json(json.dumps({'accounts': '123456789012',
+                                            'types': ['Recon:*']}))
+    assert f.rejecting_rule(finding(type_='Recon:EC2/Portscan')) is None
+    assert f.rejecting_rule(finding()) == 'Types'
+    assert f.rejecting_rule(finding(account='1')) == 'Accounts'
+    assert FindingFilter.from_json(None).rejecting_rule({}) is None
+
+
+@pytest.mark.parametrize('spec', [
+    'not json', '[]', '{"min_severity": "high"}', '{"exclude_types": []}',
+    '{"sample": {"*": 2}}', '{"sample": 0.5}', '{"severity": 4}'])
+def test_invalid_filters_are_refused(spec):
+    with pytest.raises(Exception, match="FINDING_FILTER"):
+        HandlerConfig(ENCLAVE_ID, {'user_api_key': 'key',
+                                   'user_api_secret': 'secret'},
+                      finding_filter=spec)
+
+
+@pytest.fixture
+def filtered(station):
+    spec = json.dumps({'exclude_types': '*IntegTest*'})
+    with mock.patch.dict(os.environ, {'FINDING_FILTER': spec}):
+        yield station
+
+
+def test_handler_drops_filtered_findings_without_calling_station(filtered,
+                                                                 event):
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    calls = sum(filtered.calls.values())
+    assert handler.handle(event) == {'filtered': True,
+                                     'rule': 'ExcludeTypes',
+                                     'findingId': event['detail']['id']}
+    assert sum(filtered.calls.values()) == calls
+
+    kept = copy.deepcopy(event)
+    kept['id'] = 'kept-event'
+    kept['detail']['type'] = 'Recon:EC2/Portscan'
+    handler.handle(kept)
+    assert filtered.calls['submit_report'] == 1
+
+
+def test_batch_acknowledges_filtered_findings(filtered, event):
+    events = []
+    for i, type_ in enumerate(['Recon:EC2/Portscan', event['detail']['type'],
+                               'Backdoor:EC2/Spambot']):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i)
+        e['detail']['type'] = type_
+        events.append(e)
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    assert handler.handle_batch(events) == {'batchItemFailures': []}
+    handler.close()
+    assert filtered.calls['submit_report'] == 2
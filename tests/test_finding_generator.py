@@ -0,0 +1,62 @@
+# encoding = utf-8
+
+""" Tests for the synthetic GuardDuty finding generator the load tests
+use. """
+
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+
+from .benchmarks.finding_generator import FINDING_TYPES, FindingGenerator
+from .conftest import ENCLAVE_ID
+
+
+def test_same_seed_same_findings():
+    assert FindingGenerator(seed=3).generate(20) == \
+        FindingGenerator(seed=3).generate(20)
+
+
+def test_every_family_builds_a_report():
+    gen = FindingGenerator(family_weights={f: 1.0 for f in FINDING_TYPES})
+    events = gen.generate(200)
+    families = {e['detail']['resource']['resourceType'] for e in events}
+    assert families == {'Instance', 'AccessKey', 'S3Bucket', 'EKSCluster'}
+
+    builder = GuardDutyReportBuilder(ENCLAVE_ID)
+    reports = [builder.build_for(e) for e in events]
+    assert len({r.external_id for r in reports}) == 200
+
+
+def test_reemits_update_seen_findings():
+    gen = FindingGenerator(unique_ratio=0.25, reemit_window=10)
+    events = gen.generate(400)
+    ids = [e['detail']['id'] for e in events]
+    assert len(set(ids)) == gen.n_unique
+    assert 60 < gen.n_unique < 140
+
+    latest = {}
+    for e in events:
+        finding_id = e['detail']['id']
+        if finding_id in latest:
+            assert e['detail']['service']['count'] > \
+                latest[finding_id]['detail']['service']['count']
+            assert e['detail']['updatedAt'] > \
+                latest[finding_id]['detail']['updatedAt']
+        latest[finding_id] = e
+
+
+def test_duplicates_repeat_the_latest_version():
+    gen = FindingGenerator(unique_ratio=0.5, duplicate_ratio=1.0)
+    events = gen.generate(50)
+    seen = {}
+    for e in events:
+        finding_id = e['detail']['id']
+        if finding_id in seen:
+            assert e == seen[finding_id]
+        seen[finding_id] = e
+
+
+def test_payload_padding_grows_findings():
+    small = FindingGenerator(seed=1).generate(20)
+    large = FindingGenerator(seed=1, payload_median=4000).generate(20)
+    size = lambda events: sum(len(str(e)) for e in events)
+    assert size(large) > size(small) + 20 * 1000
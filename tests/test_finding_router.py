@@ -0,0 +1,185 @@
+# encoding = utf-8
+
+""" Tests for routing findings to enclaves. """
+
+import copy
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from trustar_guardduty_lambda_handler import AsyncHandlerCache, \
+    HandlerConfig, TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler import async_ts_gd_lambda_handler
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.gd.finding_router import \
+    EnclaveRoute, FindingRouter
+
+from .benchmarks.fake_station import FakeAsyncTruStar
+from .conftest import ENCLAVE_ID
+
+CRITICAL_ENCLAVE = 'a1b2c3d4-0000-4000-8000-000000000002'
+AUDIT_ENCLAVE = 'a1b2c3d4-0000-4000-8000-000000000003'
+
+ROUTES = [
+    {'name': 'Sandbox', 'accounts': '1111*', 'enclaves': []},
+    {'name': 'Critical', 'severities': ['critical', 'high'],
+     'regions': ['us-*', 'eu-west-1'],
+     'enclaves': [CRITICAL_ENCLAVE, AUDIT_ENCLAVE]},
+    {'name': 'Recon', 'types': 'Recon:*', 'enclaves': [AUDIT_ENCLAVE]},
+]
+
+
+def finding(account='123456789012', region='us-east-1', severity=5,
+            type_='Backdoor:EC2/Spambot', finding_id='finding'):
+    return {'id': 'event-' + finding_id,
+            'detail': {'id': finding_id, 'accountId': account,
+                       'region': region, 'severity': severity,
+                       'type': type_, 'title': 'title'}}
+
+
+def test_first_matching_route_wins():
+    sink = MemoryMetricsSink()
+    metrics = MetricsRecorder([sink])
+    router = FindingRouter.from_json(ENCLAVE_ID, json.dumps(ROUTES), metrics)
+
+    assert router.enclave_ids == [ENCLAVE_ID, CRITICAL_ENCLAVE,
+                                  AUDIT_ENCLAVE]
+    assert router.route(finding()) == (ENCLAVE_ID,)
+    assert router.route(finding(severity=9.5)) == (CRITICAL_ENCLAVE,
+                                                   AUDIT_ENCLAVE)
+    assert router.route(finding(severity=7.0, region='eu-west-1')) == (
+        CRITICAL_ENCLAVE, AUDIT_ENCLAVE)
+    assert router.route(finding(severity=8, region='ap-south-1')) == (
+        ENCLAVE_ID,)
+    assert router.route(finding(account='111122223333',
+                                severity=9.5)) == ()
+    assert router.route(finding(type_='Recon:EC2/Portscan')) == (
+        AUDIT_ENCLAVE,)
+    assert router.route({}) == (ENCLAVE_ID,)
+
+    metrics.flush()
+    assert sink.count('FindingsRouted') == 6
+    assert sink.count('FindingsUnrouted') == 1
+    assert sink.count('FindingsFannedOut') == 2
+    assert sink.count('ReportsRouted') == 8
+    assert sink.count('RouteDefault') == 3
+    assert sink.count('RouteCritical') == 2
+    assert sink.count('RouteSandbox') == 1
+
+
+def test_decisions_are_remembered_and_bounded():
+    router = FindingRouter(ENCLAVE_ID, FindingRouter.parse_routes(
+        json.dumps(ROUTES)), max_decisions=2)
+    with mock.patch.object(router, 'decide',
+                           wraps=router.decide) as decide:
+        for _ in range(3):
+            router.route(finding())
+            router.route(finding(finding_id='other'))
+        assert decide.call_count == 1
+        router.route(finding(severity=1))
+        router.route(finding(severity=2))
+        router.route(finding(severity=9))
+        assert decide.call_count == 3
+    assert len(router._decisions) <= 2
+
+
+@pytest.mark.parametrize('severity, band', [
+    (1, 'low'), (3.9, 'low'), (4.0, 'medium'), ('6.9', 'medium'),
+    (7, 'high'), (8.9, 'high'), (9.0, 'critical'), (None, None),
+    ('unknown', None)])
+def test_severity_bands(severity, band):
+    assert EnclaveRoute.severity_band(severity) == band
+
+
+@pytest.mark.parametrize('routes', [
+    'not json', '{"enclaves": []}', '[{"name": "NoEnclaves"}]',
+    '[{"enclaves": [], "severity": "high"}]',
+    '[{"enclaves": [], "severities": "urgent"}]'])
+def test_invalid_routes_are_refused(routes):
+    with pytest.raises(Exception, match="ENCLAVE_ROUTES"):
+        HandlerConfig(ENCLAVE_ID, {'user_api_key': 'key',
+                                   'user_api_secret': 'secret'},
+                      enclave_routes=routes)
+
+
+@pytest.fixture
+def routed(station):
+    station.enclave_ids.extend([CRITICAL_ENCLAVE, AUDIT_ENCLAVE])
+    with mock.patch.dict(os.environ, {'ENCLAVE_ROUTES': json.dumps(ROUTES)}):
+        yield station
+
+
+def enclaves_of(station):
+    return sorted(tuple(r['enclaveIds']) for r in station.reports.values())
+
+
+def test_handler_fans_findings_out_to_their_enclaves(routed, event):
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    critical = copy.deepcopy(event)
+    critical['detail']['severity'] = 9.0
+
+    result = handler.handle(critical)
+    assert [r['enclaveIds'] for r in result['reports']] == [
+        [CRITICAL_ENCLAVE], [AUDIT_ENCLAVE]]
+    assert len({r['externalTrackingId'] for r in result['reports']}) == 2
+
+    sandbox = copy.deepcopy(event)
+    sandbox['id'] = 'sandbox-event'
+    sandbox['detail']['accountId'] = '111100000000'
+    assert handler.handle(sandbox) == {
+        'routed': False, 'findingId': event['detail']['id']}
+    assert enclaves_of(routed) == [(CRITICAL_ENCLAVE,), (AUDIT_ENCLAVE,)]
+    handler.close()
+
+
+def test_batch_writes_each_enclave_concurrently(routed, event):
+    events = []
+    for i, severity in enumerate([2, 9, 5, 8]):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i)
+        e['detail']['severity'] = severity
+        events.append(e)
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    with mock.patch.object(handler.upserter.upserters[AUDIT_ENCLAVE],
+                           'upsert', side_effect=Exception("down")):
+        response = handler.handle_batch({'Records': [
+            {'messageId': e['id'], 'body': json.dumps(e)} for e in events]})
+    handler.close()
+
+    # only the findings routed to the failing enclave are retried.
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'event-1'},
+                                              {'itemIdentifier': 'event-3'}]}
+    assert enclaves_of(routed) == [(ENCLAVE_ID,), (ENCLAVE_ID,),
+                                   (CRITICAL_ENCLAVE,), (CRITICAL_ENCLAVE,)]
+
+
+def test_async_handler_routes_findings(routed, event):
+    events = []
+    for i, severity in enumerate([2, 9]):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i)
+        e['detail']['severity'] = severity
+        events.append(e)
+    client = lambda *args, **kwargs: FakeAsyncTruStar(routed)
+    with mock.patch.object(async_ts_gd_lambda_handler, 'AsyncStationClient',
+                           client):
+        response = AsyncHandlerCache().handle_batch(events)
+    assert response == {'batchItemFailures': []}
+    assert enclaves_of(routed) == [(ENCLAVE_ID,), (CRITICAL_ENCLAVE,),
+                                   (AUDIT_ENCLAVE,)]
+
+
+def test_handler_needs_write_access_to_every_routed_enclave(station):
+    station.enclave_ids.append(CRITICAL_ENCLAVE)
+    routes = [{'severities': 'critical',
+               'enclaves': [CRITICAL_ENCLAVE, AUDIT_ENCLAVE]}]
+    with mock.patch.dict(os.environ, {'ENCLAVE_ROUTES': json.dumps(routes)}):
+        with pytest.raises(Exception, match="do not have any access"):
+            TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
@@ -0,0 +1,82 @@
+# encoding = utf-8
+
+""" Tests for the HandlerCache that re-uses lambda handlers across warm
+invocations. """
+
+import os
+from unittest import mock
+
+import pytest
+
+from trustar_guardduty_lambda_handler import HandlerCache, HandlerConfig
+
+from .benchmarks.fake_station import FakeStation
+
+
+def test_handler_is_reused_across_invocations(station, event):
+    cache = HandlerCache()
+    first = cache.get()
+    cache.handle(event)
+    cache.handle(event)
+    assert cache.get() is first
+    assert station.calls['auth'] == 1
+    assert station.calls['get_enclaves'] == 1
+
+
+def test_handler_is_rebuilt_when_configs_change(station):
+    cache = HandlerCache()
+    first = cache.get()
+    os.environ['RETURN_SAVED_REPORT'] = 'True'
+    try:
+        second = cache.get()
+    finally:
+        del os.environ['RETURN_SAVED_REPORT']
+    assert second is not first
+    assert second.check_saved_report
+
+
+def test_configs_are_only_parsed_again_when_env_vars_change(station):
+    cache = HandlerCache()
+    with mock.patch.object(HandlerConfig, 'from_env_vars',
+                           wraps=HandlerConfig.from_env_vars) as parse:
+        first = cache.get()
+        assert cache.get() is first
+        assert parse.call_count == 1
+        # an env var the configs aren't read from changes nothing.
+        with mock.patch.dict(os.environ, {'UNRELATED': 'value'}):
+            assert cache.get() is first
+        assert parse.call_count == 1
+        with mock.patch.dict(os.environ, {'UPSERT_WORKERS': '8'}):
+            assert cache.get() is first
+        assert parse.call_count == 2
+
+
+def test_rebuilt_handler_reuses_cached_permissions(station):
+    cache = HandlerCache()
+    first = cache.get()
+    cache.invalidate()
+    assert cache.get() is not first
+    assert station.calls['get_enclaves'] == 1
+
+
+def test_handler_is_rebuilt_and_retried_on_auth_error(station, event):
+    cache = HandlerCache()
+    first = cache.get()
+    first.upserter.upsert = mock.Mock(
+        side_effect=FakeStation.http_error(401, "Unauthorized"))
+    result = cache.handle(event)
+    assert cache.get() is not first
+    assert result['externalTrackingId']
+    assert station.calls['submit_report'] == 1
+
+
+def test_forbidden_write_invalidates_cached_permissions(station, event):
+    cache = HandlerCache()
+    handler = cache.get()
+    handler.ts.submit_report = mock.Mock(
+        side_effect=FakeStation.http_error(403, "Forbidden"))
+    with pytest.raises(Exception):
+        handler.upserter.upsert(handler.builder.build_for(event))
+    cache.invalidate()
+    cache.get()
+    assert station.calls['get_enclaves'] == 2
@@ -0,0 +1,199 @@
+# encoding = utf-8
+
+""" Tests for the idempotency stores and the handlers' dropping of
+duplicate deliveries. """
+
+import copy
+import json
+import os
+from unittest import mock
+
+from trustar_guardduty_lambda_handler import AsyncHandlerCache, HandlerCache
+from trustar_guardduty_lambda_handler import async_ts_gd_lambda_handler
+from trustar_guardduty_lambda_handler.handler_config import HandlerConfig
+from trustar_guardduty_lambda_handler.helpers.aws.dynamodb_idempotency_store \
+    import DynamoDbIdempotencyStore
+from trustar_guardduty_lambda_handler.helpers.aws.file_idempotency_store \
+    import FileIdempotencyStore
+from trustar_guardduty_lambda_handler.helpers.aws.idempotency_store import \
+    IdempotencyStore
+from trustar_guardduty_lambda_handler.helpers.aws.memory_idempotency_store \
+    import MemoryIdempotencyStore
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+
+from .benchmarks.fake_station import FakeAsyncTruStar
+
+
+class ConditionalCheckFailed(Exception):
+    """ What botocore raises when a put's condition is false. """
+
+    response = {'Error': {'Code': 'ConditionalCheckFailedException'}}
+
+
+class FakeDynamoDbClient:
+    """ Stands in for a boto3 DynamoDB client, evaluating the store's
+    condition the way DynamoDB would. """
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None,
+                 ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None):
+        key = (TableName, Item['idempotency_key']['S'])
+        existing = self.items.get(key)
+        if ConditionExpression is not None and existing:
+            now = int(ExpressionAttributeValues[':now']['N'])
+            if int(existing['expires_at']['N']) > now:
+                raise ConditionalCheckFailed()
+        self.items[key] = Item
+
+    def delete_item(self, TableName, Key):
+        self.items.pop((TableName, Key['idempotency_key']['S']), None)
+
+
+def test_key_for_needs_both_ids(event):
+    key = IdempotencyStore.key_for(event)
+    assert key == '{}|{}|{}'.format(event['id'], event['detail']['id'],
+                                    event['detail']['updatedAt'])
+    assert IdempotencyStore.key_for({'detail': event['detail']}) is None
+    assert MemoryIdempotencyStore().claim_event({'id': 'no-detail'})
+
+
+def test_memory_store_expires_and_evicts_keys():
+    now = [0.0]
+    store = MemoryIdempotencyStore(max_entries=2, ttl_seconds=10,
+                                   clock=lambda: now[0], lease_seconds=5)
+    assert store.claim('a')
+    assert not store.claim('a')
+    store.complete('a')
+    now[0] = 9.0
+    assert not store.claim('a')
+    now[0] = 10.0
+    assert store.claim('a')
+
+    store.claim('b')
+    store.claim('c')
+    assert len(store) == 2
+    assert store.claim('a')
+    store.release('a')
+    assert store.claim('a')
+
+
+def test_expired_lease_can_be_claimed_again():
+    now = [0.0]
+    store = MemoryIdempotencyStore(ttl_seconds=100, clock=lambda: now[0],
+                                   lease_seconds=5)
+    assert store.claim('a')
+    now[0] = 4.0
+    assert not store.claim('a')
+    # the container that held the lease died without releasing it.
+    now[0] = 5.0
+    assert store.claim('a')
+
+
+def test_file_store_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'idempotency.json')
+    first, second = FileIdempotencyStore(path), FileIdempotencyStore(path)
+    assert first.claim('a')
+    assert not second.claim('a')
+    second.release('a')
+    assert first.claim('a')
+    first.complete('a')
+    assert not FileIdempotencyStore(path).claim('a')
+
+
+def test_dynamodb_store_claims_with_a_conditional_put():
+    now = [100.0]
+    client = FakeDynamoDbClient()
+    first = DynamoDbIdempotencyStore('keys', client=client, ttl_seconds=10,
+                                     clock=lambda: now[0], lease_seconds=5)
+    second = DynamoDbIdempotencyStore('keys', client=client, ttl_seconds=10,
+                                      clock=lambda: now[0], lease_seconds=5)
+    assert first.claim('a')
+    assert not second.claim('a')
+    now[0] = 105.0
+    assert second.claim('a')
+    second.complete('a')
+    now[0] = 114.0
+    assert not first.claim('a')
+    now[0] = 115.0
+    assert first.claim('a')
+    first.release('a')
+    assert not client.items
+
+
+def test_dynamodb_store_fails_open():
+    client = mock.Mock()
+    client.put_item.side_effect = Exception("throttled")
+    store = DynamoDbIdempotencyStore('keys', client=client)
+    assert store.claim('a') and store.claim('a')
+
+
+def test_handler_drops_redelivered_events(station, event):
+    sink = MemoryMetricsSink()
+    recorder = lambda config: MetricsRecorder([sink])
+    with mock.patch.object(HandlerConfig, 'build_metrics_recorder',
+                           recorder):
+        cache = HandlerCache()
+        first = cache.handle(event)
+        calls = sum(station.calls.values())
+        second = cache.handle(copy.deepcopy(event))
+
+    assert second == {'duplicate': True,
+                      'externalTrackingId': first['externalTrackingId']}
+    assert sum(station.calls.values()) == calls
+    assert sink.count('DuplicatesDropped') == 1
+
+
+def test_handler_releases_the_key_of_a_failed_event(station, event):
+    cache = HandlerCache()
+    handler = cache.get()
+    with mock.patch.object(handler.upserter, 'upsert',
+                           side_effect=Exception("Station is down")):
+        try:
+            cache.handle(event)
+        except Exception:
+            pass
+    cache.handle(event)
+    assert len(station.reports) == 1
+
+
+def test_handler_leases_the_key_until_the_event_is_processed(station,
+                                                             event):
+    now = [0.0]
+    store = MemoryIdempotencyStore(ttl_seconds=100, clock=lambda: now[0],
+                                   lease_seconds=5)
+    expiries = []
+    cache = HandlerCache()
+    handler = cache.get()
+    handler.idempotency_store = store
+    upsert = handler.upserter.upsert
+
+    def upsert_and_peek(report):
+        expiries.extend(store._expiries.values())
+        return upsert(report)
+
+    with mock.patch.object(handler.upserter, 'upsert', upsert_and_peek):
+        cache.handle(event)
+    assert expiries == [5.0]
+    assert list(store._expiries.values()) == [100.0]
+
+
+def test_async_batch_drops_duplicates(station, event):
+    records = [{'messageId': str(i), 'body': json.dumps(event)}
+               for i in range(3)]
+    client = lambda *args, **kwargs: FakeAsyncTruStar(station)
+    with mock.patch.object(async_ts_gd_lambda_handler, 'AsyncStationClient',
+                           client), \
+            mock.patch.dict(os.environ, {'IDEMPOTENCY_STORE': 'memory'}):
+        cache = AsyncHandlerCache()
+        response = cache.handle_batch({'Records': records})
+        cache.handle_batch({'Records': records[:1]})
+
+    assert response == {'batchItemFailures': []}
+    assert station.calls['submit_report'] == 1
+    assert station.calls['update_report'] == 0
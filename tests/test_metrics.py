@@ -0,0 +1,66 @@
+# encoding = utf-8
+
+""" Tests for the per-stage metrics. """
+
+import io
+import json
+from unittest import mock
+
+from trustar_guardduty_lambda_handler import HandlerCache, HandlerConfig
+from trustar_guardduty_lambda_handler.helpers.common.emf_metrics_sink import \
+    EmfMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+
+
+def test_emf_lines_carry_every_timing_and_counter():
+    stream = io.StringIO()
+    metrics = MetricsRecorder([EmfMetricsSink(stream)],
+                              dimensions={'FunctionName': 'fn'})
+    for _ in range(150):
+        with metrics.span('Submit'):
+            pass
+    metrics.increment('Submits', 150)
+    metrics.flush()
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    directive = first['_aws']['CloudWatchMetrics'][0]
+    assert directive['Dimensions'] == [['FunctionName']]
+    assert {'Name': 'Submits', 'Unit': 'Count'} in directive['Metrics']
+    assert first['FunctionName'] == 'fn' and first['Submits'] == 150
+    assert len(first['Submit']) == 100 and len(second['Submit']) == 50
+    assert 'Submits' not in second
+
+
+def test_recorder_without_sinks_records_nothing():
+    metrics = MetricsRecorder()
+    metrics.increment('Submits')
+    with metrics.span('Submit'):
+        pass
+    metrics.flush()
+    assert not metrics.enabled
+
+
+def test_handler_emits_stage_metrics_once_per_invocation(station, event):
+    sink = MemoryMetricsSink()
+    recorder = lambda config: MetricsRecorder([sink])
+    with mock.patch.object(HandlerConfig, 'build_metrics_recorder',
+                           recorder):
+        cache = HandlerCache()
+        cache.handle(event)
+        cache.handle(dict(event, id='another-event'))
+
+    assert len(sink.snapshots) == 2
+    first = sink.snapshots[0]
+    for stage in ('Invocation', 'HandlerBuild', 'ClientBuild',
+                  'PermissionCheck', 'BuildReport', 'Upsert',
+                  'LookupExisting', 'Submit'):
+        assert len(first.timings[stage]) == 1, stage
+    assert first.counters['Submits'] == 1
+    assert first.counters['LookupAttempts'] == 1
+    assert sink.count('IndexHits') == 1
+    assert sink.count('UnchangedSkips') == 1
+    assert len(sink.timings('Invocation')) == 2
+    assert 'HandlerBuild' not in sink.snapshots[1].timings
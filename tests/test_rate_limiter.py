@@ -0,0 +1,162 @@
+# encoding = utf-8
+
+""" Tests for the TokenBucket, the StationRateLimiter and the rate-limited
+TruStar client. """
+
+import asyncio
+import json
+from unittest import mock
+
+import pytest
+from requests import HTTPError, Response
+
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.common.token_bucket import \
+    TokenBucket
+from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+    ClientBuilder
+from trustar_guardduty_lambda_handler.helpers.ts.station_rate_limiter import \
+    StationRateLimiter
+
+from .benchmarks.station_server import StationServer
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def throttled_error(retry_after=None, wait_time_ms=None):
+    response = Response()
+    response.status_code = 429
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    if wait_time_ms is not None:
+        response._content = json.dumps({'waitTime': wait_time_ms}).encode()
+    return HTTPError("429 Client Error", response=response)
+
+
+def limiter_with(sink, **kwargs):
+    return StationRateLimiter(metrics=MetricsRecorder([sink]), **kwargs)
+
+
+def test_bucket_spaces_calls_out():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=1.0, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.5, 1.0]
+    clock.now = 10.0
+    assert bucket.reserve() == 0.0
+
+
+def test_throttled_bucket_pauses_slows_and_recovers():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10.0, clock=clock)
+    bucket.throttled(3.0)
+    assert bucket.rate == 5.0
+    assert bucket.reserve() == 3.0
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 10.0
+
+
+def test_unlimited_bucket_only_waits_while_paused():
+    clock = FakeClock()
+    bucket = TokenBucket(clock=clock)
+    assert bucket.reserve() == 0.0
+    bucket.throttled(2.0)
+    assert bucket.reserve() == 2.0
+
+
+def test_limiter_queues_throttled_calls():
+    sink = MemoryMetricsSink()
+    limiter = limiter_with(sink)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise throttled_error(wait_time_ms=10)
+        return 'ok'
+    assert limiter.call(limiter.WRITE, fn) == 'ok'
+    limiter.metrics.flush()
+    assert sink.count('Throttles') == 2
+    assert len(sink.timings('StationRequest')) == 3
+    assert sum(sink.timings('RateLimitWait')) >= 15
+
+
+def test_limiter_gives_up():
+    limiter = limiter_with(MemoryMetricsSink(), max_throttled_attempts=2)
+
+    def fn():
+        raise throttled_error(retry_after=0)
+    with pytest.raises(HTTPError):
+        limiter.call(limiter.READ, fn)
+
+    limiter = limiter_with(MemoryMetricsSink(), max_pause=5.0)
+    with pytest.raises(HTTPError):
+        limiter.call(limiter.READ, lambda: fn())
+
+
+def test_limiter_does_not_pause_past_the_deadline():
+    limiter = limiter_with(MemoryMetricsSink())
+    limiter.context = mock.Mock(get_remaining_time_in_millis=lambda: 3000)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise throttled_error(retry_after=5)
+    with pytest.raises(HTTPError):
+        limiter.call(limiter.READ, fn)
+    assert len(calls) == 1
+    # the bucket was not paused for the call that gave up.
+    assert limiter.buckets[limiter.READ].reserve() == 0.0
+
+
+def test_pause_prefers_retry_after():
+    limiter = StationRateLimiter()
+    assert limiter.pause_for(throttled_error(2, 500)) == 2.0
+    assert limiter.pause_for(throttled_error(wait_time_ms=500)) == 0.5
+    assert limiter.pause_for(throttled_error()) == limiter.default_pause
+
+
+def test_async_limiter_queues_throttled_calls():
+    limiter = limiter_with(MemoryMetricsSink())
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) < 2:
+            raise throttled_error(wait_time_ms=10)
+        return 'ok'
+    assert asyncio.get_event_loop().run_until_complete(
+        limiter.call_async(limiter.READ, fn)) == 'ok'
+
+
+def test_rate_limited_trustar_client():
+    with StationServer(wait_time_ms=10) as server:
+        sink = MemoryMetricsSink()
+        limiter = limiter_with(sink, max_throttled_attempts=1)
+        ts = ClientBuilder.from_params(
+            'TEST', {'user_api_key': 'key', 'user_api_secret': 'secret',
+                     'auth_endpoint': server.auth_endpoint,
+                     'api_endpoint': server.api_endpoint}, limiter=limiter)
+        assert ts.enclave_ids is None or ts.enclave_ids == []
+        assert ts.get_user_enclaves()
+
+        server.expire_tokens()
+        assert ts.get_user_enclaves()
+
+        # the limiter, not the TruStar client, sees the 429.
+        server.throttle_rate = 1.0
+        with pytest.raises(HTTPError):
+            ts.get_user_enclaves()
+        limiter.metrics.flush()
+        assert sink.count('Throttles') == 1
+        assert server.station.calls['auth'] == 2
@@ -0,0 +1,51 @@
+# encoding = utf-8
+
+""" Tests for the GuardDutyReportBuilder's body formats and batch
+building. """
+
+import json
+
+import pytest
+
+from trustar_guardduty_lambda_handler.helpers.gd import report_builder
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+
+from .conftest import ENCLAVE_ID
+
+
+def test_body_formats_hold_the_same_detail(event):
+    pretty = GuardDutyReportBuilder(ENCLAVE_ID).build_for(event)
+    compact = GuardDutyReportBuilder(
+        ENCLAVE_ID, GuardDutyReportBuilder.COMPACT).build_for(event)
+    assert json.loads(pretty.body) == json.loads(compact.body)
+    assert pretty.body == json.dumps(json.loads(pretty.body), indent=4,
+                                     sort_keys=True)
+    assert '\n' not in compact.body
+    assert len(compact.body) < len(pretty.body)
+    assert compact.external_id == pretty.external_id
+
+
+def test_compact_body_does_not_depend_on_orjson(event, monkeypatch):
+    builder = GuardDutyReportBuilder(ENCLAVE_ID,
+                                     GuardDutyReportBuilder.COMPACT)
+    event['detail']['title'] = 'Café probe'
+    with_orjson = builder.body_from_detail(event['detail'])
+    monkeypatch.setattr(report_builder, 'orjson', None)
+    assert builder.body_from_detail(event['detail']) == with_orjson
+
+
+def test_build_many_builds_in_order(event):
+    other = json.loads(json.dumps(event))
+    other['detail']['id'] = 'another-finding'
+    builder = GuardDutyReportBuilder(ENCLAVE_ID)
+    reports = builder.build_many([event, other])
+    assert [r.external_id for r in reports] == \
+        [builder.external_id_for(event), builder.external_id_for(other)]
+    with pytest.raises(Exception):
+        builder.build_many([event, {'detail': {}}])
+
+
+def test_unknown_body_format_is_refused():
+    with pytest.raises(Exception):
+        GuardDutyReportBuilder(ENCLAVE_ID, 'yaml')
@@ -0,0 +1,66 @@
+# encoding = utf-8
+
+""" Tests for the ReportDigester and the upserter's skipping of writes
+that would not change a report. """
+
+import copy
+
+from trustar import Report
+
+from trustar_guardduty_lambda_handler.helpers.gd.report_builder import \
+    GuardDutyReportBuilder
+from trustar_guardduty_lambda_handler.helpers.ts.memory_report_index import \
+    MemoryReportIndex
+from trustar_guardduty_lambda_handler.helpers.ts.report_digester import \
+    ReportDigester
+from trustar_guardduty_lambda_handler.helpers.ts.report_upserter import \
+    ReportUpserter
+
+from .benchmarks.fake_station import FakeStation, FakeTruStar
+from .conftest import ENCLAVE_ID
+
+
+def reemitted(event, count):
+    e = copy.deepcopy(event)
+    e['detail']['service']['count'] = count
+    e['detail']['updatedAt'] = '2020-01-0{}T00:00:00Z'.format(count)
+    return e
+
+
+def test_volatile_fields_are_ignored(event):
+    builder = GuardDutyReportBuilder(ENCLAVE_ID)
+    first = builder.build_for(reemitted(event, 1))
+    second = builder.build_for(reemitted(event, 2))
+    assert ReportDigester().digest(first) != ReportDigester().digest(second)
+    digester = ReportDigester(['service.count', 'updatedAt'])
+    assert digester.unchanged(first, second)
+
+
+def test_time_began_is_compared_as_millis():
+    iso = Report(title='t', time_began='2017-04-21T00:57:21+00:00')
+    ms = Report(title='t', time_began=1492736241000)
+    assert ReportDigester().unchanged(iso, ms)
+
+
+def upsert_twice(event, index):
+    station = FakeStation([ENCLAVE_ID])
+    upserter = ReportUpserter(
+        FakeTruStar(station), ENCLAVE_ID, index=index,
+        digester=ReportDigester(['service.count', 'updatedAt']))
+    builder = GuardDutyReportBuilder(ENCLAVE_ID)
+    first = upserter.upsert(builder.build_for(reemitted(event, 1)))
+    second = upserter.upsert(builder.build_for(reemitted(event, 2)))
+    assert second.id == first.id
+    return station
+
+
+def test_unchanged_report_is_not_rewritten_after_lookup(event):
+    station = upsert_twice(event, index=None)
+    assert station.calls['get_report'] == 2
+    assert station.calls['update_report'] == 0
+
+
+def test_unchanged_report_is_not_rewritten_from_index(event):
+    station = upsert_twice(event, index=MemoryReportIndex())
+    assert station.calls['get_report'] == 1
+    assert station.calls['update_report'] == 0
@@ -0,0 +1,136 @@
+# encoding = utf-8
+
+""" Tests for the external ID -> report ID index and the upserter's use
+of it. """
+
+from unittest import mock
+
+from trustar import Report
+
+from trustar_guardduty_lambda_handler.helpers.ts.dynamodb_report_index \
+    import DynamoDbReportIndex
+from trustar_guardduty_lambda_handler.helpers.ts.file_report_index import \
+    FileReportIndex
+from trustar_guardduty_lambda_handler.helpers.ts.memory_report_index import \
+    MemoryReportIndex
+from trustar_guardduty_lambda_handler.helpers.ts.report_index import \
+    ReportIndexEntry
+from trustar_guardduty_lambda_handler.helpers.ts.report_upserter import \
+    ReportUpserter
+
+from .benchmarks.fake_station import FakeStation, FakeTruStar
+from .conftest import ENCLAVE_ID
+
+
+class FakeDynamoDbClient:
+    """ Stands in for a boto3 DynamoDB client, the way DynamoDB Local
+    would behind 'endpoint_url'. """
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, TableName, Key):
+        item = self.items.get((TableName, Key['external_id']['S']))
+        return {'Item': item} if item else {}
+
+    def put_item(self, TableName, Item):
+        self.items[(TableName, Item['external_id']['S'])] = Item
+
+    def delete_item(self, TableName, Key):
+        self.items.pop((TableName, Key['external_id']['S']), None)
+
+
+def entry(report_id):
+    return ReportIndexEntry(report_id, [ENCLAVE_ID], 'hash')
+
+
+def test_memory_index_evicts_least_recently_used():
+    index = MemoryReportIndex(max_entries=2)
+    index.put('a', entry('1'))
+    index.put('b', entry('2'))
+    index.get('a')
+    index.put('c', entry('3'))
+    assert index.get('b') is None
+    assert index.get('a').report_id == '1'
+    assert len(index) == 2
+
+
+def test_file_index_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'index.json')
+    first, second = FileReportIndex(path), FileReportIndex(path)
+    first.put('a', entry('1'))
+    assert second.get('a').report_id == '1'
+    second.delete('a')
+    assert first.get('a') is None
+
+
+def test_file_index_appends_and_compacts(tmp_path):
+    path = str(tmp_path / 'index.json')
+    first, second = FileReportIndex(path), FileReportIndex(path)
+    with mock.patch.object(FileReportIndex, 'MIN_DEAD_LINES', 5):
+        for i in range(3):
+            first.put('a', entry(str(i)))
+            second.put('b', entry(str(i)))
+        with open(path) as f:
+            assert len(f.readlines()) == 6
+        # the tail of a write that was cut off is left for the next read.
+        with open(path, 'a') as f:
+            f.write('{"k": "c", "e"')
+        assert first.get('b').report_id == '2'
+        assert first.get('c') is None
+
+        # the 5th dead line compacts the file down to the live entries.
+        second.put('a', entry('3'))
+        with open(path) as f:
+            assert len(f.readlines()) == 2
+    assert (first.get('a').report_id, first.get('b').report_id) == ('3', '2')
+    assert len(FileReportIndex(path)) == 2
+
+
+def test_dynamodb_index_round_trips_entries():
+    index = DynamoDbReportIndex('reports', client=FakeDynamoDbClient())
+    index.put('a', entry('1'))
+    got = index.get('a')
+    assert (got.report_id, got.enclave_ids, got.digest) == \
+        ('1', [ENCLAVE_ID], 'hash')
+    index.delete('a')
+    assert index.get('a') is None
+
+
+def upserter_and_station():
+    station = FakeStation([ENCLAVE_ID])
+    upserter = ReportUpserter(FakeTruStar(station), ENCLAVE_ID,
+                              index=MemoryReportIndex())
+    return upserter, station
+
+
+def test_indexed_report_is_updated_without_a_lookup():
+    upserter, station = upserter_and_station()
+    upserter.upsert(Report(title='v1', body='b1', external_id='gd-1'))
+    upserter.upsert(Report(title='v2', body='b2', external_id='gd-1'))
+    assert station.calls['get_report'] == 1
+    assert station.calls['submit_report'] == 1
+    assert station.calls['update_report'] == 1
+    saved, = station.reports.values()
+    assert saved['title'] == 'v2'
+
+
+def test_stale_entry_is_dropped_and_repaired():
+    upserter, station = upserter_and_station()
+    first = upserter.upsert(Report(title='v1', body='b1', external_id='gd-1'))
+    station.reports.clear()
+    station.ids_by_external_id.clear()
+
+    second = upserter.upsert(Report(title='v2', body='b2',
+                                    external_id='gd-1'))
+    assert second.id != first.id
+    assert station.calls['submit_report'] == 2
+    assert upserter.index.get('gd-1').report_id == second.id
+
+
+def test_entry_in_other_enclaves_is_not_trusted():
+    upserter, station = upserter_and_station()
+    upserter.index.put('gd-1', ReportIndexEntry('1', ['other-enclave']))
+    upserter.upsert(Report(title='v1', body='b1', external_id='gd-1'))
+    assert station.calls['update_report'] == 0
+    assert station.calls['submit_report'] == 1
@@ -0,0 +1,95 @@
+# encoding = utf-8
+
+""" Tests for the RetryPolicy. """
+
+import asyncio
+import copy
+
+from trustar_guardduty_lambda_handler import HandlerConfig
+from trustar_guardduty_lambda_handler.helpers.common.retry_policy import \
+    RetryPolicy
+from trustar_guardduty_lambda_handler.helpers.ts.report_details_fetcher \
+    import ReportDetailsFetcher
+
+
+class FakeContext:
+    """ A Lambda context with a fixed amount of time left. """
+
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+
+def flaky(failures):
+    """ A call that fails 'failures' times, then returns "ok". """
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise Exception("not yet")
+        return "ok"
+    return fn, calls
+
+
+def test_first_attempt_does_not_wait():
+    fn, calls = flaky(0)
+    outcome = RetryPolicy(base_delay=10).call(fn)
+    assert outcome.succeeded and outcome.value == "ok"
+    assert outcome.attempts == 1 and outcome.total_wait == 0
+
+
+def test_delays_are_capped_and_jittered():
+    policy = RetryPolicy(max_attempts=6, base_delay=1, max_delay=4)
+    delays = list(policy.delays())
+    caps = [1, 2, 4, 4, 4]
+    assert len(delays) == len(caps)
+    for delay, cap in zip(delays, caps):
+        assert cap / 2 <= delay <= cap
+    assert list(RetryPolicy(max_attempts=4, base_delay=1, max_delay=3,
+                            jitter=False).delays()) == [1, 2, 3]
+
+
+def test_retries_until_success():
+    fn, calls = flaky(2)
+    outcome = RetryPolicy(base_delay=0.001).call(fn)
+    assert outcome.succeeded and len(calls) == 3
+    assert outcome.attempts == 3 and outcome.total_wait > 0
+
+
+def test_stops_before_the_deadline():
+    fn, calls = flaky(5)
+    policy = RetryPolicy(max_attempts=10, base_delay=0.001,
+                         deadline_margin=1.0)
+    outcome = policy.call(fn, context=FakeContext(0.5))
+    assert not outcome.succeeded and outcome.stopped_for_deadline
+    assert len(calls) == 1
+
+
+def test_does_not_retry_errors_that_are_not_retryable():
+    fn, calls = flaky(5)
+    outcome = RetryPolicy(base_delay=0.001).call(
+        fn, is_retryable=lambda e: False)
+    assert not outcome.succeeded and len(calls) == 1
+
+
+def test_call_async():
+    fn, calls = flaky(1)
+
+    async def async_fn():
+        return fn()
+    outcome = asyncio.get_event_loop().run_until_complete(
+        RetryPolicy(base_delay=0.001).call_async(async_fn))
+    assert outcome.succeeded and outcome.attempts == 2
+
+
+def test_saved_report_fetch_waits_less_than_the_fixed_sleeps_did():
+    config = HandlerConfig('enclave', {'user_api_key': 'key',
+                                       'user_api_secret': 'secret'})
+    for policy in (ReportDetailsFetcher.DEFAULT_RETRY_POLICY,
+                   config.retry_policy(config.saved_report_max_attempts)):
+        policy = copy.copy(policy)
+        policy.jitter = False
+        assert sum(policy.delays()) <= 11.5
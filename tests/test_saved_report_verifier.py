@@ -0,0 +1,154 @@
+# encoding = utf-8
+
+""" Tests for the deferred saved report check:  the VerificationQueue,
+the SavedReportVerifier and the handlers' deferred mode. """
+
+import asyncio
+import os
+from unittest import mock
+
+from trustar import NumberedPage, Report
+
+from trustar_guardduty_lambda_handler import HandlerCache, \
+    TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.ts.async_saved_report_verifier \
+    import AsyncSavedReportVerifier
+from trustar_guardduty_lambda_handler.helpers.ts.saved_report_verifier \
+    import SavedReportVerifier
+from trustar_guardduty_lambda_handler.helpers.ts.verification_queue import \
+    PendingVerification, VerificationQueue
+
+from .benchmarks.fake_station import (FakeAsyncTruStar, FakeStation,
+                                      FakeTruStar)
+from .conftest import ENCLAVE_ID
+
+DEFERRED = {'RETURN_SAVED_REPORT': 'True', 'SAVED_REPORT_CHECK': 'deferred'}
+
+
+def report_for(n, body='body'):
+    return Report(title='Finding {}'.format(n), body=body,
+                  time_began='2020-01-01T00:00:00+00:00',
+                  external_id='finding-{}'.format(n), is_enclave=True,
+                  enclave_ids=[ENCLAVE_ID])
+
+
+def entry_for(n, queued_at=0.0):
+    return PendingVerification(report_for(n), None, queued_at)
+
+
+def verifier_for(ts, sink, **kwargs):
+    return SavedReportVerifier(
+        ts, [ENCLAVE_ID], TruStarGuardDutyLambdaHandler.VARS_TO_SKIP,
+        metrics=MetricsRecorder([sink]), **kwargs)
+
+
+def test_queue_replaces_drops_and_requeues():
+    queue = VerificationQueue(max_entries=2)
+    for n in range(3):
+        queue.put(entry_for(n, queued_at=n))
+    assert len(queue) == 2 and queue.dropped == 1
+
+    newer = entry_for(1, queued_at=5)
+    queue.put(newer)
+    taken = queue.take(queued_before=3)
+    assert [e.external_id for e in taken] == ['finding-2']
+
+    taken = queue.take()
+    assert taken == [newer]
+    queue.put(entry_for(1, queued_at=6))
+    queue.requeue(taken + [entry_for(2)])
+    assert [e.queued_at for e in queue.take()] == [0.0, 6]
+
+
+def test_verifier_searches_pages_instead_of_looking_up_reports():
+    station, sink = FakeStation([ENCLAVE_ID]), MemoryMetricsSink()
+    ts = FakeTruStar(station)
+    station.PAGE_SIZE = 2
+    verifier = verifier_for(ts, sink)
+    for n in range(5):
+        verifier.defer(ts.submit_report(report_for(n)))
+    ts.submit_report(report_for(9))
+
+    assert verifier.verify_due(everything=True) == 5
+    verifier.metrics.flush()
+    assert sink.count('SavedReportsVerified') == 5
+    assert station.calls['get_report'] == 0
+    assert station.calls['get_reports_page'] == 3
+    assert not len(verifier.queue)
+
+
+def test_verifier_pages_past_reports_without_an_update_time():
+    updated, created, neither = report_for(1), report_for(2), report_for(3)
+    updated.updated, created.created = 50, 40
+    page = NumberedPage(items=[updated, created, neither])
+    assert SavedReportVerifier.collect(page, {'x'}, {}, 100) == 39
+    page = NumberedPage(items=[neither])
+    assert SavedReportVerifier.collect(page, {'x'}, {}, 100) is None
+
+
+def test_verifier_counts_mismatches_and_requeues_missing_reports():
+    station, sink = FakeStation([ENCLAVE_ID]), MemoryMetricsSink()
+    ts = FakeTruStar(station)
+    verifier = verifier_for(ts, sink, max_attempts=2)
+    ts.submit_report(report_for(1, body='what Station kept'))
+    verifier.defer(report_for(1))
+    verifier.defer(report_for(2))
+
+    assert verifier.verify_due(everything=True) == 2
+    verifier.metrics.flush()
+    assert sink.count('SavedReportMismatches') == 1
+    assert sink.count('SavedReportsMissing') == 0
+    assert len(verifier.queue) == 1
+
+    assert verifier.verify_due(everything=True) == 1
+    verifier.metrics.flush()
+    assert sink.count('SavedReportsMissing') == 1
+    assert not len(verifier.queue)
+
+
+def test_verifier_waits_for_delay_and_survives_search_errors():
+    station, sink = FakeStation([ENCLAVE_ID]), MemoryMetricsSink()
+    ts = FakeTruStar(station)
+    now = [100.0]
+    verifier = verifier_for(ts, sink, delay=30.0, clock=lambda: now[0])
+    verifier.defer(ts.submit_report(report_for(1)))
+    assert verifier.verify_due() == 0
+
+    now[0] = 131.0
+    ts.get_reports_page = mock.Mock(side_effect=FakeStation.http_error(
+        503, "Unavailable"))
+    assert verifier.verify_due() == 0
+    assert len(verifier.queue) == 1
+
+
+def test_async_verifier_verifies_saved_reports():
+    station, sink = FakeStation([ENCLAVE_ID]), MemoryMetricsSink()
+    ts = FakeTruStar(station)
+    verifier = AsyncSavedReportVerifier(
+        FakeAsyncTruStar(station), [ENCLAVE_ID],
+        TruStarGuardDutyLambdaHandler.VARS_TO_SKIP,
+        metrics=MetricsRecorder([sink]))
+    verifier.defer(ts.submit_report(report_for(1)))
+    checked = asyncio.get_event_loop().run_until_complete(
+        verifier.verify_due(everything=True))
+    verifier.metrics.flush()
+    assert checked == 1
+    assert sink.count('SavedReportsVerified') == 1
+
+
+def test_deferred_handler_returns_upserted_and_verifies_later(station,
+                                                              event):
+    with mock.patch.dict(os.environ, DEFERRED):
+        cache = HandlerCache()
+        result = cache.handle(event)
+        lookups = station.calls['get_report']
+        assert result['externalTrackingId']
+        assert len(cache.get().verifier.queue) == 1
+
+        assert cache.verify() == {'checked': 1}
+    assert station.calls['get_report'] == lookups
+    assert station.calls['get_reports_page'] == 1
@@ -0,0 +1,67 @@
+# encoding = utf-8
+
+""" Tests that the real TruStar client and the AsyncStationClient work
+against the local Station server the benchmarks use. """
+
+import asyncio
+
+import pytest
+from requests import HTTPError
+from trustar import IdType, Report
+
+from trustar_guardduty_lambda_handler.helpers.ts.async_station_client import \
+    AsyncStationClient
+from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+    ClientBuilder
+
+from .benchmarks.station_server import StationServer
+
+
+@pytest.fixture
+def server():
+    with StationServer() as server:
+        yield server
+
+
+def client_params(server):
+    return {'user_api_key': 'key', 'user_api_secret': 'secret',
+            'auth_endpoint': server.auth_endpoint,
+            'api_endpoint': server.api_endpoint}
+
+
+def test_trustar_client_round_trip(server):
+    ts = ClientBuilder.from_params('TEST', client_params(server))
+    enclave_id = server.station.enclave_ids[0]
+    assert [e.id for e in ts.get_user_enclaves()] == [enclave_id]
+
+    report = ts.submit_report(Report(
+        title='t', body='b', external_id='x', enclave_ids=[enclave_id],
+        time_began='2020-01-01T00:00:00+00:00'))
+    saved = ts.get_report_details('x', id_type=IdType.EXTERNAL)
+    assert saved.id == report.id
+
+    server.expire_tokens()
+    saved.title = 'updated'
+    ts.update_report(saved)
+    assert server.station.reports[report.id]['title'] == 'updated'
+    assert server.station.calls['auth'] == 2
+
+    with pytest.raises(HTTPError) as e:
+        ts.get_report_details('missing', id_type=IdType.EXTERNAL)
+    assert e.value.response.status_code == 404
+
+
+def test_injected_errors_reach_the_async_client(server):
+    server.error_rate = 1.0
+
+    async def call():
+        client = AsyncStationClient(client_params(server), 'TEST')
+        try:
+            await client.get_report_details('x', IdType.EXTERNAL)
+        finally:
+            await client.close()
+
+    with pytest.raises(HTTPError) as e:
+        asyncio.new_event_loop().run_until_complete(call())
+    assert e.value.response.status_code == 500
+    assert server.injected['errors'] == 1
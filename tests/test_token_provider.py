@@ -0,0 +1,114 @@
+# encoding = utf-8
+
+""" Tests for the TokenProvider and the clients that take their OAuth
+tokens from it. """
+
+import asyncio
+from unittest import mock
+
+import pytest
+from requests import HTTPError
+
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+from trustar_guardduty_lambda_handler.helpers.ts.async_station_client import \
+    AsyncStationClient
+from trustar_guardduty_lambda_handler.helpers.ts.client_builder import \
+    ClientBuilder
+from trustar_guardduty_lambda_handler.helpers.ts.token_provider import \
+    TokenProvider
+
+from .benchmarks.station_server import StationServer
+
+
+@pytest.fixture
+def server():
+    with StationServer() as server:
+        yield server
+
+
+def client_params(server):
+    return {'user_api_key': 'key', 'user_api_secret': 'secret',
+            'auth_endpoint': server.auth_endpoint,
+            'api_endpoint': server.api_endpoint}
+
+
+def provider_for(server, **kwargs):
+    return TokenProvider(client_params(server), 'creds', **kwargs)
+
+
+def test_token_is_cached_in_memory_and_in_the_file(server, tmp_path):
+    path = str(tmp_path / 'token.json')
+    sink = MemoryMetricsSink()
+    first = provider_for(server, file_path=path,
+                         metrics=MetricsRecorder([sink]))
+    token = first.get()
+    assert first.get() == token
+    assert provider_for(server, file_path=path).get() == token
+    assert server.station.calls['auth'] == 1
+
+    first.metrics.flush()
+    assert sink.count('TokenRefreshes') == 1
+    assert len(sink.timings('AuthRequest')) == 1
+
+
+def test_token_is_refreshed_in_the_background_before_it_expires(server):
+    now = [0.0]
+    provider = provider_for(server, refresh_margin=300,
+                            clock=lambda: now[0])
+    token = provider.get()
+    now[0] = 3400.0
+    assert provider.cached() == token
+    provider._background.join()
+    assert server.station.calls['auth'] == 2
+    assert provider.cached() != token
+
+    now[0] = 10000.0
+    assert provider.cached() is None
+    provider.get()
+    assert server.station.calls['auth'] == 3
+
+
+def test_client_shares_the_token_and_retries_a_rejected_one(server):
+    provider = provider_for(server)
+    provider.get()
+    ts = ClientBuilder.from_params('TEST', client_params(server),
+                                   token_provider=provider)
+    ts.get_user_enclaves()
+    assert server.station.calls['auth'] == 1
+
+    server.expire_tokens()
+    ts.get_user_enclaves()
+    assert server.station.calls['auth'] == 2
+
+
+def test_client_retries_a_rejected_token_only_once(server):
+    provider = provider_for(server)
+    ts = ClientBuilder.from_params('TEST', client_params(server),
+                                   token_provider=provider)
+    with mock.patch.object(provider, 'fetch',
+                           return_value=('rejected', 3600.0)) as fetch:
+        with pytest.raises(HTTPError) as e:
+            ts.get_user_enclaves()
+    assert e.value.response.status_code == 400
+    assert fetch.call_count == 2
+
+
+def test_async_client_shares_the_token(server):
+    provider = provider_for(server)
+    provider.get()
+
+    async def call():
+        client = AsyncStationClient(client_params(server), 'TEST',
+                                    token_provider=provider)
+        try:
+            await client.get_user_enclaves()
+            server.expire_tokens()
+            await client.get_user_enclaves()
+        finally:
+            await client.close()
+
+    asyncio.new_event_loop().run_until_complete(call())
+    assert server.station.calls['auth'] == 2
@@ -0,0 +1,348 @@
+# encoding = utf-8
+
+""" Tests for the spool of the reports whose upserts failed, and for
+draining it. """
+
+import copy
+import io
+import json
+import os
+import threading
+import time
+from unittest import mock
+
+import pytest
+from trustar import Report
+
+from trustar_guardduty_lambda_handler import HandlerCache, HandlerConfig, \
+    TruStarGuardDutyLambdaHandler
+from trustar_guardduty_lambda_handler.helpers.aws.file_upsert_spool import \
+    FileUpsertSpool
+from trustar_guardduty_lambda_handler.helpers.aws.s3_upsert_spool import \
+    S3UpsertSpool
+from trustar_guardduty_lambda_handler.helpers.aws.upsert_spool import \
+    UpsertSpool
+from trustar_guardduty_lambda_handler.helpers.common.circuit_breaker import \
+    CircuitOpenError
+from trustar_guardduty_lambda_handler.helpers.common.memory_metrics_sink \
+    import MemoryMetricsSink
+from trustar_guardduty_lambda_handler.helpers.common.metrics_recorder import \
+    MetricsRecorder
+
+from .benchmarks.fake_station import FakeStation
+from .conftest import ENCLAVE_ID
+
+http_error = FakeStation.http_error
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeS3Client:
+    """ Stands in for a boto3 S3 client, keeping objects in a dict.
+    Lists two objects per page. """
+
+    def __init__(self):
+        self.objects = {}
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(k for b, k in self.objects
+                      if b == Bucket and k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = {'Contents': [{'Key': k} for k in keys[start:start + 2]],
+                'IsTruncated': start + 2 < len(keys)}
+        if page['IsTruncated']:
+            page['NextContinuationToken'] = str(start + 2)
+        return page
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Bucket, Key])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Bucket, Key] = Body
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def report(external_id, body='body'):
+    return Report(title='t', body=body, external_id=external_id,
+                  time_began='2020-01-01T00:00:00+00:00',
+                  enclave_ids=[ENCLAVE_ID])
+
+
+def finding(finding_id='finding'):
+    return {'id': 'event-' + finding_id, 'detail': {'id': finding_id}}
+
+
+def test_entries_survive_a_new_spool_and_back_off(tmp_path):
+    clock = Clock()
+    spool = FileUpsertSpool(str(tmp_path), clock=clock, backoff_seconds=10.0,
+                            max_backoff_seconds=25.0)
+    assert spool.spool(finding('a'), [report('a'), report('a2')],
+                       http_error(503, ""))
+    clock.now += 1
+    assert spool.spool(finding('b'), [report('b')], CircuitOpenError())
+
+    # a new container reads the segments back.
+    again = FileUpsertSpool(str(tmp_path), clock=clock, backoff_seconds=10.0,
+                            max_backoff_seconds=25.0)
+    assert len(again) == 3
+    assert again.due() == []
+    clock.now += 10
+    entries = again.due()
+    assert [e.key for e in entries] == ['a', 'a2', 'b']
+    assert entries[0].finding == finding('a')
+    assert entries[0].error == 'HTTPError'
+    assert entries[0].report.body == 'body'
+
+    again.ack(['a', 'unknown'])
+    again.retry_later(entries[1], http_error(500, ""))
+    assert [e.key for e in again.due()] == ['b']
+    clock.now += 20
+    assert [e.key for e in again.due(limit=1)] == ['a2']
+    again.retry_later(entries[1], http_error(500, ""))
+    assert entries[1].attempts == 3
+    # the backoff doubles up to its cap.
+    assert entries[1].retry_at == clock.now + 25.0
+
+    # a newer failure of the same report replaces the spooled one.
+    spool.spool(finding('b'), [report('b', body='newer')], http_error(429, ""))
+    clock.now += 100
+    b = [e for e in FileUpsertSpool(str(tmp_path), clock=clock).due()
+         if e.key == 'b']
+    assert [(e.report.body, e.attempts) for e in b] == [('newer', 2)]
+
+
+def test_dead_lines_are_compacted_away(tmp_path):
+    sink = MemoryMetricsSink()
+    spool = FileUpsertSpool(str(tmp_path), segment_bytes=2000,
+                            metrics=MetricsRecorder([sink]))
+    for i in range(150):
+        spool.spool(finding(str(i)), [report(str(i))], http_error(503, ""))
+    assert len(spool.segment_names()) > 1
+    spool.ack([str(i) for i in range(140)])
+
+    segments = spool.segment_names()
+    assert len(segments) == 1
+    lines = spool.read_segment(segments[0]).splitlines()
+    assert [json.loads(l)['entry']['report']['externalTrackingId']
+            for l in lines] == [str(i) for i in range(140, 150)]
+    assert len(FileUpsertSpool(str(tmp_path))) == 10
+
+    spool.record_gauges()
+    spool.metrics.flush()
+    assert sink.count('EntriesSpooled') == 150
+    assert sink.count('SpoolDrained') == 140
+    assert sink.count('SpoolCompactions') == 1
+    assert sink.timings('SpoolDepth') == [10]
+    assert sink.timings('SpoolBytes') == [len(b''.join(
+        l + b'\n' for l in lines))]
+
+
+def test_appends_wait_for_another_process_compaction(tmp_path):
+    compacting = FileUpsertSpool(str(tmp_path))
+    appending = FileUpsertSpool(str(tmp_path))
+    appending.spool(finding('a'), [report('a')], http_error(503, ""))
+    compacting.spool(finding('b'), [report('b')], http_error(503, ""))
+    write_segment = compacting.write_segment
+    appender = threading.Thread(target=lambda: appending.spool(
+        finding('c'), [report('c')], http_error(503, "")))
+
+    def write_while_appending(name, data):
+        # the other process appends after the compaction read the
+        # segments, before it deletes them.
+        appender.start()
+        appender.join(0.2)
+        write_segment(name, data)
+
+    with mock.patch.object(compacting, 'write_segment',
+                           write_while_appending):
+        compacting.compact()
+    appender.join()
+    later = FileUpsertSpool(str(tmp_path), clock=lambda: time.time() + 60)
+    assert sorted(e.key for e in later.due()) == ['a', 'b', 'c']
+
+
+def test_writes_over_the_cap_are_refused(tmp_path):
+    spool = FileUpsertSpool(str(tmp_path), max_bytes=1000)
+    assert spool.spool(finding('a'), [report('a')], http_error(503, ""))
+    assert not spool.spool(finding('b'), [report('b', body='x' * 1000)],
+                           http_error(503, ""))
+    assert [e.key for e in spool.due()] == []
+    assert len(spool) == 1
+    # compacting away acked entries makes room.
+    spool.ack(['a'])
+    assert spool.spool(finding('c'), [report('c')], http_error(503, ""))
+
+
+def test_a_cut_off_line_is_skipped(tmp_path):
+    spool = FileUpsertSpool(str(tmp_path))
+    spool.spool(finding('a'), [report('a')], http_error(503, ""))
+    segment, = spool.segment_names()
+    with open(os.path.join(str(tmp_path), segment), 'ab') as f:
+        f.write(b'{"op": "put", "entr')
+    assert len(FileUpsertSpool(str(tmp_path))) == 1
+
+
+def test_s3_spool_writes_a_segment_per_write():
+    client = FakeS3Client()
+    spool = S3UpsertSpool('bucket', prefix='spool/', client=client)
+    for i in range(5):
+        spool.spool(finding(str(i)), [report(str(i))], http_error(503, ""))
+    assert len(client.objects) == 5
+    spool.ack(['0', '1'])
+    spool.compact()
+    assert len(client.objects) == 1
+    assert all(k.startswith('spool/segment-') for _, k in client.objects)
+    other = S3UpsertSpool('bucket', prefix='spool/', client=client,
+                          clock=lambda: time.time() + 60)
+    assert sorted(e.key for e in other.due()) == ['2', '3', '4']
+
+
+def test_ack_supersedes_entries_another_container_spooled():
+    client = FakeS3Client()
+    clock = Clock()
+    first = S3UpsertSpool('bucket', client=client, clock=clock)
+    assert len(first) == 0
+    second = S3UpsertSpool('bucket', client=client, clock=clock)
+    second.spool(finding('a'), [report('a')], http_error(503, ""))
+    # the first container read the spool before 'a' was spooled.
+    clock.now += 1
+    first.ack(['a'], 'SpoolSuperseded')
+    assert len(S3UpsertSpool('bucket', client=client)) == 0
+
+
+def test_ack_of_reports_that_were_never_spooled_writes_nothing(tmp_path):
+    spool = FileUpsertSpool(str(tmp_path / 'spool'))
+    spool.ack(['a', 'b'], 'SpoolSuperseded')
+    assert spool.segment_names() == []
+    spool.spool(finding('a'), [report('a')], http_error(503, ""))
+    names = spool.segment_names()
+    spool.ack(['b'], 'SpoolSuperseded')
+    assert spool.segment_names() == names
+    assert spool.segment_stamp(names) == \
+        FileUpsertSpool(str(tmp_path / 'spool')).segment_stamp(names)
+    assert len(spool) == 1
+
+
+@pytest.mark.parametrize('error, spoolable', [
+    (http_error(503, ""), True), (http_error(429, ""), True),
+    (CircuitOpenError(), True), (ConnectionError(), True),
+    (http_error(400, ""), False), (http_error(401, ""), False),
+    (Exception("bug"), False)])
+def test_only_failures_worth_retrying_are_spooled(error, spoolable):
+    assert UpsertSpool.is_spoolable(error) == spoolable
+
+
+@pytest.fixture
+def spooled(station, tmp_path):
+    with mock.patch.dict(os.environ, {'UPSERT_SPOOL': 'file',
+                                      'UPSERT_SPOOL_PATH': str(tmp_path),
+                                      'UPSERT_SPOOL_BACKOFF_SECONDS': '0'}):
+        yield station
+
+
+def test_batch_spools_failed_upserts_and_drain_retries_them(spooled, event):
+    events = []
+    for i in range(3):
+        e = copy.deepcopy(event)
+        e['id'] = 'event-{}'.format(i)
+        e['detail']['id'] = 'finding-{}'.format(i)
+        events.append(e)
+    cache = HandlerCache()
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(503, "down")):
+        response = cache.handle_batch(events)
+    assert response == {'batchItemFailures': []}
+    assert spooled.reports == {}
+    assert len(cache.get().upsert_spool) == 3
+
+    assert cache.drain() == {'drained': 3, 'failed': 0, 'dropped': 0,
+                             'depth': 0}
+    assert len(spooled.reports) == 3
+    assert cache.drain()['drained'] == 0
+    cache.get().close()
+
+
+def test_handle_spools_and_auth_errors_still_raise(spooled, event):
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(502, "down")):
+        result = handler.handle(event)
+    assert result['spooled'] is True
+    assert result['findingId'] == event['detail']['id']
+
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(500, "down")):
+        assert handler.drain_spool() == {'drained': 0, 'failed': 1,
+                                         'dropped': 0, 'depth': 1}
+    assert handler.upsert_spool.due()[0].attempts == 2
+
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(401, "expired")):
+        other = copy.deepcopy(event)
+        other['id'] = 'other-event'
+        other['detail']['id'] = 'other-finding'
+        with pytest.raises(Exception, match="401"):
+            handler.handle(other)
+    assert len(handler.upsert_spool) == 1
+
+    # a newer upsert of the report supersedes the spooled one.
+    newer = copy.deepcopy(event)
+    newer['id'] = 'newer-event'
+    handler.handle(newer)
+    assert len(handler.upsert_spool) == 0
+    handler.close()
+
+
+def test_drain_skips_reports_another_container_upserted_since(spooled,
+                                                              event):
+    spooling = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(503, "down")):
+        spooling.handle(event)
+    other = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    newer = copy.deepcopy(event)
+    newer['id'] = 'newer-event'
+    newer['detail']['title'] = 'newer'
+    time.sleep(0.01)
+    # the other container acked before the report was spooled.
+    with mock.patch.object(other.upsert_spool, 'ack'):
+        other.handle(newer)
+    assert len(spooling.upsert_spool) == 1
+
+    assert spooling.drain_spool()['depth'] == 0
+    assert spooled.calls['update_report'] == 0
+    (saved,) = spooled.reports.values()
+    assert saved['title'] == other.builder.build_for(newer).title
+    spooling.close()
+    other.close()
+
+
+def test_drain_drops_reports_station_refuses_for_good(spooled, event):
+    handler = TruStarGuardDutyLambdaHandler(HandlerConfig.from_env_vars())
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(503, "down")):
+        handler.handle(event)
+    with mock.patch.object(FakeStation, 'submit_report',
+                           side_effect=http_error(422, "invalid")):
+        assert handler.drain_spool() == {'drained': 0, 'failed': 0,
+                                         'dropped': 1, 'depth': 0}
+    handler.close()
+
+
+def test_unknown_spool_is_refused():
+    with pytest.raises(Exception, match="UPSERT_SPOOL"):
+        HandlerConfig(ENCLAVE_ID, {'user_api_key': 'key',
+                                   'user_api_secret': 'secret'},
+                      upsert_spool='dynamodb')
+    with pytest.raises(Exception, match="UPSERT_SPOOL_BUCKET"):
+        HandlerConfig(ENCLAVE_ID, {'user_api_key': 'key',
+                                   'user_api_secret': 'secret'},
+                      upsert_spool='s3')